@@ -4,6 +4,7 @@ from app.core.extensions import init_extensions, db, login_manager, jwt
 from app.db.models.user import User
 from app.db.models.token import TokenBlacklist
 from app.api.register import register_blueprints
+from app.cli import register_commands
 import os
 
 
@@ -44,6 +45,7 @@ def create_app(config_name='default'):
         return db.session.get(User, int(identity))
     
     register_blueprints(app)
+    register_commands(app)
     
     # Add custom error handlers
     @app.errorhandler(413)
@@ -1,27 +1,33 @@
 """Chat API routes for message handling."""
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.core.extensions import db
-from app.db.models import Message, Conversation
+from app.core.extensions import db, redis_provider
+from app.db.models import Message, Conversation, UploadedFile
 from app.services.ai_service import AIService
-from app.tasks.ai import process_message_stream_task
+from app.tasks.ai import process_message_stream_task, generate_conversation_title_task
 from app.core.stream_manager import StreamManager
+from app.core.stream_fanout import get_stream_fanout_stats
+from app.core.guest_executor import GuestExecutorFull, get_guest_executor, get_guest_executor_stats
 from app.api.chat.sse import stream_ai_response
-from app.core.title_generator import generate_title
+from app.core.title_generator import generate_title, smart_title_from_first_message
+from app.core.message_tree import is_on_branch, load_branch, newest_leaf, sibling_ids
 from sqlalchemy import func
 from app.middleware.auth import optional_auth
 
-import redis
+import logging
 import uuid
-import os
 import threading
-import copy
+
+logger = logging.getLogger(__name__)
+
+
+# Files one message may attach (ids from /files/chat/upload)
+MAX_MESSAGE_ATTACHMENTS = 10
 
 
 def get_redis_client():
-    """Get Redis client instance."""
-    redis_url = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
-    return redis.from_url(redis_url, decode_responses=True)
+    """Get the shared Redis client."""
+    return redis_provider.client
 
 
 def get_ai_service():
@@ -39,20 +45,107 @@ ai_service = get_ai_service()
 chat_bp = Blueprint('chat', __name__, url_prefix='/chat')
 
 
+def _schedule_title(conversation_id, stream_id, first_message, provisional_title):
+    """Queue AI title generation; without Celery run it on a background thread."""
+    # The answer's completion event waits for the title event
+    stream_manager.expect_title(stream_id)
+    args = (conversation_id, stream_id, first_message, provisional_title)
+    try:
+        generate_conversation_title_task.delay(*args)
+        return
+    except Exception:
+        pass
+
+    app = current_app._get_current_object()
+
+    def run_title(*task_args):
+        with app.app_context():
+            try:
+                ai_service.generate_conversation_title(*task_args)
+            except Exception:
+                pass
+
+    threading.Thread(target=run_title, args=args, daemon=True).start()
+
+
+def _branch_parent_id(conversation):
+    """Message a new user turn replies to: the active leaf, else the newest message."""
+    if conversation.active_leaf_id is not None:
+        return conversation.active_leaf_id
+    return db.session.query(func.max(Message.id)).filter(Message.conversation_id == conversation.id).scalar()
+
+
+def _show_branch(conversation, leaf_id):
+    """Point the conversation at ``leaf_id``; a summary of another branch is dropped."""
+    conversation.active_leaf_id = leaf_id
+    through = conversation.summary_through_id
+    if through is not None and not is_on_branch(through, leaf_id):
+        conversation.summary = None
+        conversation.summary_through_id = None
+
+
+def _owned_message(message_id, user_id):
+    return Message.query.join(Conversation).filter(
+        Message.id == message_id, Conversation.user_id == user_id).first()
+
+
+def _answer_in_background(user_message, user_id, new_title=None):
+    """Open a response stream for ``user_message`` and queue its answer; returns the stream id.
+
+    ``new_title`` is the provisional title of a conversation this message just
+    started; its AI title is scheduled on the same stream.
+    """
+    stream_id = str(uuid.uuid4())
+    stream_manager.create_stream(stream_id, user_id, user_message.conversation_id)
+    if new_title is not None:
+        # Title first: the inline fallback below blocks until the answer is done
+        _schedule_title(user_message.conversation_id, stream_id, user_message.content, new_title)
+    try:
+        process_message_stream_task.delay(user_message.id, stream_id)
+    except Exception:
+        # Fallback to inline processing if Celery not available
+        ai_service.process_ai_task(user_message.id, stream_id)
+    return stream_id
+
+
+def _prompt_window(messages):
+    """Session history as a prompt: trimming may leave an assistant turn first."""
+    while len(messages) > 1 and messages[0].get('role') != 'user':
+        messages.pop(0)
+    return messages
+
+
+def _guest_capacity_response():
+    """503 telling the client when to retry a guest message."""
+    response = jsonify({'error': 'Chat is busy right now. Please try again shortly.', 'status': 'UNAVAILABLE'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(current_app.config.get('GUEST_RETRY_AFTER_SECONDS', 5))
+    return response
+
+
 @chat_bp.route('/send', methods=['POST'])
 @optional_auth
 def send_message(current_user):
     """Smart send: supports existing and new conversations.
 
     - Existing conversation: requires conversation_id, behaves as before.
-    - New conversation: if conversation_id missing, auto-create with AI-generated title (Phase 5 will wire full tool-calling).
+    - New conversation: if conversation_id missing, auto-create with a local title from the
+      first message; the AI title follows as a ``title`` event on the response stream.
+    - Signed-in users may attach their chat uploads with ``file_ids``; excerpts of the files
+      attached anywhere in the conversation are added to the prompt.
     """
     user_id = current_user.id if current_user else None
     data = request.get_json() or {}
 
     is_guest = user_id is None
 
-    if is_guest:
+    # Guests either resend their history as ``messages`` or opt into a server-side
+    # session by sending only ``content`` (plus the ``session_id`` they were given)
+    guest_session_mode = is_guest and 'messages' not in data
+    if guest_session_mode:
+        if not isinstance(data.get('content'), str) or not data['content'].strip():
+            return jsonify({'error': 'Content required'}), 400
+    elif is_guest:
         messages = data.get('messages')
         if not isinstance(messages, list) or not messages:
             return jsonify({'error': 'messages list required for guest chat'}), 400
@@ -62,6 +155,10 @@ def send_message(current_user):
     else:
         if not data.get('content'):
             return jsonify({'error': 'Content required'}), 400
+        file_ids = data.get('file_ids') or []
+        if (not isinstance(file_ids, list) or len(file_ids) > MAX_MESSAGE_ATTACHMENTS
+                or not all(isinstance(i, int) and not isinstance(i, bool) for i in file_ids)):
+            return jsonify({'error': f'file_ids must be a list of at most {MAX_MESSAGE_ATTACHMENTS} file ids'}), 400
 
     conversation_id = data.get('conversation_id') if not is_guest else None
 
@@ -73,36 +170,37 @@ def send_message(current_user):
                 if not conversation:
                     return jsonify({'error': 'Conversation not found'}), 404
 
+            attachments = []
+            if file_ids:
+                attachments = UploadedFile.query.filter(
+                    UploadedFile.id.in_(file_ids), UploadedFile.user_id == user_id).all()
+                if len(attachments) != len(set(file_ids)):
+                    return jsonify({'error': 'File not found'}), 404
+
             # New conversation path
             if not conversation_id:
-                # Prefer AI service tool-calling for title; it falls back locally.
-                initial_title = ai_service.generate_title_via_tool(data['content'])
+                # Local title now; the AI title is generated off the critical path
+                initial_title = smart_title_from_first_message(data['content'])
                 conversation = Conversation(user_id=user_id, title=Conversation.normalize_title(initial_title))
                 db.session.add(conversation)
                 db.session.commit()
                 conversation_id = conversation.id
 
-            # Save user message
+            # Save user message as the new leaf of the branch being shown
             user_message = Message(
                 conversation_id=conversation_id,
                 content=data['content'],
-                role='user'
+                role='user',
+                parent_message_id=_branch_parent_id(conversation),
+                attachments=attachments
             )
             db.session.add(user_message)
+            db.session.flush()
+            conversation.active_leaf_id = user_message.id
             db.session.commit()
 
-            # Generate unique stream ID for AI response
-            stream_id = str(uuid.uuid4())
-
-            # Create stream in Redis
-            stream_manager.create_stream(stream_id, user_id, conversation_id)
-
-            # Enqueue AI processing asynchronously
-            try:
-                process_message_stream_task.delay(user_message.id, stream_id)
-            except Exception:
-                # Fallback to inline processing if Celery not available
-                ai_service.process_ai_task(user_message.id, stream_id)
+            new_title = conversation.title if data.get('conversation_id') is None else None
+            stream_id = _answer_in_background(user_message, user_id, new_title=new_title)
 
             payload = {
                 'status': 'processing_started',
@@ -114,23 +212,45 @@ def send_message(current_user):
 
             return jsonify(payload)
         else:
+            # Guest answers run on a bounded pool; shed load instead of queueing without limit
+            executor = get_guest_executor(current_app.config.get('GUEST_STREAM_WORKERS', 16),
+                                          current_app.config.get('GUEST_STREAM_QUEUE_DEPTH', 64))
+            if executor.full:
+                return _guest_capacity_response()
+
+            session_id = None
+            if guest_session_mode:
+                sessions = ai_service.guest_sessions
+                session_id = data.get('session_id')
+                if not sessions.is_valid_id(session_id):
+                    session_id = sessions.new_session_id()
+                # Stored with its answer once there is one; see _remember_guest_answer
+                messages = _prompt_window(sessions.window_with(session_id, 'user', data['content']))
+
             stream_id = str(uuid.uuid4())
             stream_manager.create_stream(stream_id, None, None)
 
-            def run_guest_stream(payload, sid):
+            def run_guest_stream(payload, sid, guest_session_id):
                 try:
-                    ai_service.process_guest_messages_stream(payload, sid)
+                    ai_service.process_guest_messages_stream(payload, sid, session_id=guest_session_id)
                 except Exception:
-                    pass
+                    logger.exception("Guest stream %s failed", sid)
 
-            messages_copy = copy.deepcopy(messages)
-            threading.Thread(target=run_guest_stream, args=(messages_copy, stream_id), daemon=True).start()
+            # The parsed request body belongs to this request; no copy needed
+            try:
+                executor.submit(run_guest_stream, messages, stream_id, session_id)
+            except GuestExecutorFull:
+                stream_manager.mark_stream_error(stream_id, 'Guest chat is at capacity')
+                return _guest_capacity_response()
 
-            return jsonify({
+            payload = {
                 'status': 'processing_started',
                 'message_id': None,
                 'stream_id': stream_id
-            })
+            }
+            if session_id:
+                payload['session_id'] = session_id
+            return jsonify(payload)
 
     except Exception as e:
         db.session.rollback()
@@ -161,9 +281,17 @@ def get_conversation_history(conversation_id):
         if not conversation:
             return jsonify({'error': 'Conversation not found'}), 404
         
-        messages = Message.query.filter_by(
-            conversation_id=conversation_id
-        ).order_by(Message.timestamp).all()
+        if conversation.active_leaf_id is not None:
+            # Only the branch being shown, with the alternatives of each turn
+            messages = load_branch(conversation.active_leaf_id)
+            siblings = sibling_ids(conversation_id, messages)
+            payload = [dict(msg.to_dict(), sibling_ids=siblings.get(msg.parent_message_id, [msg.id]))
+                       for msg in messages]
+        else:
+            messages = Message.query.filter_by(
+                conversation_id=conversation_id
+            ).order_by(Message.timestamp).all()
+            payload = [msg.to_dict() for msg in messages]
         
         return jsonify({
             'conversation': {
@@ -172,15 +300,121 @@ def get_conversation_history(conversation_id):
                 'created_at': conversation.created_at.isoformat(),
                 'updated_at': conversation.updated_at.isoformat() if conversation.updated_at else None,
                 'pinned': getattr(conversation, 'pinned', False),
-                'pinned_at': conversation.pinned_at.isoformat() if getattr(conversation, 'pinned_at', None) else None
+                'pinned_at': conversation.pinned_at.isoformat() if getattr(conversation, 'pinned_at', None) else None,
+                'active_leaf_id': conversation.active_leaf_id
             },
-            'messages': [msg.to_dict() for msg in messages]
+            'messages': payload
         })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@chat_bp.route('/messages/<int:message_id>/regenerate', methods=['POST'])
+@jwt_required()
+def regenerate_message(message_id):
+    """Answer a user turn again on a new branch.
+
+    ``message_id`` is the answer to replace, or the user message to answer
+    again. Earlier answers stay as siblings of the new one.
+    """
+    user_id = get_jwt_identity()
+
+    try:
+        message = _owned_message(message_id, user_id)
+        if not message:
+            return jsonify({'error': 'Message not found'}), 404
+        if message.role == 'assistant':
+            if message.status == 'streaming':
+                return jsonify({'error': 'Message is still being generated'}), 409
+            message = message.parent_message
+            if message is None or message.role != 'user':
+                return jsonify({'error': 'Only answers to a user message can be regenerated'}), 400
+
+        _show_branch(message.conversation, message.id)
+        db.session.commit()
+
+        stream_id = _answer_in_background(message, user_id)
+        return jsonify({'status': 'processing_started', 'message_id': message.id, 'stream_id': stream_id})
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@chat_bp.route('/messages/<int:message_id>/edit', methods=['POST'])
+@jwt_required()
+def edit_message(message_id):
+    """Branch the conversation with an edited copy of a user message and answer it.
+
+    Request: ``{"content": "..."}``. The new message is a sibling of
+    ``message_id`` with the same attachments; the original branch is kept.
+    """
+    user_id = get_jwt_identity()
+    data = request.get_json() or {}
+
+    if not isinstance(data.get('content'), str) or not data['content'].strip():
+        return jsonify({'error': 'Content required'}), 400
+
+    try:
+        message = _owned_message(message_id, user_id)
+        if not message:
+            return jsonify({'error': 'Message not found'}), 404
+        if message.role != 'user':
+            return jsonify({'error': 'Only user messages can be edited'}), 400
+
+        edited = Message(
+            conversation_id=message.conversation_id,
+            content=data['content'],
+            role='user',
+            parent_message_id=message.parent_message_id,
+            attachments=list(message.attachments)
+        )
+        db.session.add(edited)
+        db.session.flush()
+        _show_branch(message.conversation, edited.id)
+        db.session.commit()
+
+        stream_id = _answer_in_background(edited, user_id)
+        return jsonify({'status': 'processing_started', 'message_id': edited.id, 'stream_id': stream_id})
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@chat_bp.route('/conversations/<int:conversation_id>/branch', methods=['PUT'])
+@jwt_required()
+def switch_branch(conversation_id):
+    """Show the branch through a message. Body: { "message_id": int }
+
+    The newest message under ``message_id`` becomes the active leaf, so
+    picking a sibling from ``sibling_ids`` shows that alternative's latest turns.
+    """
+    user_id = get_jwt_identity()
+    data = request.get_json() or {}
+
+    message_id = data.get('message_id')
+    if not isinstance(message_id, int) or isinstance(message_id, bool):
+        return jsonify({'error': 'message_id required'}), 400
+
+    try:
+        conversation = Conversation.query.filter_by(id=conversation_id, user_id=user_id).first()
+        if not conversation:
+            return jsonify({'error': 'Conversation not found'}), 404
+        message = Message.query.filter_by(id=message_id, conversation_id=conversation_id).first()
+        if not message:
+            return jsonify({'error': 'Message not found'}), 404
+
+        _show_branch(conversation, newest_leaf(message.id))
+        db.session.commit()
+
+        return jsonify({'id': conversation.id, 'active_leaf_id': conversation.active_leaf_id})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
 @chat_bp.route('/conversations', methods=['GET'])
 @jwt_required()
 def get_user_conversations():
@@ -344,15 +578,44 @@ def chat_health_check():
         health_status['services']['database'] = f'error: {str(e)}'
 
     try:
-        # Check AI service (Gemini API key)
-        api_key = os.environ.get('GEMINI_API_KEY')
-        if api_key and ai_service.client:
+        # Check AI service (configured model provider)
+        if ai_service.provider is not None:
             health_status['services']['ai_service'] = 'healthy'
+            health_status['services']['ai_provider'] = ai_service.provider.name
         else:
             health_status['services']['ai_service'] = 'warning: API key not configured'
     except Exception as e:
         health_status['services']['ai_service'] = f'error: {str(e)}'
 
+    health_status['services']['redis_pools'] = redis_provider.stats()
+
+    try:
+        if ai_service.response_cache is not None and ai_service.response_cache.enabled:
+            health_status['services']['guest_response_cache'] = ai_service.response_cache.stats()
+    except Exception as e:
+        health_status['services']['guest_response_cache'] = f'error: {str(e)}'
+
+    try:
+        if ai_service.model_limiter is not None:
+            health_status['services']['model_limiter'] = ai_service.model_limiter.stats()
+    except Exception as e:
+        health_status['services']['model_limiter'] = f'error: {str(e)}'
+
+    try:
+        if ai_service.knowledge_base is not None:
+            health_status['services']['knowledge_base'] = ai_service.knowledge_base.stats()
+    except Exception as e:
+        health_status['services']['knowledge_base'] = f'error: {str(e)}'
+
+    guest_executor_stats = get_guest_executor_stats()
+    if guest_executor_stats is not None:
+        health_status['services']['guest_executor'] = guest_executor_stats
+
+    # Multiplexed SSE reader (only present once a viewer used it in this process)
+    fanout_stats = get_stream_fanout_stats()
+    if fanout_stats is not None:
+        health_status['services']['stream_fanout'] = fanout_stats
+
     # Check Celery worker availability (if configured)
     try:
         from app.tasks.ai import celery
@@ -373,3 +636,23 @@ def stream_ai_response_route(current_user, stream_id):
     """SSE endpoint for streaming AI responses."""
     current_user_id = current_user.id if current_user else None
     return stream_ai_response(stream_id, current_user_id)
+
+
+@chat_bp.route('/stream/<stream_id>/cancel', methods=['POST'])
+@optional_auth
+def cancel_stream_route(current_user, stream_id):
+    """Stop a running generation; the partial answer is kept as a cancelled message."""
+    current_user_id = current_user.id if current_user else None
+    stream_data = stream_manager.get_stream(stream_id)
+    if not stream_data:
+        return jsonify({'error': 'Stream not found'}), 404
+
+    stream_user_id = stream_data.get('user_id')
+    if stream_user_id is not None and str(stream_user_id) != str(current_user_id):
+        return jsonify({'error': 'Stream not found'}), 404
+
+    if stream_data.get('status') in ('complete', 'error', 'cancelled'):
+        return jsonify({'error': 'Stream already finished', 'status': stream_data['status']}), 409
+
+    stream_manager.request_cancel(stream_id)
+    return jsonify({'stream_id': stream_id, 'status': 'cancelling'}), 202
@@ -1,25 +1,26 @@
 """SSE streaming endpoint for real-time AI responses."""
-from flask import Response
+from flask import Response, current_app, request
+from app.core.extensions import redis_provider
 from app.core.stream_manager import StreamManager
-import redis
-import json
+from app.core.stream_fanout import get_stream_fanout
+from app.core.stream_codec import frame_entry
+from app.api.chat.sse_protocol import (
+    KEEP_ALIVE_FRAME, TERMINAL_EVENTS, format_data, format_event, parse_last_event_id,
+)
 import time
-import os
 
 
 def get_redis_client():
-    """Get Redis client instance."""
-    redis_url = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
-    return redis.from_url(redis_url, decode_responses=True)
+    """Get the Redis client for blocking XREAD consumers."""
+    return redis_provider.blocking_client
 
 
 def get_stream_manager():
     """Get StreamManager instance."""
-    redis_client = get_redis_client()
-    return StreamManager(redis_client)
+    return StreamManager(redis_provider.client)
 
 
-# Initialize Redis and StreamManager
+# Blocking reads use their own pool; state updates go through the shared one
 redis_client = get_redis_client()
 stream_manager = get_stream_manager()
 
@@ -37,81 +38,116 @@ def create_sse_response(stream_id: str, current_user_id=None):
         if current_user_id is None or str(stream_user_id) != str(current_user_id):
             return Response("Stream not found", status=404)
     
+    use_fanout = current_app.config.get('SSE_MULTIPLEXED_READER', False)
+    fanout_block_ms = current_app.config.get('SSE_FANOUT_BLOCK_MS', 1000)
+    keepalive_seconds = current_app.config.get('SSE_KEEPALIVE_SECONDS', 15)
+    # Reconnecting clients resume from their own last seen entry
+    last_event_id = parse_last_event_id(request.headers.get('Last-Event-ID'))
+
     def event_stream():
         events_key = stream_manager.get_events_key(stream_id)
-        last_id = stream_manager.get_last_id(stream_id) or '0-0'
+        # The shared server-side cursor is only a fallback for clients without one
+        last_id = last_event_id or stream_manager.get_last_id(stream_id) or '0-0'
+
+        # Optionally share one multi-key XREAD per process across all viewers
+        fanout = get_stream_fanout(redis_client, block_ms=fanout_block_ms) if use_fanout else None
+        subscription = fanout.subscribe(events_key, last_id) if fanout else None
+
+        def read_entries():
+            if subscription is not None:
+                return subscription.get(timeout=5)
+            # Block up to 5s waiting for new entries
+            results = redis_client.xread({events_key: last_id}, count=100, block=5000)
+            return [entry for _key, entries in results or [] for entry in entries]
         
+        # Cursor as last written to the stream state
+        saved_id = last_id
+
+        def save_cursor():
+            # Between throttled heartbeats the shared cursor lags; catch it up
+            nonlocal saved_id
+            if last_id == saved_id:
+                return
+            try:
+                stream_manager.set_last_id(stream_id, last_id)
+                saved_id = last_id
+            except Exception:
+                pass
+
+        finished = False
         try:
+            # A viewer is back; lets the producer drop a pending disconnect
+            stream_manager.add_viewer(stream_id)
+            stream_manager.publish_signal(stream_id, 'resume')
+
             # Send initial connection confirmation
-            yield f"data: {json.dumps({'type': 'connected', 'stream_id': stream_id})}\n\n"
+            yield format_event({'type': 'connected', 'stream_id': stream_id})
             
             # Listen for messages with timeout via XREAD
             start_time = time.time()
+            last_sent = start_time
             timeout = 300  # 5 minutes
             
             while True:
                 # Check timeout
                 if time.time() - start_time > timeout:
-                    yield f"data: {json.dumps({'type': 'timeout', 'message': 'Stream timeout'})}\n\n"
+                    yield format_event({'type': 'timeout', 'message': 'Stream timeout'})
                     break
-                # Block up to 5s waiting for new entries
-                results = redis_client.xread({events_key: last_id}, count=100, block=5000)
-                if not results:
-                    continue
-                for key, entries in results:
-                    for entry_id, fields in entries:
-                        # Expect a 'payload' field containing JSON
-                        payload = fields.get('payload') if isinstance(fields, dict) else None
-                        if not payload:
-                            continue
-                        try:
-                            data = json.loads(payload)
-                        except Exception:
-                            continue
-                        
-                        # Update last_id and stream activity
-                        last_id = entry_id.decode() if isinstance(entry_id, bytes) else str(entry_id)
-                        try:
-                            stream_manager.set_last_id(stream_id, last_id)
-                        except Exception:
-                            pass
-                        stream_manager.update_stream_activity(stream_id)
-                        
-                        # Forward message to client
-                        yield f"data: {json.dumps(data)}\n\n"
-                        
-                        # Check if stream is complete
-                        if data.get('type') in ['complete', 'error']:
-                            stream_manager.mark_stream_complete(stream_id)
-                            break
-                    else:
+                entries = read_entries()
+                if not entries and time.time() - last_sent >= keepalive_seconds:
+                    save_cursor()
+                    yield KEEP_ALIVE_FRAME
+                    last_sent = time.time()
+                for entry_id, fields in entries:
+                    # Entries already hold the JSON sent to the browser
+                    framed = frame_entry(fields)
+                    if framed is None:
                         continue
+                    event_type, data = framed
+                    
+                    # Stream activity and the shared cursor share one throttled write
+                    last_id = entry_id.decode() if isinstance(entry_id, bytes) else str(entry_id)
+                    if stream_manager.heartbeat(stream_id, last_id=last_id):
+                        saved_id = last_id
+                    
+                    # Forward message to client; the entry id lets it resume via Last-Event-ID
+                    yield format_data(data, last_id)
+                    last_sent = time.time()
+                    
+                    # Check if stream is complete
+                    if event_type in TERMINAL_EVENTS:
+                        save_cursor()
+                        # Errors and cancellations are recorded by the producer
+                        if event_type == 'complete':
+                            stream_manager.mark_stream_complete(stream_id)
+                        finished = True
+                        break
+                if finished:
                     break
                         
         except Exception as e:
             # Log error and send error message
-            yield f"data: {json.dumps({'type': 'error', 'message': f'Stream error: {str(e)}'})}\n\n"
+            yield format_event({'type': 'error', 'message': f'Stream error: {str(e)}'})
             
         finally:
             # CRITICAL: Always cleanup
+            if subscription is not None:
+                fanout.unsubscribe(subscription)
             try:
-                # Mark stream as disconnected if still active
-                stream_data = stream_manager.get_stream(stream_id)
-                if stream_data and stream_data['status'] == 'active':
-                    stream_data['status'] = 'disconnected'
-                    stream_data['disconnected_at'] = time.time()
-                    redis_client.hset(
-                        stream_manager.streams_key, 
-                        stream_id, 
-                        json.dumps(stream_data)
-                    )
+                # Other tabs may still be watching; only the last viewer to leave counts
+                remaining = stream_manager.remove_viewer(stream_id)
+                if not finished and remaining <= 0:
+                    # Mark stream as disconnected if still active
+                    stream_manager.mark_stream_disconnected(stream_id)
+                    # Producer stops after its grace period unless a viewer reconnects
+                    stream_manager.publish_signal(stream_id, 'disconnect')
             except Exception:
                 pass
     return Response(event_stream(), content_type='text/event-stream', headers={
         'Cache-Control': 'no-cache',
         'Connection': 'keep-alive',
         'Access-Control-Allow-Origin': '*',
-        'Access-Control-Allow-Headers': 'Cache-Control'
+        'Access-Control-Allow-Headers': 'Cache-Control, Last-Event-ID'
     })
 
 
@@ -0,0 +1,248 @@
+"""Asyncio SSE gateway for ``/chat/stream/<stream_id>``.
+
+Serves the same protocol as :mod:`app.api.chat.sse` as a plain ASGI
+application backed by ``redis.asyncio``. An idle viewer costs one suspended
+coroutine instead of a WSGI worker thread, and all viewers share one
+multi-key ``XREAD`` (see :class:`AsyncStreamFanout`), so a single process can
+hold thousands of open chats on a few pooled Redis connections. See
+``asgi.py`` for the entry point.
+"""
+import asyncio
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import redis.asyncio as aioredis
+from flask import Flask
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+
+from app.api.chat.sse_protocol import (
+    KEEP_ALIVE_FRAME, TERMINAL_EVENTS, format_data, format_event, parse_last_event_id,
+)
+from app.core.stream_codec import frame_entry
+from app.core.extensions import db, redis_provider
+from app.core.stream_fanout import AsyncStreamFanout
+from app.core.stream_manager import AsyncStreamManager
+from app.db.models.user import User
+
+
+STREAM_PATH = re.compile(r'^/chat/stream/(?P<stream_id>[^/]+)/?$')
+
+SSE_HEADERS = [
+    (b'content-type', b'text/event-stream'),
+    (b'cache-control', b'no-cache'),
+    (b'connection', b'keep-alive'),
+    (b'access-control-allow-origin', b'*'),
+    (b'access-control-allow-headers', b'Authorization, Cache-Control, Last-Event-ID'),
+]
+
+
+def sse_frame(data: dict, event_id: Optional[str] = None) -> bytes:
+    return format_event(data, event_id).encode('utf-8')
+
+
+class SSEGateway:
+    """ASGI app that streams Redis Stream events to SSE clients."""
+
+    def __init__(self, flask_app: Flask, redis_client: aioredis.Redis,
+                 timeout: Optional[float] = None, block_ms: Optional[int] = None):
+        self.flask_app = flask_app
+        self.redis = redis_client
+        self.stream_manager = AsyncStreamManager(redis_client)
+        self.timeout = timeout if timeout is not None else flask_app.config.get('STREAM_TIMEOUT', 300)
+        self.block_ms = block_ms if block_ms is not None else flask_app.config.get('SSE_FANOUT_BLOCK_MS', 1000)
+        self.keepalive_seconds = flask_app.config.get('SSE_KEEPALIVE_SECONDS', 15)
+        # One XREAD for every viewer of this process
+        self.fanout = AsyncStreamFanout(redis_client, block_ms=self.block_ms)
+        # Token checks query the database; keep them off the event loop
+        self.auth_executor = ThreadPoolExecutor(
+            max_workers=flask_app.config.get('SSE_GATEWAY_AUTH_WORKERS', 8), thread_name_prefix='sse-auth')
+        self.open_connections = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        match = STREAM_PATH.match(scope.get('path', ''))
+        if not match:
+            await self._plain_response(send, 404, b'Not found')
+            return
+        if scope['method'] == 'OPTIONS':
+            await self._plain_response(send, 204, b'')
+            return
+        if scope['method'] != 'GET':
+            await self._plain_response(send, 405, b'Method not allowed')
+            return
+
+        headers = {k.decode('latin-1'): v.decode('latin-1') for k, v in scope.get('headers', [])}
+        await self.stream(match.group('stream_id'), headers, receive, send)
+
+    async def stream(self, stream_id: str, headers: dict, receive, send) -> None:
+        """Authorize the viewer, then forward events until completion or disconnect."""
+        current_user_id = await asyncio.get_running_loop().run_in_executor(
+            self.auth_executor, self.resolve_user_id, headers)
+
+        stream_data = await self.stream_manager.get_stream(stream_id)
+        if not stream_data:
+            await self._plain_response(send, 404, b'Stream not found')
+            return
+
+        stream_user_id = stream_data.get('user_id')
+        if stream_user_id is not None:
+            if current_user_id is None or str(stream_user_id) != str(current_user_id):
+                await self._plain_response(send, 404, b'Stream not found')
+                return
+
+        await send({'type': 'http.response.start', 'status': 200, 'headers': SSE_HEADERS})
+
+        self.open_connections += 1
+        disconnected = asyncio.Event()
+        watcher = asyncio.create_task(self._watch_disconnect(receive, disconnected))
+        try:
+            last_event_id = parse_last_event_id(headers.get('last-event-id'))
+            async for frame in self.event_stream(stream_id, disconnected, last_event_id):
+                await send({'type': 'http.response.body', 'body': frame, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        except OSError:
+            # Client went away mid-write
+            pass
+        finally:
+            self.open_connections -= 1
+            watcher.cancel()
+
+    async def event_stream(self, stream_id: str, disconnected: Optional[asyncio.Event] = None,
+                           last_event_id: Optional[str] = None):
+        """Yield SSE frames for a stream; mirrors ``create_sse_response``."""
+        events_key = self.stream_manager.get_events_key(stream_id)
+        last_id = last_event_id or await self.stream_manager.get_last_id(stream_id) or '0-0'
+        disconnected = disconnected or asyncio.Event()
+        finished = False
+        subscription = None
+        gone = asyncio.ensure_future(disconnected.wait())
+        # Cursor as last written to the stream state
+        saved_id = last_id
+
+        try:
+            await self.stream_manager.add_viewer(stream_id)
+            await self.stream_manager.publish_signal(stream_id, 'resume')
+            subscription = self.fanout.subscribe(events_key, last_id)
+            yield sse_frame({'type': 'connected', 'stream_id': stream_id})
+
+            start_time = time.time()
+            last_sent = start_time
+            while not disconnected.is_set():
+                if time.time() - start_time > self.timeout:
+                    yield sse_frame({'type': 'timeout', 'message': 'Stream timeout'})
+                    break
+
+                read = asyncio.ensure_future(subscription.get(timeout=self.block_ms / 1000))
+                done, _ = await asyncio.wait({read, gone}, return_when=asyncio.FIRST_COMPLETED)
+                if read not in done:
+                    read.cancel()
+                    break
+
+                entries = read.result()
+                if not entries:
+                    if time.time() - last_sent >= self.keepalive_seconds:
+                        saved_id = await self._save_cursor(stream_id, last_id, saved_id)
+                        yield KEEP_ALIVE_FRAME.encode('utf-8')
+                        last_sent = time.time()
+                    continue
+                for entry_id, fields in entries:
+                    framed = frame_entry(fields)
+                    if framed is None:
+                        continue
+                    event_type, data = framed
+
+                    last_id = entry_id
+                    if await self.stream_manager.heartbeat(stream_id, last_id=last_id):
+                        saved_id = last_id
+
+                    yield format_data(data, last_id).encode('utf-8')
+                    last_sent = time.time()
+
+                    if event_type in TERMINAL_EVENTS:
+                        saved_id = await self._save_cursor(stream_id, last_id, saved_id)
+                        if event_type == 'complete':
+                            await self.stream_manager.mark_stream_complete(stream_id)
+                        finished = True
+                        break
+                if finished:
+                    break
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            yield sse_frame({'type': 'error', 'message': f'Stream error: {str(e)}'})
+
+        finally:
+            gone.cancel()
+            if subscription is not None:
+                self.fanout.unsubscribe(subscription)
+            try:
+                remaining = await self.stream_manager.remove_viewer(stream_id)
+                if not finished and remaining <= 0:
+                    await self.stream_manager.mark_stream_disconnected(stream_id)
+                    await self.stream_manager.publish_signal(stream_id, 'disconnect')
+            except Exception:
+                pass
+
+    async def _save_cursor(self, stream_id: str, last_id: str, saved_id: str) -> str:
+        """Catch the shared cursor up between throttled heartbeats; returns the id now stored."""
+        if last_id == saved_id:
+            return saved_id
+        try:
+            await self.stream_manager.set_last_id(stream_id, last_id)
+            return last_id
+        except Exception:
+            return saved_id
+
+    def resolve_user_id(self, headers: dict) -> Optional[int]:
+        """Apply the same optional JWT check as ``optional_auth``."""
+        with self.flask_app.test_request_context('/', headers=headers):
+            try:
+                verify_jwt_in_request(optional=True)
+                identity = get_jwt_identity()
+                if not identity:
+                    return None
+                user = db.session.get(User, identity)
+                return user.id if user else None
+            except Exception:
+                return None
+
+    @staticmethod
+    async def _watch_disconnect(receive, disconnected: asyncio.Event) -> None:
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                disconnected.set()
+                return
+
+    @staticmethod
+    async def _plain_response(send, status: int, body: bytes) -> None:
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'text/plain'),
+                                (b'access-control-allow-origin', b'*'),
+                                (b'access-control-allow-headers', b'Authorization, Cache-Control, Last-Event-ID')]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.fanout.stop()
+                self.auth_executor.shutdown(wait=False)
+                await self.redis.aclose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def create_sse_gateway(flask_app: Flask) -> SSEGateway:
+    """Build the gateway with its own asyncio Redis pool."""
+    return SSEGateway(flask_app, redis_provider.create_async_client())
@@ -0,0 +1,35 @@
+"""Wire-format helpers shared by the WSGI and ASGI SSE endpoints."""
+import json
+import re
+from typing import Optional
+
+
+_ENTRY_ID = re.compile(r'^\d+-\d+$')
+
+# Comment frame sent on idle connections so proxies keep them open
+KEEP_ALIVE_FRAME = ": keep-alive\n\n"
+
+# Event types after which the producer writes nothing more
+TERMINAL_EVENTS = ('complete', 'error', 'cancelled')
+
+
+def format_data(data: str, event_id: Optional[str] = None) -> str:
+    """Render one SSE frame from already serialized JSON; ``event_id`` becomes the ``id:`` field."""
+    frame = f"data: {data}\n\n"
+    if event_id:
+        frame = f"id: {event_id}\n{frame}"
+    return frame
+
+
+def format_event(data: dict, event_id: Optional[str] = None) -> str:
+    """Render one SSE frame for an event dict."""
+    return format_data(json.dumps(data), event_id)
+
+
+def parse_last_event_id(value: Optional[str]) -> Optional[str]:
+    """Validate a ``Last-Event-ID`` header as a Redis stream entry id."""
+    if not value:
+        return None
+    value = value.strip()
+    return value if _ENTRY_ID.match(value) else None
+
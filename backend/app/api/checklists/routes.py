@@ -1,6 +1,6 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.core.extensions import db
+from app.core.extensions import db, redis_provider
 from app.db.models.checklist import Checklist, Category, Item
 from app.db.models.file import UploadedFile
 from app.schemas.checklist import ChecklistSchema, CategorySchema, ItemSchema
@@ -9,6 +9,10 @@ from sqlalchemy.sql import func
 from sqlalchemy import or_
 from app.schemas.file import FileSchema
 from app.middleware.file_validation import validate_file_upload, log_file_operation
+from app.services.checklist_tools import checklist_snapshot_cache
+from app.services.document_index import index_file
+from app.services.document_service import prepare_upload
+from app.tasks.documents import schedule_index_embedding, schedule_text_extraction
 from app.core.file_utils import (
     secure_filename_custom,
     get_upload_path,
@@ -36,6 +40,22 @@ categories_schema = CategorySchema(many=True)
 item_schema = ItemSchema()
 items_schema = ItemSchema(many=True)
 
+# Per-user snapshots read by the chat's checklist tools
+checklist_snapshots = checklist_snapshot_cache(redis_provider.client)
+
+
+@checklists_bp.after_request
+def invalidate_checklist_snapshot(response):
+    """Every successful write changes what the user's snapshot should say."""
+    if request.method in ('POST', 'PUT', 'PATCH', 'DELETE') and 200 <= response.status_code < 300:
+        try:
+            user_id = get_jwt_identity()
+        except Exception:
+            user_id = None
+        if user_id is not None:
+            checklist_snapshots.invalidate(int(user_id))
+    return response
+
 # Helper function for user authorization
 def authorize_user_for_checklist(checklist_id, user_id):
     checklist = Checklist.query.filter_by(id=checklist_id, user_id=user_id).first()
@@ -43,6 +63,15 @@ def authorize_user_for_checklist(checklist_id, user_id):
         return None
     return checklist
 
+def _reindex(uploaded_files):
+    """Refresh index text inline; returns the ids to embed after the commit."""
+    return [uploaded_file.id for uploaded_file in uploaded_files if index_file(uploaded_file, embed=False)]
+
+def _checklist_files(*criteria):
+    """Files attached to items of the categories matching ``criteria``."""
+    return (UploadedFile.query.join(Item, UploadedFile.item_id == Item.id)
+            .join(Category, Item.category_id == Category.id).filter(*criteria).all())
+
 # Checklist routes
 @checklists_bp.route('/', methods=['POST'])
 @jwt_required()
@@ -148,9 +177,15 @@ def update_checklist(checklist_id):
     except ValidationError as err:
         return jsonify(err.messages), 422
 
+    title_changed = 'title' in data and data['title'] != checklist.title
     checklist.title = data.get('title', checklist.title)
     checklist.overall_deadline = data.get('overall_deadline', checklist.overall_deadline)
+    reindexed = []
+    if title_changed:
+        # The checklist title is part of each file's entry in the document index
+        reindexed = _reindex(_checklist_files(Category.checklist_id == checklist.id))
     db.session.commit()
+    schedule_index_embedding(reindexed)
     return jsonify(checklist_schema.dump(checklist))
 
 @checklists_bp.route('/<int:checklist_id>', methods=['DELETE'])
@@ -227,8 +262,14 @@ def update_category(category_id):
     except ValidationError as err:
         return jsonify(err.messages), 422
     
+    title_changed = 'title' in data and data['title'] != category.title
     category.title = data.get('title', category.title)
+    reindexed = []
+    if title_changed:
+        # The category title is part of each file's entry in the document index
+        reindexed = _reindex(_checklist_files(Category.id == category.id))
     db.session.commit()
+    schedule_index_embedding(reindexed)
     return jsonify(category_schema.dump(category))
 
 @checklists_bp.route('/categories/<int:category_id>', methods=['DELETE'])
@@ -295,10 +336,16 @@ def update_item(item_id):
     except ValidationError as err:
         return jsonify(err.messages), 422
     
+    title_changed = 'title' in data and data['title'] != item.title
     for key, value in data.items():
         setattr(item, key, value)
+    reindexed = []
+    if title_changed:
+        # The item title is part of each file's entry in the document index
+        reindexed = _reindex(item.uploaded_files)
         
     db.session.commit()
+    schedule_index_embedding(reindexed)
     return jsonify(item_schema.dump(item))
 
 @checklists_bp.route('/items/<int:item_id>', methods=['DELETE'])
@@ -385,9 +432,18 @@ def upload_item_file(item_id):
             content_type='checklist',
             uploaded_at=func.now()
         )
+        needs_extraction = prepare_upload(uploaded_file)
         
         db.session.add(uploaded_file)
+        db.session.flush()
+        # Indexed by name and checklist path now; extraction adds the text later
+        index_file(uploaded_file, embed=False)
         db.session.commit()
+        if needs_extraction:
+            # Embeds the entry once the text is in
+            schedule_text_extraction(uploaded_file.id)
+        else:
+            schedule_index_embedding([uploaded_file.id])
         
         # Return file info with item context
         file_schema = FileSchema()
@@ -513,7 +569,9 @@ def rename_item_file(item_id, file_id):
     # Update DB
     uploaded_file.file_path = new_path
     uploaded_file.original_filename = final_name
+    index_file(uploaded_file, embed=False)
     db.session.commit()
+    schedule_index_embedding([uploaded_file.id])
 
     file_schema = FileSchema()
     return jsonify({
@@ -6,6 +6,8 @@ import logging
 
 from app.core.extensions import db
 from app.db.models import UploadedFile
+from app.services.document_service import prepare_upload
+from app.tasks.documents import schedule_text_extraction
 from app.schemas.file import FileSchema, FileUploadSchema, FileListSchema
 from app.middleware.file_validation import (
     validate_file_upload, 
@@ -249,7 +251,9 @@ def list_files():
 def upload_chat_file():
     """
     Upload a file for chat purposes.
-    This endpoint is prepared for future chat integration.
+    PDF, DOCX and text files are extracted in the background (``text_status``
+    is 'pending' until then); send the returned id in ``file_ids`` on
+    /chat/send to let the model read it. Content extracted before is ready at once.
     """
     try:
         user_id = get_jwt_identity()
@@ -260,10 +264,6 @@ def upload_chat_file():
         file_size = file_data['file_size']
         mime_type = file_data['mime_type']
         
-        # Get additional form data
-        description = request.form.get('description', '')
-        tags = request.form.get('tags', '')
-        
         # Check user quota
         is_within_quota, quota_error = check_file_quota(user_id, file_size)
         if not is_within_quota:
@@ -291,14 +291,16 @@ def upload_chat_file():
             original_filename=file.filename,
             file_size=file_size,
             mime_type=mime_type,
-            description=description,
-            tags=tags,
             content_type='chat'
         )
+        needs_extraction = prepare_upload(uploaded_file)
         
         db.session.add(uploaded_file)
         db.session.commit()
         
+        if needs_extraction:
+            schedule_text_extraction(uploaded_file.id)
+        
         # Return file info suitable for LLM processing
         return jsonify({
             'message': 'Chat file uploaded successfully',
@@ -307,7 +309,7 @@ def upload_chat_file():
                 'filename': uploaded_file.original_filename,
                 'size': uploaded_file.file_size,
                 'mime_type': uploaded_file.mime_type,
-                'description': uploaded_file.description,
+                'text_status': uploaded_file.text_status,
                 'uploaded_at': uploaded_file.uploaded_at.isoformat() if uploaded_file.uploaded_at else None
             }
         }), 201
@@ -0,0 +1,98 @@
+"""``flask`` commands registered by :func:`app.create_app`."""
+import time
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from app.core.knowledge_base import (
+    DEFAULT_CHUNK_CHARS, DEFAULT_CHUNK_OVERLAP, KnowledgeBase, create_embedder, ingest, iter_documents,
+)
+from app.services.document_index import index_missing_files, search_user_documents
+
+
+kb_cli = AppGroup('kb', help='Build and query the visa knowledge base.')
+documents_cli = AppGroup('documents', help="Maintain the per-user index of checklist files.")
+
+
+def _embedder():
+    embedder = create_embedder(current_app.config.get('KB_EMBEDDER'))
+    if embedder is None:
+        raise click.ClickException('KB_EMBEDDER=gemini requires GEMINI_API_KEY')
+    return embedder
+
+
+def _knowledge_base():
+    return KnowledgeBase(current_app.config['KB_PATH'], _embedder(),
+                         max_segments=current_app.config.get('KB_MAX_SEGMENTS', 8))
+
+
+@kb_cli.command('ingest')
+@click.argument('directory', type=click.Path(exists=True, file_okay=False))
+@click.option('--chunk-chars', default=DEFAULT_CHUNK_CHARS, show_default=True, help='Maximum chunk length.')
+@click.option('--overlap', default=DEFAULT_CHUNK_OVERLAP, show_default=True,
+              help='Characters shared by consecutive windows of an over-long sentence.')
+def ingest_command(directory, chunk_chars, overlap):
+    """Chunk and embed the .txt/.md files under DIRECTORY into a new index version."""
+    path = current_app.config['KB_PATH']
+    started = time.monotonic()
+    result = ingest(directory, path, _embedder(), max_chars=chunk_chars, overlap=overlap)
+    click.echo(f"Indexed {result['chunks']} chunks from {result['documents']} documents "
+               f"into {path} ({result['version']}) in {time.monotonic() - started:.1f}s")
+
+
+@kb_cli.command('add')
+@click.argument('directory', type=click.Path(exists=True, file_okay=False))
+def add_command(directory):
+    """Add or replace the documents under DIRECTORY without rebuilding the index."""
+    result = _knowledge_base().add_documents(iter_documents(directory))
+    click.echo(f"Added {result['chunks']} chunks from {result['documents']} documents "
+               f"({result['replaced']} old chunks replaced)")
+
+
+@kb_cli.command('delete')
+@click.argument('sources', nargs=-1, required=True)
+def delete_command(sources):
+    """Remove the chunks of SOURCES (paths as stored at ingest)."""
+    click.echo(f"Deleted {_knowledge_base().delete_documents(sources)} chunks")
+
+
+@kb_cli.command('compact')
+def compact_command():
+    """Merge all segments and drop deleted chunks."""
+    result = _knowledge_base().compact()
+    click.echo(f"{result['chunks']} chunks in {result['segments']} segment(s)")
+
+
+@kb_cli.command('search')
+@click.argument('query')
+@click.option('-k', default=5, show_default=True, help='Number of passages.')
+def search_command(query, k):
+    """Print the passages the chat would retrieve for QUERY."""
+    for passage in _knowledge_base().search(query, k=k, min_score=-1.0):
+        cosine = '-' if passage.cosine is None else f'{passage.cosine:.3f}'
+        bm25 = '-' if passage.bm25 is None else f'{passage.bm25:.2f}'
+        click.echo(f"{passage.score:.4f}  cos {cosine}  bm25 {bm25}  {passage.source}  {passage.text[:100]}")
+
+
+@documents_cli.command('index')
+@click.option('--user-id', type=int, default=None, help='Only this user\'s files.')
+def index_documents_command(user_id):
+    """Index checklist files that have no entry, or one from another embedder."""
+    click.echo(f"Indexed {index_missing_files(user_id)} files")
+
+
+@documents_cli.command('search')
+@click.argument('user_id', type=int)
+@click.argument('query')
+def search_documents_command(user_id, query):
+    """Print the files of USER_ID the chat would list for QUERY."""
+    for hit in search_user_documents(user_id, query):
+        cosine = '-' if hit.cosine is None else f'{hit.cosine:.3f}'
+        bm25 = '-' if hit.bm25 is None else f'{hit.bm25:.2f}'
+        click.echo(f"{hit.score:.4f}  cos {cosine}  bm25 {bm25}  {hit.text.splitlines()[0]}")
+
+
+def register_commands(app) -> None:
+    app.cli.add_command(kb_cli)
+    app.cli.add_command(documents_cli)
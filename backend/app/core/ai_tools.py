@@ -55,6 +55,79 @@ def get_title_generation_tool() -> Dict[str, Any]:
     }
 
 
+def get_checklist_tools() -> Dict[str, Any]:
+    """Return the tools that read and update the user's checklists during a chat answer.
+
+    They run on the server for the signed-in user; see
+    ``app.services.checklist_tools.ChecklistTools``.
+    """
+
+    return {
+        "function_declarations": [
+            {
+                "name": "get_checklist_overview",
+                "description": (
+                    "Summarize the user's visa checklists: items done, pending and overdue, and the "
+                    "next deadline of each checklist."
+                ),
+                "parameters": {"type": "OBJECT", "properties": {}},
+            },
+            {
+                "name": "list_checklist_items",
+                "description": (
+                    "List the user's checklist items by status, optionally within one checklist or "
+                    "matching words in the item, category or checklist title."
+                ),
+                "parameters": {
+                    "type": "OBJECT",
+                    "properties": {
+                        "status": {
+                            "type": "STRING",
+                            "enum": ["pending", "overdue", "done", "all"],
+                            "description": (
+                                "'pending': not done and not past its deadline; 'overdue': not done "
+                                "and past its deadline; 'done'; or 'all'. Defaults to 'pending'."
+                            ),
+                        },
+                        "checklist_id": {"type": "INTEGER", "description": "Only items of this checklist."},
+                        "query": {"type": "STRING", "description": "Words to look for, e.g. 'passport'."},
+                        "limit": {"type": "INTEGER", "description": "Maximum items to return (default 20)."},
+                    },
+                },
+            },
+            {
+                "name": "mark_item_done",
+                "description": (
+                    "Mark one of the user's checklist items as done, or as not done again. Only call "
+                    "this when the user asks for it."
+                ),
+                "parameters": {
+                    "type": "OBJECT",
+                    "properties": {
+                        "item_id": {"type": "INTEGER", "description": "Id of the item, from list_checklist_items."},
+                        "done": {"type": "BOOLEAN", "description": "False to reopen the item. Defaults to true."},
+                    },
+                    "required": ["item_id"],
+                },
+            },
+            {
+                "name": "find_uploaded_documents",
+                "description": (
+                    "Search the files the user attached to checklist items, e.g. to check whether "
+                    "a bank statement was already uploaded."
+                ),
+                "parameters": {
+                    "type": "OBJECT",
+                    "properties": {
+                        "query": {"type": "STRING", "description": "What the document is, e.g. 'bank statement'."},
+                    },
+                    "required": ["query"],
+                },
+            },
+        ]
+    }
+
+
 def get_tools_spec() -> Dict[str, Any]:
     """Return the complete tools spec collection.
 
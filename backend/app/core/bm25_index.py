@@ -0,0 +1,139 @@
+"""Array-backed inverted index with BM25 scoring.
+
+Each knowledge-base segment stores its postings in CSR form::
+
+    terms.json          term strings, position = term id
+    term_offsets.npy    int64 [terms + 1]; postings of term t are [offsets[t], offsets[t + 1])
+    postings_doc.npy    int32 row ids, ascending within a term
+    postings_tf.npy     uint16 term frequencies
+    doc_len.npy         int32 tokens per row
+
+The arrays are memory-mapped, so opening a segment costs one JSON load for
+the vocabulary, and a query touches only the postings of its own terms.
+
+Visa questions hinge on exact tokens such as ``DS-160``, ``I-20`` or
+``H-1B``; :func:`tokenize` keeps those whole and also emits the joined form
+and the parts, so ``ds160`` and ``DS 160`` still match.
+"""
+import json
+import math
+import os
+import re
+from array import array
+from collections import Counter
+from typing import Dict, List
+
+import numpy as np
+
+
+DEFAULT_K1 = 1.2
+DEFAULT_B = 0.75
+_TERM = re.compile(r'\w+(?:[-/.]\w+)*', re.UNICODE)
+_SEPARATOR = re.compile(r'[-/.]')
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms; compound codes also yield their joined form and parts."""
+    tokens = []
+    for term in _TERM.findall(str(text).lower()):
+        tokens.append(term)
+        parts = _SEPARATOR.split(term)
+        if len(parts) > 1:
+            tokens.append(''.join(parts))
+            tokens.extend(part for part in parts if part)
+    return tokens
+
+
+def idf(df: int, live_docs: int) -> float:
+    """BM25 inverse document frequency (the always-positive Lucene variant)."""
+    return math.log(1.0 + (live_docs - df + 0.5) / (df + 0.5))
+
+
+def score_documents(documents: List[List[str]], query_terms: List[str],
+                    k1: float = DEFAULT_K1, b: float = DEFAULT_B) -> np.ndarray:
+    """BM25 of ``query_terms`` against a few tokenized documents held in memory.
+
+    For small per-user collections where building postings costs more than
+    scoring every document.
+    """
+    scores = np.zeros(len(documents), dtype=np.float32)
+    if not documents:
+        return scores
+    counts = [Counter(tokens) for tokens in documents]
+    lengths = np.array([len(tokens) for tokens in documents], dtype=np.float32)
+    norm = k1 * (1 - b + b * lengths / max(float(lengths.mean()), 1e-9))
+    for term in set(query_terms):
+        tf = np.array([count.get(term, 0) for count in counts], dtype=np.float32)
+        df = int(np.count_nonzero(tf))
+        if df:
+            scores += idf(df, len(documents)) * tf * (k1 + 1) / (tf + norm)
+    return scores
+
+
+class PostingsBuilder:
+    """Accumulates one segment's postings row by row, then writes the arrays."""
+
+    def __init__(self):
+        self.vocab: Dict[str, int] = {}
+        self._terms = array('q')
+        self._docs = array('i')
+        self._tfs = array('H')
+        self._doc_len = array('i')
+
+    def add(self, tokens: List[str]) -> None:
+        """Index the next row (row ids are assigned in call order)."""
+        doc = len(self._doc_len)
+        self._doc_len.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            self._terms.append(self.vocab.setdefault(term, len(self.vocab)))
+            self._docs.append(doc)
+            self._tfs.append(min(tf, 0xFFFF))
+
+    def save(self, directory: str) -> None:
+        term_ids = np.frombuffer(self._terms, dtype=np.int64)
+        # Stable sort keeps row ids ascending inside each posting list
+        order = np.argsort(term_ids, kind='stable')
+        offsets = np.zeros(len(self.vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(self.vocab)), out=offsets[1:])
+
+        np.save(os.path.join(directory, 'term_offsets.npy'), offsets)
+        np.save(os.path.join(directory, 'postings_doc.npy'),
+                np.frombuffer(self._docs, dtype=np.intc).astype(np.int32)[order])
+        np.save(os.path.join(directory, 'postings_tf.npy'), np.frombuffer(self._tfs, dtype=np.uint16)[order])
+        np.save(os.path.join(directory, 'doc_len.npy'), np.frombuffer(self._doc_len, dtype=np.intc).astype(np.int32))
+        with open(os.path.join(directory, 'terms.json'), 'w', encoding='utf-8') as handle:
+            json.dump(list(self.vocab), handle, ensure_ascii=False)
+
+
+class Postings:
+    """Read-only view of a segment's postings."""
+
+    def __init__(self, directory: str):
+        with open(os.path.join(directory, 'terms.json'), encoding='utf-8') as handle:
+            self.vocab = {term: i for i, term in enumerate(json.load(handle))}
+        self.offsets = np.load(os.path.join(directory, 'term_offsets.npy'), mmap_mode='r')
+        self.docs = np.load(os.path.join(directory, 'postings_doc.npy'), mmap_mode='r')
+        self.tfs = np.load(os.path.join(directory, 'postings_tf.npy'), mmap_mode='r')
+        self.doc_len = np.load(os.path.join(directory, 'doc_len.npy'), mmap_mode='r')
+        self.length_norm = None
+
+    def df(self, term: str) -> int:
+        tid = self.vocab.get(term)
+        return 0 if tid is None else int(self.offsets[tid + 1] - self.offsets[tid])
+
+    def prepare(self, avgdl: float, k1: float = DEFAULT_K1, b: float = DEFAULT_B) -> None:
+        """Precompute ``k1 * (1 - b + b * len / avgdl)`` for the corpus-wide ``avgdl``."""
+        self.k1 = k1
+        self.length_norm = (k1 * (1 - b + b * np.asarray(self.doc_len, dtype=np.float32) / max(avgdl, 1e-9))
+                            ).astype(np.float32)
+
+    def accumulate(self, term: str, weight: float, scores: np.ndarray) -> None:
+        """Add ``weight`` (the term's idf) times its BM25 saturation to ``scores``."""
+        tid = self.vocab.get(term)
+        if tid is None:
+            return
+        start, end = int(self.offsets[tid]), int(self.offsets[tid + 1])
+        docs = self.docs[start:end]
+        tf = self.tfs[start:end].astype(np.float32)
+        # Rows are unique within a posting list, so fancy-index += is exact
+        scores[docs] += weight * tf * (self.k1 + 1) / (tf + self.length_norm[docs])
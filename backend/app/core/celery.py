@@ -1,8 +1,20 @@
 """Celery configuration for background tasks."""
+import os
+
 from celery import Celery
 from flask import Flask
 
 
+def beat_schedule(stream_cleanup_interval: float) -> dict:
+    """Periodic tasks run by ``celery beat``."""
+    return {
+        'cleanup-expired-streams': {
+            'task': 'cleanup.expired_streams',
+            'schedule': stream_cleanup_interval,
+        },
+    }
+
+
 def make_celery(app: Flask) -> Celery:
     """Create Celery instance for Flask app."""
     celery = Celery(
@@ -22,11 +34,12 @@ def make_celery(app: Flask) -> Celery:
         task_track_started=True,
         task_time_limit=300,  # 5 minutes
         task_soft_time_limit=240,  # 4 minutes
+        beat_schedule=beat_schedule(app.config.get('STREAM_CLEANUP_INTERVAL_SECONDS', 60)),
     )
     # Ensure tasks are discoverable in workers
     try:
         celery.conf.update(
-            imports=(celery.conf.get('imports') or []) + ['app.tasks.ai', 'app.tasks.cleanup']
+            imports=(celery.conf.get('imports') or []) + ['app.tasks.ai', 'app.tasks.cleanup', 'app.tasks.documents']
         )
     except Exception:
         pass
@@ -50,6 +63,7 @@ def init_celery(app: Flask) -> Celery:
     # Import tasks to register them
     from app.tasks import cleanup  # noqa: F401
     from app.tasks import ai  # noqa: F401
+    from app.tasks import documents  # noqa: F401
     
     return celery
 
@@ -60,7 +74,6 @@ def get_celery_app():
     global celery
     if celery is None:
         # Create a minimal Celery app for workers
-        import os
         celery = Celery(
             'visamadeeasy',
             backend=os.environ.get('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0'),
@@ -75,11 +88,13 @@ def get_celery_app():
             task_track_started=True,
             task_time_limit=300,
             task_soft_time_limit=240,
+            beat_schedule=beat_schedule(float(os.environ.get('STREAM_CLEANUP_INTERVAL_SECONDS', 60))),
         )
         
         # Import tasks to register them
         from app.tasks import cleanup  # noqa: F401
         from app.tasks import ai  # noqa: F401
+        from app.tasks import documents  # noqa: F401
         try:
             celery.autodiscover_tasks(['app.tasks'])
         except Exception:
@@ -0,0 +1,80 @@
+"""Per-user checklist snapshots cached in Redis for chat tools.
+
+A snapshot is one user's checklists and items flattened into a JSON
+document: item title with its category and checklist titles, deadline,
+completion and file count. Chat tools read it instead of joining
+checklist, category, item and file rows in the middle of a model stream.
+
+Every checklist write bumps the user's generation counter. A snapshot is
+stored with the generation it was built under and is used only while that
+generation is current, so a write that lands while a snapshot is being
+built still invalidates it. Snapshots also expire after ``ttl_seconds``;
+the counter lives twice as long, so it cannot expire and restart while an
+older snapshot is still stored.
+"""
+import json
+import logging
+from typing import Callable
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = 300
+
+
+class ChecklistSnapshotCache:
+    """Read-through cache of checklist snapshots, keyed by user id."""
+
+    def __init__(self, redis_client: redis.Redis, build: Callable[[int], dict],
+                 prefix: str = 'checklist_snapshot:', ttl_seconds: int = DEFAULT_TTL_SECONDS):
+        self.redis = redis_client
+        self.build = build
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+
+    def get_key(self, user_id: int) -> str:
+        return f"{self.prefix}{user_id}"
+
+    def get_generation_key(self, user_id: int) -> str:
+        return f"{self.prefix}{user_id}:generation"
+
+    def get(self, user_id: int) -> dict:
+        """The user's snapshot, rebuilt from the database when missing or stale.
+
+        Without Redis every call builds a fresh snapshot.
+        """
+        try:
+            raw, generation = self.redis.mget(self.get_key(user_id), self.get_generation_key(user_id))
+        except redis.RedisError as e:
+            logger.warning("Checklist snapshot cache unavailable: %s", e)
+            return self.build(user_id)
+
+        generation = int(generation or 0)
+        if raw:
+            try:
+                stored = json.loads(raw)
+                if stored.get('generation') == generation:
+                    return stored['snapshot']
+            except (TypeError, ValueError, AttributeError):
+                pass
+
+        snapshot = self.build(user_id)
+        try:
+            self.redis.set(self.get_key(user_id), json.dumps({'generation': generation, 'snapshot': snapshot}),
+                           ex=self.ttl_seconds)
+        except redis.RedisError as e:
+            logger.warning("Could not cache checklist snapshot: %s", e)
+        return snapshot
+
+    def invalidate(self, user_id: int) -> None:
+        """Mark the user's snapshot stale; call after every committed checklist write."""
+        key = self.get_generation_key(user_id)
+        try:
+            pipe = self.redis.pipeline()
+            pipe.incr(key)
+            pipe.expire(key, 2 * self.ttl_seconds)
+            pipe.execute()
+        except redis.RedisError as e:
+            # Readers see the change once the snapshot expires
+            logger.warning("Could not invalidate checklist snapshot of user %s: %s", user_id, e)
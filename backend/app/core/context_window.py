@@ -0,0 +1,103 @@
+"""Token-budgeted conversation history for model prompts.
+
+Sending the whole conversation on every turn makes long consultations slower
+and more expensive each time. :func:`build_context` walks the history
+newest-first with a keyset query (``id < cursor`` on the
+``(conversation_id, id)`` index) and stops as soon as the budget is spent, so
+older messages are never fetched. Token counts come from
+``Message.token_count``, which is stored when the message is written.
+Turns already folded into the conversation summary are excluded with
+``after_id`` (see :mod:`app.core.conversation_summary`).
+
+Conversations with branches (see :mod:`app.core.message_tree`) use
+:func:`build_branch_context`, which walks parent links from the newest
+message instead of ids, so other branches never reach the prompt.
+"""
+from typing import List, Optional
+
+from sqlalchemy.orm import load_only
+
+from app.core.message_tree import branch_cte
+from app.db.models import Message
+
+
+DEFAULT_CONTEXT_TOKEN_BUDGET = 8000
+DEFAULT_PAGE_SIZE = 50
+# Role marker and turn separators the model adds around each message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def message_tokens(message: Message) -> int:
+    """Prompt cost of one message, estimating rows written before counts existed."""
+    count = message.token_count
+    if count is None:
+        count = Message.estimate_tokens(message.content)
+    return count + MESSAGE_OVERHEAD_TOKENS
+
+
+def build_context(conversation_id: int, up_to_id: int,
+                  budget_tokens: int = DEFAULT_CONTEXT_TOKEN_BUDGET,
+                  page_size: int = DEFAULT_PAGE_SIZE,
+                  after_id: Optional[int] = None) -> List[Message]:
+    """Most recent messages in ``(after_id, up_to_id]`` that fit ``budget_tokens``.
+
+    The newest message is always included even if it alone exceeds the
+    budget. Empty messages (e.g. a streaming placeholder) are skipped, and the
+    window never starts on an assistant turn. Returned oldest first.
+    """
+    selected: List[Message] = []
+    used = 0
+    cursor: Optional[int] = up_to_id + 1
+    while cursor is not None:
+        query = (Message.query
+                 .options(load_only(Message.id, Message.role, Message.content, Message.token_count))
+                 .filter(Message.conversation_id == conversation_id, Message.id < cursor))
+        if after_id is not None:
+            query = query.filter(Message.id > after_id)
+        page = query.order_by(Message.id.desc()).limit(page_size).all()
+        cursor = page[-1].id if len(page) == page_size else None
+        for message in page:
+            if not message.content:
+                continue
+            cost = message_tokens(message)
+            if selected and used + cost > budget_tokens:
+                cursor = None
+                break
+            selected.append(message)
+            used += cost
+
+    return _oldest_first(selected)
+
+
+def build_branch_context(leaf_id: int, budget_tokens: int = DEFAULT_CONTEXT_TOKEN_BUDGET,
+                         after_id: Optional[int] = None) -> List[Message]:
+    """Like :func:`build_context` for the branch ending at ``leaf_id``.
+
+    One recursive query fetches the path from ``leaf_id`` towards the root,
+    stopping at ``after_id`` or once the budget is spent.
+    """
+    path = branch_cte(leaf_id, after_id, budget_tokens, MESSAGE_OVERHEAD_TOKENS)
+    candidates = (Message.query
+                  .options(load_only(Message.id, Message.role, Message.content, Message.token_count))
+                  .join(path, Message.id == path.c.id)
+                  .order_by(Message.id.desc())
+                  .all())
+    selected: List[Message] = []
+    used = 0
+    for message in candidates:
+        if not message.content:
+            continue
+        cost = message_tokens(message)
+        if selected and used + cost > budget_tokens:
+            break
+        selected.append(message)
+        used += cost
+    return _oldest_first(selected)
+
+
+def _oldest_first(selected: List[Message]) -> List[Message]:
+    """Newest-first selection in prompt order, never starting on an assistant turn."""
+    selected.reverse()
+    while len(selected) > 1 and selected[0].role != 'user':
+        selected.pop(0)
+    return selected
@@ -0,0 +1,111 @@
+"""Rolling summaries of conversation turns that slid out of the prompt window.
+
+Older turns are folded into ``Conversation.summary`` by a background task;
+``summary_through_id`` records the last message folded in, so each run only
+reads messages after it and nothing is summarized twice. Prompts then carry
+the summary plus the recent window (:func:`app.core.context_window.build_context`
+with ``after_id=summary_through_id``), which bounds prompt size for
+long-lived conversations. In conversations with an active branch only the
+ancestors of the window are folded; a summary stops applying when the
+branch is switched away from ``summary_through_id``.
+"""
+from typing import List, Optional
+
+from sqlalchemy import func, select
+
+from app.core.extensions import db
+from app.core.message_tree import branch_cte
+from app.db.models import Conversation, Message
+
+
+# Summarize once at least this many unsummarized turns are outside the window
+DEFAULT_SUMMARY_MIN_MESSAGES = 10
+# Turns folded per summarizer call
+DEFAULT_SUMMARY_BATCH_SIZE = 200
+
+
+class Summarizer:
+    """Folds a batch of messages into the previous summary."""
+
+    def summarize(self, previous_summary: Optional[str], messages: List[Message]) -> str:
+        raise NotImplementedError
+
+
+class ModelSummarizer(Summarizer):
+    """Summarizer backed by the configured model provider."""
+
+    def __init__(self, provider, model_name: str):
+        self.provider = provider
+        self.model_name = model_name
+
+    def summarize(self, previous_summary: Optional[str], messages: List[Message]) -> str:
+        transcript = "\n".join(
+            f"{'User' if m.role == 'user' else 'Assistant'}: {m.content}" for m in messages
+        )
+        prompt = (
+            "You maintain a running summary of a visa consultation. Update the summary "
+            "with the new turns below. Keep facts the assistant will need later "
+            "(the user's situation, documents, dates, decisions and open questions). "
+            "Reply with the updated summary only.\n\n"
+            f"Current summary:\n{previous_summary or '(none)'}\n\n"
+            f"New turns:\n{transcript}"
+        )
+        return self.provider.generate(self.model_name, [{'role': 'user', 'text': prompt}]).strip()
+
+
+def _older_turns(conversation_id: int, before_id: int, through: Optional[int], branch: bool):
+    """Filter for unsummarized messages older than ``before_id``, on its branch if ``branch``."""
+    conditions = [Message.conversation_id == conversation_id, Message.id < before_id]
+    if through is not None:
+        conditions.append(Message.id > through)
+    if branch:
+        path = branch_cte(before_id, after_id=through)
+        conditions.append(Message.id.in_(select(path.c.id)))
+    return conditions
+
+
+def summary_due(conversation_id: int, summary_through_id: Optional[int], window_start_id: int,
+                min_messages: int = DEFAULT_SUMMARY_MIN_MESSAGES, branch: bool = False) -> bool:
+    """Whether at least ``min_messages`` unsummarized turns precede the window.
+
+    With ``branch`` only the window's ancestors count.
+    """
+    query = Message.query.with_entities(Message.id).filter(
+        *_older_turns(conversation_id, window_start_id, summary_through_id, branch))
+    return query.order_by(Message.id).offset(max(min_messages - 1, 0)).limit(1).first() is not None
+
+
+def fold_older_turns(conversation_id: int, before_id: int, summarizer: Summarizer,
+                     batch_size: int = DEFAULT_SUMMARY_BATCH_SIZE) -> int:
+    """Fold unsummarized messages older than ``before_id`` into the summary.
+
+    The summary is only written if ``summary_through_id`` has not moved since
+    it was read, so concurrent runs cannot fold the same turns twice. With an
+    active branch, ``before_id`` must be on it and only its ancestors are
+    folded. Returns the number of messages folded.
+    """
+    folded = 0
+    while True:
+        conversation = db.session.get(Conversation, conversation_id)
+        if conversation is None:
+            return folded
+        through = conversation.summary_through_id
+        branch = conversation.active_leaf_id is not None
+        query = Message.query.filter(*_older_turns(conversation_id, before_id, through, branch))
+        batch = query.order_by(Message.id).limit(batch_size).all()
+        if not batch:
+            return folded
+
+        turns = [m for m in batch if m.content]
+        summary = summarizer.summarize(conversation.summary, turns) if turns else conversation.summary
+        updated = Conversation.query.filter(
+            Conversation.id == conversation_id,
+            func.coalesce(Conversation.summary_through_id, 0) == (through or 0),
+        ).update({'summary': summary, 'summary_through_id': batch[-1].id}, synchronize_session=False)
+        db.session.commit()
+        if not updated:
+            # Another run moved the summary forward first
+            return folded
+        folded += len(batch)
+        if len(batch) < batch_size:
+            return folded
@@ -0,0 +1,227 @@
+"""Text extraction and a content-addressed chunk cache for chat uploads.
+
+Extraction streams: PDFs are read page by page with pypdf, dropping its
+parsed-object cache every few pages; DOCX bodies are parsed with
+``iterparse`` straight from the zip member; text files are read in blocks.
+Each page is chunked as it arrives and spooled to disk, so the extracted text
+never sits in memory as a whole (pypdf still keeps the cross-reference table
+and page tree, a few KiB per page).
+
+Chunks are cached under ``<root>/<embedder>/<sha[:2]>/<sha>/`` as a small
+knowledge-base index (cosine + BM25, see :mod:`app.core.knowledge_base`),
+keyed by the SHA-256 of the file content. A re-upload of the same bytes, or
+the same file attached in another conversation, reuses the entry without
+extracting again. Entries are built in a temporary directory and renamed into
+place, so a reader sees a complete entry or none.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import uuid
+import zipfile
+from typing import Iterable, Iterator, Optional, Tuple
+from xml.etree import ElementTree
+
+from app.core.knowledge_base import (
+    DEFAULT_CHUNK_CHARS, DEFAULT_CHUNK_OVERLAP, Embedder, IndexWriter, KnowledgeBase, chunk_text,
+)
+
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                                  'instance', 'documents')
+PDF_CACHE_PAGES = 16
+DOCX_PARAGRAPHS_PER_PAGE = 40
+TEXT_BLOCK_CHARS = 64 * 1024
+# Leading text kept in an entry's meta, e.g. for the per-user document index
+EXCERPT_CHARS = 600
+TEXT_SUFFIXES = ('.txt', '.md', '.markdown', '.csv')
+_WORD = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+
+class UnsupportedDocument(ValueError):
+    """The file type has no text extractor."""
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def document_kind(filename: str, mime_type: Optional[str] = None) -> Optional[str]:
+    """``'pdf'``, ``'docx'`` or ``'text'``; ``None`` when no extractor handles the file."""
+    name = (filename or '').lower()
+    mime_type = (mime_type or '').lower()
+    if name.endswith('.pdf') or mime_type == 'application/pdf':
+        return 'pdf'
+    if name.endswith('.docx') or mime_type.endswith('wordprocessingml.document'):
+        return 'docx'
+    if name.endswith(TEXT_SUFFIXES) or mime_type.startswith('text/'):
+        return 'text'
+    return None
+
+
+def iter_pdf_pages(path: str, cache_pages: int = PDF_CACHE_PAGES) -> Iterator[Tuple[int, str]]:
+    """Yield ``(page number, text)``; the reader's object cache is cleared every ``cache_pages``."""
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    for number in range(len(reader.pages)):
+        yield number + 1, reader.pages[number].extract_text() or ''
+        if number % cache_pages == cache_pages - 1:
+            # Fonts and content streams are re-resolved from the file on demand
+            reader.resolved_objects.clear()
+
+
+def iter_docx_pages(path: str, paragraphs_per_page: int = DOCX_PARAGRAPHS_PER_PAGE) -> Iterator[Tuple[int, str]]:
+    """Yield groups of ``paragraphs_per_page`` paragraphs; DOCX has no fixed pages."""
+    with zipfile.ZipFile(path) as archive, archive.open('word/document.xml') as stream:
+        body, paragraphs, number = None, [], 0
+        for event, element in ElementTree.iterparse(stream, events=('start', 'end')):
+            if event == 'start':
+                if element.tag == _WORD + 'body':
+                    body = element
+                continue
+            if element.tag == _WORD + 'tab':
+                element.tail = '\t' + (element.tail or '')
+            elif element.tag == _WORD + 'p':
+                text = ''.join(node.text or '' for node in element.iter(_WORD + 't')).strip()
+                element.clear()
+                if text:
+                    paragraphs.append(text)
+                if len(paragraphs) >= paragraphs_per_page:
+                    number += 1
+                    yield number, '\n\n'.join(paragraphs)
+                    paragraphs = []
+                    if body is not None:
+                        # Finished paragraphs stay attached to <w:body> unless dropped
+                        body.clear()
+        if paragraphs:
+            yield number + 1, '\n\n'.join(paragraphs)
+
+
+def iter_text_pages(path: str, block_chars: int = TEXT_BLOCK_CHARS) -> Iterator[Tuple[int, str]]:
+    """Yield blocks of about ``block_chars``, cut at paragraph breaks when possible.
+
+    Text without blank lines (CSV, logs) is cut at the last line break once
+    twice ``block_chars`` are pending, or hard if there is none, so at most
+    about three blocks are held and searched at a time.
+    """
+    with open(path, encoding='utf-8', errors='replace') as handle:
+        number, pending = 0, ''
+        for block in iter(lambda: handle.read(block_chars), ''):
+            pending += block
+            cut = pending.rfind('\n\n')
+            if cut <= 0 and len(pending) >= 2 * block_chars:
+                cut = pending.rfind('\n')
+                if cut <= 0:
+                    cut = len(pending)
+            if cut <= 0:
+                continue
+            number += 1
+            yield number, pending[:cut]
+            pending = pending[cut:]
+        if pending.strip():
+            yield number + 1, pending
+
+
+EXTRACTORS = {'pdf': iter_pdf_pages, 'docx': iter_docx_pages, 'text': iter_text_pages}
+
+
+def iter_pages(path: str, kind: str) -> Iterator[Tuple[int, str]]:
+    extractor = EXTRACTORS.get(kind)
+    if extractor is None:
+        raise UnsupportedDocument(f"No text extractor for {kind!r}")
+    return extractor(path)
+
+
+# How a chunk's position is cited: PDF pages are real, the other kinds are blocks
+PAGE_LABELS = {'pdf': 'p.', 'docx': 'part', 'text': 'part'}
+
+
+class DocumentChunkCache:
+    """Extracted chunks of uploaded files, keyed by content hash."""
+
+    def __init__(self, root: str, embedder: Embedder, top_k: int = 4):
+        self.root = os.path.join(root, re.sub(r'[^\w.-]', '_', embedder.signature))
+        self.embedder = embedder
+        self.top_k = top_k
+
+    def path(self, content_hash: str) -> str:
+        return os.path.join(self.root, content_hash[:2], content_hash)
+
+    def contains(self, content_hash: str) -> bool:
+        return os.path.exists(os.path.join(self.path(content_hash), 'meta.json'))
+
+    def meta(self, content_hash: str) -> Optional[dict]:
+        try:
+            with open(os.path.join(self.path(content_hash), 'meta.json')) as handle:
+                return json.load(handle)
+        except FileNotFoundError:
+            return None
+
+    def open(self, content_hash: str) -> Optional[KnowledgeBase]:
+        """Searchable index of a cached document, or ``None`` if it is not cached."""
+        if not self.contains(content_hash):
+            return None
+        # Entries never change, so there is nothing to reload
+        return KnowledgeBase(self.path(content_hash), self.embedder, top_k=self.top_k,
+                             min_score=0.0, reload_seconds=float('inf'))
+
+    def build(self, content_hash: str, pages: Iterable[Tuple[int, str]], label: str = 'p.',
+              batch_size: int = 256, max_chars: int = DEFAULT_CHUNK_CHARS,
+              overlap: int = DEFAULT_CHUNK_OVERLAP) -> dict:
+        """Chunk ``pages`` into a new cache entry; returns its meta.
+
+        Each chunk's source is ``'<label> <page>'``; chunks never span pages.
+        They are spooled to disk first because the index is sized up front.
+        """
+        final = self.path(content_hash)
+        staging = f'{final}.tmp-{uuid.uuid4().hex}'
+        os.makedirs(staging)
+        try:
+            spool = os.path.join(staging, 'spool.jsonl')
+            count = chars = last_page = 0
+            excerpt = ''
+            with open(spool, 'w', encoding='utf-8') as handle:
+                for number, text in pages:
+                    last_page = number
+                    if len(excerpt) < EXCERPT_CHARS:
+                        excerpt = (excerpt + '\n' + text.strip()).strip()[:EXCERPT_CHARS]
+                    for chunk in chunk_text(text, max_chars, overlap):
+                        handle.write(json.dumps([f'{label} {number}', chunk], ensure_ascii=False) + '\n')
+                        count += 1
+                        chars += len(chunk)
+
+            writer = IndexWriter(staging, self.embedder, count)
+            with open(spool, encoding='utf-8') as handle:
+                batch = []
+                for line in handle:
+                    batch.append(tuple(json.loads(line)))
+                    if len(batch) == batch_size:
+                        writer.add(batch, self.embedder.embed([text for _label, text in batch]))
+                        batch = []
+                if batch:
+                    writer.add(batch, self.embedder.embed([text for _label, text in batch]))
+            writer.commit()
+            os.remove(spool)
+
+            meta = {'sha256': content_hash, 'pages': last_page, 'chunks': count, 'chars': chars,
+                    'excerpt': excerpt}
+            with open(os.path.join(staging, 'meta.json'), 'w') as handle:
+                json.dump(meta, handle)
+            try:
+                os.rename(staging, final)
+            except OSError:
+                # Another worker finished the same content first; its entry is equivalent
+                if not self.contains(content_hash):
+                    raise
+                shutil.rmtree(staging, ignore_errors=True)
+            return meta
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
@@ -1,3 +1,8 @@
+import threading
+from typing import Optional
+
+import redis
+import redis.asyncio as aioredis
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
@@ -5,12 +10,161 @@ from flask_login import LoginManager
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 
+from config import Config
+
+
+_REDIS_SETTINGS = (
+    'REDIS_URL',
+    'REDIS_MAX_CONNECTIONS',
+    'REDIS_SOCKET_TIMEOUT',
+    'REDIS_SOCKET_CONNECT_TIMEOUT',
+    'REDIS_HEALTH_CHECK_INTERVAL',
+    'REDIS_BLOCKING_MAX_CONNECTIONS',
+    'REDIS_BLOCKING_POOL_TIMEOUT',
+    'REDIS_BLOCKING_SOCKET_TIMEOUT',
+)
+
+
+class RedisProvider:
+    """Process-wide Redis clients backed by two connection pools.
+
+    ``client`` serves regular commands from a bounded pool. ``blocking_client``
+    is for consumers that park a connection in ``XREAD BLOCK`` or pub/sub; its
+    pool makes callers wait for a free connection instead of failing.
+
+    Settings come from ``init_app`` or, for code running outside an app (Celery
+    tasks, module imports), from :class:`config.Config`. The client objects are
+    stable: reconfiguring swaps their pools, so module-level references stay
+    valid.
+    """
+
+    def __init__(self, app: Optional[Flask] = None):
+        self.settings = {name: getattr(Config, name) for name in _REDIS_SETTINGS}
+        self._lock = threading.Lock()
+        self._client: Optional[redis.Redis] = None
+        self._blocking_client: Optional[redis.Redis] = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        app.extensions['redis'] = self
+        settings = {name: app.config.get(name, self.settings[name]) for name in _REDIS_SETTINGS}
+        with self._lock:
+            if settings == self.settings:
+                return
+            self.settings = settings
+            if self._client is not None:
+                self._swap_pool(self._client, self._make_pool())
+            if self._blocking_client is not None:
+                self._swap_pool(self._blocking_client, self._make_blocking_pool())
+
+    @property
+    def client(self) -> redis.Redis:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = redis.Redis(connection_pool=self._make_pool())
+        return self._client
+
+    @property
+    def blocking_client(self) -> redis.Redis:
+        if self._blocking_client is None:
+            with self._lock:
+                if self._blocking_client is None:
+                    self._blocking_client = redis.Redis(connection_pool=self._make_blocking_pool())
+        return self._blocking_client
+
+    def create_async_client(self) -> aioredis.Redis:
+        """Asyncio client with the blocking-pool settings; pools are per event loop."""
+        pool = aioredis.BlockingConnectionPool.from_url(
+            self.settings['REDIS_URL'],
+            max_connections=self.settings['REDIS_BLOCKING_MAX_CONNECTIONS'],
+            timeout=self.settings['REDIS_BLOCKING_POOL_TIMEOUT'],
+            socket_timeout=self.settings['REDIS_BLOCKING_SOCKET_TIMEOUT'],
+            **self._common_kwargs(),
+        )
+        return aioredis.Redis(connection_pool=pool)
+
+    def stats(self) -> dict:
+        """Connection usage per pool that has been created."""
+        stats = {}
+        if self._client is not None:
+            stats['default'] = _pool_stats(self._client.connection_pool)
+        if self._blocking_client is not None:
+            stats['blocking'] = _pool_stats(self._blocking_client.connection_pool)
+        return stats
+
+    def _common_kwargs(self) -> dict:
+        return {
+            'decode_responses': True,
+            'socket_connect_timeout': self.settings['REDIS_SOCKET_CONNECT_TIMEOUT'],
+            'health_check_interval': self.settings['REDIS_HEALTH_CHECK_INTERVAL'],
+        }
+
+    def _make_pool(self) -> redis.ConnectionPool:
+        return redis.ConnectionPool.from_url(
+            self.settings['REDIS_URL'],
+            max_connections=self.settings['REDIS_MAX_CONNECTIONS'],
+            socket_timeout=self.settings['REDIS_SOCKET_TIMEOUT'],
+            **self._common_kwargs(),
+        )
+
+    def _make_blocking_pool(self) -> redis.BlockingConnectionPool:
+        return redis.BlockingConnectionPool.from_url(
+            self.settings['REDIS_URL'],
+            max_connections=self.settings['REDIS_BLOCKING_MAX_CONNECTIONS'],
+            timeout=self.settings['REDIS_BLOCKING_POOL_TIMEOUT'],
+            socket_timeout=self.settings['REDIS_BLOCKING_SOCKET_TIMEOUT'],
+            **self._common_kwargs(),
+        )
+
+    @staticmethod
+    def _swap_pool(client: redis.Redis, pool: redis.ConnectionPool) -> None:
+        old_pool = client.connection_pool
+        client.connection_pool = pool
+        old_pool.disconnect()
+
+
+def _pool_stats(pool: redis.ConnectionPool) -> dict:
+    """Pool usage for the health check.
+
+    redis-py has no public API for connection counts, so they are read from
+    pool internals; a count whose attribute a release does not have is
+    reported as ``None`` rather than failing the health check.
+    """
+    created = idle = in_use = None
+    if isinstance(pool, redis.BlockingConnectionPool):
+        connections = getattr(pool, '_connections', None)
+        idle_queue = getattr(getattr(pool, 'pool', None), 'queue', None)
+        if connections is not None:
+            created = len(connections)
+        if idle_queue is not None:
+            idle = sum(1 for conn in list(idle_queue) if conn is not None)
+        if created is not None and idle is not None:
+            in_use = created - idle
+    else:
+        created = getattr(pool, '_created_connections', None)
+        available = getattr(pool, '_available_connections', None)
+        checked_out = getattr(pool, '_in_use_connections', None)
+        if available is not None:
+            idle = len(available)
+        if checked_out is not None:
+            in_use = len(checked_out)
+    return {
+        'max_connections': getattr(pool, 'max_connections', None),
+        'created': created,
+        'in_use': in_use,
+        'idle': idle,
+    }
+
+
 # Initialize extensions
 db = SQLAlchemy()
 migrate = Migrate()
 login_manager = LoginManager()
 jwt = JWTManager()
 cors = CORS()
+redis_provider = RedisProvider()
 
 def init_extensions(app):
     """Initialize Flask extensions with the app."""
@@ -18,4 +172,5 @@ def init_extensions(app):
     migrate.init_app(app, db)
     login_manager.init_app(app)
     jwt.init_app(app)
-    cors.init_app(app)
\ No newline at end of file
+    cors.init_app(app)
+    redis_provider.init_app(app)
@@ -0,0 +1,110 @@
+"""Bounded per-process worker pool for guest chat streams.
+
+Guest answers are not persisted, so they are generated in the web process
+instead of a Celery task. Starting a thread per request let a burst of
+anonymous traffic create thousands of threads; :class:`GuestStreamExecutor`
+runs them on ``max_workers`` threads with at most ``max_queue`` more waiting,
+and rejects the rest so the route can answer 503 with ``Retry-After``.
+"""
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+
+
+DEFAULT_MAX_WORKERS = 16
+DEFAULT_MAX_QUEUE = 64
+
+
+class GuestExecutorFull(RuntimeError):
+    """Every worker is busy and the wait queue is at its bound."""
+
+
+class GuestStreamExecutor:
+    """Thread pool with a bounded backlog and occupancy counters."""
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS, max_queue: int = DEFAULT_MAX_QUEUE):
+        self.max_workers = max(int(max_workers), 1)
+        self.max_queue = max(int(max_queue), 0)
+        self.pid = os.getpid()
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='guest-stream')
+        self._capacity = threading.BoundedSemaphore(self.max_workers + self.max_queue)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._submitted = 0
+        self._rejected = 0
+
+    @property
+    def full(self) -> bool:
+        with self._lock:
+            return self._pending >= self.max_workers + self.max_queue
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """Schedule ``fn(*args)``; raises :class:`GuestExecutorFull` when at capacity."""
+        if not self._capacity.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise GuestExecutorFull("Guest chat is at capacity")
+        with self._lock:
+            self._pending += 1
+            self._submitted += 1
+        try:
+            return self._pool.submit(self._run, fn, args)
+        except Exception:
+            self._done()
+            raise
+
+    def _run(self, fn: Callable, args: tuple) -> None:
+        with self._lock:
+            self._running += 1
+        try:
+            fn(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+            self._done()
+
+    def _done(self) -> None:
+        with self._lock:
+            self._pending -= 1
+        self._capacity.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            running, pending = self._running, self._pending
+            submitted, rejected = self._submitted, self._rejected
+        return {
+            'max_workers': self.max_workers,
+            'max_queue': self.max_queue,
+            'running': running,
+            'queued': pending - running,
+            'occupancy': round(pending / (self.max_workers + self.max_queue), 4),
+            'submitted': submitted,
+            'rejected': rejected,
+        }
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._pool.shutdown(wait=wait)
+
+
+_executor: Optional[GuestStreamExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_guest_executor(max_workers: int = DEFAULT_MAX_WORKERS,
+                       max_queue: int = DEFAULT_MAX_QUEUE) -> GuestStreamExecutor:
+    """Return the process-wide guest executor, recreating it after a fork."""
+    global _executor
+    with _executor_lock:
+        if _executor is None or _executor.pid != os.getpid():
+            _executor = GuestStreamExecutor(max_workers, max_queue)
+        return _executor
+
+
+def get_guest_executor_stats() -> Optional[dict]:
+    """Stats of this process's executor, or ``None`` if no guest stream ran yet."""
+    executor = _executor
+    if executor is None or executor.pid != os.getpid():
+        return None
+    return executor.stats()
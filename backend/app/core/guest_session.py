@@ -0,0 +1,84 @@
+"""Server-side guest chat history in Redis.
+
+Guests used to resend the whole conversation on every ``/chat/send``, so
+request size and validation work grew with each turn. With a session the
+client sends only the new message: the prompt is built from the last
+``max_messages`` entries of a capped Redis list that expires after
+``ttl_seconds`` of inactivity, and the question is stored together with its
+answer, so a refused or failed send leaves no unanswered turn behind.
+"""
+import json
+import re
+import uuid
+from typing import List, Optional
+
+import redis
+
+
+DEFAULT_TTL_SECONDS = 2 * 3600
+DEFAULT_MAX_MESSAGES = 40
+_SESSION_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+class GuestSessionStore:
+    """Capped, expiring message lists keyed by an opaque session id."""
+
+    def __init__(self, redis_client: redis.Redis, prefix: str = 'guest_session:',
+                 ttl_seconds: int = DEFAULT_TTL_SECONDS, max_messages: int = DEFAULT_MAX_MESSAGES):
+        self.redis = redis_client
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages
+
+    @staticmethod
+    def new_session_id() -> str:
+        return uuid.uuid4().hex
+
+    @staticmethod
+    def is_valid_id(session_id) -> bool:
+        return isinstance(session_id, str) and bool(_SESSION_ID.match(session_id))
+
+    def get_key(self, session_id: str) -> str:
+        return f"{self.prefix}{session_id}"
+
+    def append(self, session_id: str, role: str, content: str, read: bool = False) -> Optional[List[dict]]:
+        """Append one message; see :meth:`extend`."""
+        return self.extend(session_id, [{'role': role, 'content': content}], read=read)
+
+    def extend(self, session_id: str, messages: List[dict], read: bool = False) -> Optional[List[dict]]:
+        """Append messages, trim to the cap and refresh the TTL in one round trip.
+
+        With ``read`` the capped window including the new messages is returned.
+        """
+        key = self.get_key(session_id)
+        pipe = self.redis.pipeline()
+        pipe.rpush(key, *(json.dumps(message, ensure_ascii=False) for message in messages))
+        pipe.ltrim(key, -self.max_messages, -1)
+        pipe.expire(key, self.ttl_seconds)
+        if read:
+            pipe.lrange(key, 0, -1)
+        results = pipe.execute()
+        return self._decode(results[-1]) if read else None
+
+    def window_with(self, session_id: str, role: str, content: str) -> List[dict]:
+        """The capped window as it would be after appending a message, without storing it."""
+        messages = self.window(session_id) + [{'role': role, 'content': content}]
+        return messages[-self.max_messages:]
+
+    def window(self, session_id: str) -> List[dict]:
+        return self._decode(self.redis.lrange(self.get_key(session_id), 0, -1))
+
+    def delete(self, session_id: str) -> None:
+        self.redis.delete(self.get_key(session_id))
+
+    @staticmethod
+    def _decode(entries) -> List[dict]:
+        messages = []
+        for raw in entries or []:
+            try:
+                message = json.loads(raw)
+            except (TypeError, ValueError):
+                continue
+            if isinstance(message, dict):
+                messages.append(message)
+        return messages
@@ -0,0 +1,674 @@
+"""Local retrieval index of visa guidance for retrieval-augmented answers.
+
+``flask kb ingest <dir>`` chunks the text documents under a directory, embeds
+every chunk and writes a new index version under ``KB_PATH``::
+
+    KB_PATH/
+      CURRENT                name of the live version, replaced atomically
+      v<timestamp>/
+        manifest.json        embedder signature, generation, live segments
+        seg-<timestamp>/
+          vectors.npy        float32 [count, dim], rows L2-normalized
+          chunks.jsonl       one {"source", "text"} object per chunk
+          offsets.npy        int64 [count + 1] byte offsets into chunks.jsonl
+          documents.json     source -> row ranges, for deletes
+          deleted-<gen>.npy  tombstone mask, once rows were deleted
+          terms.json, term_offsets.npy, postings_*.npy, doc_len.npy
+                             BM25 postings (see :mod:`app.core.bm25_index`)
+
+Readers memory-map the arrays and only read the chunk text of the hits, so a
+worker's resident memory does not grow with the corpus. A query is one
+matrix-vector product per segment for the cosine ranking plus the postings of
+its terms for the BM25 ranking; the two are fused by reciprocal rank. Exact
+tokens such as form numbers (DS-160) are found by BM25 even when the
+embedding misses them. Segments are immutable: adds write a new segment,
+deletes write a new tombstone mask, and readers notice a new manifest within
+``reload_seconds``.
+
+The embedder is pluggable: ``hash`` is a deterministic feature-hashing
+embedder that needs no network (and is what tests use); ``gemini`` uses the
+Gemini embeddings API. Select one with ``KB_EMBEDDER``.
+"""
+import hashlib
+import json
+import os
+import fcntl
+import re
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.bm25_index import Postings, PostingsBuilder, idf as bm25_idf, tokenize
+
+
+DEFAULT_KB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                               'instance', 'kb')
+DEFAULT_HASH_DIM = 256
+DEFAULT_CHUNK_CHARS = 1000
+DEFAULT_CHUNK_OVERLAP = 150
+DEFAULT_TOP_K = 4
+DEFAULT_MIN_SCORE = 0.2
+DEFAULT_RRF_K = 60
+DEFAULT_MAX_SEGMENTS = 8
+MANIFEST = 'manifest.json'
+DOCUMENT_SUFFIXES = ('.txt', '.md', '.markdown')
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+class Embedder:
+    """Maps texts to L2-normalized float32 vectors of a fixed dimension."""
+
+    name = ''
+    dim = 0
+
+    @property
+    def signature(self) -> str:
+        """Identifies the vector space; an index only answers queries from the same one."""
+        return f'{self.name}:{self.dim}'
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+
+class HashEmbedder(Embedder):
+    """Signed feature hashing of words and word bigrams.
+
+    Deterministic across processes (blake2b, not ``hash()``), so an index
+    built offline matches queries in every worker.
+    """
+
+    name = 'hash'
+
+    def __init__(self, dim: int = DEFAULT_HASH_DIM):
+        self.dim = int(dim)
+
+    @staticmethod
+    @lru_cache(maxsize=1 << 16)
+    def _feature(token: str) -> Tuple[int, float]:
+        digest = int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'little')
+        return digest >> 1, 1.0 if digest & 1 else -1.0
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = _TOKEN.findall(str(text).lower())
+            for token in words + [f'{a} {b}' for a, b in zip(words, words[1:])]:
+                slot, sign = self._feature(token)
+                vectors[row, slot % self.dim] += sign
+        return normalize(vectors)
+
+
+class GeminiEmbedder(Embedder):
+    """Embeddings from the Gemini API (``client.models.embed_content``)."""
+
+    name = 'gemini'
+    batch_size = 100
+
+    def __init__(self, client, model: str = 'text-embedding-004', dim: int = 768):
+        self.client = client
+        self.model = model
+        self.dim = int(dim)
+
+    @property
+    def signature(self):
+        return f'{self.name}/{self.model}:{self.dim}'
+
+    def embed(self, texts):
+        rows = []
+        for start in range(0, len(texts), self.batch_size):
+            result = self.client.models.embed_content(model=self.model,
+                                                      contents=list(texts[start:start + self.batch_size]))
+            rows.extend(embedding.values for embedding in result.embeddings)
+        return normalize(np.asarray(rows, dtype=np.float32).reshape(len(texts), self.dim))
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length in place; all-zero rows stay zero."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+def create_embedder(name: Optional[str] = None) -> Optional[Embedder]:
+    """Embedder selected by ``name`` (default ``KB_EMBEDDER``, else ``hash``).
+
+    Returns ``None`` for ``gemini`` without ``GEMINI_API_KEY``; unknown names
+    raise ``ValueError``.
+    """
+    name = (name or os.environ.get('KB_EMBEDDER') or 'hash').lower()
+    if name == 'hash':
+        return HashEmbedder(int(os.environ.get('KB_EMBEDDING_DIM', DEFAULT_HASH_DIM)))
+    if name == 'gemini':
+        api_key = os.environ.get('GEMINI_API_KEY')
+        if not api_key:
+            return None
+        from google import genai
+
+        return GeminiEmbedder(genai.Client(api_key=api_key),
+                              model=os.environ.get('KB_EMBEDDING_MODEL', 'text-embedding-004'))
+    raise ValueError(f"Unknown KB embedder: {name}")
+
+
+def chunk_text(text: str, max_chars: int = DEFAULT_CHUNK_CHARS,
+               overlap: int = DEFAULT_CHUNK_OVERLAP) -> List[str]:
+    """Pack paragraphs into chunks of at most ``max_chars``.
+
+    Paragraphs that are too long on their own are split on sentence ends, and
+    a sentence that is still too long is cut into windows overlapping by
+    ``overlap`` characters.
+    """
+    pieces = []
+    for paragraph in re.split(r'\n\s*\n', text):
+        paragraph = ' '.join(paragraph.split())
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        for sentence in _SENTENCE_END.split(paragraph):
+            step = max(max_chars - overlap, 1)
+            pieces.extend(sentence[i:i + max_chars] for i in range(0, max(len(sentence) - overlap, 1), step))
+
+    chunks, current = [], ''
+    for piece in pieces:
+        if current and len(current) + 1 + len(piece) > max_chars:
+            chunks.append(current)
+            current = ''
+        current = f'{current} {piece}' if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def iter_documents(directory: str) -> Iterator[Tuple[str, str]]:
+    """Yield ``(relative path, text)`` for the text documents under ``directory``."""
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for filename in sorted(files):
+            if not filename.lower().endswith(DOCUMENT_SUFFIXES):
+                continue
+            path = os.path.join(root, filename)
+            with open(path, encoding='utf-8', errors='replace') as handle:
+                yield os.path.relpath(path, directory), handle.read()
+
+
+class Passage:
+    """A retrieved chunk with its fused score and the scores of each ranking that found it."""
+
+    def __init__(self, text: str, source: str, score: float,
+                 cosine: Optional[float] = None, bm25: Optional[float] = None):
+        self.text = text
+        self.source = source
+        self.score = score
+        self.cosine = cosine
+        self.bm25 = bm25
+
+    def __repr__(self):
+        return f'<Passage {self.source} {self.score:.4f}>'
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List], k: int = DEFAULT_RRF_K) -> List[Tuple[object, float]]:
+    """Fuse rankings by summing ``1 / (k + rank)`` per key; best first.
+
+    Only ranks are used, so cosine similarities and BM25 scores need no
+    common scale.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+def _top(scores: np.ndarray, depth: int) -> np.ndarray:
+    """Indices of the ``depth`` highest scores, best first."""
+    depth = min(depth, len(scores))
+    if depth <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(scores, -depth)[-depth:] if depth < len(scores) else np.arange(len(scores))
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+def _segment_name() -> str:
+    return f'seg-{time.time_ns()}'
+
+
+def _write_json(path: str, data: dict) -> None:
+    """Write ``path`` atomically so readers never see a partial file."""
+    with open(path + '.tmp', 'w', encoding='utf-8') as handle:
+        json.dump(data, handle)
+    os.replace(path + '.tmp', path)
+
+
+def _read_current(path: str) -> Optional[str]:
+    try:
+        with open(os.path.join(path, 'CURRENT')) as handle:
+            return handle.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _switch_current(path: str, version: str) -> None:
+    """Point ``CURRENT`` at ``version`` and drop older versions."""
+    pointer = os.path.join(path, 'CURRENT')
+    with open(pointer + '.tmp', 'w') as handle:
+        handle.write(version)
+    os.replace(pointer + '.tmp', pointer)
+    # Readers that still map an old version keep it alive until they reload
+    for name in os.listdir(path):
+        if name.startswith('v') and name != version:
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+
+class SegmentWriter:
+    """Writes one immutable segment: vectors, chunk texts, BM25 postings and a source map.
+
+    ``count`` must be known up front because ``vectors.npy`` is preallocated
+    and filled batch by batch through a writable memory map.
+    """
+
+    def __init__(self, directory: str, dim: int, count: int):
+        os.makedirs(directory)
+        self.directory = directory
+        self.count = int(count)
+        self.vectors = np.lib.format.open_memmap(os.path.join(directory, 'vectors.npy'), mode='w+',
+                                                 dtype=np.float32, shape=(self.count, dim))
+        self.offsets = np.zeros(self.count + 1, dtype=np.int64)
+        self.postings = PostingsBuilder()
+        # source -> [[first row, end row), ...]; chunks of a document are added together
+        self.documents = {}
+        self._chunks = open(os.path.join(directory, 'chunks.jsonl'), 'wb')
+        self.written = 0
+
+    def add(self, chunks: List[Tuple[str, str]], vectors: np.ndarray) -> None:
+        """Append ``(source, text)`` chunks with their normalized vectors."""
+        end = self.written + len(chunks)
+        if end > self.count:
+            raise ValueError(f"Segment was sized for {self.count} chunks")
+        self.vectors[self.written:end] = vectors
+        for i, (source, text) in enumerate(chunks, start=self.written):
+            self._chunks.write(json.dumps({'source': source, 'text': text}, ensure_ascii=False).encode('utf-8'))
+            self._chunks.write(b'\n')
+            self.offsets[i + 1] = self._chunks.tell()
+            self.postings.add(tokenize(text))
+            ranges = self.documents.setdefault(source, [])
+            if ranges and ranges[-1][1] == i:
+                ranges[-1][1] = i + 1
+            else:
+                ranges.append([i, i + 1])
+        self.written = end
+
+    def close(self) -> dict:
+        """Flush every file; returns the segment's manifest entry."""
+        if self.written != self.count:
+            raise ValueError(f"Expected {self.count} chunks, got {self.written}")
+        self._chunks.close()
+        self.vectors.flush()
+        del self.vectors
+        np.save(os.path.join(self.directory, 'offsets.npy'), self.offsets)
+        self.postings.save(self.directory)
+        with open(os.path.join(self.directory, 'documents.json'), 'w', encoding='utf-8') as handle:
+            json.dump(self.documents, handle, ensure_ascii=False)
+        return {'name': os.path.basename(self.directory), 'count': self.count, 'live': self.count,
+                'deleted': None}
+
+
+class IndexWriter:
+    """Builds a new index version holding one segment; :meth:`commit` makes it the live one."""
+
+    def __init__(self, path: str, embedder: Embedder, count: int):
+        self.path = path
+        self.version = f'v{time.time_ns()}'
+        self.directory = os.path.join(path, self.version)
+        self.signature = embedder.signature
+        self.dim = embedder.dim
+        self.segment = SegmentWriter(os.path.join(self.directory, _segment_name()), embedder.dim, count)
+
+    def add(self, chunks: List[Tuple[str, str]], vectors: np.ndarray) -> None:
+        self.segment.add(chunks, vectors)
+
+    def commit(self) -> str:
+        """Write the manifest, switch ``CURRENT`` to this version and drop older versions."""
+        entry = self.segment.close()
+        _write_json(os.path.join(self.directory, MANIFEST), {
+            'embedder': self.signature, 'dim': self.dim, 'generation': 1,
+            'segments': [entry] if entry['count'] else [], 'created_at': time.time(),
+        })
+        _switch_current(self.path, self.version)
+        return self.directory
+
+
+def ingest(directory: str, path: str, embedder: Embedder, max_chars: int = DEFAULT_CHUNK_CHARS,
+           overlap: int = DEFAULT_CHUNK_OVERLAP, batch_size: int = 256) -> dict:
+    """Chunk and embed every document under ``directory`` into a new index at ``path``."""
+    chunks = [(source, chunk)
+              for source, text in iter_documents(directory)
+              for chunk in chunk_text(text, max_chars, overlap)]
+    writer = IndexWriter(path, embedder, len(chunks))
+    for start in range(0, len(chunks), batch_size):
+        batch = chunks[start:start + batch_size]
+        writer.add(batch, embedder.embed([text for _source, text in batch]))
+    writer.commit()
+    return {'documents': len({source for source, _text in chunks}), 'chunks': len(chunks),
+            'version': writer.version}
+
+
+class _Segment:
+    """One opened, read-only segment."""
+
+    def __init__(self, directory: str, entry: dict):
+        self.name = entry['name']
+        self.count = entry['count']
+        self.vectors = np.load(os.path.join(directory, 'vectors.npy'), mmap_mode='r')
+        self.offsets = np.load(os.path.join(directory, 'offsets.npy'), mmap_mode='r')
+        self.postings = Postings(directory)
+        # Held open so a reader keeps working after compaction removes the directory
+        self._chunks = open(os.path.join(directory, 'chunks.jsonl'), 'rb')
+        self.deleted = np.load(os.path.join(directory, entry['deleted'])) if entry.get('deleted') else None
+
+    def chunk(self, row: int) -> dict:
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return json.loads(os.pread(self._chunks.fileno(), end - start, start))
+
+    def live_rows(self) -> np.ndarray:
+        return np.arange(self.count) if self.deleted is None else np.flatnonzero(~self.deleted)
+
+    def live_tokens(self) -> int:
+        doc_len = self.postings.doc_len
+        return int(doc_len.sum() - (doc_len[self.deleted].sum() if self.deleted is not None else 0))
+
+
+class _Index:
+    """One opened index version: its segments and corpus-wide BM25 statistics."""
+
+    def __init__(self, directory: str):
+        with open(os.path.join(directory, MANIFEST)) as handle:
+            self.manifest = json.load(handle)
+        self.segments = [_Segment(os.path.join(directory, entry['name']), entry)
+                         for entry in self.manifest['segments']]
+        self.live = sum(entry['live'] for entry in self.manifest['segments'])
+        # Document frequencies include deleted rows until compaction, as in Lucene
+        avgdl = sum(segment.live_tokens() for segment in self.segments) / max(self.live, 1)
+        for segment in self.segments:
+            segment.postings.prepare(avgdl)
+
+
+class KnowledgeBase:
+    """Hybrid retrieval over the live index version at ``path``.
+
+    Cosine similarity and BM25 each rank up to ``depth`` candidates across all
+    segments; the two rankings are merged with reciprocal rank fusion.
+    Documents are added and deleted incrementally: an add writes a new segment,
+    a delete writes a tombstone mask, and once there are more than
+    ``max_segments`` segments they are merged into one. Writers serialize on a
+    file lock; readers notice a new manifest within ``reload_seconds``.
+    """
+
+    def __init__(self, path: str, embedder: Embedder, top_k: int = DEFAULT_TOP_K,
+                 min_score: float = DEFAULT_MIN_SCORE, reload_seconds: float = 30.0,
+                 rrf_k: int = DEFAULT_RRF_K, max_segments: int = DEFAULT_MAX_SEGMENTS):
+        self.path = path
+        self.embedder = embedder
+        self.top_k = top_k
+        self.min_score = min_score
+        self.reload_seconds = reload_seconds
+        self.rrf_k = rrf_k
+        self.max_segments = max_segments
+        self._lock = threading.Lock()
+        self._key = None
+        self._index: Optional[_Index] = None
+        self._checked = float('-inf')
+
+    @classmethod
+    def from_env(cls) -> Optional['KnowledgeBase']:
+        """Knowledge base at ``KB_PATH``; ``None`` when disabled or without an embedder.
+
+        Until ``flask kb ingest`` has built an index, searches return nothing.
+        """
+        embedder = create_embedder() if os.environ.get('KB_ENABLED', 'true').lower() == 'true' else None
+        if embedder is None:
+            return None
+        return cls(os.environ.get('KB_PATH') or DEFAULT_KB_PATH, embedder,
+                   top_k=int(os.environ.get('KB_TOP_K', DEFAULT_TOP_K)),
+                   min_score=float(os.environ.get('KB_MIN_SCORE', DEFAULT_MIN_SCORE)),
+                   reload_seconds=float(os.environ.get('KB_RELOAD_SECONDS', 30)),
+                   max_segments=int(os.environ.get('KB_MAX_SEGMENTS', DEFAULT_MAX_SEGMENTS)))
+
+    def _current(self) -> Optional[_Index]:
+        now = time.monotonic()
+        if now - self._checked < self.reload_seconds:
+            return self._index
+        with self._lock:
+            if now - self._checked < self.reload_seconds:
+                return self._index
+            self._checked = now
+            try:
+                version = _read_current(self.path)
+                if version is None:
+                    return self._index
+                directory = os.path.join(self.path, version)
+                manifest = os.stat(os.path.join(directory, MANIFEST))
+                key = (version, manifest.st_ino, manifest.st_mtime_ns)
+                if key != self._key:
+                    index = _Index(directory)
+                    if index.manifest.get('embedder') != self.embedder.signature:
+                        raise ValueError(f"Index was built with {index.manifest.get('embedder')}, "
+                                         f"queries use {self.embedder.signature}")
+                    self._index, self._key = index, key
+            except (OSError, ValueError, KeyError):
+                # No index yet, a half-deleted version or a mismatched embedder: keep what we have
+                pass
+            return self._index
+
+    @property
+    def count(self) -> int:
+        index = self._current()
+        return 0 if index is None else index.live
+
+    def search(self, query: str, k: Optional[int] = None, min_score: Optional[float] = None,
+               depth: Optional[int] = None) -> List[Passage]:
+        """The ``k`` best chunks for ``query`` by fused rank.
+
+        Vector candidates need a cosine of at least ``min_score``; BM25
+        candidates need at least one matching term.
+        """
+        index = self._current()
+        k = self.top_k if k is None else k
+        if index is None or index.live == 0 or k <= 0 or not query or not query.strip():
+            return []
+        min_score = self.min_score if min_score is None else min_score
+        depth = depth or max(4 * k, 20)
+
+        dense = self._vector_ranking(index, query, depth, min_score)
+        sparse = self._bm25_ranking(index, query, depth)
+        fused = reciprocal_rank_fusion([list(dense), list(sparse)], self.rrf_k)
+
+        passages = []
+        for (s, row), score in fused[:k]:
+            chunk = index.segments[s].chunk(row)
+            passages.append(Passage(chunk['text'], chunk['source'], score,
+                                    cosine=dense.get((s, row)), bm25=sparse.get((s, row))))
+        return passages
+
+    def _vector_ranking(self, index: _Index, query: str, depth: int, min_score: float) -> dict:
+        """``{(segment, row): cosine}`` of the best ``depth`` rows, best first."""
+        vector = self.embedder.embed([query])[0]
+        hits = []
+        for s, segment in enumerate(index.segments):
+            scores = segment.vectors @ vector
+            if segment.deleted is not None:
+                scores[segment.deleted] = -np.inf
+            for row in _top(scores, depth):
+                if scores[row] < min_score:
+                    break
+                hits.append((float(scores[row]), s, int(row)))
+        hits.sort(key=lambda hit: hit[0], reverse=True)
+        return {(s, row): score for score, s, row in hits[:depth]}
+
+    def _bm25_ranking(self, index: _Index, query: str, depth: int) -> dict:
+        """``{(segment, row): bm25}`` of the best ``depth`` rows, best first."""
+        weights = {}
+        for term in set(tokenize(query)):
+            df = sum(segment.postings.df(term) for segment in index.segments)
+            if df:
+                weights[term] = bm25_idf(df, index.live)
+        if not weights:
+            return {}
+        hits = []
+        for s, segment in enumerate(index.segments):
+            scores = np.zeros(segment.count, dtype=np.float32)
+            for term, weight in weights.items():
+                segment.postings.accumulate(term, weight, scores)
+            if segment.deleted is not None:
+                scores[segment.deleted] = 0
+            for row in _top(scores, depth):
+                if scores[row] <= 0:
+                    break
+                hits.append((float(scores[row]), s, int(row)))
+        hits.sort(key=lambda hit: hit[0], reverse=True)
+        return {(s, row): score for score, s, row in hits[:depth]}
+
+    def stats(self) -> dict:
+        index = self._current()
+        if index is None:
+            return {'enabled': True, 'chunks': 0, 'version': None}
+        return {'enabled': True, 'chunks': index.live, 'segments': len(index.segments),
+                'version': self._key[0], 'generation': index.manifest.get('generation'),
+                'embedder': index.manifest.get('embedder')}
+
+    # Incremental updates
+
+    @contextmanager
+    def _write_lock(self):
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, '.lock'), 'w') as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _open_for_write(self) -> Tuple[str, dict]:
+        version = _read_current(self.path)
+        if version is None:
+            writer = IndexWriter(self.path, self.embedder, 0)
+            writer.commit()
+            version = writer.version
+        directory = os.path.join(self.path, version)
+        with open(os.path.join(directory, MANIFEST)) as handle:
+            manifest = json.load(handle)
+        if manifest.get('embedder') != self.embedder.signature:
+            raise ValueError(f"Index was built with {manifest.get('embedder')}; "
+                             f"re-ingest to switch to {self.embedder.signature}")
+        return directory, manifest
+
+    def _commit(self, directory: str, manifest: dict, stale: List[str]) -> None:
+        """Publish ``manifest``, then remove files no segment refers to any more."""
+        for entry in manifest['segments']:
+            if not entry['live']:
+                stale.append(os.path.join(directory, entry['name']))
+        manifest['segments'] = [entry for entry in manifest['segments'] if entry['live']]
+        manifest['generation'] += 1
+        _write_json(os.path.join(directory, MANIFEST), manifest)
+        for path in stale:
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.exists(path):
+                os.remove(path)
+        # Let this process see its own write on the next search
+        self._checked = float('-inf')
+
+    def _tombstone(self, directory: str, manifest: dict, sources: set, stale: List[str]) -> int:
+        """Mark every chunk of ``sources`` deleted; returns how many rows were newly deleted."""
+        removed = 0
+        for entry in manifest['segments']:
+            segment_dir = os.path.join(directory, entry['name'])
+            with open(os.path.join(segment_dir, 'documents.json'), encoding='utf-8') as handle:
+                documents = json.load(handle)
+            ranges = [span for source in sources for span in documents.get(source, ())]
+            if not ranges:
+                continue
+            if entry['deleted']:
+                deleted = np.load(os.path.join(segment_dir, entry['deleted']))
+            else:
+                deleted = np.zeros(entry['count'], dtype=bool)
+            before = int(deleted.sum())
+            for first, end in ranges:
+                deleted[first:end] = True
+            newly = int(deleted.sum()) - before
+            if not newly:
+                continue
+            if entry['deleted']:
+                stale.append(os.path.join(segment_dir, entry['deleted']))
+            entry['deleted'] = f"deleted-{manifest['generation'] + 1}.npy"
+            np.save(os.path.join(segment_dir, entry['deleted']), deleted)
+            entry['live'] = entry['count'] - before - newly
+            removed += newly
+        return removed
+
+    def add_documents(self, documents: Iterable[Tuple[str, str]], max_chars: int = DEFAULT_CHUNK_CHARS,
+                      overlap: int = DEFAULT_CHUNK_OVERLAP, batch_size: int = 256) -> dict:
+        """Index ``(source, text)`` documents in a new segment, replacing earlier versions of a source."""
+        documents = list(documents)
+        chunks = [(source, chunk) for source, text in documents for chunk in chunk_text(text, max_chars, overlap)]
+        with self._write_lock():
+            directory, manifest = self._open_for_write()
+            stale = []
+            replaced = self._tombstone(directory, manifest, {source for source, _text in documents}, stale)
+            if chunks:
+                writer = SegmentWriter(os.path.join(directory, _segment_name()), self.embedder.dim, len(chunks))
+                for start in range(0, len(chunks), batch_size):
+                    batch = chunks[start:start + batch_size]
+                    writer.add(batch, self.embedder.embed([text for _source, text in batch]))
+                manifest['segments'].append(writer.close())
+            self._commit(directory, manifest, stale)
+            if len(manifest['segments']) > self.max_segments:
+                self._merge(directory, manifest)
+        return {'documents': len(documents), 'chunks': len(chunks), 'replaced': replaced}
+
+    def delete_documents(self, sources: Iterable[str]) -> int:
+        """Delete every chunk of ``sources``; returns the number of chunks removed."""
+        with self._write_lock():
+            directory, manifest = self._open_for_write()
+            stale = []
+            removed = self._tombstone(directory, manifest, set(sources), stale)
+            if removed:
+                self._commit(directory, manifest, stale)
+        return removed
+
+    def compact(self) -> dict:
+        """Merge all segments into one without deleted rows."""
+        with self._write_lock():
+            directory, manifest = self._open_for_write()
+            self._merge(directory, manifest)
+        return {'segments': len(manifest['segments']), 'chunks': sum(e['live'] for e in manifest['segments'])}
+
+    def _merge(self, directory: str, manifest: dict, batch_size: int = 4096) -> None:
+        # Vectors are copied, not re-embedded; postings are rebuilt from the chunk text
+        stale = [os.path.join(directory, entry['name']) for entry in manifest['segments']]
+        live = sum(entry['live'] for entry in manifest['segments'])
+        writer = SegmentWriter(os.path.join(directory, _segment_name()), self.embedder.dim, live)
+        for entry in manifest['segments']:
+            segment = _Segment(os.path.join(directory, entry['name']), entry)
+            rows = segment.live_rows()
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                chunks = [segment.chunk(int(row)) for row in batch]
+                writer.add([(chunk['source'], chunk['text']) for chunk in chunks], segment.vectors[batch])
+        manifest['segments'] = [writer.close()]
+        self._commit(directory, manifest, stale)
+
+
+def format_passages(passages: Iterable[Passage]) -> Optional[str]:
+    """System-instruction block citing the retrieved passages, or ``None``."""
+    lines = [f'[{n}] ({p.source}) {p.text}' for n, p in enumerate(passages, start=1)]
+    if not lines:
+        return None
+    return ("Reference passages from the visa knowledge base. Prefer them over memory "
+            "and say so when they do not answer the question:\n" + '\n'.join(lines))
@@ -0,0 +1,250 @@
+"""Model providers behind :class:`app.services.ai_service.AIService`.
+
+A provider covers the three ways the service talks to a model: streaming
+generation, one-shot generation and forced function calls. Messages use a
+neutral ``{'role': 'user' | 'model', 'text': str}`` shape; each provider maps
+it to its SDK. With tools, a streamed answer may also yield
+:class:`FunctionCall` items; the caller runs them and streams again with two
+more messages, ``{'role': 'model', 'function_call': {'name', 'args'}}`` and
+``{'role': 'tool', 'name': str, 'response': dict}``.
+
+``gemini`` wraps ``google.genai``. ``fake`` is a deterministic local model
+with configurable time to first token, throughput, chunk size and error rate,
+so the whole send → Celery → Redis → SSE pipeline can be load-tested without
+network access or quota. Select one with ``AI_PROVIDER``.
+"""
+import hashlib
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+
+class FunctionCall:
+    """A function call requested by the model."""
+
+    def __init__(self, name: str, args: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.args = args or {}
+
+    def __repr__(self):
+        return f'<FunctionCall {self.name}>'
+
+
+class LLMProvider:
+    """Interface implemented by every model provider."""
+
+    name = ''
+
+    def stream(self, model: str, messages: List[dict], system_instruction: Optional[str] = None,
+               tools: Optional[Dict[str, Any]] = None) -> Iterator[Union[str, FunctionCall]]:
+        """Yield text chunks, and function calls when ``tools`` are offered.
+
+        Closing the iterator must abandon the request.
+        """
+        raise NotImplementedError
+
+    def generate(self, model: str, messages: List[dict],
+                 system_instruction: Optional[str] = None) -> str:
+        """Return the complete answer text."""
+        raise NotImplementedError
+
+    def call_function(self, model: str, messages: List[dict],
+                      tools: Dict[str, Any]) -> Optional[FunctionCall]:
+        """Force a call to one of ``tools``; ``None`` if the model made none."""
+        raise NotImplementedError
+
+
+class GeminiProvider(LLMProvider):
+    """Provider backed by a ``google.genai`` client (or anything shaped like one)."""
+
+    name = 'gemini'
+
+    def __init__(self, client):
+        self.client = client
+
+    @staticmethod
+    def _contents(messages: List[dict]) -> list:
+        from google.genai import types
+
+        contents = []
+        for m in messages:
+            if m.get('function_call'):
+                part = types.Part.from_function_call(name=m['function_call']['name'],
+                                                     args=m['function_call'].get('args') or {})
+                contents.append(types.Content(role='model', parts=[part]))
+            elif m['role'] == 'tool':
+                part = types.Part.from_function_response(name=m['name'], response=m['response'])
+                contents.append(types.Content(role='tool', parts=[part]))
+            else:
+                contents.append(types.Content(role='user' if m['role'] == 'user' else 'model',
+                                              parts=[types.Part.from_text(text=str(m['text']))]))
+        return contents
+
+    @staticmethod
+    def _function_call(call) -> FunctionCall:
+        args = getattr(call, "args", None)
+        # Some SDK versions surface args as a mapping-like proto
+        try:
+            args = dict(args) if args is not None else {}
+        except Exception:
+            args = {}
+        return FunctionCall(getattr(call, 'name', '') or '', args)
+
+    def stream(self, model, messages, system_instruction=None, tools=None):
+        request = {'model': model, 'contents': self._contents(messages)}
+        config = {}
+        if system_instruction:
+            config['system_instruction'] = system_instruction
+        if tools:
+            config['tools'] = [tools]
+        if config:
+            request['config'] = config
+        response = self.client.models.generate_content_stream(**request)
+        try:
+            for chunk in response:
+                for call in getattr(chunk, 'function_calls', None) or []:
+                    yield self._function_call(call)
+                text = getattr(chunk, 'text', None)
+                if text:
+                    yield text
+        finally:
+            # Dropping the SDK iterator cancels the upstream request
+            close = getattr(response, 'close', None)
+            if close is not None:
+                close()
+
+    def generate(self, model, messages, system_instruction=None):
+        request = {'model': model, 'contents': self._contents(messages)}
+        if system_instruction:
+            request['config'] = {'system_instruction': system_instruction}
+        resp = self.client.models.generate_content(**request)
+        return getattr(resp, 'text', None) or ''
+
+    def call_function(self, model, messages, tools):
+        resp = self.client.models.generate_content(
+            model=model,
+            contents=self._contents(messages),
+            config={
+                "tools": [tools],
+                # Ensure it may produce a function call
+                "tool_config": {"function_calling_config": {"mode": "ANY"}},
+            },
+        )
+        fcalls = getattr(resp, "function_calls", None)
+        if not fcalls:
+            return None
+        return self._function_call(fcalls[0])
+
+
+class FakeProviderError(RuntimeError):
+    """Injected failure of the fake provider."""
+
+
+_FAKE_VOCABULARY = (
+    "visa passport embassy appointment application form student residence permit "
+    "insurance documents bank statement proof of funds enrollment letter photo "
+    "translation apostille fee interview biometrics renewal deadline consulate "
+    "the a for with your you need to and of in on before after days weeks"
+).split()
+
+
+class FakeProvider(LLMProvider):
+    """Deterministic local model for tests and load tests.
+
+    The answer depends only on the last user message, so repeated runs stream
+    identical text. Timing follows ``ttft_ms`` and ``tokens_per_sec`` with
+    ``chunk_tokens`` words per chunk; ``error_rate`` of the requests fail
+    before their first token, drawn from a generator seeded with ``seed``.
+    """
+
+    name = 'fake'
+
+    def __init__(self, ttft_ms: float = 300.0, tokens_per_sec: float = 60.0, chunk_tokens: int = 3,
+                 error_rate: float = 0.0, answer_tokens: int = 120, seed: int = 0, sleep=time.sleep):
+        self.ttft_ms = ttft_ms
+        self.tokens_per_sec = tokens_per_sec
+        self.chunk_tokens = max(int(chunk_tokens), 1)
+        self.error_rate = error_rate
+        self.answer_tokens = answer_tokens
+        self.sleep = sleep
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'FakeProvider':
+        return cls(
+            ttft_ms=float(os.environ.get('FAKE_LLM_TTFT_MS', 300)),
+            tokens_per_sec=float(os.environ.get('FAKE_LLM_TOKENS_PER_SEC', 60)),
+            chunk_tokens=int(os.environ.get('FAKE_LLM_CHUNK_TOKENS', 3)),
+            error_rate=float(os.environ.get('FAKE_LLM_ERROR_RATE', 0)),
+            answer_tokens=int(os.environ.get('FAKE_LLM_ANSWER_TOKENS', 120)),
+            seed=int(os.environ.get('FAKE_LLM_SEED', 0)),
+        )
+
+    def answer_words(self, messages: List[dict]) -> List[str]:
+        prompt = next((m['text'] for m in reversed(messages) if m['role'] == 'user'), '')
+        digest = hashlib.sha256(str(prompt).encode('utf-8')).digest()
+        rng = random.Random(digest)
+        return [rng.choice(_FAKE_VOCABULARY) for _ in range(self.answer_tokens)]
+
+    def _maybe_fail(self) -> None:
+        if self.error_rate <= 0:
+            return
+        with self._rng_lock:
+            failed = self._rng.random() < self.error_rate
+        if failed:
+            raise FakeProviderError("Fake provider injected error")
+
+    def _chunk_delay(self, tokens: int) -> float:
+        return tokens / self.tokens_per_sec if self.tokens_per_sec > 0 else 0.0
+
+    def stream(self, model, messages, system_instruction=None, tools=None):
+        words = self.answer_words(messages)
+        self.sleep(self.ttft_ms / 1000.0)
+        self._maybe_fail()
+        for start in range(0, len(words), self.chunk_tokens):
+            piece = words[start:start + self.chunk_tokens]
+            if start:
+                self.sleep(self._chunk_delay(len(piece)))
+            yield ' '.join(piece) + ' '
+
+    def generate(self, model, messages, system_instruction=None):
+        words = self.answer_words(messages)
+        self.sleep(self.ttft_ms / 1000.0 + self._chunk_delay(len(words)))
+        self._maybe_fail()
+        return ' '.join(words)
+
+    def call_function(self, model, messages, tools):
+        declarations = (tools or {}).get('function_declarations') or []
+        if not declarations:
+            return None
+        self.sleep(self.ttft_ms / 1000.0)
+        self._maybe_fail()
+        declaration = declarations[0]
+        prompt = next((m['text'] for m in reversed(messages) if m['role'] == 'user'), '')
+        words = str(prompt).split()[-6:]
+        properties = (declaration.get('parameters') or {}).get('properties') or {}
+        args = {name: ' '.join(words) for name, spec in properties.items()
+                if str(spec.get('type', '')).upper() == 'STRING'}
+        return FunctionCall(declaration['name'], args)
+
+
+def create_provider(name: Optional[str] = None) -> Optional[LLMProvider]:
+    """Provider selected by ``name`` (default ``AI_PROVIDER``).
+
+    Returns ``None`` when the Gemini provider has no API key configured.
+    Unknown names raise ``ValueError``.
+    """
+    name = (name or os.environ.get('AI_PROVIDER') or 'gemini').lower()
+    if name == 'fake':
+        return FakeProvider.from_env()
+    if name == 'gemini':
+        api_key = os.environ.get('GEMINI_API_KEY')
+        if not api_key:
+            return None
+        from google import genai
+
+        return GeminiProvider(genai.Client(api_key=api_key))
+    raise ValueError(f"Unknown AI provider: {name}")
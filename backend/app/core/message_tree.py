@@ -0,0 +1,91 @@
+"""Branches of a conversation's message tree.
+
+Messages form a tree through ``parent_message_id``: editing a user turn or
+regenerating an answer adds a sibling instead of overwriting, and
+``Conversation.active_leaf_id`` points at the newest message of the branch
+being shown. History and prompts are the root-to-leaf path of that leaf,
+loaded with one recursive CTE that follows parent ids by primary key, so
+their cost grows with the branch and not with the tree. The same SQL runs
+on Postgres and SQLite.
+
+A parent is always older than its children, so ids increase along a path
+and the newest message under any node is a leaf.
+"""
+from typing import Dict, List, Optional
+
+from sqlalchemy import case, func, or_, select
+from sqlalchemy.orm import aliased
+
+from app.core.extensions import db
+from app.db.models import Message
+
+
+def branch_cte(leaf_id: int, after_id: Optional[int] = None, budget_tokens: Optional[int] = None,
+               overhead_tokens: int = 0):
+    """Recursive CTE of ``(id, parent_message_id, used)`` from ``leaf_id`` up to the root.
+
+    The walk stops below ``after_id`` and, with ``budget_tokens``, once the
+    messages seen so far cost more than the budget. ``used`` is a lower bound
+    of that cost: rows without a stored token count add nothing.
+    """
+    def cost(message):
+        tokens = func.coalesce(message.token_count, 0)
+        return case((tokens > 0, tokens + overhead_tokens), else_=0)
+
+    path = select(Message.id, Message.parent_message_id, cost(Message).label('used')).where(
+        Message.id == leaf_id).cte('branch', recursive=True)
+    parent = aliased(Message, name='parent')
+    step = select(parent.id, parent.parent_message_id, (path.c.used + cost(parent)).label('used')).where(
+        parent.id == path.c.parent_message_id,
+        # Parents are older; also keeps a corrupted cycle from recursing forever
+        parent.id < path.c.id,
+    )
+    if after_id is not None:
+        step = step.where(parent.id > after_id)
+    if budget_tokens is not None:
+        step = step.where(path.c.used <= budget_tokens)
+    return path.union_all(step)
+
+
+def load_branch(leaf_id: int) -> List[Message]:
+    """Messages from the root to ``leaf_id``, oldest first, in one query."""
+    path = branch_cte(leaf_id)
+    return Message.query.join(path, Message.id == path.c.id).order_by(Message.id).all()
+
+
+def is_on_branch(message_id: int, leaf_id: int) -> bool:
+    """Whether ``message_id`` is ``leaf_id`` or one of its ancestors."""
+    if message_id > leaf_id:
+        return False
+    path = branch_cte(leaf_id, after_id=message_id - 1)
+    return db.session.execute(select(path.c.id).where(path.c.id == message_id)).first() is not None
+
+
+def newest_leaf(message_id: int) -> int:
+    """The newest message in the subtree under ``message_id`` (itself if it has no replies)."""
+    subtree = select(Message.id).where(Message.id == message_id).cte('subtree', recursive=True)
+    child = aliased(Message, name='child')
+    subtree = subtree.union_all(select(child.id).where(
+        child.parent_message_id == subtree.c.id, child.id > subtree.c.id))
+    return db.session.execute(select(func.max(subtree.c.id))).scalar() or message_id
+
+
+def sibling_ids(conversation_id: int, messages: List[Message]) -> Dict[Optional[int], List[int]]:
+    """Ids of the messages sharing each parent of ``messages``, oldest first.
+
+    Keyed by parent id (``None`` for roots); lets a client page between the
+    alternatives of every turn on the branch.
+    """
+    parents = {m.parent_message_id for m in messages if m.parent_message_id is not None}
+    condition = Message.parent_message_id.in_(parents) if parents else None
+    if any(m.parent_message_id is None for m in messages):
+        root = Message.parent_message_id.is_(None)
+        condition = root if condition is None else or_(condition, root)
+    if condition is None:
+        return {}
+    siblings: Dict[Optional[int], List[int]] = {}
+    rows = db.session.query(Message.parent_message_id, Message.id).filter(
+        Message.conversation_id == conversation_id, condition).order_by(Message.id)
+    for parent_id, message_id in rows:
+        siblings.setdefault(parent_id, []).append(message_id)
+    return siblings
@@ -0,0 +1,291 @@
+"""Redis-backed concurrency and rate limits for model calls.
+
+Every Celery worker and guest thread calls the model provider directly, so a
+traffic spike turns into provider 429s that fail all in-flight answers
+together. :class:`ModelCallLimiter` puts a cluster-wide semaphore and token
+bucket in front of each call, with separate limits per tier (``user`` for
+authenticated conversations, ``guest``) and optional global ones.
+
+Waiters queue FIFO per tier in a ZSET ordered by arrival: only the first
+``free slots`` waiters may take a slot, so a newcomer never overtakes an
+older request. Slots are leases that expire, so a crashed worker cannot hold
+one forever, and a waiter that stops polling loses its place. Waiting is
+bounded by ``max_wait_seconds``; callers can report the queue position while
+they wait (streams send it to the browser as a ``queue`` event).
+
+If Redis fails, ``fail_open`` decides: grant an unlimited slot (the default,
+answers keep flowing but the provider is unprotected) or refuse the call with
+:class:`ModelCapacityError`. Either way the failure is logged.
+"""
+import logging
+import os
+import time
+import uuid
+from typing import Callable, Dict, Optional
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WAIT_SECONDS = 30.0
+# Longer than the Celery hard time limit, so only dead holders expire
+DEFAULT_LEASE_SECONDS = 330.0
+DEFAULT_POLL_INTERVAL_SECONDS = 0.1
+# A waiter that misses this many polls is dropped from the queue
+_STALE_POLLS = 20
+
+# Prune expired leases and stale waiters, take a queue ticket, then grant a
+# slot if the caller is within the free slots of its tier, the global cap
+# has room and both buckets hold a token for everyone ahead of it.
+_ACQUIRE_LUA = """
+local token = ARGV[1]
+local now = tonumber(ARGV[2])
+
+local function refill(key, rate, burst)
+  if rate <= 0 then
+    return nil
+  end
+  local state = redis.call('HMGET', key, 'tokens', 'ts')
+  local tokens = tonumber(state[1]) or burst
+  local ts = tonumber(state[2]) or now
+  return math.min(burst, tokens + math.max(0, now - ts) * rate)
+end
+
+local function take(key, tokens, rate, burst)
+  if tokens == nil then
+    return
+  end
+  redis.call('HSET', key, 'tokens', tokens - 1, 'ts', now)
+  redis.call('EXPIRE', key, math.ceil(burst / rate) + 60)
+end
+
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+redis.call('ZREMRANGEBYSCORE', KEYS[5], '-inf', now)
+local stale = redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', now)
+for i = 1, #stale do
+  redis.call('ZREM', KEYS[2], stale[i])
+  redis.call('ZREM', KEYS[3], stale[i])
+end
+
+redis.call('ZADD', KEYS[2], 'NX', now, token)
+redis.call('ZADD', KEYS[3], ARGV[4], token)
+local position = redis.call('ZRANK', KEYS[2], token)
+
+local tier_cap = tonumber(ARGV[5])
+if tier_cap > 0 and position >= tier_cap - redis.call('ZCARD', KEYS[1]) then
+  return {0, position}
+end
+local global_cap = tonumber(ARGV[8])
+if global_cap > 0 and redis.call('ZCARD', KEYS[5]) >= global_cap then
+  return {0, position}
+end
+local tier_rate, tier_burst = tonumber(ARGV[6]), tonumber(ARGV[7])
+local tier_tokens = refill(KEYS[4], tier_rate, tier_burst)
+if tier_tokens ~= nil and tier_tokens < position + 1 then
+  return {0, position}
+end
+local global_rate, global_burst = tonumber(ARGV[9]), tonumber(ARGV[10])
+local global_tokens = refill(KEYS[6], global_rate, global_burst)
+if global_tokens ~= nil and global_tokens < 1 then
+  return {0, position}
+end
+
+take(KEYS[4], tier_tokens, tier_rate, tier_burst)
+take(KEYS[6], global_tokens, global_rate, global_burst)
+redis.call('ZREM', KEYS[2], token)
+redis.call('ZREM', KEYS[3], token)
+redis.call('ZADD', KEYS[1], ARGV[3], token)
+redis.call('ZADD', KEYS[5], ARGV[3], token)
+return {1, 0}
+"""
+
+
+class ModelCapacityError(RuntimeError):
+    """No model slot became free within the wait bound."""
+
+
+class TierLimits:
+    """Concurrency and rate limits of one tier; ``0`` means unlimited."""
+
+    def __init__(self, max_concurrency: int = 0, rate_per_sec: float = 0.0, burst: Optional[float] = None):
+        self.max_concurrency = max(int(max_concurrency), 0)
+        self.rate_per_sec = max(float(rate_per_sec), 0.0)
+        # Default burst: one second worth of calls, at least one
+        self.burst = float(burst) if burst else max(self.rate_per_sec, 1.0)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrency > 0 or self.rate_per_sec > 0
+
+    @classmethod
+    def from_env(cls, prefix: str) -> 'TierLimits':
+        return cls(
+            max_concurrency=int(os.environ.get(f'{prefix}_MAX_CONCURRENCY', 0)),
+            rate_per_sec=float(os.environ.get(f'{prefix}_RATE_PER_SEC', 0)),
+            burst=float(os.environ.get(f'{prefix}_BURST', 0)),
+        )
+
+
+class ModelSlot:
+    """A granted model call; release it (or leave the ``with`` block) when done."""
+
+    def __init__(self, limiter: Optional['ModelCallLimiter'] = None, tier: str = '', token: str = ''):
+        self.limiter = limiter
+        self.tier = tier
+        self.token = token
+        self.waited_ms = 0.0
+
+    def release(self) -> None:
+        limiter, self.limiter = self.limiter, None
+        if limiter is not None:
+            limiter.release(self.tier, self.token)
+
+    def __enter__(self) -> 'ModelSlot':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+
+class ModelCallLimiter:
+    """Cluster-wide FIFO semaphore and token bucket per tier."""
+
+    def __init__(self, redis_client: redis.Redis, tiers: Dict[str, TierLimits],
+                 global_limits: Optional[TierLimits] = None,
+                 max_wait_seconds: float = DEFAULT_MAX_WAIT_SECONDS,
+                 lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                 poll_interval_seconds: float = DEFAULT_POLL_INTERVAL_SECONDS,
+                 prefix: str = 'model_limit:', clock=time.time, sleep=time.sleep,
+                 fail_open: bool = True):
+        self.redis = redis_client
+        self.tiers = tiers
+        self.global_limits = global_limits or TierLimits()
+        self.max_wait_seconds = max_wait_seconds
+        self.lease_seconds = lease_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+        self.prefix = prefix
+        self.clock = clock
+        self.sleep = sleep
+        self.fail_open = fail_open
+        self._acquire_script = self.redis.register_script(_ACQUIRE_LUA)
+
+    @classmethod
+    def from_env(cls, redis_client: redis.Redis) -> Optional['ModelCallLimiter']:
+        """Limiter configured by the ``MODEL_*`` settings, or ``None`` if none are set."""
+        tiers = {'user': TierLimits.from_env('MODEL_USER'), 'guest': TierLimits.from_env('MODEL_GUEST')}
+        global_limits = TierLimits.from_env('MODEL_GLOBAL')
+        if not global_limits.enabled and not any(limits.enabled for limits in tiers.values()):
+            return None
+        return cls(
+            redis_client, tiers, global_limits,
+            max_wait_seconds=float(os.environ.get('MODEL_QUEUE_MAX_WAIT_SECONDS', DEFAULT_MAX_WAIT_SECONDS)),
+            fail_open=os.environ.get('MODEL_LIMITER_FAIL_OPEN', 'true').lower() == 'true',
+        )
+
+    def _keys(self, tier: str) -> list:
+        return [f"{self.prefix}{tier}:holders", f"{self.prefix}{tier}:queue", f"{self.prefix}{tier}:seen",
+                f"{self.prefix}{tier}:bucket", f"{self.prefix}global:holders", f"{self.prefix}global:bucket"]
+
+    def try_acquire(self, tier: str, token: str):
+        """One attempt; returns ``(granted, queue position)``."""
+        limits = self.tiers.get(tier) or TierLimits()
+        now = self.clock()
+        granted, position = self._acquire_script(
+            keys=self._keys(tier),
+            args=[token, now, now + self.lease_seconds,
+                  now + self.poll_interval_seconds * _STALE_POLLS,
+                  limits.max_concurrency, limits.rate_per_sec, limits.burst,
+                  self.global_limits.max_concurrency, self.global_limits.rate_per_sec,
+                  self.global_limits.burst],
+        )
+        return bool(int(granted)), int(position)
+
+    def acquire(self, tier: str, on_queued: Optional[Callable[[int], None]] = None,
+                should_stop: Optional[Callable[[], object]] = None,
+                on_wait: Optional[Callable[[], None]] = None) -> Optional[ModelSlot]:
+        """Wait for a slot of ``tier``.
+
+        ``on_queued`` gets the 1-based queue position whenever it changes
+        (and ``0`` once a queued caller is granted); ``on_wait`` is called
+        before every sleep between polls. Returns ``None`` if
+        ``should_stop`` turns truthy while waiting; raises
+        :class:`ModelCapacityError` after ``max_wait_seconds``, or on a Redis
+        failure unless ``fail_open``.
+        """
+        token = uuid.uuid4().hex
+        started = self.clock()
+        last_position = None
+        try:
+            while True:
+                granted, position = self.try_acquire(tier, token)
+                if granted:
+                    slot = ModelSlot(self, tier, token)
+                    slot.waited_ms = (self.clock() - started) * 1000
+                    if last_position is not None and on_queued is not None:
+                        on_queued(0)
+                    return slot
+                if position != last_position and on_queued is not None:
+                    on_queued(position + 1)
+                last_position = position
+                if should_stop is not None and should_stop():
+                    self._leave_queue(tier, token)
+                    return None
+                if self.clock() - started >= self.max_wait_seconds:
+                    self._leave_queue(tier, token)
+                    raise ModelCapacityError("AI service is busy. Please try again in a moment.")
+                if on_wait is not None:
+                    on_wait()
+                self.sleep(self.poll_interval_seconds)
+        except redis.RedisError as e:
+            self._leave_queue(tier, token)
+            if not self.fail_open:
+                logger.error("Model limiter unavailable, refusing %s model call: %s", tier, e)
+                raise ModelCapacityError("AI service is busy. Please try again in a moment.") from e
+            logger.warning("Model limiter unavailable, calling the model without %s limits: %s", tier, e)
+            return ModelSlot()
+
+    def _leave_queue(self, tier: str, token: str) -> None:
+        keys = self._keys(tier)
+        try:
+            pipe = self.redis.pipeline()
+            pipe.zrem(keys[1], token)
+            pipe.zrem(keys[2], token)
+            pipe.execute()
+        except redis.RedisError:
+            pass
+
+    def release(self, tier: str, token: str) -> None:
+        keys = self._keys(tier)
+        try:
+            pipe = self.redis.pipeline()
+            pipe.zrem(keys[0], token)
+            pipe.zrem(keys[4], token)
+            pipe.execute()
+        except redis.RedisError:
+            # The lease expires on its own
+            pass
+
+    def stats(self) -> dict:
+        """In-flight and queued calls per tier, for the health endpoint."""
+        now = self.clock()
+        pipe = self.redis.pipeline()
+        for tier in self.tiers:
+            keys = self._keys(tier)
+            pipe.zcount(keys[0], f"({now}", '+inf')
+            pipe.zcard(keys[1])
+        pipe.zcount(f"{self.prefix}global:holders", f"({now}", '+inf')
+        counts = pipe.execute()
+        stats = {}
+        for i, (tier, limits) in enumerate(self.tiers.items()):
+            stats[tier] = {
+                'in_flight': counts[2 * i],
+                'queued': counts[2 * i + 1],
+                'max_concurrency': limits.max_concurrency,
+                'rate_per_sec': limits.rate_per_sec,
+            }
+        stats['global'] = {
+            'in_flight': counts[-1],
+            'max_concurrency': self.global_limits.max_concurrency,
+            'rate_per_sec': self.global_limits.rate_per_sec,
+        }
+        return stats
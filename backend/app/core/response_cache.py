@@ -0,0 +1,150 @@
+"""Redis cache of complete guest answers, keyed on the normalized question.
+
+Guest traffic is dominated by the same FAQ-style questions. A finished answer
+is stored under a hash of the normalized message list and model name; a
+repeat of the question is replayed from the cache instead of calling the
+model. Entries expire after a TTL, and a recency ZSET bounds the cache to
+``max_entries`` by evicting the least recently used answers.
+
+Hit, miss and eviction counters plus the generation time saved by hits are
+kept in one Redis hash so every worker reports the same figures.
+"""
+import hashlib
+import json
+import re
+import time
+from typing import Iterator, List, Optional, Tuple
+
+import redis
+
+
+DEFAULT_TTL_SECONDS = 24 * 3600
+DEFAULT_MAX_ENTRIES = 1000
+
+# Hit: refresh recency and count it. Miss: count it and drop the recency
+# entry of an answer that already expired.
+_GET_LUA = """
+local entry = redis.call('HMGET', KEYS[1], 'text', 'generation_ms')
+if not entry[1] then
+  redis.call('ZREM', KEYS[2], ARGV[2])
+  redis.call('HINCRBY', KEYS[3], 'misses', 1)
+  return false
+end
+redis.call('ZADD', KEYS[2], ARGV[1], ARGV[2])
+redis.call('HINCRBY', KEYS[3], 'hits', 1)
+return entry
+"""
+
+# Store an answer, then pop the least recently used ones over the bound. The
+# caller deletes their entries: the script may only touch keys it is passed.
+_PUT_LUA = """
+redis.call('HSET', KEYS[1], 'text', ARGV[1], 'generation_ms', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('ZADD', KEYS[2], ARGV[4], ARGV[5])
+local excess = redis.call('ZCARD', KEYS[2]) - tonumber(ARGV[6])
+if excess <= 0 then
+  return {}
+end
+local victims = redis.call('ZPOPMIN', KEYS[2], excess)
+local digests = {}
+for i = 1, #victims, 2 do
+  digests[#digests + 1] = victims[i]
+end
+redis.call('HINCRBY', KEYS[3], 'evictions', #digests)
+return digests
+"""
+
+
+def normalize_messages(messages) -> List[Tuple[str, str]]:
+    """Role/content pairs as the model sees them, ignoring case and spacing."""
+    normalized = []
+    for msg in messages or []:
+        if not isinstance(msg, dict) or not msg.get('content'):
+            continue
+        role = 'user' if msg.get('role') == 'user' else 'model'
+        text = re.sub(r"\s+", " ", str(msg['content'])).strip().casefold()
+        normalized.append((role, text.lstrip('¿¡').rstrip('?!. ')))
+    return normalized
+
+
+def cache_key(messages, model_name: str) -> str:
+    payload = json.dumps([model_name, normalize_messages(messages)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def replay_chunks(text: str, chunk_chars: int) -> Iterator[str]:
+    """Split a cached answer into chunks of roughly model-sized pieces."""
+    chunk_chars = max(int(chunk_chars), 1)
+    for start in range(0, len(text), chunk_chars):
+        yield text[start:start + chunk_chars]
+
+
+class ResponseCache:
+    """Bounded, expiring cache of guest answers."""
+
+    def __init__(self, redis_client: redis.Redis, prefix: str = 'guest_cache:',
+                 ttl_seconds: int = DEFAULT_TTL_SECONDS, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.redis = redis_client
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.lru_key = f"{prefix}lru"
+        self.stats_key = f"{prefix}stats"
+        self._get_script = self.redis.register_script(_GET_LUA)
+        self._put_script = self.redis.register_script(_PUT_LUA)
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and self.max_entries > 0
+
+    def get_entry_key(self, digest: str) -> str:
+        return f"{self.prefix}entry:{digest}"
+
+    def get(self, digest: str) -> Optional[Tuple[str, float]]:
+        """Cached ``(text, generation_ms)`` for ``digest``, or ``None``."""
+        entry = self._get_script(
+            keys=[self.get_entry_key(digest), self.lru_key, self.stats_key],
+            args=[time.time(), digest],
+        )
+        if not isinstance(entry, list) or not isinstance(entry[0], str):
+            return None
+        try:
+            return entry[0], float(entry[1] or 0)
+        except (TypeError, ValueError):
+            return entry[0], 0.0
+
+    def put(self, digest: str, text: str, generation_ms: float) -> int:
+        """Store an answer; returns how many older answers were evicted."""
+        evicted = self._put_script(
+            keys=[self.get_entry_key(digest), self.lru_key, self.stats_key],
+            args=[text, round(generation_ms, 1), self.ttl_seconds, time.time(), digest, self.max_entries],
+        ) or []
+        if evicted:
+            # Left behind if this fails; the entry TTL still removes them
+            self.redis.delete(*(self.get_entry_key(victim) for victim in evicted))
+        return len(evicted)
+
+    def record_saved(self, saved_ms: float) -> None:
+        """Add generation time avoided by a hit to the shared counters."""
+        if saved_ms > 0:
+            self.redis.hincrbyfloat(self.stats_key, 'latency_saved_ms', round(saved_ms, 1))
+
+    def stats(self) -> dict:
+        pipe = self.redis.pipeline()
+        pipe.hgetall(self.stats_key)
+        pipe.zcard(self.lru_key)
+        counters, entries = pipe.execute()
+        hits = int(counters.get('hits', 0))
+        misses = int(counters.get('misses', 0))
+        saved_ms = float(counters.get('latency_saved_ms', 0))
+        lookups = hits + misses
+        return {
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'hits': hits,
+            'misses': misses,
+            'evictions': int(counters.get('evictions', 0)),
+            'hit_ratio': round(hits / lookups, 4) if lookups else 0.0,
+            'latency_saved_ms': round(saved_ms, 1),
+            'avg_latency_saved_ms': round(saved_ms / hits, 1) if hits else 0.0,
+        }
@@ -0,0 +1,265 @@
+"""Push-based cancellation for running generations.
+
+Producers used to poll the stream state on every model chunk to find out
+whether to stop. Instead, control signals are published on
+``stream_cancel:<id>`` and one pattern subscription per process flips local
+flags, so the generation loop only checks an in-memory :class:`CancelWatch`.
+
+Signals:
+
+``cancel``
+    Explicit request (``POST /chat/stream/<id>/cancel``); stop immediately.
+``disconnect``
+    The last SSE viewer went away; stop unless a viewer comes back within the
+    grace period, so a ``Last-Event-ID`` reconnect does not lose the answer.
+``resume``
+    A viewer (re)connected; clears a pending disconnect.
+
+A model that is slow to start or stalls mid-answer produces no chunk to check
+the flag on, so :class:`WatchedResponse` reads the provider on a helper thread
+and the generation loop also wakes up every ``poll_seconds`` to look at it.
+"""
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import redis
+
+
+CANCEL = 'cancel'
+DISCONNECT = 'disconnect'
+RESUME = 'resume'
+
+DEFAULT_POLL_SECONDS = 0.25
+
+_PENDING = object()
+_END = object()
+
+
+class CancelWatch:
+    """Local view of the control signals for one stream."""
+
+    def __init__(self, stream_id: str, disconnect_grace_seconds: float = 10.0,
+                 clock=time.monotonic):
+        self.stream_id = stream_id
+        self.disconnect_grace_seconds = disconnect_grace_seconds
+        self.clock = clock
+        self.cancelled = threading.Event()
+        self.disconnected_at: Optional[float] = None
+
+    def signal(self, kind: str) -> None:
+        if kind == CANCEL:
+            self.cancelled.set()
+        elif kind == DISCONNECT:
+            if self.disconnected_at is None:
+                self.disconnected_at = self.clock()
+        elif kind == RESUME:
+            self.disconnected_at = None
+
+    @property
+    def reason(self) -> Optional[str]:
+        """``'cancelled'``, ``'disconnected'`` or ``None`` while generation may continue."""
+        if self.cancelled.is_set():
+            return 'cancelled'
+        disconnected_at = self.disconnected_at
+        if disconnected_at is not None and self.clock() - disconnected_at >= self.disconnect_grace_seconds:
+            return 'disconnected'
+        return None
+
+    def should_stop(self) -> bool:
+        return self.reason is not None
+
+
+class _Failure:
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+class WatchedResponse:
+    """Iterate a provider response until it ends or ``watch`` says stop.
+
+    The response is read on a helper thread one item at a time, so nothing is
+    fetched ahead of the consumer, while the consumer waits at most
+    ``poll_seconds`` before checking the watch again. On stop the response is
+    abandoned: iteration ends with :attr:`stop_reason` set and the helper
+    closes the response as soon as its pending read returns. ``on_idle`` is
+    called after every poll that found nothing, e.g. to keep the stream alive
+    while the model is silent.
+    """
+
+    def __init__(self, response, watch: CancelWatch, poll_seconds: float = DEFAULT_POLL_SECONDS,
+                 on_idle: Optional[Callable[[], None]] = None):
+        self.response = response
+        self.watch = watch
+        self.poll_seconds = poll_seconds
+        self.on_idle = on_idle
+        self.stop_reason: Optional[str] = None
+        self._items = queue.Queue()
+        self._wanted = threading.Semaphore(0)
+        self._abandoned = threading.Event()
+
+    def __iter__(self):
+        reader = threading.Thread(target=self._read, name=f'model-reader-{self.watch.stream_id}', daemon=True)
+        reader.start()
+        finished = False
+        try:
+            while True:
+                self._wanted.release()
+                item = self._next_item()
+                if item is _END:
+                    finished = self.stop_reason is None
+                    return
+                if isinstance(item, _Failure):
+                    finished = True
+                    raise item.error
+                yield item
+        finally:
+            if not finished:
+                self._abandoned.set()
+                self._wanted.release()
+                # Returns at once unless the provider is stalled mid-read
+                reader.join(self.poll_seconds)
+
+    def _next_item(self):
+        while True:
+            try:
+                item = self._items.get(timeout=self.poll_seconds)
+            except queue.Empty:
+                item = _PENDING
+            if item is _END or isinstance(item, _Failure):
+                return item
+            reason = self.watch.reason
+            if reason:
+                self.stop_reason = reason
+                return _END
+            if item is not _PENDING:
+                return item
+            if self.on_idle is not None:
+                self.on_idle()
+
+    def _read(self) -> None:
+        iterator = iter(self.response)
+        try:
+            while True:
+                self._wanted.acquire()
+                if self._abandoned.is_set():
+                    return
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    self._items.put(_END)
+                    return
+                except Exception as e:
+                    self._items.put(_Failure(e))
+                    return
+                self._items.put(item)
+        finally:
+            if self._abandoned.is_set():
+                # Lets the provider drop the upstream request
+                close = getattr(self.response, 'close', None)
+                if close is not None:
+                    close()
+
+
+class CancelListener:
+    """Background ``PSUBSCRIBE`` dispatching control signals to watches."""
+
+    def __init__(self, redis_client: redis.Redis, channel_prefix: str = 'stream_cancel:',
+                 flag_prefix: str = 'stream_cancelled:', autostart: bool = True):
+        self.redis = redis_client
+        self.channel_prefix = channel_prefix
+        self.flag_prefix = flag_prefix
+        self.autostart = autostart
+        self.pid = os.getpid()
+
+        self._lock = threading.Lock()
+        self._watches: Dict[str, CancelWatch] = {}
+        self._stopped = threading.Event()
+        self._subscribed = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def watch(self, stream_id: str, disconnect_grace_seconds: float = 10.0) -> CancelWatch:
+        """Start tracking signals for ``stream_id``.
+
+        The cancel flag is checked once so a cancel published before the
+        subscription existed is not lost.
+        """
+        watch = CancelWatch(stream_id, disconnect_grace_seconds)
+        with self._lock:
+            self._watches[stream_id] = watch
+        if self.autostart:
+            self.start()
+        try:
+            if self.redis.exists(f"{self.flag_prefix}{stream_id}"):
+                watch.signal(CANCEL)
+        except redis.RedisError:
+            pass
+        return watch
+
+    def unwatch(self, watch: CancelWatch) -> None:
+        with self._lock:
+            if self._watches.get(watch.stream_id) is watch:
+                del self._watches[watch.stream_id]
+
+    def dispatch(self, channel, data) -> bool:
+        """Route one published message to its watch; returns whether one matched."""
+        channel = channel.decode() if isinstance(channel, bytes) else str(channel)
+        data = data.decode() if isinstance(data, bytes) else str(data)
+        if not channel.startswith(self.channel_prefix):
+            return False
+        with self._lock:
+            watch = self._watches.get(channel[len(self.channel_prefix):])
+        if watch is None:
+            return False
+        watch.signal(data)
+        return True
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='stream-cancel', daemon=True)
+            self._thread.start()
+        # Signals published before the first PSUBSCRIBE completes would be missed
+        self._subscribed.wait(timeout=2)
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.psubscribe(f"{self.channel_prefix}*")
+                self._subscribed.set()
+                while not self._stopped.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message.get('type') == 'pmessage':
+                        self.dispatch(message['channel'], message['data'])
+            except Exception:
+                # Resubscribe after transient Redis errors
+                self._subscribed.clear()
+                time.sleep(0.5)
+            finally:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+
+
+_listener: Optional[CancelListener] = None
+_listener_lock = threading.Lock()
+
+
+def get_cancel_listener(redis_client: redis.Redis) -> CancelListener:
+    """Return the process-wide cancel listener, recreating it after a fork."""
+    global _listener
+    with _listener_lock:
+        if _listener is None or _listener.pid != os.getpid():
+            _listener = CancelListener(redis_client)
+        return _listener
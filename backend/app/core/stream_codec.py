@@ -0,0 +1,86 @@
+"""Encoding of events stored in ``stream_events:<id>`` Redis Streams.
+
+Browsers receive JSON, so the cheapest storage format is the JSON text itself.
+The ``raw`` codec stores it next to a plain ``type`` field; SSE endpoints
+forward ``data`` untouched and only look at ``type`` to spot the end of a
+stream. The ``json`` codec is the original single ``payload`` field layout.
+
+Entries are self-describing: :func:`frame_entry` reads either layout, so
+entries written before a codec switch still replay.
+"""
+import json
+from typing import Dict, Optional, Tuple
+
+
+def frame_entry(fields) -> Optional[Tuple[str, str]]:
+    """Return ``(event_type, json_text)`` for an entry of either layout.
+
+    ``None`` means the entry is not an event (or is unreadable) and should be
+    skipped.
+    """
+    if not isinstance(fields, dict):
+        return None
+    data = fields.get('data')
+    if data is not None:
+        return fields.get('type') or '', data
+    payload = fields.get('payload')
+    if not payload:
+        return None
+    try:
+        event = json.loads(payload)
+    except ValueError:
+        return None
+    if not isinstance(event, dict):
+        return None
+    return event.get('type') or '', payload
+
+
+def decode_entry(fields) -> Optional[dict]:
+    """Full event dict, for consumers that need more than the type."""
+    framed = frame_entry(fields)
+    if framed is None:
+        return None
+    try:
+        return json.loads(framed[1])
+    except ValueError:
+        return None
+
+
+class EventCodec:
+    """Converts events to stream entry fields."""
+
+    name = ''
+
+    def encode(self, event: dict) -> Dict[str, str]:
+        raise NotImplementedError
+
+
+class JsonPayloadCodec(EventCodec):
+    """One ``payload`` field holding the JSON event."""
+
+    name = 'json'
+
+    def encode(self, event: dict) -> Dict[str, str]:
+        return {'payload': json.dumps(event)}
+
+
+class RawFieldCodec(EventCodec):
+    """``type`` plus the browser-ready JSON in ``data``."""
+
+    name = 'raw'
+
+    def encode(self, event: dict) -> Dict[str, str]:
+        return {'type': event.get('type', ''), 'data': json.dumps(event)}
+
+
+CODECS = {codec.name: codec for codec in (JsonPayloadCodec(), RawFieldCodec())}
+DEFAULT_CODEC = 'raw'
+
+
+def get_codec(name: Optional[str] = None) -> EventCodec:
+    """Look up a codec by name; unknown names raise ``ValueError``."""
+    name = name or DEFAULT_CODEC
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError(f"Unknown stream event codec: {name}") from None
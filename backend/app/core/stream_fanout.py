@@ -0,0 +1,276 @@
+"""Per-process multiplexed reader for Redis Streams.
+
+Instead of every SSE generator issuing its own blocking ``XREAD``, one
+background thread reads all subscribed ``stream_events:*`` keys with a single
+multi-key ``XREAD`` and hands entries to in-process subscriber queues. The
+number of blocked Redis connections stays at one per process regardless of how
+many viewers are attached.
+
+:class:`AsyncStreamFanout` does the same with one reader task per event loop
+for the asyncio SSE gateway.
+"""
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+# A failing reader logs its traceback at most this often
+ERROR_LOG_INTERVAL_SECONDS = 30.0
+
+
+def parse_entry_id(entry_id: str) -> Tuple[int, int]:
+    """Split a Redis stream id (``<ms>-<seq>``) into a comparable tuple."""
+    ms, _, seq = str(entry_id).partition('-')
+    return int(ms), int(seq or 0)
+
+
+class Subscription:
+    """A single viewer's queue of entries for one events stream."""
+
+    def __init__(self, events_key: str, cursor: str):
+        self.events_key = events_key
+        self.cursor = cursor or '0-0'
+        self._queue: "queue.Queue[Tuple[str, dict]]" = queue.Queue()
+
+    def get(self, timeout: float) -> List[Tuple[str, dict]]:
+        """Return pending entries, waiting up to ``timeout`` seconds for the first."""
+        try:
+            entries = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while True:
+            try:
+                entries.append(self._queue.get_nowait())
+            except queue.Empty:
+                return entries
+
+    def deliver(self, entry_id: str, fields: dict) -> None:
+        if parse_entry_id(entry_id) <= parse_entry_id(self.cursor):
+            return
+        self.cursor = entry_id
+        self._queue.put_nowait((entry_id, fields))
+
+
+class AsyncSubscription(Subscription):
+    """A :class:`Subscription` awaited from an event loop."""
+
+    def __init__(self, events_key: str, cursor: str):
+        super().__init__(events_key, cursor)
+        self._queue: "asyncio.Queue[Tuple[str, dict]]" = asyncio.Queue()
+
+    async def get(self, timeout: float) -> List[Tuple[str, dict]]:
+        """Return pending entries, waiting up to ``timeout`` seconds for the first."""
+        try:
+            entries = [await asyncio.wait_for(self._queue.get(), timeout)]
+        except asyncio.TimeoutError:
+            return []
+        while not self._queue.empty():
+            entries.append(self._queue.get_nowait())
+        return entries
+
+
+class StreamFanout:
+    """Background ``XREAD`` loop dispatching entries to subscriptions."""
+
+    subscription_class = Subscription
+
+    def __init__(self, redis_client: redis.Redis, block_ms: int = 1000, count: int = 100,
+                 autostart: bool = True):
+        self.redis = redis_client
+        self.block_ms = block_ms
+        self.count = count
+        self.autostart = autostart
+        self.pid = os.getpid()
+
+        self._lock = threading.Lock()
+        self._subscriptions: Dict[str, Set[Subscription]] = {}
+        self._has_subscribers = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.dispatched = 0
+        self.last_dispatch_lag_ms = 0.0
+        self.max_dispatch_lag_ms = 0.0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self.last_error_at: Optional[float] = None
+        self._error_logged_at: Optional[float] = None
+
+    def subscribe(self, events_key: str, cursor: str = '0-0') -> Subscription:
+        subscription = self.subscription_class(events_key, cursor)
+        with self._lock:
+            self._subscriptions.setdefault(events_key, set()).add(subscription)
+            self._has_subscribers.set()
+        if self.autostart:
+            self.start()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subs = self._subscriptions.get(subscription.events_key)
+            if subs is not None:
+                subs.discard(subscription)
+                if not subs:
+                    del self._subscriptions[subscription.events_key]
+            if not self._subscriptions:
+                self._has_subscribers.clear()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='stream-fanout', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._has_subscribers.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.block_ms / 1000.0 + 1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            subscribers = sum(len(subs) for subs in self._subscriptions.values())
+            streams = len(self._subscriptions)
+        return {
+            'subscribers': subscribers,
+            'streams': streams,
+            'dispatched': self.dispatched,
+            'last_dispatch_lag_ms': round(self.last_dispatch_lag_ms, 2),
+            'max_dispatch_lag_ms': round(self.max_dispatch_lag_ms, 2),
+            'errors': self.errors,
+            'last_error': self.last_error,
+            'last_error_at': self.last_error_at,
+        }
+
+    def poll_once(self) -> int:
+        """Run one multi-key ``XREAD`` and dispatch the results.
+
+        Returns the number of entries read. Each key is read from the oldest
+        cursor among its subscribers; entries a subscriber already has are
+        skipped when delivering.
+        """
+        cursors = self._cursors()
+        if not cursors:
+            return 0
+        return self._dispatch(self.redis.xread(cursors, count=self.count, block=self.block_ms))
+
+    def _cursors(self) -> Dict[str, str]:
+        with self._lock:
+            return {events_key: min((s.cursor for s in subs), key=parse_entry_id)
+                    for events_key, subs in self._subscriptions.items()}
+
+    def _dispatch(self, results) -> int:
+        read = 0
+        for events_key, entries in results or []:
+            if isinstance(events_key, bytes):
+                events_key = events_key.decode()
+            with self._lock:
+                subs = list(self._subscriptions.get(events_key, ()))
+            for entry_id, fields in entries:
+                if isinstance(entry_id, bytes):
+                    entry_id = entry_id.decode()
+                for subscription in subs:
+                    subscription.deliver(entry_id, fields)
+                self._record_lag(entry_id)
+                read += 1
+        return read
+
+    def _record_lag(self, entry_id: str) -> None:
+        # Stream ids carry the XADD server time in milliseconds
+        lag = max(0.0, time.time() * 1000 - parse_entry_id(entry_id)[0])
+        self.dispatched += 1
+        self.last_dispatch_lag_ms = lag
+        self.max_dispatch_lag_ms = max(self.max_dispatch_lag_ms, lag)
+
+    def _record_error(self, exc: Exception) -> None:
+        """Count a failed read; log its traceback at most every ``ERROR_LOG_INTERVAL_SECONDS``."""
+        self.errors += 1
+        self.last_error = f"{type(exc).__name__}: {exc}"
+        self.last_error_at = time.time()
+        now = time.monotonic()
+        if self._error_logged_at is None or now - self._error_logged_at >= ERROR_LOG_INTERVAL_SECONDS:
+            self._error_logged_at = now
+            logger.exception("Stream fanout read failed (%d failures so far); viewers are not receiving events",
+                             self.errors)
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            if not self._has_subscribers.wait(timeout=1.0):
+                continue
+            try:
+                self.poll_once()
+            except Exception as e:
+                # Keep the reader alive across transient Redis errors
+                self._record_error(e)
+                time.sleep(0.5)
+
+
+class AsyncStreamFanout(StreamFanout):
+    """Asyncio flavour of :class:`StreamFanout` for ``redis.asyncio`` clients.
+
+    The reader is a task on the loop of the first subscriber; it ends when the
+    last subscription goes away and the next subscribe starts a new one.
+    """
+
+    subscription_class = AsyncSubscription
+
+    def __init__(self, redis_client, block_ms: int = 1000, count: int = 100, autostart: bool = True):
+        super().__init__(redis_client, block_ms=block_ms, count=count, autostart=autostart)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def poll_once(self) -> int:
+        cursors = self._cursors()
+        if not cursors:
+            return 0
+        return self._dispatch(await self.redis.xread(cursors, count=self.count, block=self.block_ms))
+
+    async def _run(self) -> None:
+        while self._subscriptions:
+            try:
+                await self.poll_once()
+            except Exception as e:
+                self._record_error(e)
+                await asyncio.sleep(0.5)
+
+
+_fanout: Optional[StreamFanout] = None
+_fanout_lock = threading.Lock()
+
+
+def get_stream_fanout(redis_client: redis.Redis, block_ms: int = 1000) -> StreamFanout:
+    """Return the process-wide fanout reader, recreating it after a fork."""
+    global _fanout
+    with _fanout_lock:
+        if _fanout is None or _fanout.pid != os.getpid():
+            _fanout = StreamFanout(redis_client, block_ms=block_ms)
+        return _fanout
+
+
+def get_stream_fanout_stats() -> Optional[dict]:
+    """Stats of the running fanout reader, or ``None`` if it was never used."""
+    fanout = _fanout
+    if fanout is None or fanout.pid != os.getpid():
+        return None
+    return fanout.stats()
@@ -1,131 +1,330 @@
-"""Redis-based stream management for SSE connections."""
+"""Redis-based stream management for SSE connections.
+
+Each stream keeps its state in its own Redis hash (``stream_state:<id>``) so
+transitions touch individual fields instead of rewriting a JSON blob.
+Multi-step transitions run as server-side Lua scripts, which makes every state
+change a single atomic round trip even with several concurrent writers.
+
+Live streams are indexed in a sorted set scored by their last activity, so
+cleanup pops the streams that went quiet longer than the cleanup grace period
+ago with a range query instead of scanning every key. The grace period is far
+longer than the health TTL: a queued answer or one waiting for a model slot
+or a slow model is quiet but still alive.
+"""
+import os
 import redis
-import json
+import threading
 import time
 from typing import Dict, Optional
 
+from app.core.stream_codec import EventCodec, get_codec
+
+# KEYS: state, health, expiry index | ARGV: stream_id, user_id, conversation_id, now, health_ttl
+_CREATE_STREAM_LUA = """
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1],
+    'stream_id', ARGV[1], 'user_id', ARGV[2], 'conversation_id', ARGV[3],
+    'status', 'active', 'created_at', ARGV[4], 'last_activity', ARGV[4],
+    'last_id', '0-0')
+redis.call('SETEX', KEYS[2], ARGV[5], 'alive')
+redis.call('ZADD', KEYS[3], ARGV[4], ARGV[1])
+return 1
+"""
+
+# KEYS: state | ARGV: last_id
+_SET_LAST_ID_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'last_id', ARGV[1])
+return 1
+"""
+
+# KEYS: state, health, expiry index | ARGV: now, health_ttl, stream_id[, last_id]
+# A live stream is refreshed even after its health key expired; a finished or
+# swept one is left alone.
+_TOUCH_STREAM_LUA = """
+local status = redis.call('HGET', KEYS[1], 'status')
+if status ~= 'active' and status ~= 'disconnected' then
+    return 0
+end
+redis.call('SETEX', KEYS[2], ARGV[2], 'alive')
+redis.call('ZADD', KEYS[3], ARGV[1], ARGV[3])
+redis.call('HSET', KEYS[1], 'last_activity', ARGV[1])
+if ARGV[4] then
+    redis.call('HSET', KEYS[1], 'last_id', ARGV[4])
+end
+return 1
+"""
+
+# KEYS: state, health, events, expiry index
+# ARGV: stream_id, status, timestamp_field, now, replay_ttl[, error_message]
+_FINISH_STREAM_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    -- Swept while its producer was still writing; the events it wrote must expire too
+    redis.call('EXPIRE', KEYS[3], ARGV[5])
+    return 0
+end
+redis.call('HSET', KEYS[1], 'status', ARGV[2], ARGV[3], ARGV[4])
+if ARGV[6] then
+    redis.call('HSET', KEYS[1], 'error_message', ARGV[6])
+end
+redis.call('DEL', KEYS[2])
+redis.call('EXPIRE', KEYS[3], ARGV[5])
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+redis.call('ZREM', KEYS[4], ARGV[1])
+return 1
+"""
+
+# KEYS: expiry index | ARGV: cutoff, limit
+_POP_EXPIRED_LUA = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #ids > 0 then
+    redis.call('ZREM', KEYS[1], unpack(ids))
+end
+return ids
+"""
+
+# KEYS: state | ARGV: now
+_DISCONNECT_STREAM_LUA = """
+if redis.call('HGET', KEYS[1], 'status') ~= 'active' then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'status', 'disconnected', 'disconnected_at', ARGV[1])
+return 1
+"""
+
+# KEYS: viewers | ARGV: ttl
+_ADD_VIEWER_LUA = """
+local n = redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return n
+"""
+
+# KEYS: viewers
+_REMOVE_VIEWER_LUA = """
+local n = redis.call('DECR', KEYS[1])
+if n <= 0 then
+    redis.call('DEL', KEYS[1])
+end
+return n
+"""
+
+# Last heartbeat per stream id, shared by every StreamManager in this process
+_last_heartbeat: Dict[str, float] = {}
+_heartbeat_lock = threading.Lock()
+_HEARTBEAT_TRACKING_LIMIT = 10000
+
+_INT_FIELDS = ('user_id', 'conversation_id')
+_FLOAT_FIELDS = ('created_at', 'last_activity', 'completed_at', 'error_at', 'cancelled_at', 'disconnected_at')
+
 
 class StreamManager:
     """Manages SSE streams using Redis for state persistence."""
-    
-    def __init__(self, redis_client: redis.Redis):
+
+    def __init__(self, redis_client: redis.Redis, heartbeat_interval_seconds: Optional[float] = None,
+                 codec: Optional[EventCodec] = None):
         self.redis = redis_client
-        self.streams_key = "active_streams"
+        # Sorted set of non-terminal stream ids scored by last activity time
+        self.streams_key = "stream_expiry"
+        self.state_key_prefix = "stream_state:"
         self.health_key_prefix = "stream_health:"
         self.events_key_prefix = "stream_events:"
+        # Control signals for the producer, see app.core.stream_cancel
+        self.cancel_channel_prefix = "stream_cancel:"
+        self.cancel_key_prefix = "stream_cancelled:"
+        # Open SSE connections per stream; the last one to leave signals disconnect
+        self.viewers_key_prefix = "stream_viewers:"
+        # Set while a new conversation's AI title is being generated
+        self.title_key_prefix = "stream_title:"
+        self.health_ttl_seconds = 60
+        # Cleanup only deletes streams quiet for this long; must exceed the longest queue and model wait
+        self.cleanup_grace_seconds = float(os.environ.get('STREAM_CLEANUP_GRACE_SECONDS', 1800))
         self.default_stream_ttl_seconds = 600  # 10 minutes to allow short replays
-    
+        self.cleanup_batch_size = 1000
+        if heartbeat_interval_seconds is None:
+            heartbeat_interval_seconds = float(os.environ.get('STREAM_HEARTBEAT_INTERVAL', 5))
+        self.heartbeat_interval_seconds = heartbeat_interval_seconds
+        # How events are laid out in stream entries, see app.core.stream_codec
+        self.codec = codec or get_codec(os.environ.get('STREAM_EVENT_CODEC'))
+
+        self._create_script = self.redis.register_script(_CREATE_STREAM_LUA)
+        self._set_last_id_script = self.redis.register_script(_SET_LAST_ID_LUA)
+        self._touch_script = self.redis.register_script(_TOUCH_STREAM_LUA)
+        self._finish_script = self.redis.register_script(_FINISH_STREAM_LUA)
+        self._disconnect_script = self.redis.register_script(_DISCONNECT_STREAM_LUA)
+        self._pop_expired_script = self.redis.register_script(_POP_EXPIRED_LUA)
+        self._add_viewer_script = self.redis.register_script(_ADD_VIEWER_LUA)
+        self._remove_viewer_script = self.redis.register_script(_REMOVE_VIEWER_LUA)
+
     def create_stream(self, stream_id: str, user_id: int, conversation_id: int) -> bool:
         """Create a new stream and set initial state."""
-        stream_data = {
-            'stream_id': stream_id,
-            'user_id': user_id,
-            'conversation_id': conversation_id,
-            'status': 'active',
-            'created_at': time.time(),
-            'last_activity': time.time(),
-            # Redis Streams last delivered id for SSE resumption. "0-0" means from start
-            'last_id': '0-0'
-        }
-        
-        # Store in Redis Hash
-        self.redis.hset(self.streams_key, stream_id, json.dumps(stream_data))
-        
-        # Set health check with TTL
-        self.redis.setex(f"{self.health_key_prefix}{stream_id}", 60, "alive")
-        
+        self._create_script(
+            keys=[self.get_state_key(stream_id), self.get_health_key(stream_id), self.streams_key],
+            args=[
+                stream_id,
+                '' if user_id is None else user_id,
+                '' if conversation_id is None else conversation_id,
+                time.time(),
+                self.health_ttl_seconds,
+            ],
+        )
         return True
 
+    def get_state_key(self, stream_id: str) -> str:
+        return f"{self.state_key_prefix}{stream_id}"
+
+    def get_health_key(self, stream_id: str) -> str:
+        return f"{self.health_key_prefix}{stream_id}"
+
     def get_events_key(self, stream_id: str) -> str:
         return f"{self.events_key_prefix}{stream_id}"
 
+    def get_cancel_channel(self, stream_id: str) -> str:
+        return f"{self.cancel_channel_prefix}{stream_id}"
+
+    def get_cancel_key(self, stream_id: str) -> str:
+        return f"{self.cancel_key_prefix}{stream_id}"
+
+    def get_viewers_key(self, stream_id: str) -> str:
+        return f"{self.viewers_key_prefix}{stream_id}"
+
+    def get_title_key(self, stream_id: str) -> str:
+        return f"{self.title_key_prefix}{stream_id}"
+
+    def add_event(self, stream_id: str, event: dict, pipe: Optional[redis.client.Pipeline] = None):
+        """Append an event to the stream's events log using the configured codec."""
+        return (pipe or self.redis).xadd(self.get_events_key(stream_id), self.codec.encode(event))
+
     def get_last_id(self, stream_id: str) -> str:
-        stream_data = self.get_stream(stream_id)
-        return stream_data.get('last_id', '0-0') if stream_data else '0-0'
+        last_id = self.redis.hget(self.get_state_key(stream_id), 'last_id')
+        if isinstance(last_id, bytes):
+            last_id = last_id.decode()
+        return last_id or '0-0'
 
     def set_last_id(self, stream_id: str, last_id: str) -> None:
-        stream_data = self.get_stream(stream_id) or {}
-        stream_data['last_id'] = last_id
-        self.redis.hset(self.streams_key, stream_id, json.dumps(stream_data))
-    
-    def update_stream_activity(self, stream_id: str) -> bool:
-        """Refresh stream activity and extend TTL."""
-        if not self.redis.exists(f"{self.health_key_prefix}{stream_id}"):
-            return False  # Stream doesn't exist or expired
-        
-        # Refresh TTL
-        self.redis.setex(f"{self.health_key_prefix}{stream_id}", 60, "alive")
-        
-        # Update last activity
-        stream_data = self.get_stream(stream_id)
-        if stream_data:
-            stream_data['last_activity'] = time.time()
-            self.redis.hset(self.streams_key, stream_id, json.dumps(stream_data))
-        
+        self._set_last_id_script(keys=[self.get_state_key(stream_id)], args=[last_id])
+
+    def update_stream_activity(self, stream_id: str, pipe: Optional[redis.client.Pipeline] = None,
+                               last_id: Optional[str] = None) -> bool:
+        """Refresh stream activity and extend TTL; ``last_id`` also moves the shared cursor.
+
+        When ``pipe`` is given the refresh is queued on that pipeline and the
+        result is only available after it executes; ``True`` is returned.
+        """
+        keys, args = self._touch_params(stream_id, last_id)
+        refreshed = self._touch_script(keys=keys, args=args, client=pipe)
+        return True if pipe is not None else bool(refreshed)
+
+    def heartbeat(self, stream_id: str, pipe: Optional[redis.client.Pipeline] = None,
+                  last_id: Optional[str] = None) -> bool:
+        """Throttled :meth:`update_stream_activity` for per-chunk and per-event callers.
+
+        Refreshes ``stream_health:<id>`` (and the cursor, for SSE viewers
+        passing ``last_id``) at most once per ``heartbeat_interval_seconds``
+        per process and stream. Returns whether a refresh was sent (or queued
+        on ``pipe``).
+        """
+        if not self._heartbeat_due(stream_id):
+            return False
+        self.update_stream_activity(stream_id, pipe=pipe, last_id=last_id)
         return True
-    
+
     def get_stream(self, stream_id: str) -> Optional[Dict]:
         """Get stream data from Redis."""
-        data = self.redis.hget(self.streams_key, stream_id)
-        return json.loads(data) if data else None
-    
+        return self._decode_stream(self.redis.hgetall(self.get_state_key(stream_id)))
+
     def mark_stream_complete(self, stream_id: str) -> bool:
         """Mark stream as completed."""
-        stream_data = self.get_stream(stream_id)
-        if stream_data:
-            stream_data['status'] = 'complete'
-            stream_data['completed_at'] = time.time()
-            self.redis.hset(self.streams_key, stream_id, json.dumps(stream_data))
-            
-            # Remove health check
-            self.redis.delete(f"{self.health_key_prefix}{stream_id}")
-            # Set TTL for events stream so it can be replayed briefly, then cleaned
-            try:
-                self.redis.expire(self.get_events_key(stream_id), self.default_stream_ttl_seconds)
-            except Exception:
-                pass
-            return True
-        return False
-    
+        return self._finish_stream(stream_id, 'complete', 'completed_at')
+
     def mark_stream_error(self, stream_id: str, error_message: str) -> bool:
         """Mark stream as errored."""
-        stream_data = self.get_stream(stream_id)
-        if stream_data:
-            stream_data['status'] = 'error'
-            stream_data['error_message'] = error_message
-            stream_data['error_at'] = time.time()
-            self.redis.hset(self.streams_key, stream_id, json.dumps(stream_data))
-            
-            # Remove health check
-            self.redis.delete(f"{self.health_key_prefix}{stream_id}")
-            try:
-                self.redis.expire(self.get_events_key(stream_id), self.default_stream_ttl_seconds)
-            except Exception:
-                pass
-            return True
-        return False
-    
+        return self._finish_stream(stream_id, 'error', 'error_at', error_message)
+
+    def mark_stream_cancelled(self, stream_id: str) -> bool:
+        """Mark stream as cancelled after the producer stopped early."""
+        return self._finish_stream(stream_id, 'cancelled', 'cancelled_at')
+
+    def mark_stream_disconnected(self, stream_id: str) -> bool:
+        """Mark an active stream as disconnected once its SSE consumer goes away."""
+        return bool(self._disconnect_script(keys=[self.get_state_key(stream_id)], args=[time.time()]))
+
+    def add_viewer(self, stream_id: str) -> int:
+        """Count an SSE connection to a stream; returns the number now open."""
+        return int(self._add_viewer_script(keys=[self.get_viewers_key(stream_id)],
+                                           args=[self.default_stream_ttl_seconds]))
+
+    def remove_viewer(self, stream_id: str) -> int:
+        """Forget an SSE connection; returns how many are still open."""
+        return int(self._remove_viewer_script(keys=[self.get_viewers_key(stream_id)]))
+
+    def expect_title(self, stream_id: str) -> None:
+        """Note that a ``title`` event is coming so completion can wait for it."""
+        self.redis.set(self.get_title_key(stream_id), 1, ex=self.health_ttl_seconds)
+
+    def title_done(self, stream_id: str) -> None:
+        self.redis.delete(self.get_title_key(stream_id))
+
+    def title_pending(self, stream_id: str) -> bool:
+        return self.redis.exists(self.get_title_key(stream_id)) == 1
+
+    def request_cancel(self, stream_id: str) -> None:
+        """Ask the producer to stop generating.
+
+        The flag key covers producers that start watching after the publish.
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.set(self.get_cancel_key(stream_id), 1, ex=self.default_stream_ttl_seconds)
+        pipe.publish(self.get_cancel_channel(stream_id), 'cancel')
+        pipe.execute()
+
+    def publish_signal(self, stream_id: str, signal: str) -> None:
+        """Publish a viewer ``disconnect``/``resume`` signal to the producer."""
+        self.redis.publish(self.get_cancel_channel(stream_id), signal)
+
     def cleanup_expired_streams(self) -> int:
-        """Clean up streams whose health keys have expired."""
-        expired_count = 0
-        pattern = f"{self.health_key_prefix}*"
-        
-        for key in self.redis.scan_iter(match=pattern):
-            if not self.redis.exists(key):
-                # Health key expired, clean up stream
-                # Handle both string and bytes keys
-                key_str = key.decode() if isinstance(key, bytes) else key
-                stream_id = key_str.replace(self.health_key_prefix, "")
-                self.redis.hdel(self.streams_key, stream_id)
-                expired_count += 1
-        
-        return expired_count
-    
+        """Delete streams with no activity for longer than ``cleanup_grace_seconds``.
+
+        Expired ids are popped from the expiry index in batches of
+        ``cleanup_batch_size``; each batch drops the state hash, events stream
+        and health key of its streams in one pipeline.
+        """
+        cutoff = time.time() - self.cleanup_grace_seconds
+        removed = 0
+        while True:
+            expired = [self._to_str(sid) for sid in self._pop_expired_script(
+                keys=[self.streams_key], args=[cutoff, self.cleanup_batch_size])]
+            if not expired:
+                break
+
+            pipe = self.redis.pipeline(transaction=False)
+            for stream_id in expired:
+                pipe.delete(self.get_state_key(stream_id), self.get_events_key(stream_id),
+                            self.get_health_key(stream_id))
+                self._forget_heartbeat(stream_id)
+            pipe.execute()
+
+            removed += len(expired)
+            if len(expired) < self.cleanup_batch_size:
+                break
+        return removed
+
     def get_active_streams(self) -> Dict[str, Dict]:
         """Get all active streams."""
+        stream_ids = [self._to_str(sid) for sid in self.redis.zrange(self.streams_key, 0, -1)]
+        if not stream_ids:
+            return {}
+
+        pipe = self.redis.pipeline(transaction=False)
+        for stream_id in stream_ids:
+            pipe.hgetall(self.get_state_key(stream_id))
+
         streams = {}
-        for stream_id, data in self.redis.hgetall(self.streams_key).items():
-            streams[stream_id] = json.loads(data)
+        for stream_id, raw in zip(stream_ids, pipe.execute()):
+            data = self._decode_stream(raw)
+            if data:
+                streams[stream_id] = data
         return streams
 
     # Optional helpers for trimming stream size
@@ -134,3 +333,112 @@ class StreamManager:
             self.redis.xtrim(self.get_events_key(stream_id), max_len_approx, approximate=True)
         except Exception:
             pass
+
+    def _finish_stream(self, stream_id: str, status: str, timestamp_field: str,
+                       error_message: Optional[str] = None) -> bool:
+        """Move a stream to a terminal state and schedule its keys for expiry."""
+        self._forget_heartbeat(stream_id)
+        keys, args = self._finish_params(stream_id, status, timestamp_field, error_message)
+        return bool(self._finish_script(keys=keys, args=args))
+
+    def _heartbeat_due(self, stream_id: str) -> bool:
+        now = time.monotonic()
+        with _heartbeat_lock:
+            last = _last_heartbeat.get(stream_id)
+            if last is not None and now - last < self.heartbeat_interval_seconds:
+                return False
+            _last_heartbeat[stream_id] = now
+            if len(_last_heartbeat) > _HEARTBEAT_TRACKING_LIMIT:
+                # Drop streams that have been quiet for longer than the health TTL
+                horizon = now - self.health_ttl_seconds
+                for sid in [sid for sid, ts in _last_heartbeat.items() if ts < horizon]:
+                    del _last_heartbeat[sid]
+            return True
+
+    @staticmethod
+    def _forget_heartbeat(stream_id: str) -> None:
+        with _heartbeat_lock:
+            _last_heartbeat.pop(stream_id, None)
+
+    def _touch_params(self, stream_id: str, last_id: Optional[str] = None):
+        args = [time.time(), self.health_ttl_seconds, stream_id]
+        if last_id is not None:
+            args.append(last_id)
+        return [self.get_state_key(stream_id), self.get_health_key(stream_id), self.streams_key], args
+
+    def _finish_params(self, stream_id: str, status: str, timestamp_field: str,
+                       error_message: Optional[str] = None):
+        keys = [
+            self.get_state_key(stream_id),
+            self.get_health_key(stream_id),
+            self.get_events_key(stream_id),
+            self.streams_key,
+        ]
+        args = [stream_id, status, timestamp_field, time.time(), self.default_stream_ttl_seconds]
+        if error_message is not None:
+            args.append(error_message)
+        return keys, args
+
+    @staticmethod
+    def _to_str(value) -> str:
+        return value.decode() if isinstance(value, bytes) else value
+
+    @classmethod
+    def _decode_stream(cls, raw: Optional[Dict]) -> Optional[Dict]:
+        """Convert a raw state hash into typed stream data."""
+        if not raw:
+            return None
+        data = {cls._to_str(k): cls._to_str(v) for k, v in raw.items()}
+        for field in _INT_FIELDS:
+            if field in data:
+                data[field] = int(data[field]) if data[field] not in ('', None) else None
+        for field in _FLOAT_FIELDS:
+            if field in data:
+                data[field] = float(data[field])
+        return data
+
+
+class AsyncStreamManager(StreamManager):
+    """Asyncio flavour of :class:`StreamManager` for ``redis.asyncio`` clients.
+
+    Shares key layout and Lua scripts with the sync manager and covers the
+    operations an SSE consumer needs.
+    """
+
+    async def get_stream(self, stream_id: str) -> Optional[Dict]:
+        return self._decode_stream(await self.redis.hgetall(self.get_state_key(stream_id)))
+
+    async def get_last_id(self, stream_id: str) -> str:
+        last_id = await self.redis.hget(self.get_state_key(stream_id), 'last_id')
+        return self._to_str(last_id) or '0-0'
+
+    async def set_last_id(self, stream_id: str, last_id: str) -> None:
+        await self._set_last_id_script(keys=[self.get_state_key(stream_id)], args=[last_id])
+
+    async def update_stream_activity(self, stream_id: str, last_id: Optional[str] = None) -> bool:
+        keys, args = self._touch_params(stream_id, last_id)
+        return bool(await self._touch_script(keys=keys, args=args))
+
+    async def heartbeat(self, stream_id: str, last_id: Optional[str] = None) -> bool:
+        if not self._heartbeat_due(stream_id):
+            return False
+        await self.update_stream_activity(stream_id, last_id=last_id)
+        return True
+
+    async def mark_stream_complete(self, stream_id: str) -> bool:
+        self._forget_heartbeat(stream_id)
+        keys, args = self._finish_params(stream_id, 'complete', 'completed_at')
+        return bool(await self._finish_script(keys=keys, args=args))
+
+    async def mark_stream_disconnected(self, stream_id: str) -> bool:
+        return bool(await self._disconnect_script(keys=[self.get_state_key(stream_id)], args=[time.time()]))
+
+    async def add_viewer(self, stream_id: str) -> int:
+        return int(await self._add_viewer_script(keys=[self.get_viewers_key(stream_id)],
+                                                 args=[self.default_stream_ttl_seconds]))
+
+    async def remove_viewer(self, stream_id: str) -> int:
+        return int(await self._remove_viewer_script(keys=[self.get_viewers_key(stream_id)]))
+
+    async def publish_signal(self, stream_id: str, signal: str) -> None:
+        await self.redis.publish(self.get_cancel_channel(stream_id), signal)
@@ -0,0 +1,159 @@
+"""Coalescing writer for streaming model output into Redis Streams."""
+import heapq
+import logging
+import os
+import threading
+import time
+from typing import Callable, List, Optional
+
+import redis
+
+from app.core.stream_manager import StreamManager
+
+
+DEFAULT_FLUSH_BYTES = 256
+DEFAULT_FLUSH_INTERVAL_MS = 50
+
+logger = logging.getLogger(__name__)
+
+
+class FlushScheduler:
+    """One daemon thread that flushes writers whose buffered text has waited too long.
+
+    Without it, text buffered just before the model pauses (slow tokens, a
+    tool round, a limiter wait) would only be sent with the next chunk.
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self._condition = threading.Condition()
+        self._heap = []
+        self._sequence = 0
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule(self, delay: float, callback: Callable[[], None]) -> None:
+        """Run ``callback`` on the scheduler thread after ``delay`` seconds."""
+        with self._condition:
+            self._sequence += 1
+            heapq.heappush(self._heap, (time.monotonic() + delay, self._sequence, callback))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='stream-flush', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._condition.wait(timeout)
+                _deadline, _sequence, callback = heapq.heappop(self._heap)
+            try:
+                callback()
+            except Exception as e:
+                logger.warning("Timed stream flush failed: %s", e)
+
+
+_scheduler: Optional[FlushScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_flush_scheduler() -> FlushScheduler:
+    """Return the process-wide flush scheduler, recreating it after a fork."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None or _scheduler.pid != os.getpid():
+            _scheduler = FlushScheduler()
+        return _scheduler
+
+
+class StreamChunkWriter:
+    """Buffers model chunks and writes them as fewer ``chunk`` events.
+
+    Pending text is flushed once it reaches ``max_bytes`` or once
+    ``max_interval_ms`` has passed since the previous flush; if no further
+    chunk arrives in time, the :class:`FlushScheduler` sends it when the
+    interval is up, so a pause in model output never holds text back. Each
+    flush sends the
+    ``XADD`` and, when due, the throttled stream heartbeat in one pipeline. The
+    full response is kept as a list of parts and joined once via :attr:`text`.
+    """
+
+    def __init__(self, redis_client: redis.Redis, stream_manager: StreamManager, stream_id: str,
+                 message_id: Optional[int] = None, max_bytes: int = DEFAULT_FLUSH_BYTES,
+                 max_interval_ms: int = DEFAULT_FLUSH_INTERVAL_MS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.redis = redis_client
+        self.stream_manager = stream_manager
+        self.stream_id = stream_id
+        self.message_id = message_id
+        self.max_bytes = max_bytes
+        self.max_interval = max_interval_ms / 1000.0
+        self.clock = clock
+        self.events_key = stream_manager.get_events_key(stream_id)
+        self.codec = stream_manager.codec
+
+        self._parts: List[str] = []
+        self._pending: List[str] = []
+        self._pending_bytes = 0
+        self._last_flush = clock()
+        self._lock = threading.Lock()
+        self._timer_armed = False
+        self._closed = False
+        self.flush_count = 0
+
+    @property
+    def text(self) -> str:
+        """Full response written so far."""
+        return ''.join(self._parts)
+
+    def write(self, content: str) -> None:
+        """Buffer a chunk and flush if the size or time threshold is reached."""
+        if not content:
+            return
+        with self._lock:
+            self._parts.append(content)
+            self._pending.append(content)
+            self._pending_bytes += len(content.encode('utf-8'))
+
+            if (self._pending_bytes >= self.max_bytes
+                    or self.clock() - self._last_flush >= self.max_interval):
+                self._flush()
+            elif not self._timer_armed:
+                self._timer_armed = True
+                get_flush_scheduler().schedule(self.max_interval, self._flush_due)
+
+    def flush(self, *events: dict) -> None:
+        """Write pending text plus any extra ``events`` in a single pipeline."""
+        with self._lock:
+            self._flush(*events)
+
+    def _flush_due(self) -> None:
+        with self._lock:
+            self._timer_armed = False
+            if not self._closed:
+                self._flush()
+
+    def _flush(self, *events: dict) -> None:
+        if not self._pending and not events:
+            return
+
+        pipe = self.redis.pipeline(transaction=False)
+        if self._pending:
+            pipe.xadd(self.events_key, self.codec.encode({
+                'type': 'chunk', 'content': ''.join(self._pending), 'message_id': self.message_id}))
+            self.stream_manager.heartbeat(self.stream_id, pipe=pipe)
+        for event in events:
+            pipe.xadd(self.events_key, self.codec.encode(event))
+        pipe.execute()
+
+        self._pending = []
+        self._pending_bytes = 0
+        self._last_flush = self.clock()
+        self.flush_count += 1
+
+    def close(self, final_event: dict) -> None:
+        """Flush remaining text together with the terminal event."""
+        with self._lock:
+            self._flush(final_event)
+            self._closed = True
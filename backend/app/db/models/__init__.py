@@ -4,6 +4,7 @@ from .checklist import Checklist, Category, Item
 from .file import UploadedFile
 from .conversation import Conversation, Message
 from .password_reset_token import PasswordResetToken
+from .document_index import DocumentIndexEntry
 
-__all__ = ['User', 'Checklist', 'Category', 'Item', 'UploadedFile', 'Conversation', 'Message', 'PasswordResetToken']
+__all__ = ['User', 'Checklist', 'Category', 'Item', 'UploadedFile', 'Conversation', 'Message', 'PasswordResetToken', 'DocumentIndexEntry']
 
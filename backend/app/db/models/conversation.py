@@ -1,6 +1,16 @@
 from app.core.extensions import db
 from sqlalchemy import func
+from sqlalchemy.orm import validates
 from datetime import datetime
+import math
+
+
+# Files the user attached to a message; their excerpts are added to the prompt
+message_attachment = db.Table(
+    'message_attachment',
+    db.Column('message_id', db.Integer, db.ForeignKey('message.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('file_id', db.Integer, db.ForeignKey('uploaded_file.id', ondelete='CASCADE'), primary_key=True),
+)
 
 
 class Conversation(db.Model):
@@ -14,6 +24,11 @@ class Conversation(db.Model):
     updated_at = db.Column(db.DateTime, server_default=func.now(), onupdate=func.now())
     pinned = db.Column(db.Boolean, nullable=False, server_default='false')
     pinned_at = db.Column(db.DateTime, nullable=True)
+    # Rolling summary of every message up to summary_through_id (inclusive)
+    summary = db.Column(db.Text, nullable=True)
+    summary_through_id = db.Column(db.Integer, nullable=True)
+    # Newest message of the branch shown and continued; its ancestors are the history
+    active_leaf_id = db.Column(db.Integer, nullable=True)
     
     # Relationships
     user = db.relationship('User', backref=db.backref('conversations', lazy=True))
@@ -42,20 +57,46 @@ class Conversation(db.Model):
 class Message(db.Model):
     """Message model for chat messages."""
     __tablename__ = 'message'
+    __table_args__ = (
+        # Newest-first keyset reads of a conversation's history
+        db.Index('ix_message_conversation_id_id', 'conversation_id', 'id'),
+        # Children of a message: sibling branches and subtree walks
+        db.Index('ix_message_parent_message_id', 'parent_message_id'),
+    )
+
+    # Rough characters per model token for Spanish/English prose
+    CHARS_PER_TOKEN = 4
     
     id = db.Column(db.Integer, primary_key=True)
     conversation_id = db.Column(db.Integer, db.ForeignKey('conversation.id'), nullable=False)
     content = db.Column(db.Text, nullable=False)
     role = db.Column(db.String(20), nullable=False)  # 'user' or 'assistant'
-    status = db.Column(db.String(20), nullable=False, default='complete')  # 'streaming', 'complete', 'error'
+    status = db.Column(db.String(20), nullable=False, default='complete')  # 'streaming', 'complete', 'error', 'cancelled'
     timestamp = db.Column(db.DateTime, server_default=func.now())
+    # Previous message on the branch; edits and regenerations add siblings
     parent_message_id = db.Column(db.Integer, db.ForeignKey('message.id'), nullable=True)
+    # Estimated prompt tokens for content, kept in sync on write
+    token_count = db.Column(db.Integer, nullable=True)
     
     # Self-referential relationship for message threading
     parent_message = db.relationship('Message', remote_side=[id], backref='replies')
+    attachments = db.relationship('UploadedFile', secondary=message_attachment, lazy=True,
+                                  backref=db.backref('messages', lazy=True))
     
     def __repr__(self):
         return f'<Message {self.id}: {self.role}>'
+
+    @validates('content')
+    def _count_tokens(self, key, content):
+        self.token_count = self.estimate_tokens(content)
+        return content
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """Cheap token estimate; no tokenizer round trip on the write path."""
+        if not text:
+            return 0
+        return math.ceil(len(text) / Message.CHARS_PER_TOKEN)
     
     def to_dict(self):
         """Convert message to dictionary for JSON serialization."""
@@ -0,0 +1,31 @@
+from app.core.extensions import db
+from sqlalchemy.sql import func
+
+
+class DocumentIndexEntry(db.Model):
+    """A checklist file in its owner's document index (see app.services.document_index).
+
+    One row per file, keyed by the file id: indexing is an upsert and
+    eviction a primary-key delete, cascaded from the file (and so from its
+    Item, Category and Checklist).
+    """
+    __tablename__ = 'document_index_entry'
+
+    file_id = db.Column(db.Integer, db.ForeignKey('uploaded_file.id', ondelete='CASCADE'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    # File name, checklist path and leading text, as shown to the model
+    text = db.Column(db.Text, nullable=False)
+    # Space-separated BM25 tokens of text
+    terms = db.Column(db.Text, nullable=False)
+    # Signature of the embedder that produced embedding (float32 bytes)
+    embedder = db.Column(db.String(64), nullable=True)
+    embedding = db.Column(db.LargeBinary, nullable=True)
+    updated_at = db.Column(db.DateTime, server_default=func.now(), onupdate=func.now())
+
+    uploaded_file = db.relationship(
+        'UploadedFile',
+        backref=db.backref('index_entry', uselist=False, lazy=True, cascade='all, delete-orphan'),
+    )
+
+    def __repr__(self):
+        return f'<DocumentIndexEntry file={self.file_id}>'
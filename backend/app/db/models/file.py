@@ -14,6 +14,10 @@ class UploadedFile(db.Model):
     # Optional content classification used by routes (e.g., 'chat', 'checklist', 'profile')
     content_type = db.Column(db.String(50), nullable=True)
     uploaded_at = db.Column(db.DateTime, server_default=func.now())
+    # SHA-256 of the content; extracted text is cached under it and shared by equal uploads
+    content_hash = db.Column(db.String(64), index=True, nullable=True)
+    # Chat and checklist uploads: 'pending', 'ready', 'failed' or 'unsupported'
+    text_status = db.Column(db.String(20), nullable=True)
 
     # File owner (reserve for future chat/doc features)
     user_id = db.Column(
@@ -53,4 +57,5 @@ class UploadedFile(db.Model):
             'uploaded_at': self.uploaded_at.isoformat() if self.uploaded_at else None,
             'item_id': self.item_id,
             'user_id': self.user_id,
+            'text_status': self.text_status,
         }
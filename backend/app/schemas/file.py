@@ -10,6 +10,8 @@ class FileSchema(Schema):
     mime_type = fields.Str(dump_only=True)
     uploaded_at = fields.DateTime(dump_only=True)
     item_id = fields.Int(dump_only=True)
+    # Chat uploads: poll /files/info until 'ready' (or 'failed'/'unsupported')
+    text_status = fields.Str(dump_only=True)
     # Keep minimal surface; ownership flows via item
 
     def calc_size(self, obj):
@@ -1,35 +1,103 @@
 """AI service for processing chat messages with streaming responses."""
-from google import genai
-from google.genai import types  # noqa: F401  # reserved for future tool configs
+import time
 import redis
-import json
 from app.core.extensions import db
 from app.db.models import Message, Conversation
 from app.core.stream_manager import StreamManager
+from app.core.stream_writer import StreamChunkWriter, DEFAULT_FLUSH_BYTES, DEFAULT_FLUSH_INTERVAL_MS
+from app.core.stream_cancel import CancelWatch, WatchedResponse, get_cancel_listener
+from app.core.context_window import build_branch_context, build_context, DEFAULT_CONTEXT_TOKEN_BUDGET
+from app.core.response_cache import ResponseCache, cache_key, replay_chunks
+from app.core.guest_session import GuestSessionStore
+from app.core.knowledge_base import KnowledgeBase, format_passages
+from app.services.document_service import DEFAULT_ATTACHMENT_TOP_K, attachment_context, conversation_attachments
+from app.services.document_index import (
+    DEFAULT_USER_DOCUMENTS_MIN_SCORE, DEFAULT_USER_DOCUMENTS_TOP_K, format_user_documents, search_user_documents,
+)
+from app.services.checklist_tools import ChecklistTools, checklist_snapshot_cache
+from app.core.llm_provider import FunctionCall, GeminiProvider, LLMProvider, create_provider
+from app.core.model_limiter import ModelCallLimiter, ModelSlot
+from app.core.conversation_summary import (
+    ModelSummarizer, Summarizer, fold_older_turns, summary_due, DEFAULT_SUMMARY_MIN_MESSAGES,
+)
 from app.core import ai_tools
 from app.core.title_generator import generate_title
 
 
+# Model turns that may call tools before an answer is forced
+DEFAULT_MAX_TOOL_ROUNDS = 4
+DEFAULT_TITLE_WAIT_SECONDS = 5.0
+TITLE_POLL_SECONDS = 0.1
+
+
 class AIService:
     """Service for handling AI interactions with streaming responses."""
     
     def __init__(self, redis_client: redis.Redis, stream_manager: StreamManager):
         self.redis = redis_client
         self.stream_manager = stream_manager
-        self.client = None
+        self.provider: LLMProvider = None
         # Allow overriding the model via environment variable AI_MODEL
         self.model_name = 'gemini-2.0-flash-001'
         
-        # Initialize Gemini client if API key is available
         import os
         env_model = os.environ.get('AI_MODEL')
         if env_model:
             self.model_name = env_model
-        api_key = os.environ.get('GEMINI_API_KEY')
-        if api_key:
-            # The python-genai client reads API key from env automatically
-            # but we keep explicit construction for clarity.
-            self.client = genai.Client(api_key=api_key)
+        # Chunk coalescing thresholds for writes into Redis Streams
+        self.flush_bytes = int(os.environ.get('STREAM_FLUSH_BYTES', DEFAULT_FLUSH_BYTES))
+        self.flush_interval_ms = int(os.environ.get('STREAM_FLUSH_INTERVAL_MS', DEFAULT_FLUSH_INTERVAL_MS))
+        # Generation stops this long after the last SSE viewer disconnects
+        self.disconnect_grace_seconds = float(os.environ.get('STREAM_DISCONNECT_GRACE_SECONDS', 10))
+        # A new conversation's first answer completes after its title event, waiting at most this long
+        self.title_wait_seconds = float(os.environ.get('TITLE_EVENT_WAIT_SECONDS', DEFAULT_TITLE_WAIT_SECONDS))
+        # Prompt history is the most recent turns that fit this many tokens
+        self.context_token_budget = int(os.environ.get('CONTEXT_TOKEN_BUDGET', DEFAULT_CONTEXT_TOKEN_BUDGET))
+        # Older turns are summarized once this many have left the window
+        self.summary_min_messages = int(os.environ.get('SUMMARY_MIN_MESSAGES', DEFAULT_SUMMARY_MIN_MESSAGES))
+        # Repeated guest questions are answered from a bounded Redis cache
+        self.response_cache = ResponseCache(
+            redis_client,
+            ttl_seconds=int(os.environ.get('GUEST_CACHE_TTL_SECONDS', 24 * 3600)),
+            max_entries=int(os.environ.get('GUEST_CACHE_MAX_ENTRIES', 1000)),
+        )
+        # Cache hits are replayed as chunks of this size at this spacing
+        self.cache_replay_chunk_chars = int(os.environ.get('GUEST_CACHE_REPLAY_CHUNK_CHARS', 48))
+        self.cache_replay_interval_ms = float(os.environ.get('GUEST_CACHE_REPLAY_INTERVAL_MS', 15))
+        # Opt-in server-side guest history: capped Redis lists with a TTL
+        self.guest_sessions = GuestSessionStore(
+            redis_client,
+            ttl_seconds=int(os.environ.get('GUEST_SESSION_TTL_SECONDS', 2 * 3600)),
+            max_messages=int(os.environ.get('GUEST_SESSION_MAX_MESSAGES', 40)),
+        )
+        # Cluster-wide concurrency/rate limits per tier; None when unconfigured
+        self.model_limiter = ModelCallLimiter.from_env(redis_client)
+        # Passages from the local visa knowledge base are added to prompts
+        self.knowledge_base = KnowledgeBase.from_env()
+        # Excerpts of the conversation's attached files added to prompts
+        self.attachment_top_k = int(os.environ.get('ATTACHMENT_TOP_K', DEFAULT_ATTACHMENT_TOP_K))
+        # The user's checklist files matching the question are listed in prompts
+        self.user_documents_top_k = int(os.environ.get('USER_DOCUMENTS_TOP_K', DEFAULT_USER_DOCUMENTS_TOP_K))
+        self.user_documents_min_score = float(os.environ.get('USER_DOCUMENTS_MIN_SCORE',
+                                                             DEFAULT_USER_DOCUMENTS_MIN_SCORE))
+        # Signed-in chats may call checklist tools, served from cached per-user snapshots
+        self.chat_tools_enabled = os.environ.get('CHAT_TOOLS_ENABLED', 'true').lower() == 'true'
+        self.max_tool_rounds = int(os.environ.get('CHAT_MAX_TOOL_ROUNDS', DEFAULT_MAX_TOOL_ROUNDS))
+        self.checklist_snapshots = checklist_snapshot_cache(redis_client)
+        # Defaults to the process-wide listener on first use
+        self.cancel_listener = None
+        # AI_PROVIDER picks the model backend; gemini needs GEMINI_API_KEY
+        self.provider = create_provider()
+
+    @property
+    def client(self):
+        """SDK client of the Gemini provider, or ``None``."""
+        return getattr(self.provider, 'client', None)
+
+    @client.setter
+    def client(self, client) -> None:
+        # A genai-shaped client (SDK or test double) goes through the Gemini adapter
+        self.provider = GeminiProvider(client) if client is not None else None
     
     def process_ai_task(self, message_id: int, stream_id: str) -> None:
         """Process AI task with Redis state management and retry logic."""
@@ -55,6 +123,8 @@ class AIService:
             if not stream_data:
                 self._create_error_message(conversation_id, stream_id, f"Stream {stream_id} not found")
                 return
+            # Quiet while it waited in the queue; alive again from here
+            self._keep_alive(stream_id)
             
             # Create AI message in database with streaming status
             ai_message = Message(
@@ -65,6 +135,10 @@ class AIService:
                 parent_message_id=user_message.id
             )
             db.session.add(ai_message)
+            db.session.flush()
+            # The answer extends the branch unless another one was picked meanwhile
+            Conversation.query.filter_by(id=conversation.id, active_leaf_id=user_message.id).update(
+                {'active_leaf_id': ai_message.id}, synchronize_session=False)
             db.session.commit()
             
             # Stream AI response using Redis Streams
@@ -84,87 +158,292 @@ class AIService:
             # Mark stream as error
             self.stream_manager.mark_stream_error(stream_id, str(exc))
 
-    def process_guest_messages_stream(self, messages: list[dict], stream_id: str) -> None:
-        """Stream AI response for guest users without persisting to the database."""
+    def process_guest_messages_stream(self, messages: list[dict], stream_id: str,
+                                      session_id: str = None) -> None:
+        """Stream AI response for guest users without persisting to the database.
 
-        events_key = self.stream_manager.get_events_key(stream_id)
-        ai_response = ""
+        With ``session_id`` the question and its answer are appended to that
+        guest session.
+        """
+
+        writer = self._make_writer(stream_id, None)
+        watch = None
 
         try:
+            self._keep_alive(stream_id)
             if not messages:
                 raise ValueError("No messages provided")
 
-            if not self.client:
-                raise RuntimeError("AI service is temporarily unavailable. Please try again later.")
+            digest = None
+            if self.response_cache is not None and self.response_cache.enabled:
+                digest = cache_key(messages, self.model_name)
+                try:
+                    cached = self.response_cache.get(digest)
+                except redis.RedisError:
+                    cached = None
+                if cached is not None:
+                    watch = self._watch_cancel(stream_id)
+                    self._replay_cached(cached, writer, watch, stream_id)
+                    self._remember_guest_answer(session_id, messages, writer.text)
+                    return
 
-            from google.genai import types
+            if self.provider is None:
+                raise RuntimeError("AI service is temporarily unavailable. Please try again later.")
 
-            gemini_messages = []
+            model_messages = []
             for msg in messages:
                 if not isinstance(msg, dict):
                     continue
-                role = msg.get('role')
                 content = msg.get('content')
                 if not content:
                     continue
-                if role == 'user':
-                    gemini_messages.append(types.Content(
-                        role='user',
-                        parts=[types.Part.from_text(text=str(content))]
-                    ))
-                else:
-                    gemini_messages.append(types.Content(
-                        role='model',
-                        parts=[types.Part.from_text(text=str(content))]
-                    ))
-
-            if not gemini_messages:
-                raise ValueError("No valid messages provided")
-
-            response = self.client.models.generate_content_stream(
-                model=self.model_name,
-                contents=gemini_messages,
-            )
+                role = 'user' if msg.get('role') == 'user' else 'model'
+                model_messages.append({'role': role, 'text': str(content)})
 
-            for chunk in response:
-                if not self.stream_manager.get_stream(stream_id):
-                    break
+            if not model_messages:
+                raise ValueError("No valid messages provided")
 
-                if getattr(chunk, 'text', None):
-                    content = chunk.text
-                    ai_response += content
-                    payload = json.dumps({'type': 'chunk', 'content': content, 'message_id': None})
-                    _ = self.redis.xadd(events_key, {'payload': payload})
-                    self.stream_manager.update_stream_activity(stream_id)
+            system_instruction = self._retrieval_instruction(model_messages)
+            watch = self._watch_cancel(stream_id)
+            slot = self._acquire_model_slot('guest', stream_id, watch)
+            if slot is None:
+                stop_reason = watch.reason
+            else:
+                with slot:
+                    started = time.monotonic()
+                    response = self.provider.stream(self.model_name, model_messages, system_instruction)
+                    stop_reason = self._write_chunks(response, writer, watch)
 
-            complete_payload = json.dumps({'type': 'complete', 'message_id': None})
-            _ = self.redis.xadd(events_key, {'payload': complete_payload})
-            self.stream_manager.mark_stream_complete(stream_id)
+            if stop_reason:
+                writer.close({'type': 'cancelled', 'message_id': None, 'reason': stop_reason})
+                self.stream_manager.mark_stream_cancelled(stream_id)
+            else:
+                writer.close({'type': 'complete', 'message_id': None})
+                self.stream_manager.mark_stream_complete(stream_id)
+                if digest is not None and writer.text:
+                    self._cache_answer(digest, writer.text, (time.monotonic() - started) * 1000)
             self.stream_manager.trim_events_stream(stream_id)
+            self._remember_guest_answer(session_id, messages, writer.text)
 
         except Exception as exc:
             self._emit_guest_error(stream_id, str(exc))
+        finally:
+            if watch is not None:
+                self._unwatch_cancel(watch)
     
+    def _replay_cached(self, cached, writer: StreamChunkWriter, watch: CancelWatch, stream_id: str) -> None:
+        """Stream a cached guest answer with the same events as a live one."""
+        text, generation_ms = cached
+        started = time.monotonic()
+        interval = self.cache_replay_interval_ms / 1000.0
+        stop_reason = None
+        for piece in replay_chunks(text, self.cache_replay_chunk_chars):
+            stop_reason = watch.reason
+            if stop_reason:
+                break
+            writer.write(piece)
+            if interval > 0:
+                time.sleep(interval)
+        if stop_reason:
+            writer.close({'type': 'cancelled', 'message_id': None, 'reason': stop_reason})
+            self.stream_manager.mark_stream_cancelled(stream_id)
+        else:
+            writer.close({'type': 'complete', 'message_id': None})
+            self.stream_manager.mark_stream_complete(stream_id)
+        self.stream_manager.trim_events_stream(stream_id)
+        try:
+            self.response_cache.record_saved(generation_ms - (time.monotonic() - started) * 1000)
+        except Exception:
+            pass
+
+    def _remember_guest_answer(self, session_id: str, messages: list, text: str) -> None:
+        """Append a guest question and its answer (complete or partial) to the session history.
+
+        The question is the last message of the prompt; it is only stored
+        once answered, so the session never ends on an unanswered turn.
+        """
+        if not session_id or not text:
+            return
+        question = messages[-1].get('content') if messages and isinstance(messages[-1], dict) else None
+        turn = [{'role': 'user', 'content': question}] if question else []
+        try:
+            self.guest_sessions.extend(session_id, turn + [{'role': 'assistant', 'content': text}])
+        except redis.RedisError:
+            # The answer was delivered; the next turn just lacks it as context
+            pass
+
+    def _cache_answer(self, digest: str, text: str, generation_ms: float) -> None:
+        try:
+            self.response_cache.put(digest, text, generation_ms)
+        except Exception:
+            # The answer was delivered; caching is best effort
+            pass
+
+    def _make_writer(self, stream_id: str, message_id) -> StreamChunkWriter:
+        """Build a chunk writer using the configured coalescing thresholds."""
+        return StreamChunkWriter(
+            self.redis,
+            self.stream_manager,
+            stream_id,
+            message_id=message_id,
+            max_bytes=self.flush_bytes,
+            max_interval_ms=self.flush_interval_ms,
+        )
+
+    def _watch_cancel(self, stream_id: str) -> CancelWatch:
+        """Subscribe to cancel/disconnect signals for a generation."""
+        if self.cancel_listener is None:
+            self.cancel_listener = get_cancel_listener(self.redis)
+        return self.cancel_listener.watch(stream_id, self.disconnect_grace_seconds)
+
+    def _unwatch_cancel(self, watch: CancelWatch) -> None:
+        if self.cancel_listener is not None:
+            self.cancel_listener.unwatch(watch)
+
+    def _retrieval_instruction(self, model_messages: list) -> str:
+        """Knowledge-base passages for the latest user turn, or ``None``."""
+        if self.knowledge_base is None:
+            return None
+        query = next((m['text'] for m in reversed(model_messages) if m['role'] == 'user'), '')
+        try:
+            return format_passages(self.knowledge_base.search(query))
+        except Exception:
+            # Retrieval only improves answers; never fail the stream over it
+            return None
+
+    def _attachment_instruction(self, conversation_id: int, model_messages: list) -> str:
+        """Excerpts of the files attached in the conversation, or ``None``."""
+        query = next((m['text'] for m in reversed(model_messages) if m['role'] == 'user'), '')
+        try:
+            files = conversation_attachments(conversation_id)
+            return attachment_context(files, query, self.attachment_top_k) if files else None
+        except Exception:
+            return None
+
+    def _user_documents_instruction(self, user_id: int, model_messages: list) -> str:
+        """The user's indexed checklist files matching the latest user turn, or ``None``."""
+        query = next((m['text'] for m in reversed(model_messages) if m['role'] == 'user'), '')
+        try:
+            return format_user_documents(search_user_documents(
+                user_id, query, self.user_documents_top_k, self.user_documents_min_score))
+        except Exception:
+            return None
+
+    def _acquire_model_slot(self, tier: str, stream_id: str = None,
+                            watch: CancelWatch = None) -> ModelSlot:
+        """Wait for a model call slot of ``tier`` under the configured limits.
+
+        While queued, a stream gets ``queue`` events with its position. Returns
+        ``None`` if the generation was stopped while waiting.
+        """
+        if self.model_limiter is None:
+            return ModelSlot()
+
+        def report_position(position: int) -> None:
+            try:
+                self.stream_manager.add_event(stream_id, {'type': 'queue', 'position': position})
+            except Exception:
+                pass
+
+        return self.model_limiter.acquire(
+            tier,
+            on_queued=report_position if stream_id else None,
+            should_stop=(lambda: watch.reason) if watch is not None else None,
+            on_wait=(lambda: self._keep_alive(stream_id)) if stream_id else None,
+        )
+
+    def _keep_alive(self, stream_id: str) -> None:
+        """Throttled activity refresh while the stream waits without writing.
+
+        Keeps a queued or slow answer from looking abandoned to the cleanup sweep.
+        """
+        try:
+            self.stream_manager.heartbeat(stream_id)
+        except redis.RedisError:
+            pass
+
+    def _write_chunks(self, response, writer: StreamChunkWriter, watch: CancelWatch, calls: list = None):
+        """Forward model chunks to ``writer`` until done or signalled to stop.
+
+        Function calls in the response are appended to ``calls``. Returns the
+        stop reason, or ``None`` if the model finished. A stop is noticed even
+        while the model sends nothing; the response is then closed so the
+        provider drops the upstream request, see :class:`WatchedResponse`.
+        """
+        chunks = WatchedResponse(response, watch, on_idle=lambda: self._keep_alive(writer.stream_id))
+        for text in chunks:
+            if isinstance(text, FunctionCall):
+                if calls is not None:
+                    calls.append(text)
+            elif text:
+                # Buffered; flushed with its activity refresh in one pipeline
+                writer.write(text)
+        return chunks.stop_reason
+
+    def _stream_model_call(self, model_messages: list, system_instruction: str, writer: StreamChunkWriter,
+                           watch: CancelWatch, tools: dict = None, calls: list = None):
+        """One user-tier model call under the limiter, streamed to ``writer``.
+
+        Every call takes its own slot and rate token. Returns the stop reason,
+        as :meth:`_write_chunks`.
+        """
+        slot = self._acquire_model_slot('user', writer.stream_id, watch)
+        if slot is None:
+            return watch.reason
+        with slot:
+            if tools is None:
+                response = self.provider.stream(self.model_name, model_messages, system_instruction)
+            else:
+                response = self.provider.stream(self.model_name, model_messages, system_instruction, tools=tools)
+            return self._write_chunks(response, writer, watch, calls)
+
+    def _stream_with_tools(self, model_messages: list, system_instruction: str, writer: StreamChunkWriter,
+                           watch: CancelWatch, tools: ChecklistTools):
+        """Stream an answer, running the model's tool calls between turns.
+
+        Each call and its result are appended to the prompt and the model is
+        asked again; after ``max_tool_rounds`` turns with calls the tools are
+        withdrawn so it has to answer. Returns the stop reason, as
+        :meth:`_write_chunks`.
+        """
+        messages = list(model_messages)
+        declarations = ai_tools.get_checklist_tools()
+        for round_number in range(self.max_tool_rounds + 1):
+            offered = declarations if round_number < self.max_tool_rounds else None
+            calls = []
+            reason = self._stream_model_call(messages, system_instruction, writer, watch, offered, calls)
+            if reason or not calls:
+                return reason
+            for call in calls:
+                messages.append({'role': 'model', 'function_call': {'name': call.name, 'args': call.args}})
+                messages.append({'role': 'tool', 'name': call.name, 'response': tools.execute(call)})
+        return None
+
     def _create_error_message(self, conversation_id: int, stream_id: str, error_msg: str) -> None:
         """Create an error message when AI processing fails early."""
         if not conversation_id:
             return
             
         try:
+            conversation = db.session.get(Conversation, conversation_id)
+            parent_id = conversation.active_leaf_id if conversation else None
             ai_message = Message(
                 conversation_id=conversation_id,
                 content=f"Error: {error_msg}",
                 role='assistant',
-                status='error'
+                status='error',
+                parent_message_id=parent_id
             )
             db.session.add(ai_message)
+            db.session.flush()
+            if parent_id is not None:
+                conversation.active_leaf_id = ai_message.id
             db.session.commit()
             
             # Write error event to Redis Stream so SSE can consume it
             try:
-                events_key = self.stream_manager.get_events_key(stream_id)
-                payload = json.dumps({'type': 'error','message': error_msg,'message_id': ai_message.id})
-                _ = self.redis.xadd(events_key, {'payload': payload})
+                self.stream_manager.add_event(
+                    stream_id, {'type': 'error', 'message': error_msg, 'message_id': ai_message.id})
             except Exception:
                 pass
             
@@ -173,134 +452,141 @@ class AIService:
     def _stream_ai_response_with_redis(self, user_message: Message, ai_message: Message, 
                                      stream_id: str, conversation_id: int) -> None:
         """Stream AI response using Redis Streams (XADD)."""
-        events_key = self.stream_manager.get_events_key(stream_id)
-        ai_response = ""
+        writer = self._make_writer(stream_id, ai_message.id)
+        watch = None
         
         try:
-            # Get conversation history
-            messages = Message.query.filter_by(
-                conversation_id=conversation_id
-            ).order_by(Message.timestamp).all()
-            
-            # Convert to AI format
-            ai_messages = [
-                {"role": msg.role, "content": msg.content} 
-                for msg in messages
-            ]
+            # Summary of older turns plus recent history, within the token budget
+            conversation = db.session.get(Conversation, conversation_id)
+            summary = conversation.summary if conversation else None
+            summary_through_id = conversation.summary_through_id if conversation else None
+            budget = self.context_token_budget - Message.estimate_tokens(summary)
+            # Branching conversations: only the ancestors of this turn
+            branch = conversation is not None and conversation.active_leaf_id is not None
+            if branch:
+                messages = build_branch_context(user_message.id, budget, after_id=summary_through_id)
+            else:
+                messages = build_context(conversation_id, user_message.id, budget,
+                                         after_id=summary_through_id)
             
-            # Check if Gemini client is available
-            if not self.client:
+            # Check if a model provider is available
+            if self.provider is None:
                 error_msg = "AI service is temporarily unavailable. Please try again later."
                 self._handle_ai_error(ai_message, stream_id, f"stream:{stream_id}", error_msg)
                 return
             
-            # Convert messages to Gemini format using types.Content
-            from google.genai import types
-            gemini_messages = []
-            for msg in ai_messages:
-                if msg['role'] == 'user':
-                    gemini_messages.append(types.Content(
-                        role='user', 
-                        parts=[types.Part.from_text(text=msg['content'])]
-                    ))
-                elif msg['role'] == 'assistant':
-                    gemini_messages.append(types.Content(
-                        role='model', 
-                        parts=[types.Part.from_text(text=msg['content'])]
-                    ))
+            # Convert to the provider message format
+            model_messages = [
+                {'role': 'user' if msg.role == 'user' else 'model', 'text': msg.content}
+                for msg in messages
+                if msg.role in ('user', 'assistant')
+            ]
             
             # With Redis Streams, late consumers can replay from 0-0 or last_id.
 
-            # Call Gemini API with streaming
-            response = self.client.models.generate_content_stream(
-                model=self.model_name,
-                contents=gemini_messages,
-            )
-            
-            for chunk in response:
-                # Check if stream still exists
-                if not self.stream_manager.get_stream(stream_id):
-                    break
-                    
-                if getattr(chunk, 'text', None):
-                    content = chunk.text
-                    ai_response += content
-                    
-                    # Add chunk event to Redis Stream
-                    payload = json.dumps({'type': 'chunk','content': content,'message_id': ai_message.id})
-                    _ = self.redis.xadd(events_key, {'payload': payload})
-                    
-                    # Update stream activity
-                    self.stream_manager.update_stream_activity(stream_id)
-            
+            # Cancellation is pushed to us; the loop only checks a local flag
+            watch = self._watch_cancel(stream_id)
+
+            # Stream from the model
+            instructions = []
+            if summary:
+                instructions.append("Summary of the earlier part of this conversation:\n" + summary)
+            passages = self._retrieval_instruction(model_messages)
+            if passages:
+                instructions.append(passages)
+            attachments = self._attachment_instruction(conversation_id, model_messages)
+            if attachments:
+                instructions.append(attachments)
+            if conversation is not None:
+                documents = self._user_documents_instruction(conversation.user_id, model_messages)
+                if documents:
+                    instructions.append(documents)
+            system_instruction = '\n\n'.join(instructions) or None
+            if self.chat_tools_enabled and conversation is not None:
+                tools = ChecklistTools(conversation.user_id, self.checklist_snapshots)
+                stop_reason = self._stream_with_tools(model_messages, system_instruction, writer, watch, tools)
+            else:
+                stop_reason = self._stream_model_call(model_messages, system_instruction, writer, watch)
+
+            if stop_reason:
+                # Keep what was generated so far
+                ai_message.content = writer.text
+                ai_message.status = 'cancelled'
+                db.session.commit()
+                writer.close({'type': 'cancelled', 'message_id': ai_message.id, 'reason': stop_reason})
+                self.stream_manager.mark_stream_cancelled(stream_id)
+                return
+
             # Update database with complete response
-            ai_message.content = ai_response
+            ai_message.content = writer.text
             ai_message.status = 'complete'
             db.session.commit()
+
+            if user_message.parent_message_id is None:
+                # Readers stop at 'complete'; a later title event would never reach them
+                self._await_title(stream_id)
             
-            # Add completion event
-            complete_payload = json.dumps({'type': 'complete','message_id': ai_message.id})
-            _ = self.redis.xadd(events_key, {'payload': complete_payload})
+            # Flush the tail of the response together with the completion event
+            writer.close({'type': 'complete', 'message_id': ai_message.id})
             
             # Mark stream as complete
             self.stream_manager.mark_stream_complete(stream_id)
             # Optionally trim stream size
             self.stream_manager.trim_events_stream(stream_id)
+
+            if messages and summary_due(conversation_id, summary_through_id, messages[0].id,
+                                        self.summary_min_messages, branch=branch):
+                self._schedule_summary(conversation_id, messages[0].id)
             
         except Exception as e:
             self._handle_ai_error(ai_message, stream_id, f"stream:{stream_id}", str(e))
+        finally:
+            if watch is not None:
+                self._unwatch_cancel(watch)
+
+    def summarize_conversation(self, conversation_id: int, before_id: int,
+                               summarizer: Summarizer = None) -> int:
+        """Fold turns older than ``before_id`` into the conversation summary."""
+        if summarizer is None:
+            if self.provider is None:
+                return 0
+            summarizer = ModelSummarizer(self.provider, self.model_name)
+        with self._acquire_model_slot('user'):
+            return fold_older_turns(conversation_id, before_id, summarizer)
+
+    @staticmethod
+    def _schedule_summary(conversation_id: int, before_id: int) -> None:
+        try:
+            from app.tasks.ai import summarize_conversation_task
+            summarize_conversation_task.delay(conversation_id, before_id)
+        except Exception:
+            # A missed summary only means a longer prompt next turn
+            pass
 
     def generate_title_via_tool(self, first_message_text: str) -> str:
-        """Try to generate a title using GenAI tool-calling; fallback locally.
+        """Try to generate a title using tool-calling; fallback locally.
 
         Keeps logic minimal: declare the title tool and ask the model to call it
-        based on the first user message. If the client isn't configured or
+        based on the first user message. If no provider is configured or the
         function call isn't returned, use local fallbacks.
         """
         try:
-            if not self.client:
+            if self.provider is None:
                 return generate_title(ai_tool_title=None, first_message=first_message_text)
 
             tools_spec = ai_tools.get_tools_spec()
             # Prompt model to call the tool to produce a concise title from the first message
-            contents = [
-                {"role": "user", "parts": [
-                    (
-                        "Given the following first user message, call the tool "
-                        "generate_conversation_title with the best concise title. "
-                        "Return a function call, not plain text.\n\n"
-                    ),
-                    first_message_text,
-                ]}
-            ]
-
-            resp = self.client.models.generate_content(
-                model=self.model_name,
-                contents=contents,
-                config={
-                    "tools": [tools_spec],
-                    # Ensure it may produce a function call
-                    "tool_config": {"function_calling_config": {"mode": "ANY"}},
-                },
-            )
-
-            fcalls = getattr(resp, "function_calls", None)
-            if not fcalls:
-                return generate_title(ai_tool_title=None, first_message=first_message_text)
+            prompt = (
+                "Given the following first user message, call the tool "
+                "generate_conversation_title with the best concise title. "
+                "Return a function call, not plain text.\n\n"
+            ) + first_message_text
 
-            # Use the first function call result; guard for structure differences
-            call = fcalls[0]
-            args = getattr(call, "args", None)
-            if args and "title" in args:
-                return generate_title(ai_tool_title=str(args["title"]), first_message=first_message_text)
-
-            # Some SDK surfaces args as dict(call.args)
-            try:
-                args_dict = dict(args) if args is not None else {}
-            except Exception:
-                args_dict = {}
-            if "title" in args_dict:
-                return generate_title(ai_tool_title=str(args_dict["title"]), first_message=first_message_text)
+            with self._acquire_model_slot('user'):
+                call = self.provider.call_function(
+                    self.model_name, [{'role': 'user', 'text': prompt}], tools_spec)
+            if call is not None and call.args.get("title"):
+                return generate_title(ai_tool_title=str(call.args["title"]), first_message=first_message_text)
 
             return generate_title(ai_tool_title=None, first_message=first_message_text)
 
@@ -308,6 +594,49 @@ class AIService:
             # Fall back silently to local generation on any SDK/runtime error
             return generate_title(ai_tool_title=None, first_message=first_message_text)
     
+    def generate_conversation_title(self, conversation_id: int, stream_id: str,
+                                    first_message_text: str, provisional_title: str) -> str:
+        """Replace a conversation's provisional title with the AI one.
+
+        The title is only changed if it still is the provisional one (the user
+        may have renamed the conversation meanwhile); a ``title`` event then
+        goes out on the stream of the first response, whose completion waits
+        for it.
+        """
+        try:
+            title = Conversation.normalize_title(self.generate_title_via_tool(first_message_text))
+            if not title or title == provisional_title:
+                return provisional_title
+
+            updated = Conversation.query.filter_by(id=conversation_id, title=provisional_title).update(
+                {'title': title}, synchronize_session=False)
+            db.session.commit()
+            if not updated:
+                return provisional_title
+
+            try:
+                self.stream_manager.add_event(
+                    stream_id, {'type': 'title', 'conversation_id': conversation_id, 'title': title})
+            except Exception:
+                # The new title is stored; clients also see it on the next list fetch
+                pass
+            return title
+        finally:
+            try:
+                self.stream_manager.title_done(stream_id)
+            except Exception:
+                pass
+
+    def _await_title(self, stream_id: str) -> None:
+        """Wait, up to ``title_wait_seconds``, for a pending ``title`` event."""
+        deadline = time.monotonic() + self.title_wait_seconds
+        try:
+            while self.stream_manager.title_pending(stream_id) and time.monotonic() < deadline:
+                time.sleep(TITLE_POLL_SECONDS)
+        except redis.RedisError:
+            # The title is stored either way; clients see it on the next list fetch
+            pass
+
     def _handle_ai_error(self, ai_message: Message, stream_id: str, channel: str, error_msg: str) -> None:
         """Handle AI processing errors."""
         # Update database with error
@@ -317,9 +646,8 @@ class AIService:
 
         # Add error event to Redis Stream
         try:
-            events_key = self.stream_manager.get_events_key(stream_id)
-            payload = json.dumps({'type': 'error','message': error_msg,'message_id': ai_message.id})
-            _ = self.redis.xadd(events_key, {'payload': payload})
+            self.stream_manager.add_event(
+                stream_id, {'type': 'error', 'message': error_msg, 'message_id': ai_message.id})
         except Exception:
             pass
 
@@ -329,9 +657,8 @@ class AIService:
     def _emit_guest_error(self, stream_id: str, error_msg: str) -> None:
         """Emit an error event for guest streams."""
         try:
-            events_key = self.stream_manager.get_events_key(stream_id)
-            payload = json.dumps({'type': 'error', 'message': error_msg, 'message_id': None})
-            _ = self.redis.xadd(events_key, {'payload': payload})
+            self.stream_manager.add_event(
+                stream_id, {'type': 'error', 'message': error_msg, 'message_id': None})
         except Exception:
             pass
 
@@ -0,0 +1,184 @@
+"""Checklist tools the chat model can call while answering.
+
+Reads are served from the user's cached checklist snapshot (see
+:mod:`app.core.checklist_snapshot`), so a tool call in the middle of a
+stream costs one Redis round trip instead of the joins behind
+``/checklists/tasks-summary``. Only ``mark_item_done`` touches item rows:
+it updates one item the user owns and invalidates the snapshot.
+
+Every tool returns a JSON-serializable dict; problems are reported to the
+model as ``{'error': ...}`` so it can tell the user instead of failing the
+stream.
+"""
+import datetime
+import logging
+import os
+from typing import Optional
+
+import redis
+from sqlalchemy.sql import func
+
+from app.core.checklist_snapshot import DEFAULT_TTL_SECONDS, ChecklistSnapshotCache
+from app.core.extensions import db
+from app.core.llm_provider import FunctionCall
+from app.db.models.checklist import Category, Checklist, Item
+from app.db.models.file import UploadedFile
+from app.services.document_index import search_user_documents
+
+logger = logging.getLogger(__name__)
+
+ITEM_STATUSES = ('pending', 'overdue', 'done', 'all')
+DEFAULT_ITEM_LIMIT = 20
+MAX_ITEM_LIMIT = 50
+MAX_DOCUMENT_RESULTS = 5
+
+
+def _iso(value) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def build_checklist_snapshot(user_id: int) -> dict:
+    """The user's checklists and items, flattened, from a single query.
+
+    Items are ordered like the tasks summary: by deadline, undated last,
+    then by id. Whether an item is overdue depends on the day, so it is
+    left to the reader.
+    """
+    files = db.session.query(
+        UploadedFile.item_id, func.count(UploadedFile.id).label('files')
+    ).filter(UploadedFile.user_id == user_id, UploadedFile.item_id.isnot(None)).group_by(
+        UploadedFile.item_id).subquery()
+    rows = db.session.query(
+        Checklist.id, Checklist.title, Checklist.overall_deadline,
+        Category.id, Category.title,
+        Item.id, Item.title, Item.deadline, Item.is_completed, files.c.files,
+    ).select_from(Checklist).outerjoin(
+        Category, Category.checklist_id == Checklist.id
+    ).outerjoin(
+        Item, Item.category_id == Category.id
+    ).outerjoin(
+        files, files.c.item_id == Item.id
+    ).filter(Checklist.user_id == user_id).order_by(Checklist.id).all()
+
+    checklists, items = {}, []
+    for (checklist_id, checklist_title, overall_deadline, category_id, category_title,
+         item_id, item_title, deadline, is_completed, file_count) in rows:
+        checklists.setdefault(checklist_id, {
+            'id': checklist_id, 'title': checklist_title, 'overall_deadline': _iso(overall_deadline)})
+        if item_id is not None:
+            items.append({
+                'id': item_id, 'title': item_title,
+                'checklist_id': checklist_id, 'checklist': checklist_title,
+                'category_id': category_id, 'category': category_title,
+                'deadline': _iso(deadline), 'is_completed': bool(is_completed), 'files': file_count or 0,
+            })
+    items.sort(key=lambda item: (item['deadline'] is None, item['deadline'] or '', item['id']))
+    return {
+        'user_id': user_id,
+        'built_at': datetime.datetime.utcnow().isoformat(),
+        'checklists': list(checklists.values()),
+        'items': items,
+    }
+
+
+def checklist_snapshot_cache(redis_client: redis.Redis) -> ChecklistSnapshotCache:
+    """Snapshot cache with the configured TTL; writers and the chat must agree on it."""
+    return ChecklistSnapshotCache(
+        redis_client, build_checklist_snapshot,
+        ttl_seconds=int(os.environ.get('CHECKLIST_SNAPSHOT_TTL_SECONDS', DEFAULT_TTL_SECONDS)),
+    )
+
+
+def item_status(item: dict, today: datetime.date) -> str:
+    """'done', 'overdue' or 'pending', as in ``/checklists/tasks-summary``."""
+    if item['is_completed']:
+        return 'done'
+    if item['deadline'] and item['deadline'] < today.isoformat():
+        return 'overdue'
+    return 'pending'
+
+
+class ChecklistTools:
+    """Runs the model's checklist tool calls for one user."""
+
+    def __init__(self, user_id: int, snapshots: ChecklistSnapshotCache, today: datetime.date = None):
+        self.user_id = user_id
+        self.snapshots = snapshots
+        self.today = today or datetime.date.today()
+
+    def execute(self, call: FunctionCall) -> dict:
+        """Result of ``call`` for the model's tool response."""
+        handler = {
+            'get_checklist_overview': self.get_checklist_overview,
+            'list_checklist_items': self.list_checklist_items,
+            'mark_item_done': self.mark_item_done,
+            'find_uploaded_documents': self.find_uploaded_documents,
+        }.get(call.name)
+        if handler is None:
+            return {'error': f'Unknown tool: {call.name}'}
+        try:
+            return handler(**(call.args or {}))
+        except (TypeError, ValueError) as e:
+            return {'error': f'Invalid arguments for {call.name}: {e}'}
+        except Exception as e:
+            logger.warning("Checklist tool %s failed for user %s: %s", call.name, self.user_id, e)
+            return {'error': f'{call.name} failed; the checklist could not be read or updated.'}
+
+    def _summarize(self, item: dict) -> dict:
+        return {
+            'id': item['id'], 'title': item['title'], 'checklist_id': item['checklist_id'],
+            'checklist': item['checklist'], 'category': item['category'], 'deadline': item['deadline'],
+            'status': item_status(item, self.today), 'files': item['files'],
+        }
+
+    def get_checklist_overview(self) -> dict:
+        snapshot = self.snapshots.get(self.user_id)
+        overview = {checklist['id']: dict(checklist, done=0, pending=0, overdue=0, next_deadline=None)
+                    for checklist in snapshot['checklists']}
+        for item in snapshot['items']:
+            summary = overview[item['checklist_id']]
+            status = item_status(item, self.today)
+            summary[status] += 1
+            if status == 'pending' and item['deadline'] and not summary['next_deadline']:
+                # Items are ordered by deadline
+                summary['next_deadline'] = item['deadline']
+        return {'today': self.today.isoformat(), 'checklists': list(overview.values())}
+
+    def list_checklist_items(self, status: str = 'pending', checklist_id=None, query: str = None,
+                             limit=DEFAULT_ITEM_LIMIT) -> dict:
+        if status not in ITEM_STATUSES:
+            raise ValueError(f"status must be one of {', '.join(ITEM_STATUSES)}")
+        checklist_id = int(checklist_id) if checklist_id is not None else None
+        limit = max(1, min(int(limit), MAX_ITEM_LIMIT))
+        words = (query or '').lower().split()
+
+        matches = []
+        for item in self.snapshots.get(self.user_id)['items']:
+            if checklist_id is not None and item['checklist_id'] != checklist_id:
+                continue
+            if status != 'all' and item_status(item, self.today) != status:
+                continue
+            if words:
+                text = f"{item['title']} {item['category']} {item['checklist']}".lower()
+                if not all(word in text for word in words):
+                    continue
+            matches.append(item)
+        return {'today': self.today.isoformat(), 'total': len(matches),
+                'items': [self._summarize(item) for item in matches[:limit]]}
+
+    def mark_item_done(self, item_id, done: bool = True) -> dict:
+        if not isinstance(done, bool):
+            raise ValueError('done must be true or false')
+        item = Item.query.join(Category).join(Checklist).filter(
+            Item.id == int(item_id), Checklist.user_id == self.user_id).first()
+        if item is None:
+            return {'error': f'No checklist item {item_id} for this user.'}
+        item.is_completed = done
+        db.session.commit()
+        self.snapshots.invalidate(self.user_id)
+        return {'id': item.id, 'title': item.title, 'is_completed': item.is_completed}
+
+    def find_uploaded_documents(self, query: str) -> dict:
+        hits = search_user_documents(self.user_id, query, k=MAX_DOCUMENT_RESULTS)
+        # Entry text: name, checklist path, upload date, start of the text
+        return {'documents': [{'file_id': hit.file_id, 'description': hit.text[:300]} for hit in hits]}
@@ -0,0 +1,185 @@
+"""Per-user index of the files attached to checklist items.
+
+Each file is one :class:`DocumentIndexEntry`: its name, where it sits in the
+user's checklists and the start of its extracted text, with BM25 tokens and
+an embedding of that text. Entries are upserted when a file is uploaded,
+renamed, finishes extraction or its item, category or checklist is renamed,
+and evicted by primary key when the file row is deleted, whether directly or
+via its Item, Category or Checklist. Nothing is ever rebuilt as a whole.
+
+Request handlers only write the text and terms; the embedding, an API call
+with remote embedders, is added by the documents Celery task
+(:func:`embed_files`). Until then the entry takes part in BM25 only.
+
+A query ranks only the user's own entries: cosine similarity and BM25 over
+a few dozen rows, fused by reciprocal rank.
+"""
+import logging
+from typing import List, Optional
+
+import numpy as np
+
+from app.core.bm25_index import score_documents, tokenize
+from app.core.extensions import db
+from app.core.knowledge_base import DEFAULT_RRF_K, reciprocal_rank_fusion
+from app.db.models import DocumentIndexEntry, UploadedFile
+from app.services.document_service import TEXT_READY, get_document_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_USER_DOCUMENTS_TOP_K = 5
+DEFAULT_USER_DOCUMENTS_MIN_SCORE = 0.2
+
+
+class DocumentHit:
+    """An indexed file matching a query, with its fused score and per-ranking scores."""
+
+    def __init__(self, file_id: int, text: str, score: float,
+                 cosine: Optional[float] = None, bm25: Optional[float] = None):
+        self.file_id = file_id
+        self.text = text
+        self.score = score
+        self.cosine = cosine
+        self.bm25 = bm25
+
+    def __repr__(self):
+        return f'<DocumentHit file={self.file_id} {self.score:.4f}>'
+
+
+def entry_text(uploaded_file: UploadedFile) -> str:
+    """What the index knows about a file: name, checklist path and leading text."""
+    lines = [uploaded_file.original_filename]
+    item = uploaded_file.item
+    if item is not None:
+        category = item.category
+        path = [category.checklist.title, category.title, item.title] if category is not None else [item.title]
+        lines.append(' > '.join(path))
+    if uploaded_file.uploaded_at is not None:
+        lines.append(f'uploaded {uploaded_file.uploaded_at:%Y-%m-%d}')
+    cache = get_document_cache()
+    if cache is not None and uploaded_file.text_status == TEXT_READY and uploaded_file.content_hash:
+        excerpt = (cache.meta(uploaded_file.content_hash) or {}).get('excerpt')
+        if excerpt:
+            lines.append(excerpt)
+    return '\n'.join(lines)
+
+
+def index_file(uploaded_file: UploadedFile, embed: bool = True) -> bool:
+    """Add or refresh the file's entry in the caller's transaction; ``False`` on failure.
+
+    Without ``embed`` a changed text drops its stale embedding instead of
+    computing a new one; schedule :func:`embed_files` after the commit.
+    The index only helps answers, so a failure (e.g. the embedding API being
+    down) is logged and leaves the upload alone; ``flask documents index``
+    fills gaps later.
+    """
+    try:
+        text = entry_text(uploaded_file)
+        entry = uploaded_file.index_entry or DocumentIndexEntry(uploaded_file=uploaded_file)
+        changed = entry.text != text
+        entry.user_id = uploaded_file.user_id
+        entry.text = text
+        entry.terms = ' '.join(tokenize(text))
+        cache = get_document_cache()
+        if cache is not None and embed:
+            entry.embedder = cache.embedder.signature
+            entry.embedding = _vector_bytes(cache.embedder.embed([text])[0])
+        elif changed:
+            entry.embedder = entry.embedding = None
+        db.session.add(entry)
+        return True
+    except Exception as e:
+        logger.warning("Could not index file %s: %s", uploaded_file.id, e)
+        return False
+
+
+def embed_files(file_ids: List[int]) -> int:
+    """Embed the entries of ``file_ids`` that lack a current embedding; returns how many.
+
+    One batch call to the embedder. An entry whose text changed meanwhile is
+    left for the embedding scheduled by that change.
+    """
+    cache = get_document_cache()
+    if cache is None or not file_ids:
+        return 0
+    signature = cache.embedder.signature
+    entries = DocumentIndexEntry.query.filter(
+        DocumentIndexEntry.file_id.in_(file_ids),
+        db.or_(DocumentIndexEntry.embedding.is_(None), DocumentIndexEntry.embedder.is_(None),
+               DocumentIndexEntry.embedder != signature),
+    ).all()
+    if not entries:
+        return 0
+    texts = {entry.file_id: entry.text for entry in entries}
+    vectors = cache.embedder.embed(list(texts.values()))
+    embedded = 0
+    for (file_id, text), vector in zip(texts.items(), vectors):
+        embedded += DocumentIndexEntry.query.filter_by(file_id=file_id, text=text).update(
+            {'embedder': signature, 'embedding': _vector_bytes(vector)}, synchronize_session=False)
+    db.session.commit()
+    return embedded
+
+
+def _vector_bytes(vector) -> bytes:
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def index_missing_files(user_id: Optional[int] = None) -> int:
+    """Index checklist files without an up-to-date entry; returns how many were indexed."""
+    cache = get_document_cache()
+    signature = cache.embedder.signature if cache is not None else None
+    stale = DocumentIndexEntry.file_id.is_(None)
+    if signature is not None:
+        stale = db.or_(stale, DocumentIndexEntry.embedder.is_(None), DocumentIndexEntry.embedder != signature)
+    query = UploadedFile.query.outerjoin(DocumentIndexEntry).filter(UploadedFile.item_id.isnot(None), stale)
+    if user_id is not None:
+        query = query.filter(UploadedFile.user_id == user_id)
+    indexed = sum(index_file(uploaded_file) for uploaded_file in query.all())
+    db.session.commit()
+    return indexed
+
+
+def search_user_documents(user_id: int, query: str, k: int = DEFAULT_USER_DOCUMENTS_TOP_K,
+                          min_score: float = DEFAULT_USER_DOCUMENTS_MIN_SCORE) -> List[DocumentHit]:
+    """The user's indexed files best matching ``query``.
+
+    Vector candidates need a cosine of at least ``min_score``; BM25
+    candidates need a matching term. Entries embedded by another embedder
+    still take part in BM25.
+    """
+    if not query or not query.strip() or k <= 0:
+        return []
+    entries = DocumentIndexEntry.query.filter_by(user_id=user_id).all()
+    if not entries:
+        return []
+
+    cache = get_document_cache()
+    dense = {}
+    if cache is not None:
+        embedded = [entry for entry in entries if entry.embedder == cache.embedder.signature and entry.embedding]
+        if embedded:
+            vectors = np.frombuffer(b''.join(entry.embedding for entry in embedded), dtype=np.float32)
+            cosines = vectors.reshape(len(embedded), -1) @ cache.embedder.embed([query])[0]
+            for row in np.argsort(-cosines, kind='stable'):
+                if cosines[row] < min_score:
+                    break
+                dense[embedded[row].file_id] = float(cosines[row])
+
+    scores = score_documents([entry.terms.split() for entry in entries], tokenize(query))
+    sparse = {entries[row].file_id: float(scores[row])
+              for row in np.argsort(-scores, kind='stable') if scores[row] > 0}
+
+    texts = {entry.file_id: entry.text for entry in entries}
+    fused = reciprocal_rank_fusion([list(dense), list(sparse)], DEFAULT_RRF_K)
+    return [DocumentHit(file_id, texts[file_id], score, cosine=dense.get(file_id), bm25=sparse.get(file_id))
+            for file_id, score in fused[:k]]
+
+
+def format_user_documents(hits: List[DocumentHit]) -> Optional[str]:
+    """System-instruction block listing the matching files, or ``None``."""
+    if not hits:
+        return None
+    lines = ['- ' + hit.text.replace('\n', ' | ')[:300] for hit in hits]
+    return ("Files the user has uploaded to their checklists that may be relevant (name | checklist > "
+            "category > item | upload date | start of the text). Use them to answer questions about "
+            "which documents the user already has:\n" + '\n'.join(lines))
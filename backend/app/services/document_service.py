@@ -0,0 +1,133 @@
+"""Text of chat uploads: extraction status and the excerpts added to prompts."""
+import logging
+import os
+import threading
+from typing import List, Optional
+
+from app.core.document_text import (
+    DEFAULT_CACHE_PATH, PAGE_LABELS, DocumentChunkCache, document_kind, file_sha256, iter_pages,
+)
+from app.core.extensions import db
+from app.core.knowledge_base import create_embedder
+from app.db.models import Message, UploadedFile
+from app.db.models.conversation import message_attachment
+
+logger = logging.getLogger(__name__)
+
+TEXT_PENDING = 'pending'
+TEXT_READY = 'ready'
+TEXT_FAILED = 'failed'
+TEXT_UNSUPPORTED = 'unsupported'
+DEFAULT_ATTACHMENT_TOP_K = 6
+# Most recent distinct files of a conversation searched for each answer
+MAX_CONVERSATION_ATTACHMENTS = 10
+
+
+_cache: Optional[DocumentChunkCache] = None
+_cache_pid: Optional[int] = None
+_cache_lock = threading.Lock()
+
+
+def get_document_cache() -> Optional[DocumentChunkCache]:
+    """This process's chunk cache; ``None`` when no embedder is available."""
+    global _cache, _cache_pid
+    with _cache_lock:
+        if _cache is None or _cache_pid != os.getpid():
+            embedder = create_embedder()
+            if embedder is None:
+                return None
+            _cache = DocumentChunkCache(os.environ.get('DOCUMENT_CACHE_PATH') or DEFAULT_CACHE_PATH, embedder)
+            _cache_pid = os.getpid()
+        return _cache
+
+
+def prepare_upload(uploaded_file: UploadedFile) -> bool:
+    """Hash a new chat upload and set its text status; ``True`` if extraction must run.
+
+    Content that was extracted before (a re-upload, or the same file in
+    another conversation) is ready straight away.
+    """
+    if document_kind(uploaded_file.original_filename, uploaded_file.mime_type) is None:
+        uploaded_file.text_status = TEXT_UNSUPPORTED
+        return False
+    uploaded_file.content_hash = file_sha256(uploaded_file.file_path)
+    cache = get_document_cache()
+    if cache is not None and cache.contains(uploaded_file.content_hash):
+        uploaded_file.text_status = TEXT_READY
+        return False
+    uploaded_file.text_status = TEXT_PENDING
+    return True
+
+
+def extract_uploaded_file(file_id: int) -> Optional[str]:
+    """Extract and cache the text of an upload; returns its new text status."""
+    uploaded_file = db.session.get(UploadedFile, file_id)
+    if uploaded_file is None:
+        return None
+    kind = document_kind(uploaded_file.original_filename, uploaded_file.mime_type)
+    cache = get_document_cache()
+    if kind is None:
+        status = TEXT_UNSUPPORTED
+    elif cache is None:
+        logger.warning("No embedder configured; cannot index file %s", file_id)
+        status = TEXT_FAILED
+    else:
+        try:
+            uploaded_file.content_hash = uploaded_file.content_hash or file_sha256(uploaded_file.file_path)
+            if not cache.contains(uploaded_file.content_hash):
+                cache.build(uploaded_file.content_hash, iter_pages(uploaded_file.file_path, kind), PAGE_LABELS[kind])
+            status = TEXT_READY
+        except Exception as e:
+            logger.warning("Text extraction failed for file %s: %s", file_id, e)
+            status = TEXT_FAILED
+    uploaded_file.text_status = status
+    if uploaded_file.item_id is not None and status == TEXT_READY:
+        # Imported here: the index builds on this module
+        from app.services.document_index import index_file
+        index_file(uploaded_file)
+    db.session.commit()
+    return status
+
+
+def conversation_attachments(conversation_id: int,
+                             limit: int = MAX_CONVERSATION_ATTACHMENTS) -> List[UploadedFile]:
+    """Files attached anywhere in the conversation, most recently attached first."""
+    rows = (db.session.query(message_attachment.c.file_id)
+            .join(Message, Message.id == message_attachment.c.message_id)
+            .filter(Message.conversation_id == conversation_id)
+            .order_by(Message.id.desc(), message_attachment.c.file_id.desc())
+            .all())
+    file_ids = list(dict.fromkeys(file_id for (file_id,) in rows))[:limit]
+    if not file_ids:
+        return []
+    files = {f.id: f for f in UploadedFile.query.filter(UploadedFile.id.in_(file_ids)).all()}
+    return [files[file_id] for file_id in file_ids if file_id in files]
+
+
+def attachment_context(files: List[UploadedFile], query: str,
+                       k: int = DEFAULT_ATTACHMENT_TOP_K) -> Optional[str]:
+    """System-instruction block with the best excerpts of ``files`` for ``query``, or ``None``."""
+    cache = get_document_cache()
+    hits, waiting = [], []
+    for uploaded_file in files:
+        index = None
+        if cache is not None and uploaded_file.text_status == TEXT_READY:
+            index = cache.open(uploaded_file.content_hash)
+        if index is None:
+            if uploaded_file.text_status == TEXT_PENDING:
+                waiting.append(uploaded_file.original_filename)
+            continue
+        for rank, passage in enumerate(index.search(query, k=k)):
+            hits.append((rank, -passage.score, uploaded_file.original_filename, passage))
+
+    # Fused scores are per file, so take every file's best excerpt before anyone's second
+    hits.sort(key=lambda hit: hit[:2])
+    lines = [f'[{filename}, {passage.source}] {passage.text}' for _rank, _score, filename, passage in hits[:k]]
+    blocks = []
+    if lines:
+        blocks.append("Excerpts from files the user attached to this conversation. Cite them as "
+                      "[file, page] and say when they do not contain the answer:\n" + '\n'.join(lines))
+    if waiting:
+        blocks.append("These attached files are still being read and cannot be quoted yet: "
+                      + ', '.join(waiting))
+    return '\n\n'.join(blocks) or None
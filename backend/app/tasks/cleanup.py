@@ -1,19 +1,16 @@
 """Background cleanup tasks for chat streams and other artifacts."""
-import os
-
-import redis
 from celery import Celery
 
-from app import create_app
 from app.core.celery import celery
+from app.core.extensions import redis_provider
 from app.core.stream_manager import StreamManager
 from app.services.password_reset_service import prune_expired_reset_tokens
+from app.tasks.worker import get_worker_context
 
 
 def get_redis_client():
-    """Get Redis client instance."""
-    redis_url = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
-    return redis.from_url(redis_url, decode_responses=True)
+    """Get the shared Redis client."""
+    return redis_provider.client
 
 
 def get_stream_manager():
@@ -46,11 +43,16 @@ def create_cleanup_task(celery_app: Celery):
     return cleanup_expired_streams_task
 
 
+@celery.task(name='cleanup.expired_streams')
+def cleanup_expired_streams_periodic_task():
+    """Celery beat entry point for stream cleanup."""
+    return cleanup_expired_streams()
+
+
 def cleanup_password_reset_tokens():
     """Remove password reset tokens that are past the configured retention window."""
     try:
-        app = create_app(os.environ.get('FLASK_CONFIG', 'development'))
-        with app.app_context():
+        with get_worker_context().app.app_context():
             from flask import current_app
 
             retention = current_app.config.get('PASSWORD_RESET_TOKEN_RETENTION_MINUTES', 1440)
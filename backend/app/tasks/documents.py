@@ -0,0 +1,76 @@
+"""Celery tasks to extract the text of uploaded files and embed their index entries."""
+import threading
+
+from flask import current_app
+
+from app.core.celery import celery
+from app.services.document_index import embed_files
+from app.services.document_service import TEXT_FAILED, extract_uploaded_file
+from app.tasks.worker import get_worker_context
+
+
+# Long PDFs take longer than the 5 minute default limit
+@celery.task(name='documents.extract_text', time_limit=1800, soft_time_limit=1740)
+def extract_file_text_task(file_id: int) -> str:
+    """Extract, chunk and cache the text of an uploaded file."""
+    worker = get_worker_context()
+    with worker.app.app_context():
+        try:
+            return extract_uploaded_file(file_id)
+        except Exception as e:
+            print(f"Text extraction task error: {e}")
+            return TEXT_FAILED
+
+
+def schedule_text_extraction(file_id: int) -> None:
+    """Queue text extraction; without Celery run it on a background thread."""
+    try:
+        extract_file_text_task.delay(file_id)
+        return
+    except Exception:
+        pass
+
+    app = current_app._get_current_object()
+
+    def run_extraction():
+        with app.app_context():
+            try:
+                extract_uploaded_file(file_id)
+            except Exception as e:
+                print(f"Text extraction error: {e}")
+
+    threading.Thread(target=run_extraction, daemon=True).start()
+
+
+@celery.task(name='documents.embed_index_entries')
+def embed_index_entries_task(file_ids: list) -> int:
+    """Embed the document index entries of checklist files off the request path."""
+    worker = get_worker_context()
+    with worker.app.app_context():
+        try:
+            return embed_files(file_ids)
+        except Exception as e:
+            print(f"Index embedding task error: {e}")
+            return 0
+
+
+def schedule_index_embedding(file_ids: list) -> None:
+    """Queue embedding of index entries; without Celery run it on a background thread."""
+    if not file_ids:
+        return
+    try:
+        embed_index_entries_task.delay(list(file_ids))
+        return
+    except Exception:
+        pass
+
+    app = current_app._get_current_object()
+
+    def run_embedding():
+        with app.app_context():
+            try:
+                embed_files(file_ids)
+            except Exception as e:
+                print(f"Index embedding error: {e}")
+
+    threading.Thread(target=run_embedding, daemon=True).start()
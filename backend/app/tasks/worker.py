@@ -0,0 +1,63 @@
+"""Flask app and services shared by every task in a Celery worker process.
+
+Building the app per task re-registers blueprints, re-creates upload
+directories and starts from cold DB and Redis connections, and a fresh
+``AIService`` means a fresh model provider client. The context here is built once
+per worker process, from ``worker_process_init`` in prefork children, or
+lazily on first use elsewhere (solo pool, eager tasks), and is rebuilt if
+the process forks.
+"""
+import os
+import threading
+from typing import Optional
+
+from celery.signals import worker_process_init, worker_process_shutdown
+from flask import Flask
+
+from app import create_app
+from app.core.extensions import db, redis_provider
+from app.core.stream_manager import StreamManager
+from app.services.ai_service import AIService
+
+
+class WorkerContext:
+    """The app and long-lived services of one worker process."""
+
+    def __init__(self, config_name: Optional[str] = None):
+        self.pid = os.getpid()
+        self.app: Flask = create_app(config_name or os.environ.get('FLASK_CONFIG', 'development'))
+        redis_client = redis_provider.client
+        self.stream_manager = StreamManager(redis_client)
+        self.ai_service = AIService(redis_client, self.stream_manager)
+
+    def close(self) -> None:
+        with self.app.app_context():
+            db.engine.dispose()
+
+
+_context: Optional[WorkerContext] = None
+_context_lock = threading.Lock()
+
+
+def get_worker_context() -> WorkerContext:
+    """Return this process's context, building it on first use or after a fork."""
+    global _context
+    with _context_lock:
+        if _context is None or _context.pid != os.getpid():
+            _context = WorkerContext()
+        return _context
+
+
+@worker_process_init.connect
+def init_worker_process(**_kwargs) -> None:
+    """Warm the context before the child takes its first task."""
+    get_worker_context()
+
+
+@worker_process_shutdown.connect
+def shutdown_worker_process(**_kwargs) -> None:
+    global _context
+    with _context_lock:
+        context, _context = _context, None
+    if context is not None and context.pid == os.getpid():
+        context.close()
@@ -0,0 +1,15 @@
+"""ASGI entry point for the asyncio SSE gateway.
+
+Serves only ``/chat/stream/<stream_id>``; everything else stays on the Flask
+app in ``main.py``. Run with e.g. ``uvicorn asgi:app --port 5001``.
+"""
+import os
+from dotenv import load_dotenv
+from app import create_app
+from app.api.chat.sse_gateway import create_sse_gateway
+
+# Load environment variables
+load_dotenv()
+
+flask_app = create_app(os.getenv('FLASK_CONFIG', 'development'))
+app = create_sse_gateway(flask_app)
@@ -56,6 +56,16 @@ class Config:
 
     # Redis Configuration
     REDIS_URL = os.environ.get('REDIS_URL') or 'redis://localhost:6379/0'
+    # Shared pool for regular commands
+    REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', 50))
+    REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', 5))
+    REDIS_SOCKET_CONNECT_TIMEOUT = float(os.environ.get('REDIS_SOCKET_CONNECT_TIMEOUT', 2))
+    REDIS_HEALTH_CHECK_INTERVAL = int(os.environ.get('REDIS_HEALTH_CHECK_INTERVAL', 30))
+    # Separate pool for XREAD/pub-sub consumers that hold a connection while blocked;
+    # callers wait up to REDIS_BLOCKING_POOL_TIMEOUT for a free connection
+    REDIS_BLOCKING_MAX_CONNECTIONS = int(os.environ.get('REDIS_BLOCKING_MAX_CONNECTIONS', 200))
+    REDIS_BLOCKING_POOL_TIMEOUT = float(os.environ.get('REDIS_BLOCKING_POOL_TIMEOUT', 5))
+    REDIS_BLOCKING_SOCKET_TIMEOUT = float(os.environ.get('REDIS_BLOCKING_SOCKET_TIMEOUT', 30))
     
     # Celery Configuration
     CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL') or 'redis://localhost:6379/0'
@@ -64,10 +74,89 @@ class Config:
     # AI Configuration
     GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
     AI_MODEL = os.environ.get('AI_MODEL') or 'gemini-1.5-flash'
+    # Model backend: 'gemini' or 'fake' (deterministic local model for load tests)
+    AI_PROVIDER = os.environ.get('AI_PROVIDER') or 'gemini'
+    # Fake provider timing and failure injection
+    FAKE_LLM_TTFT_MS = float(os.environ.get('FAKE_LLM_TTFT_MS', 300))
+    FAKE_LLM_TOKENS_PER_SEC = float(os.environ.get('FAKE_LLM_TOKENS_PER_SEC', 60))
+    FAKE_LLM_CHUNK_TOKENS = int(os.environ.get('FAKE_LLM_CHUNK_TOKENS', 3))
+    FAKE_LLM_ERROR_RATE = float(os.environ.get('FAKE_LLM_ERROR_RATE', 0))
+    # Cluster-wide limits on model calls per tier (user, guest) and overall; 0 means unlimited
+    MODEL_USER_MAX_CONCURRENCY = int(os.environ.get('MODEL_USER_MAX_CONCURRENCY', 0))
+    MODEL_USER_RATE_PER_SEC = float(os.environ.get('MODEL_USER_RATE_PER_SEC', 0))
+    MODEL_GUEST_MAX_CONCURRENCY = int(os.environ.get('MODEL_GUEST_MAX_CONCURRENCY', 0))
+    MODEL_GUEST_RATE_PER_SEC = float(os.environ.get('MODEL_GUEST_RATE_PER_SEC', 0))
+    MODEL_GLOBAL_MAX_CONCURRENCY = int(os.environ.get('MODEL_GLOBAL_MAX_CONCURRENCY', 0))
+    MODEL_GLOBAL_RATE_PER_SEC = float(os.environ.get('MODEL_GLOBAL_RATE_PER_SEC', 0))
+    # Queued model calls give up (error event) after this long
+    MODEL_QUEUE_MAX_WAIT_SECONDS = float(os.environ.get('MODEL_QUEUE_MAX_WAIT_SECONDS', 30))
+    # Without Redis, model calls go ahead unlimited (true) or fail with a busy error (false)
+    MODEL_LIMITER_FAIL_OPEN = os.environ.get('MODEL_LIMITER_FAIL_OPEN', 'true').lower() == 'true'
+    # Prompt history is trimmed to the most recent turns within this many tokens
+    CONTEXT_TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET', 8000))
+    # Turns outside the window are folded into a rolling summary in batches of at least this many
+    SUMMARY_MIN_MESSAGES = int(os.environ.get('SUMMARY_MIN_MESSAGES', 10))
+    # Guest answers cached per normalized question; a TTL or size of 0 disables the cache
+    GUEST_CACHE_TTL_SECONDS = int(os.environ.get('GUEST_CACHE_TTL_SECONDS', 24 * 3600))
+    GUEST_CACHE_MAX_ENTRIES = int(os.environ.get('GUEST_CACHE_MAX_ENTRIES', 1000))
+    # Cache hits are replayed into the stream as chunks of this size at this spacing
+    GUEST_CACHE_REPLAY_CHUNK_CHARS = int(os.environ.get('GUEST_CACHE_REPLAY_CHUNK_CHARS', 48))
+    GUEST_CACHE_REPLAY_INTERVAL_MS = float(os.environ.get('GUEST_CACHE_REPLAY_INTERVAL_MS', 15))
+    # Guest answers run on this many threads per web process with at most this many waiting;
+    # beyond that /chat/send answers 503 with Retry-After
+    GUEST_STREAM_WORKERS = int(os.environ.get('GUEST_STREAM_WORKERS', 16))
+    GUEST_STREAM_QUEUE_DEPTH = int(os.environ.get('GUEST_STREAM_QUEUE_DEPTH', 64))
+    GUEST_RETRY_AFTER_SECONDS = int(os.environ.get('GUEST_RETRY_AFTER_SECONDS', 5))
+    # Server-side guest history (opt-in): idle sessions expire, prompts use the last N messages
+    GUEST_SESSION_TTL_SECONDS = int(os.environ.get('GUEST_SESSION_TTL_SECONDS', 2 * 3600))
+    GUEST_SESSION_MAX_MESSAGES = int(os.environ.get('GUEST_SESSION_MAX_MESSAGES', 40))
+    # Visa knowledge base built by `flask kb ingest <dir>`; the top passages (vector + BM25) are added to prompts
+    KB_ENABLED = os.environ.get('KB_ENABLED', 'true').lower() == 'true'
+    KB_PATH = os.environ.get('KB_PATH') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'kb')
+    # 'hash' (local, deterministic) or 'gemini'; an index only serves queries from the embedder that built it
+    KB_EMBEDDER = os.environ.get('KB_EMBEDDER') or 'hash'
+    KB_TOP_K = int(os.environ.get('KB_TOP_K', 4))
+    KB_MIN_SCORE = float(os.environ.get('KB_MIN_SCORE', 0.2))
+    # `flask kb add/delete` write small segments; past this many they are merged into one
+    KB_MAX_SEGMENTS = int(os.environ.get('KB_MAX_SEGMENTS', 8))
+    # Extracted chat upload text, cached by content hash and shared by equal uploads
+    DOCUMENT_CACHE_PATH = os.environ.get('DOCUMENT_CACHE_PATH') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'instance', 'documents')
+    # Excerpts of a conversation's attached files added to each prompt
+    ATTACHMENT_TOP_K = int(os.environ.get('ATTACHMENT_TOP_K', 6))
+    # Checklist files listed in prompts when they match the question (per-user document index)
+    USER_DOCUMENTS_TOP_K = int(os.environ.get('USER_DOCUMENTS_TOP_K', 5))
+    USER_DOCUMENTS_MIN_SCORE = float(os.environ.get('USER_DOCUMENTS_MIN_SCORE', 0.2))
+    # Chat tools over the user's checklists, read from per-user snapshots cached in Redis
+    CHAT_TOOLS_ENABLED = os.environ.get('CHAT_TOOLS_ENABLED', 'true').lower() == 'true'
+    CHAT_MAX_TOOL_ROUNDS = int(os.environ.get('CHAT_MAX_TOOL_ROUNDS', 4))
+    CHECKLIST_SNAPSHOT_TTL_SECONDS = int(os.environ.get('CHECKLIST_SNAPSHOT_TTL_SECONDS', 300))
     
     # Stream Configuration
     STREAM_TIMEOUT = 300  # 5 minutes
     STREAM_HEALTH_TTL = 60  # 1 minute
+    # Model chunks are coalesced before XADD; flush at this many bytes or ms
+    STREAM_FLUSH_BYTES = int(os.environ.get('STREAM_FLUSH_BYTES', 256))
+    STREAM_FLUSH_INTERVAL_MS = int(os.environ.get('STREAM_FLUSH_INTERVAL_MS', 50))
+    # Share one multi-key XREAD per process across all SSE viewers
+    SSE_MULTIPLEXED_READER = os.environ.get('SSE_MULTIPLEXED_READER', 'false').lower() == 'true'
+    SSE_FANOUT_BLOCK_MS = int(os.environ.get('SSE_FANOUT_BLOCK_MS', 1000))
+    # Threads the asyncio SSE gateway uses for token and user lookups
+    SSE_GATEWAY_AUTH_WORKERS = int(os.environ.get('SSE_GATEWAY_AUTH_WORKERS', 8))
+    # stream_health refreshes are throttled to one per interval per process and stream
+    STREAM_HEARTBEAT_INTERVAL = float(os.environ.get('STREAM_HEARTBEAT_INTERVAL', 5))
+    # Idle SSE connections get a comment frame this often
+    SSE_KEEPALIVE_SECONDS = int(os.environ.get('SSE_KEEPALIVE_SECONDS', 15))
+    # Stream entry layout: 'raw' (type + browser-ready JSON) or 'json' (single payload field)
+    STREAM_EVENT_CODEC = os.environ.get('STREAM_EVENT_CODEC', 'raw')
+    # How often celery beat sweeps streams whose producer stopped heartbeating
+    STREAM_CLEANUP_INTERVAL_SECONDS = float(os.environ.get('STREAM_CLEANUP_INTERVAL_SECONDS', 60))
+    # A stream is only swept after this long without activity; covers Celery backlog and model waits
+    STREAM_CLEANUP_GRACE_SECONDS = float(os.environ.get('STREAM_CLEANUP_GRACE_SECONDS', 1800))
+    # Generation stops this long after the last SSE viewer disconnects (resume window)
+    STREAM_DISCONNECT_GRACE_SECONDS = float(os.environ.get('STREAM_DISCONNECT_GRACE_SECONDS', 10))
+    # A new conversation's first answer sends 'complete' after its title event, waiting at most this long
+    TITLE_EVENT_WAIT_SECONDS = float(os.environ.get('TITLE_EVENT_WAIT_SECONDS', 5))
 
 class DevelopmentConfig(Config):
     """Development configuration."""
@@ -0,0 +1,39 @@
+"""Add uploaded file text status and message attachments
+
+Revision ID: 4f7d2a9c1e58
+Revises: e8c2b5d0f6a1
+Create Date: 2026-10-17 14:05:27.904163
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f7d2a9c1e58'
+down_revision = 'e8c2b5d0f6a1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('uploaded_file', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('text_status', sa.String(length=20), nullable=True))
+        batch_op.create_index(batch_op.f('ix_uploaded_file_content_hash'), ['content_hash'], unique=False)
+
+    op.create_table('message_attachment',
+    sa.Column('message_id', sa.Integer(), nullable=False),
+    sa.Column('file_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['file_id'], ['uploaded_file.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['message_id'], ['message.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('message_id', 'file_id')
+    )
+
+
+def downgrade():
+    op.drop_table('message_attachment')
+    with op.batch_alter_table('uploaded_file', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_uploaded_file_content_hash'))
+        batch_op.drop_column('text_status')
+        batch_op.drop_column('content_hash')
@@ -0,0 +1,40 @@
+"""Add per-user document index entries for checklist files
+
+Revision ID: 9a3e6c5b7d21
+Revises: 4f7d2a9c1e58
+Create Date: 2026-10-17 16:22:48.310574
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a3e6c5b7d21'
+down_revision = '4f7d2a9c1e58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('document_index_entry',
+    sa.Column('file_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('text', sa.Text(), nullable=False),
+    sa.Column('terms', sa.Text(), nullable=False),
+    sa.Column('embedder', sa.String(length=64), nullable=True),
+    sa.Column('embedding', sa.LargeBinary(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['file_id'], ['uploaded_file.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('file_id')
+    )
+    with op.batch_alter_table('document_index_entry', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_document_index_entry_user_id'), ['user_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('document_index_entry', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_document_index_entry_user_id'))
+
+    op.drop_table('document_index_entry')
@@ -0,0 +1,39 @@
+"""Add active branch pointer to conversations
+
+Revision ID: b7e4d2a8c913
+Revises: 9a3e6c5b7d21
+Create Date: 2026-10-17 18:05:12.774031
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e4d2a8c913'
+down_revision = '9a3e6c5b7d21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('active_leaf_id', sa.Integer(), nullable=True))
+    op.create_index('ix_message_parent_message_id', 'message', ['parent_message_id'])
+    # Existing conversations are linear: chain each unparented message to the one before it
+    op.execute(
+        "UPDATE message SET parent_message_id = ("
+        "SELECT MAX(previous.id) FROM message AS previous "
+        "WHERE previous.conversation_id = message.conversation_id AND previous.id < message.id"
+        ") WHERE parent_message_id IS NULL"
+    )
+    op.execute(
+        "UPDATE conversation SET active_leaf_id = ("
+        "SELECT MAX(message.id) FROM message WHERE message.conversation_id = conversation.id)"
+    )
+
+
+def downgrade():
+    op.drop_index('ix_message_parent_message_id', table_name='message')
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.drop_column('active_leaf_id')
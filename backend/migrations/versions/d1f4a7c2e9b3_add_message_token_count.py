@@ -0,0 +1,30 @@
+"""Add message token count and history index
+
+Revision ID: d1f4a7c2e9b3
+Revises: a52d91c3d412
+Create Date: 2026-10-17 10:12:41.218305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd1f4a7c2e9b3'
+down_revision = 'a52d91c3d412'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('token_count', sa.Integer(), nullable=True))
+    # Same estimate as Message.estimate_tokens (ceil of chars / 4)
+    op.execute("UPDATE message SET token_count = (LENGTH(content) + 3) / 4")
+    op.create_index('ix_message_conversation_id_id', 'message', ['conversation_id', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_message_conversation_id_id', table_name='message')
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.drop_column('token_count')
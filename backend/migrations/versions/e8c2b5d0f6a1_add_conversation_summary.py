@@ -0,0 +1,28 @@
+"""Add rolling conversation summary
+
+Revision ID: e8c2b5d0f6a1
+Revises: d1f4a7c2e9b3
+Create Date: 2026-10-17 11:40:03.551927
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8c2b5d0f6a1'
+down_revision = 'd1f4a7c2e9b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('summary', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('summary_through_id', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.drop_column('summary_through_id')
+        batch_op.drop_column('summary')
@@ -0,0 +1,36 @@
+"""Shared fixtures for benchmarks.
+
+Benchmarks that need a live Redis read ``BENCH_REDIS_URL`` (falling back to
+``REDIS_URL``) and are skipped when the server is unreachable. Run them with
+``pytest tests/benchmarks -s`` to see the printed reports.
+"""
+import os
+import uuid
+
+import pytest
+import redis
+
+
+@pytest.fixture
+def live_redis_url():
+    """URL of the Redis server used by live benchmarks."""
+    return os.environ.get('BENCH_REDIS_URL') or os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+
+
+@pytest.fixture
+def live_redis(live_redis_url):
+    """Redis client for benchmarks; skips the test if no server is reachable."""
+    client = redis.from_url(live_redis_url, decode_responses=True, socket_connect_timeout=0.5)
+    try:
+        client.ping()
+    except redis.RedisError:
+        pytest.skip(f"Redis not reachable at {live_redis_url}")
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def bench_prefix():
+    """Unique prefix for ids created by a benchmark run."""
+    return f"bench-{uuid.uuid4().hex[:8]}"
+
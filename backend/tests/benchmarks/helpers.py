@@ -0,0 +1,144 @@
+"""Timing and reporting helpers shared by the benchmarks."""
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+
+def ops_per_sec(fn, iterations: int) -> float:
+    """Run ``fn(i)`` ``iterations`` times and return the achieved rate."""
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn(i)
+    elapsed = time.perf_counter() - start
+    return iterations / elapsed if elapsed else float('inf')
+
+
+def report(title: str, rows: dict) -> None:
+    """Print a small aligned table of benchmark results."""
+    print(f"\n{title}")
+    width = max(len(name) for name in rows)
+    for name, value in rows.items():
+        if isinstance(value, float):
+            value = f"{value:,.1f}"
+        print(f"  {name.ljust(width)}  {value}")
+
+
+class CountingRedis:
+    """Minimal Redis double that counts commands and network round trips.
+
+    Every direct command or script call is one round trip; commands queued on a
+    pipeline are counted individually but cost one round trip per ``execute``.
+    Replies are canned: ``hgetall`` reports an active stream, the rest return 1.
+    """
+
+    def __init__(self):
+        self.commands = Counter()
+        self.round_trips = 0
+
+    @property
+    def total_commands(self) -> int:
+        return sum(self.commands.values())
+
+    def reset(self) -> None:
+        self.commands.clear()
+        self.round_trips = 0
+
+    def register_script(self, source):
+        return _CountingScript(self)
+
+    def pipeline(self, transaction=True):
+        return _CountingPipeline(self)
+
+    def reply(self, name):
+        if name == 'hgetall':
+            return {'status': 'active'}
+        return 1
+
+    def __getattr__(self, name):
+        def command(*args, **kwargs):
+            self.commands[name] += 1
+            self.round_trips += 1
+            return self.reply(name)
+        return command
+
+
+class _CountingScript:
+    def __init__(self, owner):
+        self.owner = owner
+
+    def __call__(self, keys=None, args=None, client=None):
+        if isinstance(client, _CountingPipeline):
+            client.queue('evalsha')
+            return None
+        self.owner.commands['evalsha'] += 1
+        self.owner.round_trips += 1
+        return 1
+
+
+class _CountingPipeline:
+    def __init__(self, owner):
+        self.owner = owner
+        self.queued = []
+
+    def queue(self, name):
+        self.owner.commands[name] += 1
+        self.queued.append(name)
+
+    def execute(self):
+        results = [self.owner.reply(name) for name in self.queued]
+        if self.queued:
+            self.owner.round_trips += 1
+        self.queued = []
+        return results
+
+    def __getattr__(self, name):
+        def command(*args, **kwargs):
+            self.queue(name)
+            return self
+        return command
+
+
+class FakeStreamingClient:
+    """Stand-in for ``genai.Client`` that streams canned text chunks."""
+
+    def __init__(self, chunks, delay_s: float = 0.0):
+        self.chunks = list(chunks)
+        self.delay_s = delay_s
+        self.models = self
+
+    def generate_content_stream(self, model, contents, **kwargs):
+        for text in self.chunks:
+            if self.delay_s:
+                time.sleep(self.delay_s)
+            yield SimpleNamespace(text=text)
+
+
+def make_pdf(pages) -> bytes:
+    """Minimal PDF with one page per item of ``pages`` (lists of text lines or strings)."""
+    def escape(line):
+        return line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>', None,
+               b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    kids = []
+    for page in pages:
+        lines = page.splitlines() if isinstance(page, str) else list(page)
+        text = ' T* '.join(f'({escape(line)}) Tj' for line in lines)
+        stream = f'BT /F1 10 Tf 12 TL 72 760 Td {text} ET'.encode('latin-1', 'replace')
+        objects.append(b'<< /Length %d >>\nstream\n%s\nendstream' % (len(stream), stream))
+        objects.append(b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+                       b'/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>' % (len(objects)))
+        kids.append(len(objects))
+    objects[1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+        b' '.join(b'%d 0 R' % kid for kid in kids), len(kids))
+
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n%s\nendobj\n' % (number, body)
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    out += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return bytes(out)
@@ -0,0 +1,66 @@
+"""Benchmark: prompt history per turn, full conversation vs. token-budgeted window."""
+import time
+
+import pytest
+
+from app.core.context_window import DEFAULT_CONTEXT_TOKEN_BUDGET, build_context, message_tokens
+from app.core.extensions import db
+from app.db.models import Conversation, Message
+from tests.benchmarks.helpers import report
+
+REPEATS = 20
+# A typical consultation turn: a question or a few paragraphs of answer
+CONTENT = {'user': '¿Qué documentos necesito para renovar la visa de estudiante? ' * 2,
+           'assistant': 'Para renovar la visa necesitas el pasaporte vigente, la carta de la universidad ' * 8}
+
+
+def _seed(user_id, size):
+    conversation = Conversation(user_id=user_id, title=f'bench {size}')
+    db.session.add(conversation)
+    db.session.commit()
+    conversation_id = conversation.id
+    rows = []
+    for i in range(size):
+        role = 'user' if i % 2 == 0 else 'assistant'
+        rows.append({'conversation_id': conversation_id, 'role': role, 'content': CONTENT[role],
+                     'status': 'complete', 'token_count': Message.estimate_tokens(CONTENT[role])})
+    db.session.execute(Message.__table__.insert(), rows)
+    db.session.commit()
+    newest_id = db.session.query(db.func.max(Message.id)).scalar()
+    db.session.expunge_all()
+    return conversation_id, newest_id
+
+
+def _full_history(conversation_id, newest_id):
+    return Message.query.filter_by(conversation_id=conversation_id).order_by(Message.timestamp).all()
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        result = fn(*args)
+        db.session.expunge_all()
+    return (time.perf_counter() - start) / REPEATS * 1000, result
+
+
+@pytest.mark.parametrize('size', [10, 1_000, 10_000])
+def test_history_per_turn(app, test_user, size):
+    conversation_id, newest_id = _seed(test_user.id, size)
+
+    full_ms, full = _timed(_full_history, conversation_id, newest_id)
+    window_ms, window = _timed(build_context, conversation_id, newest_id)
+
+    report(f"Prompt history, {size} messages (budget {DEFAULT_CONTEXT_TOKEN_BUDGET} tokens)", {
+        'full: ms/turn': full_ms,
+        'full: messages': len(full),
+        'full: prompt tokens': sum(message_tokens(m) for m in full),
+        'window: ms/turn': window_ms,
+        'window: messages': len(window),
+        'window: prompt tokens': sum(message_tokens(m) for m in window),
+    })
+
+    assert sum(message_tokens(m) for m in window) <= DEFAULT_CONTEXT_TOKEN_BUDGET
+    if size == 10:
+        assert len(window) == len(full)
+    else:
+        assert len(window) < len(full)
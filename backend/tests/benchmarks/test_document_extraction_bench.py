@@ -0,0 +1,75 @@
+"""Benchmark: chat upload text extraction and the content-hash chunk cache.
+
+A synthetic PDF of ``pages`` pages (50 lines each) goes through the upload
+pipeline: page-by-page pypdf extraction, chunking, hash embedding and the
+cache entry build. Peak traced memory is measured for extraction with the
+pypdf object cache cleared every ``PDF_CACHE_PAGES`` pages and never cleared,
+which shows what the clearing saves as the page count grows. A second upload
+of the same bytes costs a hash and an existence check; searching the cached
+entry is timed as well.
+
+``BENCH_PDF_PAGES`` overrides the page counts.
+"""
+import os
+import time
+import tracemalloc
+
+import pytest
+
+from app.core.document_text import PDF_CACHE_PAGES, DocumentChunkCache, file_sha256, iter_pdf_pages
+from app.core.knowledge_base import HashEmbedder
+from tests.benchmarks.helpers import make_pdf, report
+
+PAGES = [int(n) for n in os.environ.get('BENCH_PDF_PAGES', '100,500').split(',')]
+LINES = 50
+
+
+def _peak_kib(path, cache_pages):
+    tracemalloc.start()
+    try:
+        for _page in iter_pdf_pages(path, cache_pages):
+            pass
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.mark.parametrize('pages', PAGES)
+def test_pdf_extraction_and_cache(tmp_path, pages):
+    path = str(tmp_path / 'guide.pdf')
+    with open(path, 'wb') as handle:
+        handle.write(make_pdf([[f'Page {p} line {i}: bring the DS-160 confirmation and I-20 (form {p}-{i})'
+                                for i in range(LINES)] for p in range(pages)]))
+
+    started = time.perf_counter()
+    extracted = sum(1 for _page in iter_pdf_pages(path))
+    extract_s = time.perf_counter() - started
+    assert extracted == pages
+
+    cache = DocumentChunkCache(str(tmp_path / 'documents'), HashEmbedder())
+    started = time.perf_counter()
+    content_hash = file_sha256(path)
+    meta = cache.build(content_hash, iter_pdf_pages(path), 'p.')
+    build_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    assert cache.contains(file_sha256(path))
+    reupload_ms = (time.perf_counter() - started) * 1000
+
+    index = cache.open(content_hash)
+    index.search('warm up')
+    started = time.perf_counter()
+    passages = index.search(f'DS-160 form {pages // 2}-7')
+    search_ms = (time.perf_counter() - started) * 1000
+    assert passages
+
+    report(f"Chat upload PDF extraction, {pages} pages", {
+        'file KiB': os.path.getsize(path) / 1024,
+        'extract pages/s': pages / extract_s,
+        'extract+chunk+index s': build_s,
+        'chunks': meta['chunks'],
+        f'peak KiB (cache cleared every {PDF_CACHE_PAGES} pages)': _peak_kib(path, PDF_CACHE_PAGES),
+        'peak KiB (cache never cleared)': _peak_kib(path, pages + 1),
+        're-upload hash+lookup ms': reupload_ms,
+        'search cached entry ms': search_ms,
+    })
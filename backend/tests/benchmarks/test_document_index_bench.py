@@ -0,0 +1,80 @@
+"""Benchmark: per-user document index of checklist files.
+
+A user with ``files`` checklist files (synthetic names and item titles) is
+indexed entry by entry; then a query, an upsert (rename) and an eviction
+(file delete) are timed. Eviction is a primary-key delete, so its cost
+should not move with the number of files; search scores every entry of
+the user. SQLite in memory, so the numbers exclude network round trips.
+
+``BENCH_USER_FILES`` overrides the file counts.
+"""
+import os
+import time
+
+import numpy as np
+import pytest
+
+from app.core.extensions import db
+from app.db.models import DocumentIndexEntry, UploadedFile
+from app.db.models.checklist import Category, Checklist, Item
+from app.services import document_service
+from app.services.document_index import index_file, search_user_documents
+from tests.benchmarks.helpers import report
+
+SIZES = [int(n) for n in os.environ.get('BENCH_USER_FILES', '50,500').split(',')]
+KINDS = ['Bank statement', 'Passport', 'Offer letter', 'I-20', 'Tax return', 'Pay stub', 'Diploma', 'Photo']
+RUNS = 20
+
+
+@pytest.mark.parametrize('files', SIZES)
+def test_user_document_index(app, test_user, tmp_path, monkeypatch, files):
+    monkeypatch.setenv('DOCUMENT_CACHE_PATH', str(tmp_path / 'documents'))
+    monkeypatch.setenv('KB_EMBEDDER', 'hash')
+    monkeypatch.setattr(document_service, '_cache', None)
+    checklist = Checklist(user_id=test_user.id, title='Visa')
+    category = Category(checklist=checklist, title='Documents')
+    items = [Item(category=category, title=f'{KINDS[i % len(KINDS)]} {i}') for i in range(files)]
+    uploads = [UploadedFile(user_id=test_user.id, item=item, file_path=f'/tmp/{i}.pdf',
+                            original_filename=f'{KINDS[i % len(KINDS)].lower().replace(" ", "_")}_{i}.pdf',
+                            content_type='checklist') for i, item in enumerate(items)]
+    db.session.add_all([checklist, category] + items + uploads)
+    db.session.commit()
+
+    started = time.perf_counter()
+    for uploaded_file in uploads:
+        index_file(uploaded_file)
+    db.session.commit()
+    index_ms = (time.perf_counter() - started) * 1000 / files
+
+    search = []
+    for run in range(RUNS):
+        started = time.perf_counter()
+        hits = search_user_documents(test_user.id, f'do I already have a {KINDS[run % len(KINDS)].lower()}?')
+        search.append((time.perf_counter() - started) * 1000)
+        assert hits
+
+    # Fresh session: commit cost should not include expiring the objects set up above
+    file_ids = [uploaded_file.id for uploaded_file in uploads[:RUNS]]
+    db.session.expunge_all()
+    upsert, evict = [], []
+    for file_id in file_ids:
+        started = time.perf_counter()
+        uploaded_file = db.session.get(UploadedFile, file_id)
+        uploaded_file.original_filename = 'renamed_' + uploaded_file.original_filename
+        index_file(uploaded_file)
+        db.session.commit()
+        upsert.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        db.session.delete(uploaded_file)
+        db.session.commit()
+        evict.append((time.perf_counter() - started) * 1000)
+    assert DocumentIndexEntry.query.count() == files - RUNS
+
+    report(f"Per-user document index, {files} files", {
+        'index ms/file': index_ms,
+        'search p50 ms': float(np.percentile(search, 50)),
+        'search p99 ms': float(np.percentile(search, 99)),
+        'upsert p50 ms': float(np.percentile(upsert, 50)),
+        'evict p50 ms': float(np.percentile(evict, 50)),
+    })
@@ -0,0 +1,53 @@
+"""Benchmark: per-event cost of storing and forwarding stream events."""
+import json
+import os
+import time
+
+from app.api.chat.sse_protocol import format_data, format_event
+from app.core.stream_codec import frame_entry, get_codec
+from tests.benchmarks.helpers import report
+
+EVENTS = int(os.environ.get('BENCH_CODEC_EVENTS', 10_000))
+
+
+def _events():
+    return [{'type': 'chunk', 'content': 'La visa de estudiante permite trabajar ' * 2, 'message_id': i}
+            for i in range(EVENTS)]
+
+
+def _legacy_forward(fields):
+    """The original reader: parse the payload, check the type, serialize again."""
+    event = json.loads(fields['payload'])
+    return event['type'], format_event(event, '1-0')
+
+
+def _raw_forward(fields):
+    event_type, data = frame_entry(fields)
+    return event_type, format_data(data, '1-0')
+
+
+def _time(fn, items):
+    start = time.perf_counter()
+    out = [fn(item) for item in items]
+    return time.perf_counter() - start, out
+
+
+def test_event_codec_costs():
+    events = _events()
+    rows = {}
+    frames = {}
+    for name, forward in (('json', _legacy_forward), ('raw', _raw_forward)):
+        codec = get_codec(name)
+        encode_s, entries = _time(codec.encode, events)
+        forward_s, out = _time(forward, entries)
+        frames[name] = [frame for _type, frame in out]
+        stored = sum(len(k) + len(v) for fields in entries for k, v in fields.items())
+        rows[f'{name}: encode us/event'] = encode_s / EVENTS * 1e6
+        rows[f'{name}: forward us/event'] = forward_s / EVENTS * 1e6
+        rows[f'{name}: stored bytes/event'] = stored / EVENTS
+
+    report(f"Stream event codecs ({EVENTS} events)", rows)
+
+    # Identical wire output; forwarding raw entries skips the parse/serialize pair
+    assert frames['raw'] == frames['json']
+    assert rows['raw: forward us/event'] < rows['json: forward us/event']
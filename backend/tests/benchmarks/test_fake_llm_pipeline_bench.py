@@ -0,0 +1,140 @@
+"""Benchmark: the full send → Celery → Redis → SSE path on the fake model.
+
+``AI_PROVIDER=fake`` replaces Gemini with the deterministic local model, so
+the pipeline can be load-tested without network access or quota. A Celery
+worker runs in-process against the live Redis broker; each message is posted
+to ``/chat/send`` and its answer read back from ``/chat/stream/<id>``.
+The solo pool runs the title task of each new conversation first, so the
+first chunk also waits for one fake tool call.
+"""
+import json
+import os
+import time
+
+import pytest
+
+from app.core.extensions import db, redis_provider
+from app.core.stream_manager import StreamManager
+from app.db.models import User
+from tests.benchmarks.helpers import report
+
+MESSAGES = int(os.environ.get('BENCH_PIPELINE_MESSAGES', 20))
+FAKE_LLM = {
+    'FAKE_LLM_TTFT_MS': os.environ.get('BENCH_FAKE_LLM_TTFT_MS', '200'),
+    'FAKE_LLM_TOKENS_PER_SEC': os.environ.get('BENCH_FAKE_LLM_TOKENS_PER_SEC', '400'),
+    'FAKE_LLM_CHUNK_TOKENS': os.environ.get('BENCH_FAKE_LLM_CHUNK_TOKENS', '3'),
+    'FAKE_LLM_ERROR_RATE': os.environ.get('BENCH_FAKE_LLM_ERROR_RATE', '0.05'),
+    'FAKE_LLM_ANSWER_TOKENS': '120',
+}
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def _read_stream(client, stream_id, headers, sent_at):
+    """Consume the SSE response; returns (ms to first chunk, ms to end, chunks, final type)."""
+    response = client.get(f'/chat/stream/{stream_id}', headers=headers, buffered=False)
+    first_chunk_ms, chunks, final = None, 0, None
+    for frame in response.response:
+        frame = frame.decode() if isinstance(frame, bytes) else frame
+        for line in frame.splitlines():
+            if not line.startswith('data: '):
+                continue
+            event = json.loads(line[len('data: '):])
+            if event['type'] == 'chunk':
+                chunks += 1
+                if first_chunk_ms is None:
+                    first_chunk_ms = (time.perf_counter() - sent_at) * 1000
+            elif event['type'] in ('complete', 'error', 'cancelled', 'timeout'):
+                final = event['type']
+        if final:
+            break
+    response.close()
+    return first_chunk_ms, (time.perf_counter() - sent_at) * 1000, chunks, final
+
+
+@pytest.fixture
+def pipeline(live_redis, live_redis_url, monkeypatch):
+    """Test app plus an in-process Celery worker using the fake provider."""
+    from celery.contrib.testing.worker import start_worker
+
+    from app import create_app
+    from app.tasks import worker as worker_module
+    from app.tasks.ai import celery
+
+    monkeypatch.setenv('AI_PROVIDER', 'fake')
+    for name, value in FAKE_LLM.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(celery.conf, 'broker_url', live_redis_url)
+    monkeypatch.setattr(celery.conf, 'result_backend', live_redis_url)
+    monkeypatch.setattr(celery.conf, 'task_always_eager', False)
+
+    # The worker shares the test app (and its in-memory database)
+    context = worker_module.WorkerContext('testing')
+    app = create_app('testing')
+    context.app = app
+    monkeypatch.setattr(worker_module, '_context', context)
+    # Building an app resets the shared Redis pools; point them at the bench server last
+    app.config['REDIS_URL'] = live_redis_url
+    redis_provider.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        user = User(email='bench@example.com', username='bench', yearofbirth=1990,
+                    educational_level="Bachelor's Degree")
+        user.set_password('BenchPassword123')
+        db.session.add(user)
+        db.session.commit()
+
+        with start_worker(celery, pool='solo', perform_ping_check=False, loglevel='WARNING'):
+            yield app
+        db.drop_all()
+
+
+def test_fake_llm_through_celery_and_sse(pipeline, live_redis):
+    client = pipeline.test_client()
+    token = client.post('/auth/login', json={
+        'email': 'bench@example.com', 'password': 'BenchPassword123'}).get_json()['data']['access_token']
+    headers = {'Authorization': f'Bearer {token}'}
+
+    first_chunk, total, chunk_counts, finals, stream_ids = [], [], [], [], []
+    try:
+        for i in range(MESSAGES):
+            sent_at = time.perf_counter()
+            resp = client.post('/chat/send', json={'content': f'Which documents for visa case {i}?'},
+                               headers=headers)
+            assert resp.status_code == 200, resp.get_json()
+            stream_id = resp.get_json()['stream_id']
+            stream_ids.append(stream_id)
+            ttft_ms, total_ms, chunks, final = _read_stream(client, stream_id, headers, sent_at)
+            finals.append(final)
+            if final == 'complete':
+                first_chunk.append(ttft_ms)
+                total.append(total_ms)
+                chunk_counts.append(chunks)
+
+        completed = len(total)
+        answer_tokens = int(FAKE_LLM['FAKE_LLM_ANSWER_TOKENS'])
+        report(f"Fake LLM pipeline, {MESSAGES} messages (ttft {FAKE_LLM['FAKE_LLM_TTFT_MS']} ms, "
+               f"{FAKE_LLM['FAKE_LLM_TOKENS_PER_SEC']} tok/s, error rate {FAKE_LLM['FAKE_LLM_ERROR_RATE']})", {
+            'completed': completed,
+            'errors': finals.count('error'),
+            'first chunk p50 ms': _percentile(first_chunk, 0.5) if first_chunk else 0,
+            'first chunk p95 ms': _percentile(first_chunk, 0.95) if first_chunk else 0,
+            'total p50 ms': _percentile(total, 0.5) if total else 0,
+            'tokens/s per stream': answer_tokens / (sum(total) / completed / 1000) if completed else 0,
+            'SSE chunk events per answer': sum(chunk_counts) / completed if completed else 0,
+        })
+
+        assert completed + finals.count('error') == MESSAGES
+        assert completed > 0
+        # Nothing arrives before the configured time to first token
+        assert min(first_chunk) >= float(FAKE_LLM['FAKE_LLM_TTFT_MS'])
+    finally:
+        keys = [key for sid in stream_ids for key in live_redis.scan_iter(f"*{sid}*")]
+        if keys:
+            live_redis.delete(*keys)
+        if stream_ids:
+            live_redis.zrem(StreamManager(live_redis).streams_key, *stream_ids)
@@ -0,0 +1,76 @@
+"""Benchmark: a burst of guest sends, thread per request vs. the bounded executor.
+
+Each job stands in for a guest answer (``ANSWER_S`` of streaming). The report
+shows the peak thread count of the web process and how many requests were
+shed with 503. It also shows the submit cost seen by the request thread.
+"""
+import os
+import threading
+import time
+import tracemalloc
+
+from app.core.guest_executor import GuestExecutorFull, GuestStreamExecutor
+from tests.benchmarks.helpers import report
+
+BURST = int(os.environ.get('BENCH_GUEST_BURST', 1000))
+ANSWER_S = 0.2
+WORKERS = 16
+QUEUE_DEPTH = 64
+
+
+def _answer():
+    time.sleep(ANSWER_S)
+
+
+def _burst(submit):
+    """Fire BURST submits; returns (peak threads, rejected, submit µs, heap KiB)."""
+    baseline = threading.active_count()
+    peak, rejected = baseline, 0
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(BURST):
+        try:
+            submit()
+        except GuestExecutorFull:
+            rejected += 1
+        peak = max(peak, threading.active_count())
+    submit_us = (time.perf_counter() - start) / BURST * 1e6
+    _current, heap_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak - baseline, rejected, submit_us, heap_peak / 1024
+
+
+def test_guest_burst_threads():
+    threads = []
+
+    def spawn():
+        thread = threading.Thread(target=_answer, daemon=True)
+        thread.start()
+        threads.append(thread)
+
+    unbounded = _burst(spawn)
+    for thread in threads:
+        thread.join()
+
+    executor = GuestStreamExecutor(max_workers=WORKERS, max_queue=QUEUE_DEPTH)
+    try:
+        bounded = _burst(lambda: executor.submit(_answer))
+        stats = executor.stats()
+    finally:
+        executor.shutdown(wait=True)
+
+    report(f"Guest burst of {BURST} sends, {ANSWER_S * 1000:.0f} ms answers "
+           f"(pool {WORKERS} + queue {QUEUE_DEPTH})", {
+        'thread per request: peak extra threads': unbounded[0],
+        'thread per request: submit µs': unbounded[2],
+        'thread per request: heap peak KiB': unbounded[3],
+        'executor: peak extra threads': bounded[0],
+        'executor: submit µs': bounded[2],
+        'executor: heap peak KiB': bounded[3],
+        'executor: rejected with 503': bounded[1],
+        'executor: submitted': stats['submitted'],
+    })
+
+    assert bounded[0] <= WORKERS
+    assert stats['submitted'] + bounded[1] == BURST
+    assert stats['submitted'] >= WORKERS + QUEUE_DEPTH
@@ -0,0 +1,81 @@
+"""Benchmark: health and cursor writes per response, per-event vs. throttled heartbeat."""
+from unittest.mock import patch
+
+from app.core import stream_manager as stream_manager_module
+from app.core.stream_manager import StreamManager
+from app.core.stream_writer import StreamChunkWriter
+from tests.benchmarks.helpers import CountingRedis, report
+
+# A ~10 s answer delivered as 500 events, one every 20 ms
+EVENTS = 500
+SPACING_S = 0.02
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _forward_per_event(stream_manager, clock):
+    """What the SSE viewer did per forwarded event, minus the XREAD: cursor write and touch."""
+    for i in range(EVENTS):
+        clock.now += SPACING_S
+        stream_manager.set_last_id('bench-sse', f'{i}-0')
+        stream_manager.update_stream_activity('bench-sse')
+
+
+def _forward_throttled(stream_manager, clock):
+    """The cursor rides on the throttled heartbeat and is caught up at the terminal event."""
+    saved_id = None
+    for i in range(EVENTS):
+        clock.now += SPACING_S
+        if stream_manager.heartbeat('bench-sse', last_id=f'{i}-0'):
+            saved_id = f'{i}-0'
+    if saved_id != f'{EVENTS - 1}-0':
+        stream_manager.set_last_id('bench-sse', f'{EVENTS - 1}-0')
+
+
+def _write(redis_client, stream_manager, clock):
+    """Writer path: flushes every 50 ms, each flush refreshes via heartbeat."""
+    writer = StreamChunkWriter(redis_client, stream_manager, 'bench-writer', clock=clock)
+    for _ in range(EVENTS):
+        clock.now += SPACING_S
+        writer.write('visa')
+    writer.close({'type': 'complete', 'message_id': None})
+    return writer.flush_count
+
+
+def test_health_refreshes_per_response():
+    stream_manager_module._last_heartbeat.clear()
+    redis_client = CountingRedis()
+    stream_manager = StreamManager(redis_client)
+    clock = FakeClock()
+
+    with patch.object(stream_manager_module.time, 'monotonic', clock):
+        _forward_per_event(stream_manager, clock)
+        per_event = redis_client.total_commands
+
+        redis_client.reset()
+        _forward_throttled(stream_manager, clock)
+        throttled = redis_client.total_commands
+
+        redis_client.reset()
+        flushes = _write(redis_client, stream_manager, clock)
+        writer_touches = redis_client.commands['evalsha']
+
+    report(f"Redis commands forwarding {EVENTS} events over "
+           f"{EVENTS * SPACING_S:.0f} s (heartbeat every {stream_manager.heartbeat_interval_seconds} s)", {
+        'SSE per-event cursor + touch': per_event,
+        'SSE throttled heartbeat with cursor': throttled,
+        'writer flushes': flushes,
+        'writer health refreshes': writer_touches,
+    })
+    stream_manager_module._last_heartbeat.clear()
+
+    assert per_event == EVENTS * 2
+    # One write per heartbeat interval plus the final cursor catch-up
+    assert throttled <= EVENTS * SPACING_S / stream_manager.heartbeat_interval_seconds + 2
+    assert writer_touches < flushes
@@ -0,0 +1,91 @@
+"""Benchmark: hybrid knowledge-base search at 10k, 100k and 1M chunks.
+
+The corpus is synthetic: each chunk is ``WORDS`` words drawn from a Zipf-like
+vocabulary of ``VOCAB`` terms (so frequent terms have long posting lists),
+with a visa form number in one chunk out of a hundred, and a random unit
+vector (embedding real text at 1M chunks would benchmark the embedder
+instead). Queries go through :meth:`KnowledgeBase.search`: hash embedding of
+the query, the cosine ranking, the BM25 ranking, fusion and reading the hit
+texts. The BM25 ranking is also timed on its own.
+
+``BENCH_KB_SIZES`` and ``BENCH_KB_DIM`` override the corpus sizes and the
+dimension; the 1M index at 256 dims is a 1 GiB vector file.
+"""
+import os
+import time
+
+import numpy as np
+import pytest
+
+from app.core.knowledge_base import HashEmbedder, IndexWriter, KnowledgeBase, normalize
+from tests.benchmarks.helpers import report
+
+SIZES = [int(n) for n in os.environ.get('BENCH_KB_SIZES', '10000,100000,1000000').split(',')]
+DIM = int(os.environ.get('BENCH_KB_DIM', 256))
+VOCAB = 50_000
+WORDS = 12
+FORMS = ['DS-160', 'I-20', 'H-1B', 'DS-2019', 'I-797']
+QUERIES = 50
+BATCH = 50_000
+
+
+def _texts(rng, n):
+    ranks = np.arange(1, VOCAB + 1)
+    ids = rng.choice(VOCAB, size=(n, WORDS), p=(1 / ranks) / (1 / ranks).sum())
+    texts = [' '.join(f'w{i}' for i in row) for row in ids]
+    for row in range(0, n, 100):
+        texts[row] += f' {FORMS[row // 100 % len(FORMS)]}'
+    return texts
+
+
+def _build(path, embedder, count):
+    rng = np.random.default_rng(count)
+    writer = IndexWriter(path, embedder, count)
+    for start in range(0, count, BATCH):
+        n = min(BATCH, count - start)
+        chunks = [('bench.md', text) for text in _texts(rng, n)]
+        writer.add(chunks, normalize(rng.standard_normal((n, embedder.dim), dtype=np.float32)))
+    writer.commit()
+    return os.path.getsize(os.path.join(writer.segment.directory, 'vectors.npy'))
+
+
+def _percentiles(latencies):
+    return float(np.percentile(latencies, 50)), float(np.percentile(latencies, 99))
+
+
+@pytest.mark.parametrize('count', SIZES)
+def test_kb_hybrid_search_latency(tmp_path, count):
+    embedder = HashEmbedder(dim=DIM)
+    started = time.perf_counter()
+    size = _build(str(tmp_path), embedder, count)
+    build_s = time.perf_counter() - started
+
+    knowledge_base = KnowledgeBase(str(tmp_path), embedder, top_k=4, min_score=-1.0)
+    knowledge_base.search('warm up the page cache')
+    index = knowledge_base._current()
+    queries = [f'{FORMS[i % len(FORMS)]} w{i % 10} w{100 + i} w{5000 + i}' for i in range(QUERIES)]
+
+    hybrid, lexical = [], []
+    for query in queries:
+        started = time.perf_counter()
+        passages = knowledge_base.search(query)
+        hybrid.append((time.perf_counter() - started) * 1000)
+        assert len(passages) == 4
+        assert any(passage.bm25 for passage in passages)
+
+        started = time.perf_counter()
+        knowledge_base._bm25_ranking(index, query, 20)
+        lexical.append((time.perf_counter() - started) * 1000)
+
+    hybrid_p50, hybrid_p99 = _percentiles(hybrid)
+    bm25_p50, bm25_p99 = _percentiles(lexical)
+    report(f"Knowledge base hybrid search, {count:,} chunks x {DIM} dims", {
+        'index build s': build_s,
+        'vectors MiB': size / 2**20,
+        'postings': int(index.segments[0].postings.docs.shape[0]),
+        'hybrid p50 ms': hybrid_p50,
+        'hybrid p99 ms': hybrid_p99,
+        'bm25 ranking p50 ms': bm25_p50,
+        'bm25 ranking p99 ms': bm25_p99,
+        'queries/s': 1000 / float(np.mean(hybrid)),
+    })
@@ -0,0 +1,80 @@
+"""Benchmark: history of a branching conversation, whole tree vs. active branch.
+
+A conversation of ``turns`` question/answer pairs, where every answer was
+regenerated ``REGENERATIONS`` times and every tenth question also has an
+abandoned edit, is loaded the old way (every message by timestamp), as the
+active branch with the recursive-CTE path loader, and as a prompt window.
+The branch payload stays proportional to the branch; on SQLite the
+recursive walk costs more per row than a plain scan, so small trees load
+faster whole.
+"""
+import time
+
+import pytest
+
+from app.core.context_window import build_branch_context
+from app.core.extensions import db
+from app.core.message_tree import load_branch
+from app.db.models import Conversation, Message
+from tests.benchmarks.helpers import report
+
+REPEATS = 20
+REGENERATIONS = 2
+CONTENT = 'Para renovar la visa necesitas el pasaporte vigente y la carta de la universidad. ' * 4
+
+
+def _add(conversation_id, parent_id, role):
+    message = Message(conversation_id=conversation_id, parent_message_id=parent_id, role=role, content=CONTENT)
+    db.session.add(message)
+    db.session.flush()
+    return message.id
+
+
+def _seed(user_id, turns):
+    conversation = Conversation(user_id=user_id, title=f'bench {turns}')
+    db.session.add(conversation)
+    db.session.flush()
+    leaf = None
+    for turn in range(turns):
+        if turn % 10 == 9:
+            # An edited question whose answer is abandoned
+            _add(conversation.id, _add(conversation.id, leaf, 'user'), 'assistant')
+        question = _add(conversation.id, leaf, 'user')
+        for _ in range(REGENERATIONS):
+            _add(conversation.id, question, 'assistant')
+        leaf = _add(conversation.id, question, 'assistant')
+    conversation.active_leaf_id = leaf
+    db.session.commit()
+    conversation_id = conversation.id
+    db.session.expunge_all()
+    return conversation_id, leaf
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        result = fn(*args)
+        db.session.expunge_all()
+    return (time.perf_counter() - start) / REPEATS * 1000, result
+
+
+@pytest.mark.parametrize('turns', [50, 500])
+def test_branch_history(app, test_user, turns):
+    conversation_id, leaf = _seed(test_user.id, turns)
+
+    tree_ms, tree = _timed(
+        lambda: Message.query.filter_by(conversation_id=conversation_id).order_by(Message.timestamp).all())
+    branch_ms, branch = _timed(load_branch, leaf)
+    window_ms, window = _timed(build_branch_context, leaf)
+
+    report(f"Branching conversation history, {turns} turns ({REGENERATIONS} regenerations each)", {
+        'whole tree: ms': tree_ms,
+        'whole tree: messages': len(tree),
+        'active branch: ms': branch_ms,
+        'active branch: messages': len(branch),
+        'prompt window: ms': window_ms,
+        'prompt window: messages': len(window),
+    })
+
+    assert len(branch) == 2 * turns
+    assert len(tree) > len(branch)
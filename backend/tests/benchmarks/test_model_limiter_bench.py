@@ -0,0 +1,87 @@
+"""Benchmark: a burst of model calls through the distributed limiter (live Redis).
+
+``BENCH_LIMITER_CALLERS`` threads, each standing in for a worker or guest
+thread, request a slot at once and hold it for a simulated model call. The
+report shows the peak concurrency the provider would see, and how long
+callers waited. It also counts how often a caller overtook an earlier
+arrival.
+"""
+import os
+import threading
+import time
+
+from app.core.model_limiter import ModelCallLimiter, TierLimits
+from tests.benchmarks.helpers import report
+
+CALLERS = int(os.environ.get('BENCH_LIMITER_CALLERS', 40))
+MAX_CONCURRENCY = 5
+RATE_PER_SEC = 100
+CALL_S = 0.05
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def test_limiter_caps_burst(live_redis, bench_prefix):
+    limiter = ModelCallLimiter(
+        live_redis, {'user': TierLimits(max_concurrency=MAX_CONCURRENCY, rate_per_sec=RATE_PER_SEC)},
+        max_wait_seconds=60, poll_interval_seconds=0.01, prefix=f"{bench_prefix}:limit:")
+    lock = threading.Lock()
+    in_flight = [0, 0]  # current, peak
+    arrivals, grants, waits, positions, failed_open = [], [], [], [], []
+
+    def caller(i):
+        # Stagger arrivals so FIFO order is well defined
+        time.sleep(i * 0.002)
+        with lock:
+            arrivals.append(i)
+        seen = []
+        slot = limiter.acquire('user', on_queued=seen.append)
+        if slot.limiter is None:
+            # Redis error: the limiter let the call through unlimited
+            with lock:
+                failed_open.append(i)
+            return
+        with slot:
+            with lock:
+                grants.append(i)
+                waits.append(slot.waited_ms)
+                positions.append(max(seen or [0]))
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight[1], in_flight[0])
+            time.sleep(CALL_S)
+            with lock:
+                in_flight[0] -= 1
+
+    threads = [threading.Thread(target=caller, args=(i,)) for i in range(CALLERS)]
+    start = time.perf_counter()
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        overtakes = sum(1 for a, b in zip(grants, grants[1:])
+                        if arrivals.index(b) < arrivals.index(a) - MAX_CONCURRENCY)
+
+        report(f"Model limiter, {CALLERS} simultaneous calls of {CALL_S * 1000:.0f} ms "
+               f"(cap {MAX_CONCURRENCY}, {RATE_PER_SEC}/s)", {
+            'peak concurrency': in_flight[1],
+            'wait p50 ms': _percentile(waits, 0.5),
+            'wait p95 ms': _percentile(waits, 0.95),
+            'deepest queue position': max(positions),
+            'out-of-order grants': overtakes,
+            'failed open (Redis errors)': len(failed_open),
+            'total s': elapsed,
+        })
+
+        assert in_flight[1] <= MAX_CONCURRENCY
+        assert len(grants) + len(failed_open) == CALLERS
+        # The limited calls take at least one round of CALL_S per MAX_CONCURRENCY callers
+        assert elapsed >= (len(grants) // MAX_CONCURRENCY) * CALL_S
+    finally:
+        keys = list(live_redis.scan_iter(f"{bench_prefix}*"))
+        if keys:
+            live_redis.delete(*keys)
@@ -0,0 +1,72 @@
+"""Benchmark: guest FAQ traffic with and without the response cache (live Redis)."""
+import os
+import random
+import time
+
+from app.core.response_cache import ResponseCache
+from app.core.stream_cancel import CancelListener
+from app.core.stream_manager import StreamManager
+from app.services.ai_service import AIService
+from tests.benchmarks.helpers import FakeStreamingClient, report
+
+REQUESTS = int(os.environ.get('BENCH_CACHE_REQUESTS', 200))
+# 20 FAQ questions with a skewed popularity, written with varying case/spacing
+QUESTIONS = [f"What documents do I need for visa type {i}?" for i in range(20)]
+WEIGHTS = [1 / (rank + 1) for rank in range(len(QUESTIONS))]
+# ~1.2 KB answer as 60 chunks, 10 ms apart: ~0.6 s of generation per miss
+ANSWER_CHUNKS = ["Passport, proof of funds. "] * 60
+CHUNK_DELAY_S = 0.01
+
+
+def _traffic(seed=7):
+    rng = random.Random(seed)
+    for question in rng.choices(QUESTIONS, weights=WEIGHTS, k=REQUESTS):
+        if rng.random() < 0.5:
+            question = '  ' + question.upper()
+        yield [{'role': 'user', 'content': question}]
+
+
+def _run(service, stream_manager, prefix):
+    latencies = []
+    for i, messages in enumerate(_traffic()):
+        stream_id = f"{prefix}-{i}"
+        stream_manager.create_stream(stream_id, None, None)
+        start = time.perf_counter()
+        service.process_guest_messages_stream(messages, stream_id)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def test_guest_cache_hit_ratio_and_latency(live_redis, bench_prefix):
+    stream_manager = StreamManager(live_redis)
+    service = AIService(live_redis, stream_manager)
+    service.client = FakeStreamingClient(ANSWER_CHUNKS, delay_s=CHUNK_DELAY_S)
+    service.cancel_listener = CancelListener(live_redis, autostart=False)
+    service.cache_replay_interval_ms = 0
+
+    service.response_cache = None
+    uncached = _run(service, stream_manager, f"{bench_prefix}-nocache")
+
+    cache = ResponseCache(live_redis, prefix=f"{bench_prefix}:cache:", ttl_seconds=300, max_entries=10)
+    service.response_cache = cache
+    cached = _run(service, stream_manager, f"{bench_prefix}-cache")
+    stats = cache.stats()
+
+    try:
+        report(f"Guest FAQ traffic, {REQUESTS} requests over {len(QUESTIONS)} questions "
+               f"(cache bounded to {cache.max_entries})", {
+            'uncached avg ms': sum(uncached) / len(uncached),
+            'cached avg ms': sum(cached) / len(cached),
+            'hit ratio': stats['hit_ratio'],
+            'evictions': stats['evictions'],
+            'latency saved ms': stats['latency_saved_ms'],
+        })
+        assert stats['hits'] + stats['misses'] == REQUESTS
+        assert stats['entries'] <= cache.max_entries
+        assert sum(cached) < sum(uncached)
+    finally:
+        keys = list(live_redis.scan_iter(f"{bench_prefix}*")) + list(live_redis.scan_iter(f"stream_*{bench_prefix}*"))
+        if keys:
+            live_redis.delete(*keys)
+        live_redis.zrem(stream_manager.streams_key, *[f"{bench_prefix}-nocache-{i}" for i in range(REQUESTS)],
+                        *[f"{bench_prefix}-cache-{i}" for i in range(REQUESTS)])
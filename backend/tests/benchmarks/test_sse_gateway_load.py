@@ -0,0 +1,123 @@
+"""Load test: many concurrent SSE viewers on the asyncio gateway.
+
+Opens ``BENCH_SSE_CONNECTIONS`` streams against a live Redis, measures the
+Python heap held per idle connection and the XADD-to-frame latency of events
+published while all connections are open. The gateway is built as in
+production, on the capped blocking pool, with several times more viewers
+than that pool has connections.
+"""
+import asyncio
+import json
+import os
+import time
+import tracemalloc
+
+from app.api.chat.sse_gateway import create_sse_gateway
+from app.core.extensions import redis_provider
+from app.core.stream_manager import StreamManager
+from config import Config
+from tests.benchmarks.helpers import report
+
+CONNECTIONS = int(os.environ.get('BENCH_SSE_CONNECTIONS', 4 * Config.REDIS_BLOCKING_MAX_CONNECTIONS))
+EVENTS_PER_STREAM = 5
+
+
+class LatencyRecorder:
+    """ASGI ``send`` that timestamps every forwarded event."""
+
+    def __init__(self, connected: asyncio.Event, counter: list):
+        self.connected = connected
+        self.counter = counter
+        self.latencies = []
+        self.errors = []
+
+    async def __call__(self, message):
+        if message['type'] != 'http.response.body' or not message.get('body'):
+            return
+        now = time.time()
+        for frame in message['body'].decode().split('\n\n'):
+            if not frame.startswith('data: '):
+                continue
+            data = json.loads(frame[len('data: '):])
+            if data.get('type') == 'connected':
+                self.counter[0] += 1
+                if self.counter[0] == CONNECTIONS:
+                    self.connected.set()
+            elif data.get('type') == 'error':
+                self.errors.append(data.get('message'))
+            elif 'sent_at' in data:
+                self.latencies.append(now - data['sent_at'])
+
+
+async def _never_disconnect():
+    await asyncio.sleep(3600)
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def _run(app, stream_ids, events_keys):
+    gateway = create_sse_gateway(app)
+    client = gateway.redis
+    connected = asyncio.Event()
+    counter = [0]
+    recorders = [LatencyRecorder(connected, counter) for _ in stream_ids]
+
+    tracemalloc.start()
+    baseline = tracemalloc.take_snapshot()
+    tasks = [
+        asyncio.create_task(gateway.stream(sid, {}, _never_disconnect, rec))
+        for sid, rec in zip(stream_ids, recorders)
+    ]
+    await asyncio.wait_for(connected.wait(), timeout=60)
+    # Let the shared reader settle into its blocking XREAD before measuring
+    await asyncio.sleep(0.5)
+    held = tracemalloc.take_snapshot().compare_to(baseline, 'filename')
+    tracemalloc.stop()
+    per_connection = sum(stat.size_diff for stat in held) / CONNECTIONS
+
+    for seq in range(EVENTS_PER_STREAM):
+        for key in events_keys:
+            payload = json.dumps({'type': 'chunk', 'content': str(seq), 'sent_at': time.time()})
+            await client.xadd(key, {'payload': payload})
+        await asyncio.sleep(0.05)
+    for key in events_keys:
+        await client.xadd(key, {'payload': json.dumps({'type': 'complete', 'sent_at': time.time()})})
+
+    await asyncio.wait_for(asyncio.gather(*tasks), timeout=120)
+    await gateway.fanout.stop()
+    await client.aclose()
+    return (per_connection, [lat for rec in recorders for lat in rec.latencies],
+            [err for rec in recorders for err in rec.errors], gateway.open_connections)
+
+
+def test_sse_gateway_concurrent_streams(app, live_redis, live_redis_url, bench_prefix, monkeypatch):
+    pool_size = redis_provider.settings['REDIS_BLOCKING_MAX_CONNECTIONS']
+    assert CONNECTIONS > pool_size
+    monkeypatch.setitem(redis_provider.settings, 'REDIS_URL', live_redis_url)
+    manager = StreamManager(live_redis)
+    manager.streams_key = f"{bench_prefix}-active-stream-ids"
+    stream_ids = [f"{bench_prefix}-{i}" for i in range(CONNECTIONS)]
+    for sid in stream_ids:
+        manager.create_stream(sid, None, None)
+    events_keys = [manager.get_events_key(sid) for sid in stream_ids]
+
+    try:
+        per_connection, latencies, errors, still_open = asyncio.run(_run(app, stream_ids, events_keys))
+    finally:
+        for sid in stream_ids:
+            live_redis.delete(manager.get_state_key(sid), manager.get_health_key(sid), manager.get_events_key(sid))
+        live_redis.delete(manager.streams_key)
+
+    report(f"Asyncio SSE gateway, {CONNECTIONS} concurrent streams on a {pool_size}-connection pool", {
+        'heap per idle connection (KiB)': per_connection / 1024,
+        'events delivered': len(latencies),
+        'p50 event latency (ms)': _percentile(latencies, 0.50) * 1000,
+        'p99 event latency (ms)': _percentile(latencies, 0.99) * 1000,
+    })
+
+    assert errors == []
+    assert still_open == 0
+    assert len(latencies) == CONNECTIONS * (EVENTS_PER_STREAM + 1)
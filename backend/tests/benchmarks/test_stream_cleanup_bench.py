@@ -0,0 +1,75 @@
+"""Benchmark: cleanup time and memory reclaimed for 100k abandoned streams."""
+import json
+import os
+import time
+
+from app.core.stream_manager import StreamManager
+from tests.benchmarks.helpers import report
+
+STREAMS = int(os.environ.get('BENCH_CLEANUP_STREAMS', 100_000))
+LIVE_STREAMS = 100
+PIPELINE_SIZE = 5000
+
+
+def _isolated_manager(client, prefix):
+    """StreamManager whose keys live under ``prefix`` so the run can be torn down."""
+    manager = StreamManager(client)
+    manager.streams_key = f"{prefix}:stream_expiry"
+    manager.state_key_prefix = f"{prefix}:stream_state:"
+    manager.health_key_prefix = f"{prefix}:stream_health:"
+    manager.events_key_prefix = f"{prefix}:stream_events:"
+    return manager
+
+
+def _create(manager, stream_ids, created_at):
+    """Create streams as a crashed worker would leave them: state, events and index entry."""
+    payload = json.dumps({'type': 'chunk', 'content': 'x' * 64, 'message_id': None})
+    for start in range(0, len(stream_ids), PIPELINE_SIZE):
+        pipe = manager.redis.pipeline(transaction=False)
+        for stream_id in stream_ids[start:start + PIPELINE_SIZE]:
+            manager._create_script(
+                keys=[manager.get_state_key(stream_id), manager.get_health_key(stream_id), manager.streams_key],
+                args=[stream_id, 1, 1, created_at, manager.health_ttl_seconds],
+                client=pipe,
+            )
+            pipe.xadd(manager.get_events_key(stream_id), {'payload': payload})
+        pipe.execute()
+
+
+def _used_memory(client) -> int:
+    return int(client.info('memory')['used_memory'])
+
+
+def test_cleanup_reclaims_abandoned_streams(live_redis, bench_prefix):
+    manager = _isolated_manager(live_redis, bench_prefix)
+    abandoned = [f"{bench_prefix}-dead-{i}" for i in range(STREAMS)]
+    alive = [f"{bench_prefix}-live-{i}" for i in range(LIVE_STREAMS)]
+    try:
+        before = _used_memory(live_redis)
+        _create(manager, abandoned, time.time() - 3600)
+        _create(manager, alive, time.time())
+        peak = _used_memory(live_redis)
+
+        start = time.perf_counter()
+        removed = manager.cleanup_expired_streams()
+        elapsed = time.perf_counter() - start
+        after = _used_memory(live_redis)
+
+        remaining = live_redis.zcard(manager.streams_key)
+        leftover_events = live_redis.exists(*[manager.get_events_key(sid) for sid in abandoned[:1000]])
+    finally:
+        for key in live_redis.scan_iter(match=f"{bench_prefix}:*", count=10_000):
+            live_redis.unlink(key)
+
+    report(f"Cleanup of {STREAMS:,} abandoned streams ({LIVE_STREAMS} live)", {
+        'removed': removed,
+        'cleanup seconds': elapsed,
+        'streams per second': removed / elapsed if elapsed else float('inf'),
+        'memory grown by (MB)': (peak - before) / 2**20,
+        'memory reclaimed (MB)': (peak - after) / 2**20,
+    })
+
+    assert removed == STREAMS
+    assert remaining == LIVE_STREAMS
+    assert leftover_events == 0
+    assert peak - after >= 0.8 * (peak - before) * STREAMS / (STREAMS + LIVE_STREAMS)
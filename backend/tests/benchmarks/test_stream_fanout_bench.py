@@ -0,0 +1,96 @@
+"""Benchmark: Redis connections held by N SSE viewers, per-viewer XREAD vs. fanout."""
+import json
+import os
+import threading
+import time
+
+import redis
+
+from app.core.stream_fanout import StreamFanout
+from tests.benchmarks.helpers import report
+
+VIEWERS = int(os.environ.get('BENCH_FANOUT_VIEWERS', 100))
+
+
+def _connected_clients(client) -> int:
+    return len(client.client_list())
+
+
+def _run_direct(url, keys, ready, done):
+    """Every viewer blocks in its own XREAD, as create_sse_response does today."""
+    client = redis.from_url(url, decode_responses=True)
+
+    def viewer(key):
+        last_id = '0-0'
+        ready.release()
+        while not done.is_set():
+            for _key, entries in client.xread({key: last_id}, count=100, block=200) or []:
+                for entry_id, _fields in entries:
+                    last_id = entry_id
+
+    threads = [threading.Thread(target=viewer, args=(key,), daemon=True) for key in keys]
+    for t in threads:
+        t.start()
+    return client, threads
+
+
+def _run_fanout(url, keys, ready, done):
+    """Every viewer waits on its subscription queue; one reader thread does XREAD."""
+    client = redis.from_url(url, decode_responses=True)
+    fanout = StreamFanout(client, block_ms=200)
+
+    def viewer(key):
+        subscription = fanout.subscribe(key, '0-0')
+        ready.release()
+        while not done.is_set():
+            subscription.get(timeout=0.2)
+        fanout.unsubscribe(subscription)
+
+    threads = [threading.Thread(target=viewer, args=(key,), daemon=True) for key in keys]
+    for t in threads:
+        t.start()
+    return client, threads, fanout
+
+
+def _measure(live_redis, start, keys):
+    baseline = _connected_clients(live_redis)
+    ready = threading.Semaphore(0)
+    done = threading.Event()
+    result = start(keys, ready, done)
+    for _ in keys:
+        ready.acquire()
+    time.sleep(0.5)
+    held = _connected_clients(live_redis) - baseline
+
+    for key in keys:
+        live_redis.xadd(key, {'payload': json.dumps({'type': 'chunk', 'content': 'x'})})
+    time.sleep(0.5)
+
+    done.set()
+    for t in result[1]:
+        t.join(timeout=2)
+    result[0].close()
+    return held, result
+
+
+def test_connections_do_not_grow_with_viewers(live_redis, live_redis_url, bench_prefix):
+    keys = [f"stream_events:{bench_prefix}-{i}" for i in range(VIEWERS)]
+    try:
+        direct_held, _ = _measure(
+            live_redis, lambda k, r, d: _run_direct(live_redis_url, k, r, d), keys)
+        fanout_held, (_client, _threads, fanout) = _measure(
+            live_redis, lambda k, r, d: _run_fanout(live_redis_url, k, r, d), keys)
+        stats = fanout.stats()
+        fanout.stop()
+    finally:
+        live_redis.delete(*keys)
+
+    report(f"Redis connections for {VIEWERS} SSE viewers", {
+        'per-viewer XREAD connections': direct_held,
+        'fanout connections': fanout_held,
+        'fanout entries dispatched': stats['dispatched'],
+        'fanout max dispatch lag (ms)': stats['max_dispatch_lag_ms'],
+    })
+
+    assert fanout_held <= 2
+    assert stats['dispatched'] >= VIEWERS
@@ -0,0 +1,136 @@
+"""Benchmark: per-stream hash + Lua transitions vs. the legacy JSON blob layout."""
+import json
+import time
+
+import pytest
+
+from app.core.stream_manager import StreamManager
+from tests.benchmarks.helpers import ops_per_sec, report
+
+ITERATIONS = 2000
+
+
+class LegacyStreamManager:
+    """The pre-Lua implementation: one JSON blob per stream in a shared hash."""
+
+    def __init__(self, redis_client, streams_key):
+        self.redis = redis_client
+        self.streams_key = streams_key
+        self.health_key_prefix = "bench_legacy_health:"
+
+    def create_stream(self, stream_id, user_id, conversation_id):
+        now = time.time()
+        data = {'stream_id': stream_id, 'user_id': user_id, 'conversation_id': conversation_id,
+                'status': 'active', 'created_at': now, 'last_activity': now, 'last_id': '0-0'}
+        self.redis.hset(self.streams_key, stream_id, json.dumps(data))
+        self.redis.setex(f"{self.health_key_prefix}{stream_id}", 60, "alive")
+
+    def get_stream(self, stream_id):
+        data = self.redis.hget(self.streams_key, stream_id)
+        return json.loads(data) if data else None
+
+    def set_last_id(self, stream_id, last_id):
+        data = self.get_stream(stream_id) or {}
+        data['last_id'] = last_id
+        self.redis.hset(self.streams_key, stream_id, json.dumps(data))
+
+    def update_stream_activity(self, stream_id):
+        if not self.redis.exists(f"{self.health_key_prefix}{stream_id}"):
+            return False
+        self.redis.setex(f"{self.health_key_prefix}{stream_id}", 60, "alive")
+        data = self.get_stream(stream_id)
+        if data:
+            data['last_activity'] = time.time()
+            self.redis.hset(self.streams_key, stream_id, json.dumps(data))
+        return True
+
+    def mark_stream_complete(self, stream_id):
+        data = self.get_stream(stream_id)
+        if data:
+            data['status'] = 'complete'
+            data['completed_at'] = time.time()
+            self.redis.hset(self.streams_key, stream_id, json.dumps(data))
+            self.redis.delete(f"{self.health_key_prefix}{stream_id}")
+            return True
+        return False
+
+
+def _run_lifecycle(manager, prefix):
+    """Measure each transition on its own set of streams."""
+    ids = [f"{prefix}-{i}" for i in range(ITERATIONS)]
+    return {
+        'create': ops_per_sec(lambda i: manager.create_stream(ids[i], 1, 1), ITERATIONS),
+        'update_activity': ops_per_sec(lambda i: manager.update_stream_activity(ids[i]), ITERATIONS),
+        'set_last_id': ops_per_sec(lambda i: manager.set_last_id(ids[i], f"{i}-0"), ITERATIONS),
+        'mark_complete': ops_per_sec(lambda i: manager.mark_stream_complete(ids[i]), ITERATIONS),
+    }
+
+
+def _cleanup(client, pattern_prefixes, hash_key):
+    for prefix in pattern_prefixes:
+        keys = list(client.scan_iter(match=f"{prefix}*"))
+        if keys:
+            client.delete(*keys)
+    client.delete(hash_key)
+
+
+def test_stream_manager_ops_per_sec(live_redis, bench_prefix):
+    legacy_key = f"{bench_prefix}-legacy-active-streams"
+    legacy = LegacyStreamManager(live_redis, legacy_key)
+    current = StreamManager(live_redis)
+    current.streams_key = f"{bench_prefix}-active-stream-ids"
+
+    try:
+        legacy_rates = _run_lifecycle(legacy, f"{bench_prefix}-legacy")
+        current_rates = _run_lifecycle(current, f"{bench_prefix}-lua")
+    finally:
+        _cleanup(
+            live_redis,
+            [legacy.health_key_prefix + bench_prefix,
+             current.state_key_prefix + bench_prefix,
+             current.health_key_prefix + bench_prefix,
+             current.events_key_prefix + bench_prefix],
+            legacy_key,
+        )
+        live_redis.delete(current.streams_key)
+
+    rows = {}
+    for op in legacy_rates:
+        rows[f"{op} legacy ops/s"] = legacy_rates[op]
+        rows[f"{op} lua ops/s"] = current_rates[op]
+        rows[f"{op} speedup"] = f"{current_rates[op] / legacy_rates[op]:.2f}x"
+    report(f"StreamManager transitions ({ITERATIONS} streams)", rows)
+    assert all(rate > 0 for rate in current_rates.values())
+
+
+@pytest.mark.parametrize('writers', [4])
+def test_concurrent_writers_do_not_lose_fields(live_redis, bench_prefix, writers):
+    """Concurrent field updates on one stream must not overwrite each other."""
+    import threading
+
+    manager = StreamManager(live_redis)
+    manager.streams_key = f"{bench_prefix}-active-stream-ids"
+    stream_id = f"{bench_prefix}-shared"
+    manager.create_stream(stream_id, 1, 1)
+
+    def activity():
+        for _ in range(200):
+            manager.update_stream_activity(stream_id)
+
+    def cursor():
+        for i in range(200):
+            manager.set_last_id(stream_id, f"{i}-0")
+
+    threads = [threading.Thread(target=activity) for _ in range(writers)]
+    threads.append(threading.Thread(target=cursor))
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        data = manager.get_stream(stream_id)
+        assert data['last_id'] == '199-0'
+        assert data['status'] == 'active'
+    finally:
+        live_redis.delete(manager.get_state_key(stream_id), manager.get_health_key(stream_id),
+                          manager.streams_key)
@@ -0,0 +1,57 @@
+"""Benchmark: Redis commands per response with and without chunk coalescing."""
+import json
+
+from app.core.stream_cancel import CancelListener
+from app.core.stream_manager import StreamManager
+from app.services.ai_service import AIService
+from tests.benchmarks.helpers import CountingRedis, FakeStreamingClient, report
+
+# ~2 KB answer streamed as 4-byte tokens, roughly what Gemini emits per chunk
+TOKENS = ["visa"] * 500
+GUEST_MESSAGES = [{'role': 'user', 'content': 'What documents do I need for a student visa?'}]
+
+
+def _legacy_stream(redis_client, stream_manager, client, stream_id):
+    """The pre-coalescing loop: one XADD and one activity refresh per chunk."""
+    events_key = stream_manager.get_events_key(stream_id)
+    ai_response = ""
+    for chunk in client.models.generate_content_stream(model='fake', contents=[]):
+        if not stream_manager.get_stream(stream_id):
+            break
+        ai_response += chunk.text
+        payload = json.dumps({'type': 'chunk', 'content': chunk.text, 'message_id': None})
+        redis_client.xadd(events_key, {'payload': payload})
+        stream_manager.update_stream_activity(stream_id)
+    redis_client.xadd(events_key, {'payload': json.dumps({'type': 'complete', 'message_id': None})})
+    stream_manager.mark_stream_complete(stream_id)
+    return ai_response
+
+
+def test_redis_commands_per_response():
+    redis_client = CountingRedis()
+    stream_manager = StreamManager(redis_client)
+    client = FakeStreamingClient(TOKENS)
+
+    _legacy_stream(redis_client, stream_manager, client, 'bench-legacy')
+    legacy = (redis_client.total_commands, redis_client.round_trips)
+
+    redis_client.reset()
+    service = AIService(redis_client, stream_manager)
+    service.client = client
+    service.cancel_listener = CancelListener(redis_client, autostart=False)
+    service.response_cache = None
+    service.process_guest_messages_stream(GUEST_MESSAGES, 'bench-coalesced')
+    coalesced = (redis_client.total_commands, redis_client.round_trips)
+
+    report(f"Redis traffic per {len(TOKENS)}-chunk response "
+           f"(flush at {service.flush_bytes} B / {service.flush_interval_ms} ms)", {
+        'legacy commands': legacy[0],
+        'legacy round trips': legacy[1],
+        'coalesced commands': coalesced[0],
+        'coalesced round trips': coalesced[1],
+        'XADD legacy -> coalesced': f"{len(TOKENS) + 1} -> {redis_client.commands['xadd']}",
+        'coalesced breakdown': dict(redis_client.commands),
+    })
+
+    assert redis_client.commands['xadd'] < len(TOKENS) / 10
+    assert coalesced[1] < legacy[1]
@@ -0,0 +1,65 @@
+"""Benchmark: per-task overhead, app and AIService built per task vs. once per worker."""
+import os
+import time
+
+from app import create_app
+from app.core.stream_cancel import CancelListener
+from app.core.stream_manager import StreamManager
+from app.services.ai_service import AIService
+from app.tasks import worker as worker_module
+from tests.benchmarks.helpers import CountingRedis, FakeStreamingClient, report
+
+TASKS = int(os.environ.get('BENCH_WORKER_TASKS', 50))
+GUEST_MESSAGES = [{'role': 'user', 'content': 'What documents do I need for a student visa?'}]
+# Short stub answer so setup cost is visible next to it
+CHUNKS = ["visa "] * 40
+
+
+def _generate(ai_service, redis_client, stream_id):
+    ai_service.client = FakeStreamingClient(CHUNKS)
+    ai_service.cancel_listener = CancelListener(redis_client, autostart=False)
+    ai_service.response_cache = None
+    ai_service.redis = redis_client
+    ai_service.stream_manager = StreamManager(redis_client)
+    ai_service.process_guest_messages_stream(GUEST_MESSAGES, stream_id)
+
+
+def _cold_task(redis_client, i):
+    """What the task did before: a new app and service for every message."""
+    app = create_app('testing')
+    with app.app_context():
+        service = AIService(redis_client, StreamManager(redis_client))
+        _generate(service, redis_client, f'cold-{i}')
+
+
+def _warm_task(redis_client, i):
+    worker = worker_module.get_worker_context()
+    with worker.app.app_context():
+        _generate(worker.ai_service, redis_client, f'warm-{i}')
+
+
+def _per_task_ms(task, redis_client):
+    start = time.perf_counter()
+    for i in range(TASKS):
+        task(redis_client, i)
+    return (time.perf_counter() - start) / TASKS * 1000
+
+
+def test_task_overhead_cold_vs_warm(monkeypatch):
+    # A key makes AIService build a real genai.Client; the stub model replaces it
+    monkeypatch.setenv('GEMINI_API_KEY', 'bench-key')
+    monkeypatch.setenv('FLASK_CONFIG', 'testing')
+    monkeypatch.setattr(worker_module, '_context', None)
+    redis_client = CountingRedis()
+
+    worker_module.init_worker_process()
+    cold_ms = _per_task_ms(_cold_task, redis_client)
+    warm_ms = _per_task_ms(_warm_task, redis_client)
+
+    report(f"Celery task overhead, {TASKS} tasks with a stub model", {
+        'cold (app + service per task) ms/task': cold_ms,
+        'warm (per-worker context) ms/task': warm_ms,
+        'saved ms/task': cold_ms - warm_ms,
+    })
+
+    assert warm_ms < cold_ms
@@ -0,0 +1,48 @@
+"""A provider that plays back scripted turns, for tests of the chat service."""
+from typing import List, Union
+
+from app.core.llm_provider import FunctionCall, LLMProvider
+
+
+class ScriptedProvider(LLMProvider):
+    """Plays back a fixed script of streamed turns; for tests of tool calling.
+
+    Each ``stream`` call consumes the next turn: a string is streamed word
+    by word, a :class:`FunctionCall` (or a list mixing calls and strings) is
+    yielded as is. Once the script runs out every call answers ``default``.
+    Each request is recorded in ``requests`` as a dict of ``messages``,
+    ``system_instruction`` and ``tools``.
+    """
+
+    name = 'scripted'
+
+    def __init__(self, turns: List[Union[str, FunctionCall, List[Union[str, FunctionCall]]]],
+                 default: str = 'Done.'):
+        self.turns = list(turns)
+        self.default = default
+        self.requests: List[dict] = []
+
+    def _next_turn(self, messages, system_instruction, tools) -> list:
+        # Copied: callers keep appending to their message list
+        self.requests.append({'messages': [dict(m) for m in messages],
+                              'system_instruction': system_instruction, 'tools': tools})
+        turn = self.turns.pop(0) if self.turns else self.default
+        items = turn if isinstance(turn, list) else [turn]
+        chunks = []
+        for item in items:
+            if isinstance(item, str):
+                chunks.extend(word + ' ' for word in item.split())
+            else:
+                chunks.append(item)
+        return chunks
+
+    def stream(self, model, messages, system_instruction=None, tools=None):
+        yield from self._next_turn(messages, system_instruction, tools)
+
+    def generate(self, model, messages, system_instruction=None):
+        return ''.join(chunk for chunk in self._next_turn(messages, system_instruction, None)
+                       if isinstance(chunk, str)).strip()
+
+    def call_function(self, model, messages, tools):
+        return next((chunk for chunk in self._next_turn(messages, None, tools)
+                     if isinstance(chunk, FunctionCall)), None)
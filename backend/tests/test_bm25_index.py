@@ -0,0 +1,68 @@
+"""Tests for the array-backed BM25 postings."""
+import math
+
+import numpy as np
+import pytest
+
+from app.core.bm25_index import Postings, PostingsBuilder, idf, score_documents, tokenize
+
+
+DOCS = [
+    'Fill in the DS-160 form before the interview',
+    'The I-20 form comes from the school',
+    'Interview interview interview',
+]
+
+
+@pytest.fixture
+def postings(tmp_path):
+    builder = PostingsBuilder()
+    for text in DOCS:
+        builder.add(tokenize(text))
+    builder.save(str(tmp_path))
+    postings = Postings(str(tmp_path))
+    postings.prepare(avgdl=float(np.mean(postings.doc_len)))
+    return postings
+
+
+def test_tokenize_keeps_form_numbers():
+    assert tokenize('DS-160 and H-1B') == ['ds-160', 'ds160', 'ds', '160', 'and', 'h-1b', 'h1b', 'h', '1b']
+    assert set(tokenize('ds160')) <= set(tokenize('DS-160'))
+
+
+def test_csr_layout(postings):
+    tid = postings.vocab['form']
+    start, end = postings.offsets[tid], postings.offsets[tid + 1]
+    assert list(postings.docs[start:end]) == [0, 1]
+    assert postings.df('interview') == 2
+    assert postings.df('passport') == 0
+
+
+def test_scores_match_bm25_formula(postings):
+    weight = idf(postings.df('interview'), len(DOCS))
+    scores = np.zeros(len(DOCS), dtype=np.float32)
+    postings.accumulate('interview', weight, scores)
+
+    avgdl = float(np.mean(postings.doc_len))
+    expected = []
+    for doc, tf in enumerate([1, 0, 3]):
+        norm = 1.2 * (1 - 0.75 + 0.75 * postings.doc_len[doc] / avgdl)
+        expected.append(weight * tf * 2.2 / (tf + norm))
+    assert scores == pytest.approx(expected, rel=1e-5)
+    assert scores[2] > scores[0] > scores[1] == 0
+
+
+def test_idf_is_positive_and_decreasing():
+    assert idf(1, 1000) > idf(500, 1000) > idf(1000, 1000) > 0
+    assert idf(1, 10) == pytest.approx(math.log(1 + 9.5 / 1.5))
+
+
+def test_score_documents_in_memory(postings):
+    documents = [tokenize(text) for text in DOCS]
+
+    scores = score_documents(documents, tokenize('interview'))
+
+    expected = np.zeros(len(DOCS), dtype=np.float32)
+    postings.accumulate('interview', idf(2, len(DOCS)), expected)
+    assert scores == pytest.approx(expected, rel=1e-5)
+    assert not score_documents(documents, ['passport']).any()
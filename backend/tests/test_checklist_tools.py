@@ -0,0 +1,265 @@
+"""Tests for the chat's checklist tools and their cached snapshots."""
+import datetime
+from unittest.mock import Mock
+
+import pytest
+import redis
+from sqlalchemy import event
+
+from app.api.checklists import routes
+from app.core.checklist_snapshot import ChecklistSnapshotCache
+from app.core.extensions import db
+from app.core.llm_provider import FunctionCall
+from app.core.model_limiter import ModelSlot
+from app.core.stream_cancel import CancelListener
+from app.core.stream_codec import get_codec
+from app.db.models import Conversation, Message, UploadedFile, User
+from app.db.models.checklist import Category, Checklist, Item
+from app.services.ai_service import AIService
+from app.services.checklist_tools import ChecklistTools, build_checklist_snapshot
+from tests.scripted_provider import ScriptedProvider
+
+TODAY = datetime.date.today()
+
+
+class DictRedis:
+    """The few Redis commands the snapshot cache uses, over a dict."""
+
+    def __init__(self):
+        self.data = {}
+
+    def mget(self, *keys):
+        return [self.data.get(key) for key in keys]
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1)
+
+    def expire(self, key, seconds):
+        pass
+
+    def pipeline(self):
+        return self
+
+    def execute(self):
+        pass
+
+
+@pytest.fixture
+def items(app, test_user):
+    """Two checklists of the test user and one item of another user, by title."""
+    visa = Checklist(user_id=test_user.id, title='F-1 visa')
+    documents = Category(checklist=visa, title='Documents')
+    travel = Checklist(user_id=test_user.id, title='Travel')
+    booking = Category(checklist=travel, title='Booking')
+    other = User(username='other', email='other@example.com', yearofbirth=1992, educational_level='Master')
+    other.set_password('password123')
+    theirs = Checklist(user=other, title='Theirs')
+    created = [
+        Item(category=documents, title='Passport', deadline=TODAY - datetime.timedelta(days=1)),
+        Item(category=documents, title='Bank statement', deadline=TODAY + datetime.timedelta(days=10)),
+        Item(category=documents, title='I-20', deadline=TODAY - datetime.timedelta(days=5), is_completed=True),
+        Item(category=documents, title='Photo'),
+        Item(category=booking, title='Flight booking', deadline=TODAY + datetime.timedelta(days=30)),
+        Item(category=Category(checklist=theirs, title='Other'), title='Their passport',
+             deadline=TODAY - datetime.timedelta(days=1)),
+    ]
+    db.session.add_all([visa, travel, other] + created)
+    db.session.commit()
+    items = {item.title: item for item in created}
+    db.session.add(UploadedFile(user_id=test_user.id, item_id=items['Bank statement'].id,
+                                file_path='/tmp/march.pdf', original_filename='march.pdf',
+                                content_type='checklist'))
+    db.session.commit()
+    return items
+
+
+@pytest.fixture
+def snapshots():
+    return ChecklistSnapshotCache(DictRedis(), Mock(wraps=build_checklist_snapshot))
+
+
+class TestSnapshot:
+    def test_flattens_the_users_items(self, items, test_user):
+        snapshot = build_checklist_snapshot(test_user.id)
+
+        assert [checklist['title'] for checklist in snapshot['checklists']] == ['F-1 visa', 'Travel']
+        assert [item['title'] for item in snapshot['items']] == [
+            'I-20', 'Passport', 'Bank statement', 'Flight booking', 'Photo']
+        bank = snapshot['items'][2]
+        assert (bank['checklist'], bank['category'], bank['files']) == ('F-1 visa', 'Documents', 1)
+        assert bank['deadline'] == (TODAY + datetime.timedelta(days=10)).isoformat()
+
+    def test_cached_until_invalidated(self, items, test_user, snapshots):
+        first = snapshots.get(test_user.id)
+        assert snapshots.get(test_user.id) == first
+        assert snapshots.build.call_count == 1
+
+        snapshots.invalidate(test_user.id)
+        snapshots.get(test_user.id)
+        assert snapshots.build.call_count == 2
+
+    def test_builds_without_redis(self, items, test_user):
+        failing = Mock()
+        failing.mget.side_effect = redis.ConnectionError('down')
+        failing.pipeline.side_effect = redis.ConnectionError('down')
+        snapshots = ChecklistSnapshotCache(failing, build_checklist_snapshot)
+
+        assert len(snapshots.get(test_user.id)['items']) == 5
+        snapshots.invalidate(test_user.id)
+
+    def test_checklist_writes_invalidate(self, client, auth_headers, items, test_user, monkeypatch):
+        monkeypatch.setattr(routes.checklist_snapshots, 'redis', DictRedis())
+        key = routes.checklist_snapshots.get_generation_key(test_user.id)
+
+        client.get('/checklists/', headers=auth_headers)
+        assert key not in routes.checklist_snapshots.redis.data
+        client.patch(f"/checklists/items/{items['Photo'].id}", headers=auth_headers, json={'is_completed': True})
+        client.patch(f"/checklists/items/{items['Their passport'].id}", headers=auth_headers,
+                     json={'is_completed': True})
+
+        assert routes.checklist_snapshots.redis.data[key] == '1'
+
+
+class TestTools:
+    @pytest.fixture
+    def tools(self, items, test_user, snapshots):
+        return ChecklistTools(test_user.id, snapshots, today=TODAY)
+
+    def call(self, tools, name, **args):
+        return tools.execute(FunctionCall(name, args))
+
+    def test_lists_items_by_status(self, tools):
+        titles = lambda result: [item['title'] for item in result['items']]
+
+        assert titles(self.call(tools, 'list_checklist_items', status='overdue')) == ['Passport']
+        assert titles(self.call(tools, 'list_checklist_items')) == ['Bank statement', 'Flight booking', 'Photo']
+        assert titles(self.call(tools, 'list_checklist_items', status='all', query='BANK', limit=5.0)) == [
+            'Bank statement']
+        result = self.call(tools, 'list_checklist_items', status='pending', limit=1)
+        assert result['total'] == 3 and len(result['items']) == 1
+
+    def test_overview(self, tools):
+        visa, travel = self.call(tools, 'get_checklist_overview')['checklists']
+
+        assert (visa['done'], visa['pending'], visa['overdue']) == (1, 2, 1)
+        assert visa['next_deadline'] == (TODAY + datetime.timedelta(days=10)).isoformat()
+        assert travel['pending'] == 1
+
+    def test_mark_item_done_updates_and_invalidates(self, tools, items):
+        self.call(tools, 'list_checklist_items')
+
+        result = self.call(tools, 'mark_item_done', item_id=float(items['Passport'].id))
+
+        assert result['is_completed'] is True
+        assert db.session.get(Item, items['Passport'].id).is_completed
+        assert self.call(tools, 'list_checklist_items', status='overdue')['items'] == []
+        assert tools.snapshots.build.call_count == 2
+
+    def test_other_users_items_are_not_touched(self, tools, items):
+        result = self.call(tools, 'mark_item_done', item_id=items['Their passport'].id)
+
+        assert 'error' in result
+        assert not db.session.get(Item, items['Their passport'].id).is_completed
+
+    def test_done_must_be_a_bool(self, tools, items):
+        result = self.call(tools, 'mark_item_done', item_id=items['Passport'].id, done='false')
+
+        assert 'error' in result
+        assert not db.session.get(Item, items['Passport'].id).is_completed
+        assert self.call(tools, 'mark_item_done', item_id=items['I-20'].id, done=False)['is_completed'] is False
+
+    def test_bad_calls_return_errors(self, tools):
+        assert 'error' in self.call(tools, 'delete_everything')
+        assert 'error' in self.call(tools, 'list_checklist_items', status='later')
+        assert 'error' in self.call(tools, 'list_checklist_items', page=2)
+
+    def test_reads_run_no_queries_once_cached(self, app, tools):
+        self.call(tools, 'get_checklist_overview')
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            self.call(tools, 'list_checklist_items', status='overdue')
+            self.call(tools, 'get_checklist_overview')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+
+        assert statements == []
+
+
+class TestToolCallingInChat:
+    @pytest.fixture
+    def service(self, items, snapshots):
+        mock_redis = Mock()
+        mock_redis.exists.return_value = 0
+        stream_manager = Mock()
+        stream_manager.codec = get_codec()
+        stream_manager.title_pending.return_value = False
+        service = AIService(mock_redis, stream_manager)
+        service.cancel_listener = CancelListener(mock_redis, autostart=False)
+        service.model_limiter = None
+        service.knowledge_base = None
+        service.checklist_snapshots = snapshots
+        return service
+
+    def answer(self, service, test_user, question):
+        conversation = Conversation(user_id=test_user.id, title='Visa')
+        db.session.add(conversation)
+        db.session.commit()
+        user = Message(conversation_id=conversation.id, content=question, role='user')
+        ai = Message(conversation_id=conversation.id, content='', role='assistant', status='streaming')
+        db.session.add_all([user, ai])
+        db.session.commit()
+        service._stream_ai_response_with_redis(user, ai, 's1', conversation.id)
+        return ai
+
+    def test_scripted_calls_read_and_update_the_checklist(self, service, items, test_user):
+        passport = items['Passport'].id
+        service.provider = ScriptedProvider([
+            FunctionCall('list_checklist_items', {'status': 'overdue'}),
+            ['Marking it now.', FunctionCall('mark_item_done', {'item_id': float(passport)})],
+            'Your passport is marked as done.',
+        ])
+
+        ai = self.answer(service, test_user, 'Mark my overdue passport item as done')
+
+        assert ai.status == 'complete'
+        assert ai.content == 'Marking it now. Your passport is marked as done. '
+        first, second, third = service.provider.requests
+        assert first['tools']['function_declarations'][0]['name'] == 'get_checklist_overview'
+        assert second['messages'][-2] == {'role': 'model', 'function_call': {
+            'name': 'list_checklist_items', 'args': {'status': 'overdue'}}}
+        assert second['messages'][-1]['response']['items'][0]['id'] == passport
+        assert third['messages'][-1] == {'role': 'tool', 'name': 'mark_item_done', 'response': {
+            'id': passport, 'title': 'Passport', 'is_completed': True}}
+        assert db.session.get(Item, passport).is_completed
+
+    def test_every_model_call_takes_a_limiter_slot(self, service, test_user):
+        service.model_limiter = Mock()
+        service.model_limiter.acquire.return_value = ModelSlot()
+        service.provider = ScriptedProvider([FunctionCall('get_checklist_overview')], default='Here it is.')
+
+        self.answer(service, test_user, 'How am I doing?')
+
+        assert len(service.provider.requests) == 2
+        assert [c.args for c in service.model_limiter.acquire.call_args_list] == [('user',), ('user',)]
+
+    def test_tools_are_withdrawn_after_max_rounds(self, service, test_user):
+        service.max_tool_rounds = 2
+        service.provider = ScriptedProvider([FunctionCall('get_checklist_overview')] * 2, default='Here it is.')
+
+        ai = self.answer(service, test_user, 'How am I doing?')
+
+        assert [request['tools'] is not None for request in service.provider.requests] == [True, True, False]
+        assert ai.content == 'Here it is. '
+
+    def test_disabled_tools_are_not_offered(self, service, test_user):
+        service.chat_tools_enabled = False
+        service.provider = ScriptedProvider(['Hello.'])
+
+        self.answer(service, test_user, 'Hi')
+
+        assert service.provider.requests[0]['tools'] is None
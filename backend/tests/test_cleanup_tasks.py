@@ -8,28 +8,10 @@ class TestCleanupTasks:
     """Test cleanup task functionality."""
     
     def test_get_redis_client(self):
-        """Test getting Redis client."""
-        with patch.dict('os.environ', {'REDIS_URL': 'redis://test:6379/0'}):
-            with patch('redis.from_url') as mock_from_url:
-                mock_client = Mock()
-                mock_from_url.return_value = mock_client
-                
-                client = get_redis_client()
-                
-                assert client == mock_client
-                mock_from_url.assert_called_once_with('redis://test:6379/0', decode_responses=True)
-    
-    def test_get_redis_client_default(self):
-        """Test getting Redis client with default URL."""
-        with patch.dict('os.environ', {}, clear=True):
-            with patch('redis.from_url') as mock_from_url:
-                mock_client = Mock()
-                mock_from_url.return_value = mock_client
-                
-                client = get_redis_client()
-                
-                assert client == mock_client
-                mock_from_url.assert_called_once_with('redis://localhost:6379/0', decode_responses=True)
+        """Tasks share the app-wide pooled client."""
+        from app.core.extensions import redis_provider
+
+        assert get_redis_client() is redis_provider.client
     
     def test_get_stream_manager(self):
         """Test getting StreamManager instance."""
@@ -87,3 +69,12 @@ class TestCleanupTasks:
             result = task_func()
             assert result == 3
             mock_cleanup.assert_called_once()
+
+    def test_stream_cleanup_is_scheduled(self):
+        """celery beat runs the registered stream cleanup task."""
+        from app.core.celery import beat_schedule, celery
+
+        schedule = beat_schedule(30)
+        assert schedule['cleanup-expired-streams'] == {'task': 'cleanup.expired_streams', 'schedule': 30}
+        assert 'cleanup.expired_streams' in celery.tasks
+        assert celery.conf.beat_schedule['cleanup-expired-streams']['task'] == 'cleanup.expired_streams'
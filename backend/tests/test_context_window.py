@@ -0,0 +1,103 @@
+"""Tests for the token-budgeted history builder."""
+import pytest
+from sqlalchemy import event
+
+from app.core.context_window import MESSAGE_OVERHEAD_TOKENS, build_context, message_tokens
+from app.core.extensions import db
+from app.db.models import Conversation, Message
+
+
+@pytest.fixture
+def conversation(app, test_user):
+    conversation = Conversation(user_id=test_user.id, title='Visa')
+    db.session.add(conversation)
+    db.session.commit()
+    return conversation
+
+
+def add_turns(conversation, count, content='x' * 40):
+    """Alternating user/assistant messages of 10 estimated tokens each."""
+    messages = [Message(conversation_id=conversation.id, content=content,
+                        role='user' if i % 2 == 0 else 'assistant')
+                for i in range(count)]
+    db.session.add_all(messages)
+    db.session.commit()
+    return messages
+
+
+def count_selects():
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    return statements, lambda: event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def test_token_count_stored_on_write(conversation):
+    message = Message(conversation_id=conversation.id, content='a' * 9, role='user')
+    assert message.token_count == 3
+
+    message.content = 'a' * 40
+    assert message.token_count == 10
+
+
+def test_legacy_rows_are_estimated(conversation):
+    message = add_turns(conversation, 1)[0]
+    message.token_count = None
+    assert message_tokens(message) == 10 + MESSAGE_OVERHEAD_TOKENS
+
+
+def test_keeps_most_recent_turns_within_budget(conversation):
+    messages = add_turns(conversation, 10)
+    per_message = 10 + MESSAGE_OVERHEAD_TOKENS
+
+    window = build_context(conversation.id, messages[-1].id, budget_tokens=per_message * 4)
+
+    assert [m.id for m in window] == [m.id for m in messages[-4:]]
+
+
+def test_window_starts_on_user_turn(conversation):
+    messages = add_turns(conversation, 10)
+    per_message = 10 + MESSAGE_OVERHEAD_TOKENS
+
+    window = build_context(conversation.id, messages[-1].id, budget_tokens=per_message * 3)
+
+    # The three newest start with an assistant reply, which is dropped
+    assert [m.role for m in window] == ['user', 'assistant']
+
+
+def test_newest_message_always_included(conversation):
+    message = add_turns(conversation, 3, content='x' * 400)[-1]
+
+    window = build_context(conversation.id, message.id, budget_tokens=1)
+
+    assert [m.id for m in window] == [message.id]
+
+
+def test_stops_at_up_to_id_and_skips_empty(conversation):
+    user, assistant = add_turns(conversation, 2)
+    placeholder = Message(conversation_id=conversation.id, content='', role='assistant')
+    db.session.add(placeholder)
+    db.session.commit()
+
+    assert build_context(conversation.id, placeholder.id) == [user, assistant]
+    assert build_context(conversation.id, user.id) == [user]
+
+
+def test_old_pages_are_never_read(conversation):
+    messages = add_turns(conversation, 200)
+    conversation_id, newest_id = conversation.id, messages[-1].id
+    statements, stop = count_selects()
+    try:
+        window = build_context(conversation_id, newest_id, budget_tokens=300, page_size=20)
+    finally:
+        stop()
+
+    # 300 tokens fit 21 messages (the oldest, an assistant turn, is dropped):
+    # two pages of 20 are read and the other eight never are
+    assert len(window) == 20
+    assert len(statements) == 2
+    assert 'LIMIT' in statements[0].upper()
@@ -0,0 +1,174 @@
+"""Tests for rolling conversation summaries."""
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+import pytest
+
+from app.core.context_window import build_context
+from app.core.stream_cancel import CancelListener
+from app.core.stream_codec import get_codec
+from app.core.conversation_summary import Summarizer, fold_older_turns, summary_due
+from app.core.extensions import db
+from app.db.models import Conversation, Message
+from app.services.ai_service import AIService
+
+
+class FakeSummarizer(Summarizer):
+    """Records which messages each call folded; the summary lists their ids."""
+
+    def __init__(self):
+        self.calls = []
+
+    def summarize(self, previous_summary, messages):
+        ids = [m.id for m in messages]
+        self.calls.append((previous_summary, ids))
+        return ' '.join(filter(None, [previous_summary, ','.join(map(str, ids))]))
+
+
+@pytest.fixture
+def conversation(app, test_user):
+    conversation = Conversation(user_id=test_user.id, title='Visa')
+    db.session.add(conversation)
+    db.session.commit()
+    return conversation
+
+
+def add_turns(conversation, count):
+    messages = [Message(conversation_id=conversation.id, content=f'turn {i}',
+                        role='user' if i % 2 == 0 else 'assistant')
+                for i in range(count)]
+    db.session.add_all(messages)
+    db.session.commit()
+    return [m.id for m in messages]
+
+
+def test_folds_incrementally_without_repeats(conversation):
+    ids = add_turns(conversation, 12)
+    summarizer = FakeSummarizer()
+
+    assert fold_older_turns(conversation.id, ids[6], summarizer) == 6
+    assert fold_older_turns(conversation.id, ids[6], summarizer) == 0
+    assert fold_older_turns(conversation.id, ids[10], summarizer) == 4
+
+    first = ','.join(map(str, ids[:6]))
+    assert summarizer.calls == [(None, ids[:6]), (first, ids[6:10])]
+    db.session.refresh(conversation)
+    assert conversation.summary_through_id == ids[9]
+    assert conversation.summary == first + ' ' + ','.join(map(str, ids[6:10]))
+
+
+def test_folds_in_batches(conversation):
+    ids = add_turns(conversation, 5)
+    summarizer = FakeSummarizer()
+
+    assert fold_older_turns(conversation.id, ids[-1] + 1, summarizer, batch_size=2) == 5
+    assert [batch for _prev, batch in summarizer.calls] == [ids[0:2], ids[2:4], ids[4:5]]
+
+
+def test_concurrent_fold_is_discarded(conversation):
+    ids = add_turns(conversation, 4)
+
+    class RacingSummarizer(FakeSummarizer):
+        def summarize(self, previous_summary, messages):
+            # Another worker commits a summary while this one is running
+            Conversation.query.filter_by(id=conversation.id).update(
+                {'summary': 'other', 'summary_through_id': ids[1]})
+            db.session.commit()
+            return super().summarize(previous_summary, messages)
+
+    assert fold_older_turns(conversation.id, ids[2], RacingSummarizer()) == 0
+    db.session.refresh(conversation)
+    assert conversation.summary == 'other'
+
+
+def test_summary_due(conversation):
+    ids = add_turns(conversation, 12)
+
+    assert summary_due(conversation.id, None, ids[10], min_messages=10) is True
+    assert summary_due(conversation.id, None, ids[9], min_messages=10) is False
+    assert summary_due(conversation.id, ids[0], ids[10], min_messages=10) is False
+
+
+def test_window_excludes_summarized_turns(conversation):
+    ids = add_turns(conversation, 6)
+
+    window = build_context(conversation.id, ids[-1], after_id=ids[1])
+
+    assert [m.id for m in window] == ids[2:]
+
+
+class RecordingClient:
+    def __init__(self):
+        self.models = self
+        self.requests = []
+
+    def generate_content_stream(self, **request):
+        self.requests.append(request)
+        yield SimpleNamespace(text='ok')
+
+
+class TestAIServiceSummaries:
+    """Generation sends the summary plus recent turns and schedules folding."""
+
+    @pytest.fixture
+    def service(self, mock_redis):
+        stream_manager = Mock()
+        stream_manager.codec = get_codec()
+        stream_manager.title_pending.return_value = False
+        service = AIService(mock_redis, stream_manager)
+        service.cancel_listener = CancelListener(mock_redis, autostart=False)
+        service.client = RecordingClient()
+        return service
+
+    @pytest.fixture
+    def mock_redis(self):
+        mock_redis = Mock()
+        mock_redis.exists = Mock(return_value=0)
+        return mock_redis
+
+    def run_turn(self, service, conversation):
+        user = Message(conversation_id=conversation.id, content='new question', role='user')
+        db.session.add(user)
+        db.session.commit()
+        ai = Message(conversation_id=conversation.id, content='', role='assistant', status='streaming')
+        db.session.add(ai)
+        db.session.commit()
+        service._stream_ai_response_with_redis(user, ai, 's1', conversation.id)
+        assert ai.status == 'complete'
+        return user
+
+    def test_summary_sent_with_recent_turns(self, service, conversation):
+        ids = add_turns(conversation, 4)
+        conversation.summary = 'Student visa, Spain'
+        conversation.summary_through_id = ids[1]
+        db.session.commit()
+
+        with patch.object(AIService, '_schedule_summary') as schedule:
+            self.run_turn(service, conversation)
+
+        request = service.client.requests[0]
+        assert 'Student visa, Spain' in request['config']['system_instruction']
+        assert len(request['contents']) == 3
+        schedule.assert_not_called()
+
+    def test_schedules_summary_when_turns_leave_window(self, service, conversation):
+        add_turns(conversation, 30)
+        service.context_token_budget = 40
+        service.summary_min_messages = 10
+
+        with patch.object(AIService, '_schedule_summary') as schedule:
+            user = self.run_turn(service, conversation)
+
+        request = service.client.requests[0]
+        assert 'system_instruction' not in request.get('config', {})
+        window_start = schedule.call_args.args[1]
+        assert schedule.call_args.args[0] == conversation.id
+        assert window_start <= user.id
+        assert len(request['contents']) < 31
+
+    def test_summarize_conversation_uses_given_summarizer(self, service, conversation):
+        ids = add_turns(conversation, 4)
+        summarizer = FakeSummarizer()
+
+        assert service.summarize_conversation(conversation.id, ids[2], summarizer) == 2
+        assert summarizer.calls == [(None, ids[:2])]
@@ -0,0 +1,161 @@
+"""Tests for the per-user index of checklist files."""
+import io
+from unittest.mock import Mock, patch
+
+import pytest
+
+from app.core.extensions import db
+from app.db.models import DocumentIndexEntry, UploadedFile
+from app.db.models.checklist import Category, Checklist, Item
+from app.services import document_service
+from app.services.ai_service import AIService
+from app.services.document_index import embed_files, index_file, index_missing_files, search_user_documents
+
+
+@pytest.fixture
+def items(app, tmp_path, monkeypatch, test_user):
+    """Uploads and the chunk cache under tmp_path, and a checklist with three items."""
+    app.config['UPLOAD_FOLDER'] = str(tmp_path / 'uploads')
+    monkeypatch.setenv('DOCUMENT_CACHE_PATH', str(tmp_path / 'documents'))
+    monkeypatch.setenv('KB_EMBEDDER', 'hash')
+    monkeypatch.setattr(document_service, '_cache', None)
+    checklist = Checklist(user_id=test_user.id, title='F-1 visa')
+    category = Category(checklist=checklist, title='Finances')
+    titles = ['Bank statement', 'Passport', 'Admission letter']
+    db.session.add_all([checklist, category] + [Item(category=category, title=title) for title in titles])
+    db.session.commit()
+    return {item.title: item for item in category.items}
+
+
+@pytest.fixture
+def embed_task():
+    """The queued embedding task, run in-process when called."""
+    with patch('app.tasks.documents.embed_index_entries_task') as task:
+        task.delay.side_effect = embed_files
+        yield task
+
+
+@pytest.fixture
+def upload(client, auth_headers, items, embed_task):
+    """POST a checklist file and return its id; text extraction is left to the caller."""
+    def upload(item_title, name, content):
+        with patch('app.tasks.documents.extract_file_text_task'):
+            response = client.post(f'/checklists/items/{items[item_title].id}/files', headers=auth_headers,
+                                   data={'file': (io.BytesIO(content.encode()), name)})
+        assert response.status_code == 201
+        return response.get_json()['file']['id']
+    return upload
+
+
+def _entry(file_id):
+    return db.session.get(DocumentIndexEntry, file_id)
+
+
+class TestIndexing:
+    def test_upload_indexes_name_and_checklist_path(self, upload, test_user, embed_task):
+        file_id = upload('Bank statement', 'march.txt', 'Balance 12,400 USD')
+
+        entry = _entry(file_id)
+        assert entry.user_id == test_user.id
+        assert entry.text.splitlines()[:2] == ['march.txt', 'F-1 visa > Finances > Bank statement']
+        # Embedded by the extraction task once the text is in
+        assert entry.embedding is None
+        embed_task.delay.assert_not_called()
+
+        document_service.extract_uploaded_file(file_id)
+
+        entry = _entry(file_id)
+        assert entry.embedder == 'hash:256' and len(entry.embedding) == 256 * 4
+
+    def test_request_paths_leave_embedding_to_the_task(self, upload, items, embed_task):
+        file_id = upload('Passport', 'scan.txt', 'P<USA')
+        uploaded_file = db.session.get(UploadedFile, file_id)
+        embedder = Mock(signature='hash:256')
+        embedder.embed.side_effect = AssertionError('embedded inline')
+
+        with patch.object(document_service.get_document_cache(), 'embedder', embedder):
+            uploaded_file.original_filename = 'passport.txt'
+            assert index_file(uploaded_file, embed=False)
+        db.session.commit()
+
+        assert _entry(file_id).embedding is None
+        assert embed_files([file_id]) == 1 and _entry(file_id).embedding is not None
+        assert embed_files([file_id]) == 0
+
+    def test_extraction_adds_leading_text(self, upload):
+        file_id = upload('Bank statement', 'march.txt', 'Closing balance 12,400 USD')
+
+        document_service.extract_uploaded_file(file_id)
+
+        assert _entry(file_id).text.endswith('Closing balance 12,400 USD')
+
+    def test_renames_refresh_the_entry(self, client, auth_headers, upload, items, embed_task):
+        file_id = upload('Passport', 'scan.txt', 'P<USA')
+
+        client.patch(f"/checklists/items/{items['Passport'].id}/files/{file_id}", headers=auth_headers,
+                     json={'original_filename': 'passport-photo-page.txt'})
+        client.patch(f"/checklists/items/{items['Passport'].id}", headers=auth_headers,
+                     json={'title': 'Passport (valid 6 months)'})
+
+        assert _entry(file_id).text.splitlines()[:2] == [
+            'passport-photo-page.txt', 'F-1 visa > Finances > Passport (valid 6 months)']
+        assert embed_task.delay.call_count == 2 and _entry(file_id).embedding is not None
+
+    def test_checklist_and_category_renames_refresh_entries(self, client, auth_headers, upload, items):
+        file_id = upload('Passport', 'scan.txt', 'P<USA')
+        category = items['Passport'].category
+
+        client.patch(f'/checklists/{category.checklist_id}', headers=auth_headers, json={'title': 'Student visa'})
+        client.patch(f'/checklists/categories/{category.id}', headers=auth_headers, json={'title': 'Identity'})
+
+        assert _entry(file_id).text.splitlines()[1] == 'Student visa > Identity > Passport'
+
+    def test_deletes_evict_entries(self, client, auth_headers, upload, items):
+        kept = upload('Bank statement', 'march.txt', 'march')
+        deleted = upload('Bank statement', 'april.txt', 'april')
+        cascaded = upload('Passport', 'scan.txt', 'P<USA')
+
+        client.delete(f"/checklists/items/{items['Bank statement'].id}/files/{deleted}", headers=auth_headers)
+        client.delete(f"/checklists/items/{items['Passport'].id}", headers=auth_headers)
+
+        assert _entry(deleted) is None and _entry(cascaded) is None
+        assert _entry(kept) is not None
+        assert DocumentIndexEntry.query.count() == 1
+
+    def test_index_missing_files_backfills(self, items, test_user, tmp_path):
+        path = tmp_path / 'old.txt'
+        path.write_text('uploaded before the index existed')
+        db.session.add(UploadedFile(user_id=test_user.id, item_id=items['Passport'].id, file_path=str(path),
+                                    original_filename='old.txt', content_type='checklist'))
+        db.session.commit()
+
+        assert index_missing_files() == 1
+        assert index_missing_files() == 0
+
+
+class TestSearch:
+    def test_finds_the_bank_statement(self, upload, test_user):
+        bank = upload('Bank statement', 'estado_de_cuenta.txt', 'Saldo disponible')
+        upload('Passport', 'scan.txt', 'P<USA')
+        upload('Admission letter', 'i20.txt', 'Form I-20 certificate of eligibility')
+
+        hits = search_user_documents(test_user.id, 'Do I already have a bank statement uploaded?')
+
+        assert hits[0].file_id == bank and hits[0].bm25 > 0
+
+    def test_other_users_files_are_not_searched(self, upload, test_user):
+        upload('Bank statement', 'march.txt', 'march')
+
+        assert search_user_documents(test_user.id + 1, 'bank statement') == []
+        assert search_user_documents(test_user.id, '   ') == []
+
+    def test_matches_reach_the_prompt_instruction(self, upload, test_user):
+        upload('Admission letter', 'i20.txt', 'Form I-20')
+        service = AIService(Mock(), Mock())
+
+        instruction = service._user_documents_instruction(
+            test_user.id, [{'role': 'user', 'text': 'Did I upload my admission letter?'}])
+
+        assert '- i20.txt | F-1 visa > Finances > Admission letter' in instruction
+        with patch('app.services.ai_service.search_user_documents', side_effect=OSError('db down')):
+            assert service._user_documents_instruction(test_user.id, []) is None
@@ -0,0 +1,257 @@
+"""Tests for chat upload text extraction, the chunk cache and attachments in prompts."""
+import io
+import os
+import zipfile
+from unittest.mock import Mock, patch
+
+import pytest
+
+from app.core.document_text import (
+    DocumentChunkCache, document_kind, iter_docx_pages, iter_pages, iter_pdf_pages, iter_text_pages,
+)
+from app.core.extensions import db
+from app.core.knowledge_base import HashEmbedder
+from app.db.models import Conversation, Message, UploadedFile, User
+from app.services import document_service
+from app.services.ai_service import AIService
+from tests.benchmarks.helpers import make_pdf
+
+
+def _docx(path, paragraphs):
+    body = ''.join(f'<w:p><w:r><w:t>{text}</w:t></w:r></w:p>' for text in paragraphs)
+    xml = ('<?xml version="1.0" encoding="UTF-8"?>'
+           '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+           f'<w:body>{body}</w:body></w:document>')
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('word/document.xml', xml)
+    return str(path)
+
+
+@pytest.fixture
+def embedder():
+    return HashEmbedder(dim=128)
+
+
+@pytest.fixture
+def cache(tmp_path, embedder):
+    return DocumentChunkCache(str(tmp_path / 'documents'), embedder)
+
+
+@pytest.fixture
+def document_env(app, tmp_path, monkeypatch):
+    """Uploads and the chunk cache under tmp_path, with a fresh process cache."""
+    app.config['UPLOAD_FOLDER'] = str(tmp_path / 'uploads')
+    monkeypatch.setenv('DOCUMENT_CACHE_PATH', str(tmp_path / 'documents'))
+    monkeypatch.setenv('KB_EMBEDDER', 'hash')
+    monkeypatch.setattr(document_service, '_cache', None)
+    return tmp_path
+
+
+class TestExtraction:
+    def test_document_kind(self):
+        assert document_kind('I-20.PDF') == 'pdf'
+        assert document_kind('letter', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document') == 'docx'
+        assert document_kind('notes.md') == 'text'
+        assert document_kind('photo.png', 'image/png') is None
+
+    def test_pdf_pages_in_order(self, tmp_path):
+        path = tmp_path / 'form.pdf'
+        path.write_bytes(make_pdf([[f'Page {n} of the DS-160 guide'] for n in range(1, 11)]))
+
+        # A small cache window exercises re-resolving objects after a clear
+        pages = list(iter_pdf_pages(str(path), cache_pages=3))
+
+        assert [number for number, _text in pages] == list(range(1, 11))
+        assert 'Page 7 of the DS-160 guide' in pages[6][1]
+
+    def test_docx_paragraph_groups(self, tmp_path):
+        path = _docx(tmp_path / 'letter.docx', ['Dear officer', '', 'I am applying', 'for an F-1 visa', 'Regards'])
+
+        pages = list(iter_docx_pages(path, paragraphs_per_page=2))
+
+        assert pages == [(1, 'Dear officer\n\nI am applying'), (2, 'for an F-1 visa\n\nRegards')]
+
+    def test_text_blocks_cut_at_paragraphs(self, tmp_path):
+        path = tmp_path / 'notes.txt'
+        path.write_text('first paragraph\n\nsecond paragraph\n\nthird', encoding='utf-8')
+
+        pages = list(iter_text_pages(str(path), block_chars=20))
+
+        assert ''.join(text for _number, text in pages) == path.read_text(encoding='utf-8')
+        assert pages[0] == (1, 'first paragraph')
+
+    def test_text_without_paragraphs_is_still_cut(self, tmp_path):
+        path = tmp_path / 'items.csv'
+        path.write_text(''.join(f'{i},passport,pending\n' for i in range(200)), encoding='utf-8')
+        path_unbroken = tmp_path / 'blob.txt'
+        path_unbroken.write_text('x' * 500, encoding='utf-8')
+
+        for source in (path, path_unbroken):
+            pages = list(iter_text_pages(str(source), block_chars=50))
+
+            assert ''.join(text for _number, text in pages) == source.read_text(encoding='utf-8').rstrip()
+            assert len(pages) >= 5 and max(len(text) for _number, text in pages) <= 150
+
+    def test_unsupported_kind(self, tmp_path):
+        with pytest.raises(ValueError):
+            iter_pages(str(tmp_path / 'x.png'), 'image')
+
+
+class TestChunkCache:
+    def test_build_and_search(self, tmp_path, cache):
+        pages = [(1, 'Cover page'), (2, 'The DS-160 confirmation page must be printed.'), (3, 'Fees')]
+
+        meta = cache.build('ab' * 32, pages, label='p.')
+
+        assert meta == {'sha256': 'ab' * 32, 'pages': 3, 'chunks': 3, 'chars': meta['chars'],
+                        'excerpt': 'Cover page\nThe DS-160 confirmation page must be printed.\nFees'}
+        assert cache.contains('ab' * 32) and cache.meta('ab' * 32)['chunks'] == 3
+        passages = cache.open('ab' * 32).search('DS-160 confirmation')
+        assert passages[0].source == 'p. 2'
+        assert sorted(os.listdir(os.path.dirname(cache.path('ab' * 32)))) == ['ab' * 32]
+
+    def test_missing_entry(self, cache):
+        assert cache.open('cd' * 32) is None
+        assert cache.meta('cd' * 32) is None
+
+    def test_failed_build_leaves_nothing(self, cache):
+        def pages():
+            yield 1, 'first page'
+            raise OSError('truncated file')
+
+        with pytest.raises(OSError):
+            cache.build('ef' * 32, pages())
+
+        assert not cache.contains('ef' * 32)
+        assert os.listdir(os.path.dirname(cache.path('ef' * 32))) == []
+
+    def test_entries_are_per_embedder(self, tmp_path, cache):
+        cache.build('ab' * 32, [(1, 'text')])
+        assert not DocumentChunkCache(str(tmp_path / 'documents'), HashEmbedder(dim=64)).contains('ab' * 32)
+
+
+class TestDocumentService:
+    def _upload(self, user, path, name):
+        uploaded_file = UploadedFile(user_id=user.id, file_path=str(path), original_filename=name,
+                                     file_size=os.path.getsize(path), content_type='chat')
+        needs_extraction = document_service.prepare_upload(uploaded_file)
+        db.session.add(uploaded_file)
+        db.session.commit()
+        return uploaded_file, needs_extraction
+
+    def test_extract_then_reuse_by_content(self, document_env, test_user):
+        path = document_env / 'guide.pdf'
+        path.write_bytes(make_pdf([['Proof of funds'], ['Bring the I-20 to the interview']]))
+
+        first, needs_extraction = self._upload(test_user, path, 'guide.pdf')
+        assert needs_extraction and first.text_status == 'pending'
+        assert document_service.extract_uploaded_file(first.id) == 'ready'
+
+        second, needs_extraction = self._upload(test_user, path, 'copy of guide.pdf')
+        assert not needs_extraction
+        assert second.text_status == 'ready' and second.content_hash == first.content_hash
+
+    def test_unsupported_and_broken_files(self, document_env, test_user):
+        image = document_env / 'photo.png'
+        image.write_bytes(b'\x89PNG')
+        broken = document_env / 'broken.pdf'
+        broken.write_bytes(b'not a pdf')
+
+        uploaded_image, needs_extraction = self._upload(test_user, image, 'photo.png')
+        assert not needs_extraction and uploaded_image.text_status == 'unsupported'
+        uploaded_pdf, _ = self._upload(test_user, broken, 'broken.pdf')
+        assert document_service.extract_uploaded_file(uploaded_pdf.id) == 'failed'
+
+    def test_attachment_context(self, document_env, test_user):
+        ready_path = document_env / 'letter.docx'
+        _docx(ready_path, ['My employer filed the H-1B petition in April.'])
+        pending_path = document_env / 'bank.txt'
+        pending_path.write_text('Balance statement', encoding='utf-8')
+        ready, _ = self._upload(test_user, ready_path, 'letter.docx')
+        document_service.extract_uploaded_file(ready.id)
+        pending, _ = self._upload(test_user, pending_path, 'bank.txt')
+
+        context = document_service.attachment_context([ready, pending], 'When was the H-1B petition filed?')
+
+        assert '[letter.docx, part 1] My employer filed the H-1B petition in April.' in context
+        assert 'still being read' in context and 'bank.txt' in context
+
+    def test_conversation_attachments_newest_first(self, document_env, test_user):
+        files = []
+        for name in ('a.txt', 'b.txt'):
+            path = document_env / name
+            path.write_text(name, encoding='utf-8')
+            files.append(self._upload(test_user, path, name)[0])
+        conversation = Conversation(user_id=test_user.id, title='Docs')
+        db.session.add(conversation)
+        db.session.commit()
+        for attachments in ([files[0]], [files[1]], [files[0]]):
+            db.session.add(Message(conversation_id=conversation.id, content='see file', role='user',
+                                   attachments=attachments))
+        db.session.commit()
+
+        assert [f.original_filename for f in document_service.conversation_attachments(conversation.id)] == \
+            ['a.txt', 'b.txt']
+
+    def test_attachments_reach_the_prompt_instruction(self, document_env, test_user):
+        path = document_env / 'offer.txt'
+        path.write_text('The offer letter states a salary of 95,000 USD.', encoding='utf-8')
+        uploaded_file, _ = self._upload(test_user, path, 'offer.txt')
+        document_service.extract_uploaded_file(uploaded_file.id)
+        conversation = Conversation(user_id=test_user.id, title='Offer')
+        db.session.add(conversation)
+        db.session.commit()
+        db.session.add(Message(conversation_id=conversation.id, content='See my offer', role='user',
+                               attachments=[uploaded_file]))
+        db.session.commit()
+        service = AIService(Mock(), Mock())
+
+        instruction = service._attachment_instruction(
+            conversation.id, [{'role': 'user', 'text': 'What salary does the offer state?'}])
+
+        assert '[offer.txt, part 1] The offer letter states a salary' in instruction
+        with patch('app.services.ai_service.conversation_attachments', side_effect=OSError('db down')):
+            assert service._attachment_instruction(conversation.id, []) is None
+
+
+class TestRoutes:
+    def test_chat_upload_schedules_extraction_once_per_content(self, client, auth_headers, document_env):
+        with patch('app.tasks.documents.extract_file_text_task') as task:
+            response = client.post('/files/chat/upload', headers=auth_headers,
+                                   data={'file': (io.BytesIO(b'DS-160 notes'), 'notes.txt')})
+            assert response.status_code == 201
+            file_id = response.get_json()['file']['id']
+            assert response.get_json()['file']['text_status'] == 'pending'
+            task.delay.assert_called_once_with(file_id)
+
+            document_service.extract_uploaded_file(file_id)
+            response = client.post('/files/chat/upload', headers=auth_headers,
+                                   data={'file': (io.BytesIO(b'DS-160 notes'), 'again.txt')})
+
+        assert response.get_json()['file']['text_status'] == 'ready'
+        assert task.delay.call_count == 1
+
+    def test_send_attaches_owned_files(self, client, auth_headers, test_user, document_env):
+        other = User(email='other@example.com', username='other', yearofbirth=1990, educational_level='PhD')
+        other.set_password('TestPassword123')
+        db.session.add(other)
+        db.session.commit()
+        mine = UploadedFile(user_id=test_user.id, file_path='x', original_filename='mine.pdf', content_type='chat')
+        theirs = UploadedFile(user_id=other.id, file_path='y', original_filename='theirs.pdf', content_type='chat')
+        db.session.add_all([mine, theirs])
+        db.session.commit()
+
+        with patch('app.api.chat.routes.ai_service'), patch('app.api.chat.routes.stream_manager'), \
+                patch('app.api.chat.routes.process_message_stream_task'), \
+                patch('app.api.chat.routes._schedule_title'):
+            bad = client.post('/chat/send', headers=auth_headers, json={'content': 'Hi', 'file_ids': ['1']})
+            foreign = client.post('/chat/send', headers=auth_headers,
+                                  json={'content': 'Hi', 'file_ids': [mine.id, theirs.id]})
+            response = client.post('/chat/send', headers=auth_headers,
+                                   json={'content': 'Read this', 'file_ids': [mine.id]})
+
+        assert bad.status_code == 400
+        assert foreign.status_code == 404
+        assert response.status_code == 200
+        message = db.session.get(Message, response.get_json()['message_id'])
+        assert [f.original_filename for f in message.attachments] == ['mine.pdf']
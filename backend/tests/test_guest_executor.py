@@ -0,0 +1,116 @@
+"""Tests for the bounded guest stream executor and the guest send path."""
+import threading
+from unittest.mock import Mock, patch
+
+import pytest
+
+from app.core import guest_executor as guest_executor_module
+from app.core.guest_executor import GuestExecutorFull, GuestStreamExecutor
+
+
+GUEST_MESSAGES = [{'role': 'user', 'content': 'What documents do I need?'}]
+
+
+@pytest.fixture
+def executor():
+    executor = GuestStreamExecutor(max_workers=2, max_queue=1)
+    yield executor
+    executor.shutdown(wait=True)
+
+
+class TestGuestStreamExecutor:
+    def test_rejects_beyond_workers_plus_queue(self, executor):
+        release = threading.Event()
+        started = threading.Semaphore(0)
+
+        def job():
+            started.release()
+            release.wait(5)
+
+        futures = [executor.submit(job) for _ in range(3)]
+        started.acquire(timeout=5)
+        started.acquire(timeout=5)
+
+        assert executor.full is True
+        with pytest.raises(GuestExecutorFull):
+            executor.submit(job)
+        stats = executor.stats()
+        assert stats['running'] == 2
+        assert stats['queued'] == 1
+        assert stats['occupancy'] == 1.0
+        assert stats['rejected'] == 1
+
+        release.set()
+        for future in futures:
+            future.result(timeout=5)
+        assert executor.full is False
+        assert executor.stats()['submitted'] == 3
+
+    def test_failing_job_frees_its_slot(self, executor):
+        def boom():
+            raise RuntimeError('boom')
+
+        for _ in range(5):
+            with pytest.raises(RuntimeError):
+                executor.submit(boom).result(timeout=5)
+
+        assert executor.stats()['running'] == 0
+        assert executor.full is False
+
+    def test_process_wide_instance(self, monkeypatch):
+        monkeypatch.setattr(guest_executor_module, '_executor', None)
+        assert guest_executor_module.get_guest_executor_stats() is None
+
+        executor = guest_executor_module.get_guest_executor(3, 4)
+        try:
+            assert guest_executor_module.get_guest_executor() is executor
+            assert guest_executor_module.get_guest_executor_stats()['max_workers'] == 3
+        finally:
+            executor.shutdown()
+
+
+class TestGuestSend:
+    """/chat/send without a token."""
+
+    @pytest.fixture
+    def routes(self):
+        from app.api.chat import routes
+        with patch.object(routes, 'stream_manager', Mock()), \
+                patch.object(routes, 'ai_service', Mock()):
+            yield routes
+
+    def test_runs_on_executor(self, client, routes):
+        executor = Mock(full=False)
+        with patch.object(routes, 'get_guest_executor', return_value=executor):
+            resp = client.post('/chat/send', json={'messages': GUEST_MESSAGES})
+
+        assert resp.status_code == 200
+        stream_id = resp.get_json()['stream_id']
+        routes.stream_manager.create_stream.assert_called_once_with(stream_id, None, None)
+        run, *args = executor.submit.call_args.args
+        assert args == [GUEST_MESSAGES, stream_id, None]
+        assert 'session_id' not in resp.get_json()
+
+        run(*args)
+        routes.ai_service.process_guest_messages_stream.assert_called_once_with(
+            GUEST_MESSAGES, stream_id, session_id=None)
+
+    def test_full_pool_returns_503_with_retry_after(self, app, client, routes):
+        app.config['GUEST_RETRY_AFTER_SECONDS'] = 7
+        with patch.object(routes, 'get_guest_executor', return_value=Mock(full=True)):
+            resp = client.post('/chat/send', json={'messages': GUEST_MESSAGES})
+
+        assert resp.status_code == 503
+        assert resp.headers['Retry-After'] == '7'
+        routes.stream_manager.create_stream.assert_not_called()
+
+    def test_lost_race_marks_stream_failed(self, client, routes):
+        executor = Mock(full=False)
+        executor.submit.side_effect = GuestExecutorFull('full')
+        with patch.object(routes, 'get_guest_executor', return_value=executor):
+            resp = client.post('/chat/send', json={'messages': GUEST_MESSAGES})
+
+        assert resp.status_code == 503
+        assert 'Retry-After' in resp.headers
+        stream_id = routes.stream_manager.create_stream.call_args.args[0]
+        routes.stream_manager.mark_stream_error.assert_called_once_with(stream_id, 'Guest chat is at capacity')
@@ -0,0 +1,161 @@
+"""Tests for server-side guest sessions."""
+import json
+from unittest.mock import Mock, patch
+
+import pytest
+
+from app.core.guest_executor import GuestExecutorFull
+from app.core.guest_session import GuestSessionStore
+from app.core.llm_provider import FakeProvider
+from app.core.stream_cancel import CancelListener
+from app.core.stream_codec import get_codec
+from app.services.ai_service import AIService
+
+
+SESSION_ID = 'a' * 32
+
+
+def entry(role, content):
+    return json.dumps({'role': role, 'content': content})
+
+
+class TestGuestSessionStore:
+    @pytest.fixture
+    def mock_redis(self):
+        return Mock()
+
+    @pytest.fixture
+    def store(self, mock_redis):
+        return GuestSessionStore(mock_redis, ttl_seconds=600, max_messages=4)
+
+    def test_ids(self, store):
+        assert store.is_valid_id(store.new_session_id())
+        assert not store.is_valid_id('../etc')
+        assert not store.is_valid_id(None)
+        assert not store.is_valid_id('A' * 32)
+
+    def test_append_trims_and_refreshes_ttl_in_one_round_trip(self, store, mock_redis):
+        pipe = mock_redis.pipeline.return_value
+        pipe.execute.return_value = [3, True, True, [entry('user', 'Hi'), 'not json', entry('user', 'Visa?')]]
+
+        window = store.append(SESSION_ID, 'user', 'Visa?', read=True)
+
+        key = f'guest_session:{SESSION_ID}'
+        assert json.loads(pipe.rpush.call_args.args[1]) == {'role': 'user', 'content': 'Visa?'}
+        pipe.ltrim.assert_called_once_with(key, -4, -1)
+        pipe.expire.assert_called_once_with(key, 600)
+        pipe.lrange.assert_called_once_with(key, 0, -1)
+        pipe.execute.assert_called_once()
+        assert window == [{'role': 'user', 'content': 'Hi'}, {'role': 'user', 'content': 'Visa?'}]
+
+    def test_append_without_read(self, store, mock_redis):
+        assert store.append(SESSION_ID, 'assistant', 'Passport.') is None
+        mock_redis.pipeline.return_value.lrange.assert_not_called()
+
+    def test_window_with_does_not_store(self, store, mock_redis):
+        mock_redis.lrange.return_value = [entry('user', str(i)) for i in range(4)]
+
+        window = store.window_with(SESSION_ID, 'user', 'Visa?')
+
+        assert [m['content'] for m in window] == ['1', '2', '3', 'Visa?']
+        mock_redis.pipeline.assert_not_called()
+
+
+class TestGuestSessionSend:
+    """/chat/send with ``content`` instead of ``messages``."""
+
+    @pytest.fixture
+    def routes(self):
+        from app.api.chat import routes
+        executor = Mock(full=False)
+        with patch.object(routes, 'stream_manager', Mock()), \
+                patch.object(routes, 'ai_service', Mock()), \
+                patch.object(routes, 'get_guest_executor', return_value=executor):
+            yield routes
+
+    def submitted(self, routes):
+        return routes.get_guest_executor.return_value.submit.call_args.args[1:]
+
+    def test_new_session(self, client, routes):
+        sessions = routes.ai_service.guest_sessions
+        sessions.is_valid_id.return_value = False
+        sessions.new_session_id.return_value = SESSION_ID
+        sessions.window_with.return_value = [{'role': 'user', 'content': 'Visa?'}]
+
+        resp = client.post('/chat/send', json={'content': 'Visa?'})
+
+        assert resp.status_code == 200
+        assert resp.get_json()['session_id'] == SESSION_ID
+        sessions.window_with.assert_called_once_with(SESSION_ID, 'user', 'Visa?')
+        sessions.append.assert_not_called()
+        sessions.extend.assert_not_called()
+        messages, stream_id, session_id = self.submitted(routes)
+        assert messages == [{'role': 'user', 'content': 'Visa?'}]
+        assert (stream_id, session_id) == (resp.get_json()['stream_id'], SESSION_ID)
+
+    def test_existing_session_window_starts_on_user_turn(self, client, routes):
+        sessions = routes.ai_service.guest_sessions
+        sessions.is_valid_id.return_value = True
+        sessions.window_with.return_value = [
+            {'role': 'assistant', 'content': 'Passport.'},
+            {'role': 'user', 'content': 'And insurance?'},
+        ]
+
+        resp = client.post('/chat/send', json={'content': 'And insurance?', 'session_id': SESSION_ID})
+
+        assert resp.get_json()['session_id'] == SESSION_ID
+        sessions.new_session_id.assert_not_called()
+        assert self.submitted(routes)[0] == [{'role': 'user', 'content': 'And insurance?'}]
+
+    def test_content_required(self, client, routes):
+        resp = client.post('/chat/send', json={'content': '   '})
+        assert resp.status_code == 400
+        routes.ai_service.guest_sessions.window_with.assert_not_called()
+
+    def test_refused_send_leaves_session_untouched(self, client, routes):
+        sessions = routes.ai_service.guest_sessions
+        sessions.is_valid_id.return_value = True
+        sessions.window_with.return_value = [{'role': 'user', 'content': 'Visa?'}]
+        routes.get_guest_executor.return_value.submit.side_effect = GuestExecutorFull()
+
+        resp = client.post('/chat/send', json={'content': 'Visa?', 'session_id': SESSION_ID})
+
+        assert resp.status_code == 503
+        sessions.append.assert_not_called()
+        sessions.extend.assert_not_called()
+
+
+class TestGuestSessionAnswers:
+    @pytest.fixture
+    def service(self):
+        mock_redis = Mock()
+        mock_redis.exists.return_value = 0
+        stream_manager = Mock()
+        stream_manager.codec = get_codec()
+        service = AIService(mock_redis, stream_manager)
+        service.cancel_listener = CancelListener(mock_redis, autostart=False)
+        service.response_cache = None
+        service.model_limiter = None
+        service.provider = FakeProvider(ttft_ms=0, tokens_per_sec=0, answer_tokens=5)
+        service.guest_sessions = Mock()
+        return service
+
+    def test_answer_appended_to_session(self, service):
+        messages = [{'role': 'user', 'content': 'Visa?'}]
+
+        service.process_guest_messages_stream(messages, 's1', session_id=SESSION_ID)
+
+        expected = ''.join(service.provider.stream('fake', [{'role': 'user', 'text': 'Visa?'}]))
+        service.guest_sessions.extend.assert_called_once_with(SESSION_ID, [
+            {'role': 'user', 'content': 'Visa?'}, {'role': 'assistant', 'content': expected}])
+
+    def test_failed_answer_leaves_session_untouched(self, service):
+        service.provider = None
+
+        service.process_guest_messages_stream([{'role': 'user', 'content': 'Visa?'}], 's1', session_id=SESSION_ID)
+
+        service.guest_sessions.extend.assert_not_called()
+
+    def test_stateless_guest_untouched(self, service):
+        service.process_guest_messages_stream([{'role': 'user', 'content': 'Visa?'}], 's1')
+        service.guest_sessions.extend.assert_not_called()
@@ -0,0 +1,239 @@
+"""Tests for the local visa knowledge base."""
+import os
+from unittest.mock import Mock
+
+import numpy as np
+import pytest
+
+from app.core.knowledge_base import (
+    HashEmbedder, IndexWriter, KnowledgeBase, Passage, chunk_text, create_embedder, format_passages, ingest,
+    reciprocal_rank_fusion,
+)
+from app.core.llm_provider import FakeProvider
+from app.core.stream_cancel import CancelListener
+from app.core.stream_codec import get_codec
+from app.services.ai_service import AIService
+
+
+DOCUMENTS = {
+    'student/f1.md': "F-1 student visa\n\nYou need Form I-20 from your school and proof of funds "
+                     "covering the first year of tuition and living costs.",
+    'work/h1b.txt': "H-1B specialty occupation\n\nYour employer files a petition; the annual cap "
+                    "lottery runs in March.",
+    'notes.pdf': "ignored: not a text document",
+}
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    root = tmp_path / 'docs'
+    for name, text in DOCUMENTS.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding='utf-8')
+    return str(root)
+
+
+@pytest.fixture
+def kb_path(tmp_path):
+    return str(tmp_path / 'kb')
+
+
+@pytest.fixture
+def embedder():
+    return HashEmbedder(dim=128)
+
+
+class TestEmbedding:
+    def test_hash_embedder_is_deterministic_and_normalized(self, embedder):
+        vectors = embedder.embed(['Proof of funds for F-1', 'proof of FUNDS for f-1', ''])
+
+        assert vectors.dtype == np.float32
+        assert np.allclose(vectors[0], vectors[1])
+        assert np.isclose(np.linalg.norm(vectors[0]), 1.0)
+        assert not vectors[2].any()
+
+    def test_create_embedder(self, monkeypatch):
+        monkeypatch.setenv('KB_EMBEDDING_DIM', '64')
+        assert create_embedder('hash').signature == 'hash:64'
+        monkeypatch.delenv('GEMINI_API_KEY', raising=False)
+        assert create_embedder('gemini') is None
+        with pytest.raises(ValueError):
+            create_embedder('nope')
+
+
+class TestChunking:
+    def test_packs_paragraphs(self):
+        assert chunk_text("one\n\ntwo\n\n\nthree", max_chars=9) == ['one two', 'three']
+
+    def test_long_sentence_windows_overlap(self):
+        chunks = chunk_text('x' * 250, max_chars=100, overlap=20)
+        assert [len(c) for c in chunks] == [100, 100, 90]
+
+
+class TestKnowledgeBase:
+    def test_ingest_and_search(self, corpus, kb_path, embedder):
+        result = ingest(corpus, kb_path, embedder)
+        knowledge_base = KnowledgeBase(kb_path, embedder, min_score=0.0)
+
+        assert result['documents'] == 2
+        assert knowledge_base.count == result['chunks'] == 2
+        passages = knowledge_base.search('What proof of funds does the F-1 visa need?', k=1)
+        assert [p.source for p in passages] == [os.path.join('student', 'f1.md')]
+        assert 'I-20' in passages[0].text
+
+    def test_min_score_filters_vector_candidates_only(self, corpus, kb_path, embedder):
+        ingest(corpus, kb_path, embedder)
+        passages = KnowledgeBase(kb_path, embedder, min_score=0.99).search('lottery in March')
+
+        assert [p.source for p in passages] == ['work/h1b.txt']
+        assert passages[0].cosine is None and passages[0].bm25 > 0
+
+    def test_missing_index_returns_nothing(self, kb_path, embedder):
+        knowledge_base = KnowledgeBase(kb_path, embedder)
+        assert knowledge_base.search('visa') == []
+        assert knowledge_base.stats()['chunks'] == 0
+
+    def test_reingest_swaps_version_and_prunes_old(self, corpus, kb_path, embedder):
+        ingest(corpus, kb_path, embedder)
+        knowledge_base = KnowledgeBase(kb_path, embedder, reload_seconds=0)
+        first = knowledge_base.stats()['version']
+
+        writer = IndexWriter(kb_path, embedder, 1)
+        writer.add([('new.md', 'Schengen visa')], embedder.embed(['Schengen visa']))
+        writer.commit()
+
+        assert knowledge_base.stats()['version'] == writer.version != first
+        assert sorted(os.listdir(kb_path)) == ['CURRENT', writer.version]
+        assert knowledge_base.search('Schengen', min_score=0.0)[0].source == 'new.md'
+
+    def test_other_embedder_index_is_ignored(self, corpus, kb_path, embedder):
+        ingest(corpus, kb_path, embedder)
+        assert KnowledgeBase(kb_path, HashEmbedder(dim=64)).search('F-1 funds', min_score=-1) == []
+
+    def test_writer_requires_declared_count(self, kb_path, embedder):
+        writer = IndexWriter(kb_path, embedder, 2)
+        writer.add([('a', 'a')], embedder.embed(['a']))
+        with pytest.raises(ValueError):
+            writer.commit()
+
+    def test_cli_ingest_and_search(self, app, corpus, kb_path):
+        app.config.update(KB_PATH=kb_path, KB_EMBEDDER='hash')
+        runner = app.test_cli_runner()
+
+        result = runner.invoke(args=['kb', 'ingest', corpus])
+        assert result.exit_code == 0, result.output
+        assert 'Indexed 2 chunks from 2 documents' in result.output
+
+        result = runner.invoke(args=['kb', 'search', 'H-1B lottery', '-k', '1'])
+        assert 'h1b.txt' in result.output
+
+        result = runner.invoke(args=['kb', 'delete', 'work/h1b.txt'])
+        assert 'Deleted 1 chunks' in result.output
+        result = runner.invoke(args=['kb', 'add', corpus])
+        assert 'Added 2 chunks from 2 documents (1 old chunks replaced)' in result.output
+        assert '2 chunks in 1 segment(s)' in runner.invoke(args=['kb', 'compact']).output
+
+    def test_format_passages(self):
+        assert format_passages([]) is None
+        block = format_passages([Passage('Bring I-20.', 'f1.md', 0.8)])
+        assert block.endswith('[1] (f1.md) Bring I-20.')
+
+
+class TestHybridAndUpdates:
+    @pytest.fixture
+    def knowledge_base(self, corpus, kb_path, embedder):
+        ingest(corpus, kb_path, embedder)
+        return KnowledgeBase(kb_path, embedder, min_score=0.0, reload_seconds=0, max_segments=3)
+
+    def test_rrf_rewards_agreement(self):
+        fused = reciprocal_rank_fusion([['a', 'b', 'c'], ['b', 'c']], k=60)
+        assert [key for key, _score in fused] == ['b', 'c', 'a']
+        assert fused[0][1] == pytest.approx(1 / 62 + 1 / 61)
+
+    def test_exact_form_number_found_by_bm25(self, knowledge_base):
+        knowledge_base.add_documents([('forms/ds160.md', 'Submit DS-160 online and print the barcode page.')])
+        passages = knowledge_base.search('ds160 confirmation', k=1, min_score=0.99)
+        assert passages[0].source == 'forms/ds160.md'
+        assert passages[0].bm25 > 0
+
+    def test_add_replaces_existing_source(self, knowledge_base, kb_path):
+        result = knowledge_base.add_documents([('work/h1b.txt', 'H-1B petitions now open in April.')])
+
+        assert result == {'documents': 1, 'chunks': 1, 'replaced': 1}
+        assert knowledge_base.count == 2
+        texts = [p.text for p in knowledge_base.search('H-1B lottery March April', k=5)]
+        assert texts.count('H-1B petitions now open in April.') == 1
+        assert not any('March' in text for text in texts)
+
+    def test_delete_and_drop_empty_segments(self, knowledge_base):
+        knowledge_base.add_documents([('extra.md', 'Schengen visa insurance')])
+        assert knowledge_base.stats()['segments'] == 2
+
+        assert knowledge_base.delete_documents(['extra.md', 'missing.md']) == 1
+        assert knowledge_base.delete_documents(['extra.md']) == 0
+        stats = knowledge_base.stats()
+        assert (stats['segments'], stats['chunks']) == (1, 2)
+        assert all(p.source != 'extra.md' for p in knowledge_base.search('Schengen insurance', k=5))
+
+    def test_segments_merge_past_limit(self, knowledge_base, kb_path):
+        for n in range(3):
+            knowledge_base.add_documents([(f'extra-{n}.md', f'Country {n} embassy hours')])
+        knowledge_base.delete_documents(['student/f1.md'])
+        assert knowledge_base.stats()['segments'] == 1
+        assert knowledge_base.compact() == {'segments': 1, 'chunks': 4}
+
+        version = os.path.join(kb_path, knowledge_base.stats()['version'])
+        assert len([name for name in os.listdir(version) if name.startswith('seg-')]) == 1
+        assert knowledge_base.search('embassy hours country 2', k=1)[0].source == 'extra-2.md'
+
+    def test_reader_survives_compaction_until_reload(self, knowledge_base, kb_path, embedder):
+        reader = KnowledgeBase(kb_path, embedder, min_score=0.0, reload_seconds=3600)
+        assert reader.search('I-20 funds', k=1)[0].source == 'student/f1.md'
+
+        knowledge_base.add_documents([('extra.md', 'Embassy hours')])
+        knowledge_base.compact()
+
+        assert reader.search('I-20 funds', k=1)[0].source == 'student/f1.md'
+
+    def test_add_to_empty_path_creates_index(self, kb_path, embedder):
+        knowledge_base = KnowledgeBase(kb_path, embedder, min_score=0.0)
+        knowledge_base.add_documents([('a.md', 'Work permit rules')])
+        assert knowledge_base.search('work permit')[0].source == 'a.md'
+
+    def test_other_embedder_cannot_write(self, knowledge_base, kb_path):
+        with pytest.raises(ValueError):
+            KnowledgeBase(kb_path, HashEmbedder(dim=64)).add_documents([('a.md', 'text')])
+
+
+class TestRetrievalInPrompt:
+    @pytest.fixture
+    def service(self, corpus, kb_path, embedder):
+        ingest(corpus, kb_path, embedder)
+        mock_redis = Mock()
+        mock_redis.exists.return_value = 0
+        stream_manager = Mock()
+        stream_manager.codec = get_codec()
+        service = AIService(mock_redis, stream_manager)
+        service.cancel_listener = CancelListener(mock_redis, autostart=False)
+        service.response_cache = None
+        service.model_limiter = None
+        service.provider = Mock(wraps=FakeProvider(ttft_ms=0, tokens_per_sec=0, answer_tokens=3))
+        service.knowledge_base = KnowledgeBase(kb_path, embedder, min_score=0.1)
+        return service
+
+    def test_guest_prompt_gets_passages(self, service):
+        service.process_guest_messages_stream(
+            [{'role': 'user', 'content': 'When is the H-1B cap lottery?'}], 's1')
+
+        system_instruction = service.provider.stream.call_args.args[2]
+        assert '[1] (work/h1b.txt)' in system_instruction
+
+    def test_retrieval_errors_are_ignored(self, service):
+        service.knowledge_base = Mock()
+        service.knowledge_base.search.side_effect = OSError('gone')
+
+        service.process_guest_messages_stream([{'role': 'user', 'content': 'H-1B?'}], 's1')
+
+        assert service.provider.stream.call_args.args[2] is None
+        service.stream_manager.mark_stream_complete.assert_called_once_with('s1')
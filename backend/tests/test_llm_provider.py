@@ -0,0 +1,202 @@
+"""Tests for the model providers and their use by AIService."""
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+import pytest
+
+from app.core import ai_tools
+from app.core.llm_provider import (
+    FakeProvider, FakeProviderError, GeminiProvider, create_provider,
+)
+from app.core.stream_cancel import CancelListener
+from app.core.stream_codec import decode_entry, get_codec
+from app.services.ai_service import AIService
+
+
+QUESTION = [{'role': 'user', 'text': 'What documents do I need for a student visa?'}]
+
+
+class RecordingSleep:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, seconds):
+        self.calls.append(seconds)
+
+
+class TestFakeProvider:
+    def test_answer_is_deterministic_per_question(self):
+        provider = FakeProvider(ttft_ms=0, tokens_per_sec=0, answer_tokens=30)
+        first = ''.join(provider.stream('fake', QUESTION))
+        again = ''.join(FakeProvider(ttft_ms=0, tokens_per_sec=0, answer_tokens=30).stream('fake', QUESTION))
+        other = ''.join(provider.stream('fake', [{'role': 'user', 'text': 'How long is a work permit valid?'}]))
+
+        assert first == again
+        assert first != other
+        assert len(first.split()) == 30
+        assert provider.generate('fake', QUESTION) == first.strip()
+
+    def test_stream_timing_follows_ttft_and_throughput(self):
+        sleep = RecordingSleep()
+        provider = FakeProvider(ttft_ms=250, tokens_per_sec=50, chunk_tokens=5,
+                                answer_tokens=20, sleep=sleep)
+
+        chunks = list(provider.stream('fake', QUESTION))
+
+        assert [len(chunk.split()) for chunk in chunks] == [5, 5, 5, 5]
+        assert sleep.calls[0] == pytest.approx(0.25)
+        # One pause per chunk after the first, sized by its tokens
+        assert sleep.calls[1:] == [pytest.approx(0.1)] * 3
+
+    def test_error_rate_is_seeded(self):
+        def failures(seed):
+            provider = FakeProvider(ttft_ms=0, tokens_per_sec=0, error_rate=0.3, seed=seed)
+            outcome = []
+            for _ in range(200):
+                try:
+                    provider.generate('fake', QUESTION)
+                    outcome.append(False)
+                except FakeProviderError:
+                    outcome.append(True)
+            return outcome
+
+        run = failures(seed=3)
+        assert run == failures(seed=3)
+        assert 30 < sum(run) < 90
+
+    def test_stream_failure_happens_before_first_chunk(self):
+        provider = FakeProvider(ttft_ms=0, error_rate=1.0)
+        with pytest.raises(FakeProviderError):
+            next(provider.stream('fake', QUESTION))
+
+    def test_call_function_fills_string_arguments(self):
+        provider = FakeProvider(ttft_ms=0)
+        call = provider.call_function('fake', [{'role': 'user', 'text': 'Please help with my student visa documents'}],
+                                      ai_tools.get_tools_spec())
+
+        assert call.name == 'generate_conversation_title'
+        assert call.args['title'] == 'help with my student visa documents'
+
+    def test_call_function_without_tools(self):
+        assert FakeProvider(ttft_ms=0).call_function('fake', QUESTION, {}) is None
+
+
+class FakeGenAIClient:
+    """Records requests made through the ``google.genai`` surface."""
+
+    def __init__(self, chunks=(), function_calls=None, text=''):
+        self.models = self
+        self.chunks = list(chunks)
+        self.function_calls = function_calls
+        self.text = text
+        self.requests = []
+        self.closed = False
+
+    def generate_content_stream(self, **request):
+        self.requests.append(request)
+        client = self
+
+        class Response:
+            def __iter__(self):
+                return iter(SimpleNamespace(text=text) for text in client.chunks)
+
+            def close(self):
+                client.closed = True
+
+        return Response()
+
+    def generate_content(self, **request):
+        self.requests.append(request)
+        return SimpleNamespace(text=self.text, function_calls=self.function_calls)
+
+
+class TestGeminiProvider:
+    def test_stream_maps_roles_and_system_instruction(self):
+        client = FakeGenAIClient(chunks=['Pass', '', 'port'])
+        provider = GeminiProvider(client)
+        messages = [{'role': 'user', 'text': 'Hi'}, {'role': 'model', 'text': 'Hello'},
+                    {'role': 'user', 'text': 'Visa?'}]
+
+        assert list(provider.stream('gemini-x', messages, 'Earlier: student visa')) == ['Pass', 'port']
+
+        request = client.requests[0]
+        assert request['model'] == 'gemini-x'
+        assert [c.role for c in request['contents']] == ['user', 'model', 'user']
+        assert request['config'] == {'system_instruction': 'Earlier: student visa'}
+        assert client.closed
+
+    def test_closing_the_stream_closes_the_response(self):
+        client = FakeGenAIClient(chunks=['a', 'b', 'c'])
+        stream = GeminiProvider(client).stream('gemini-x', QUESTION)
+        assert next(stream) == 'a'
+        stream.close()
+        assert client.closed
+
+    def test_call_function_reads_args(self):
+        client = FakeGenAIClient(function_calls=[SimpleNamespace(name='generate_conversation_title',
+                                                                 args={'title': 'Student visa'})])
+        call = GeminiProvider(client).call_function('gemini-x', QUESTION, ai_tools.get_tools_spec())
+
+        assert call.name == 'generate_conversation_title'
+        assert call.args == {'title': 'Student visa'}
+        assert client.requests[0]['config']['tool_config'] == {'function_calling_config': {'mode': 'ANY'}}
+
+    def test_call_function_without_calls(self):
+        client = FakeGenAIClient(function_calls=None)
+        assert GeminiProvider(client).call_function('gemini-x', QUESTION, ai_tools.get_tools_spec()) is None
+
+
+class TestCreateProvider:
+    def test_fake_reads_env(self, monkeypatch):
+        monkeypatch.setenv('AI_PROVIDER', 'fake')
+        monkeypatch.setenv('FAKE_LLM_TTFT_MS', '5')
+        monkeypatch.setenv('FAKE_LLM_CHUNK_TOKENS', '7')
+        monkeypatch.setenv('FAKE_LLM_ERROR_RATE', '0.1')
+
+        provider = create_provider()
+
+        assert isinstance(provider, FakeProvider)
+        assert (provider.ttft_ms, provider.chunk_tokens, provider.error_rate) == (5.0, 7, 0.1)
+
+    def test_gemini_without_key(self, monkeypatch):
+        monkeypatch.delenv('AI_PROVIDER', raising=False)
+        monkeypatch.delenv('GEMINI_API_KEY', raising=False)
+        assert create_provider() is None
+
+    def test_unknown_provider(self):
+        with pytest.raises(ValueError):
+            create_provider('nope')
+
+
+class TestAIServiceWithFakeProvider:
+    @pytest.fixture
+    def service(self, monkeypatch):
+        monkeypatch.setenv('AI_PROVIDER', 'fake')
+        monkeypatch.setenv('FAKE_LLM_TTFT_MS', '0')
+        monkeypatch.setenv('FAKE_LLM_TOKENS_PER_SEC', '0')
+        mock_redis = Mock()
+        mock_redis.exists.return_value = 0
+        stream_manager = Mock()
+        stream_manager.codec = get_codec()
+        service = AIService(mock_redis, stream_manager)
+        service.cancel_listener = CancelListener(mock_redis, autostart=False)
+        service.response_cache = None
+        return service
+
+    def test_selected_by_config(self, service):
+        assert isinstance(service.provider, FakeProvider)
+        assert service.client is None
+
+    def test_guest_stream_writes_fake_answer(self, service):
+        service.process_guest_messages_stream(
+            [{'role': 'user', 'content': QUESTION[0]['text']}], 'stream-1')
+
+        pipe = service.redis.pipeline.return_value
+        events = [decode_entry(call.args[1]) for call in pipe.xadd.call_args_list]
+        text = ''.join(e['content'] for e in events if e['type'] == 'chunk')
+        assert text == ''.join(service.provider.stream('fake', QUESTION))
+        assert events[-1]['type'] == 'complete'
+
+    def test_title_via_fake_tool_call(self, service):
+        title = service.generate_title_via_tool('Need help with my student visa documents')
+        assert title.lower() == 'help with my student visa documents'
@@ -0,0 +1,218 @@
+"""Tests for branching conversations: path loading, prompts and the branch endpoints."""
+from contextlib import contextmanager
+from unittest.mock import Mock, patch
+
+import pytest
+from sqlalchemy import event
+
+from app.core.context_window import MESSAGE_OVERHEAD_TOKENS, build_branch_context
+from app.core.conversation_summary import fold_older_turns, summary_due
+from app.core.extensions import db
+from app.core.message_tree import is_on_branch, load_branch, newest_leaf, sibling_ids
+from app.core.stream_cancel import CancelListener
+from app.core.stream_codec import get_codec
+from app.db.models import Conversation, Message
+from app.services.ai_service import AIService
+from tests.scripted_provider import ScriptedProvider
+from tests.test_conversation_summary import FakeSummarizer
+
+
+@pytest.fixture
+def conversation(app, test_user):
+    conversation = Conversation(user_id=test_user.id, title='Visa')
+    db.session.add(conversation)
+    db.session.commit()
+    return conversation
+
+
+def reply(conversation, parent, role, content='x' * 40):
+    """Add a message under ``parent`` and make it the active leaf."""
+    message = Message(conversation_id=conversation.id, role=role, content=content,
+                      parent_message_id=parent.id if parent else None)
+    db.session.add(message)
+    db.session.flush()
+    conversation.active_leaf_id = message.id
+    db.session.commit()
+    return message
+
+
+def chain(conversation, count, parent=None, prefix='turn'):
+    messages = []
+    for i in range(count):
+        role = 'user' if i % 2 == 0 else 'assistant'
+        parent = reply(conversation, parent, role, f'{prefix} {i} '.ljust(40, 'x'))
+        messages.append(parent)
+    return messages
+
+
+@contextmanager
+def count_statements():
+    statements = []
+    record = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+
+class TestLoading:
+    def test_loads_only_the_branch_in_one_query(self, conversation):
+        trunk = chain(conversation, 4)
+        chain(conversation, 6, parent=trunk[1], prefix='old')
+        branch = chain(conversation, 3, parent=trunk[1], prefix='new')
+        expected = [m.id for m in trunk[:2] + branch]
+        db.session.expunge_all()
+
+        with count_statements() as statements:
+            messages = load_branch(expected[-1])
+
+        assert [m.id for m in messages] == expected
+        assert len(statements) == 1 and 'RECURSIVE' in statements[0].upper()
+
+    def test_branch_helpers(self, conversation):
+        question, answer = chain(conversation, 2)
+        retry = reply(conversation, question, 'assistant')
+        follow_up = reply(conversation, answer, 'user')
+
+        assert is_on_branch(question.id, retry.id) and not is_on_branch(answer.id, retry.id)
+        assert newest_leaf(question.id) == follow_up.id and newest_leaf(retry.id) == retry.id
+        assert sibling_ids(conversation.id, [question, answer]) == {
+            None: [question.id], question.id: [answer.id, retry.id]}
+
+    def test_branch_context_keeps_budget_and_summary(self, conversation):
+        trunk = chain(conversation, 10)
+        sibling = reply(conversation, trunk[7], 'user', 'sibling')
+        per_message = 10 + MESSAGE_OVERHEAD_TOKENS
+
+        window = build_branch_context(trunk[-1].id, budget_tokens=per_message * 4)
+        assert [m.id for m in window] == [m.id for m in trunk[-4:]]
+
+        window = build_branch_context(trunk[-1].id, budget_tokens=10_000, after_id=trunk[5].id)
+        assert [m.id for m in window] == [m.id for m in trunk[6:]]
+        assert sibling.id not in [m.id for m in build_branch_context(trunk[-1].id)]
+
+    def test_summary_only_folds_ancestors(self, conversation):
+        trunk = chain(conversation, 4)
+        chain(conversation, 4, parent=trunk[1], prefix='old')
+        branch = chain(conversation, 4, parent=trunk[1], prefix='new')
+
+        assert summary_due(conversation.id, None, branch[2].id, min_messages=4, branch=True)
+        assert not summary_due(conversation.id, None, branch[2].id, min_messages=5, branch=True)
+        summarizer = FakeSummarizer()
+        assert fold_older_turns(conversation.id, branch[2].id, summarizer) == 4
+        assert summarizer.calls == [(None, [trunk[0].id, trunk[1].id, branch[0].id, branch[1].id])]
+
+
+class TestPrompt:
+    def test_prompt_excludes_other_branches(self, conversation):
+        question, answer = chain(conversation, 2)
+        edited = reply(conversation, None, 'user', 'edited question')
+        ai = Message(conversation_id=conversation.id, role='assistant', content='', status='streaming',
+                     parent_message_id=edited.id)
+        db.session.add(ai)
+        db.session.commit()
+        mock_redis = Mock()
+        mock_redis.exists.return_value = 0
+        stream_manager = Mock()
+        stream_manager.codec = get_codec()
+        stream_manager.title_pending.return_value = False
+        service = AIService(mock_redis, stream_manager)
+        service.cancel_listener = CancelListener(mock_redis, autostart=False)
+        service.model_limiter = None
+        service.knowledge_base = None
+        service.chat_tools_enabled = False
+        service.provider = ScriptedProvider(['Answer.'])
+
+        service._stream_ai_response_with_redis(edited, ai, 's1', conversation.id)
+
+        assert service.provider.requests[0]['messages'] == [{'role': 'user', 'text': 'edited question'}]
+
+
+class TestEndpoints:
+    @pytest.fixture(autouse=True)
+    def no_streaming(self):
+        with patch('app.api.chat.routes.stream_manager'), patch('app.api.chat.routes._schedule_title'), \
+                patch('app.api.chat.routes.process_message_stream_task') as task:
+            yield task
+
+    def answer(self, user_message_id, text):
+        """What the answer task does: reply and advance the branch."""
+        user_message = db.session.get(Message, user_message_id)
+        conversation = user_message.conversation
+        answer = Message(conversation_id=conversation.id, role='assistant', content=text,
+                         parent_message_id=user_message.id)
+        db.session.add(answer)
+        db.session.flush()
+        conversation.active_leaf_id = answer.id
+        db.session.commit()
+        return answer.id
+
+    def history(self, client, auth_headers, conversation_id):
+        response = client.get(f'/chat/history/{conversation_id}', headers=auth_headers)
+        assert response.status_code == 200
+        return response.get_json()
+
+    def test_send_continues_the_active_branch(self, client, auth_headers):
+        first = client.post('/chat/send', headers=auth_headers, json={'content': 'Hello'}).get_json()
+        answer_id = self.answer(first['message_id'], 'Hi!')
+        second = client.post('/chat/send', headers=auth_headers,
+                             json={'content': 'Tourist visa?', 'conversation_id': first['conversation_id']})
+
+        follow_up = db.session.get(Message, second.get_json()['message_id'])
+        assert follow_up.parent_message_id == answer_id
+        assert follow_up.conversation.active_leaf_id == follow_up.id
+
+    def test_regenerate_and_switch_back(self, client, auth_headers, no_streaming):
+        sent = client.post('/chat/send', headers=auth_headers, json={'content': 'Hello'}).get_json()
+        first_answer = self.answer(sent['message_id'], 'First answer')
+
+        response = client.post(f'/chat/messages/{first_answer}/regenerate', headers=auth_headers)
+
+        assert response.status_code == 200
+        assert response.get_json()['message_id'] == sent['message_id']
+        no_streaming.delay.assert_called_with(sent['message_id'], response.get_json()['stream_id'])
+        second_answer = self.answer(sent['message_id'], 'Second answer')
+        messages = self.history(client, auth_headers, sent['conversation_id'])['messages']
+        assert [m['content'] for m in messages] == ['Hello', 'Second answer']
+        assert messages[1]['sibling_ids'] == [first_answer, second_answer]
+
+        response = client.put(f"/chat/conversations/{sent['conversation_id']}/branch", headers=auth_headers,
+                              json={'message_id': first_answer})
+        assert response.get_json()['active_leaf_id'] == first_answer
+        messages = self.history(client, auth_headers, sent['conversation_id'])['messages']
+        assert [m['content'] for m in messages] == ['Hello', 'First answer']
+
+    def test_edit_branches_and_drops_other_summary(self, client, auth_headers):
+        sent = client.post('/chat/send', headers=auth_headers, json={'content': 'Student visa'}).get_json()
+        answer_id = self.answer(sent['message_id'], 'You need an I-20')
+        conversation = db.session.get(Conversation, sent['conversation_id'])
+        conversation.summary, conversation.summary_through_id = 'Student visa', answer_id
+        db.session.commit()
+
+        response = client.post(f"/chat/messages/{sent['message_id']}/edit", headers=auth_headers,
+                               json={'content': 'Work visa'})
+
+        assert response.status_code == 200
+        edited_id = response.get_json()['message_id']
+        history = self.history(client, auth_headers, sent['conversation_id'])
+        assert history['conversation']['active_leaf_id'] == edited_id
+        assert [m['content'] for m in history['messages']] == ['Work visa']
+        assert history['messages'][0]['sibling_ids'] == [sent['message_id'], edited_id]
+        conversation = db.session.get(Conversation, sent['conversation_id'])
+        assert conversation.summary is None and conversation.summary_through_id is None
+
+    def test_rejects_invalid_targets(self, client, auth_headers, conversation):
+        question, answer = chain(conversation, 2)
+        streaming = Message(conversation_id=conversation.id, role='assistant', content='', status='streaming',
+                            parent_message_id=question.id)
+        db.session.add(streaming)
+        db.session.commit()
+
+        assert client.post(f'/chat/messages/{answer.id}/edit', headers=auth_headers,
+                           json={'content': 'x'}).status_code == 400
+        assert client.post(f'/chat/messages/{question.id}/edit', headers=auth_headers, json={}).status_code == 400
+        assert client.post(f'/chat/messages/{streaming.id}/regenerate', headers=auth_headers).status_code == 409
+        assert client.post('/chat/messages/999999/regenerate', headers=auth_headers).status_code == 404
+        assert client.put(f'/chat/conversations/{conversation.id}/branch', headers=auth_headers,
+                          json={'message_id': 999999}).status_code == 404
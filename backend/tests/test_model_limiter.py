@@ -0,0 +1,237 @@
+"""Tests for the distributed model call limiter."""
+from unittest.mock import Mock
+
+import pytest
+import redis
+
+from app.core.llm_provider import FakeProvider
+from app.core.model_limiter import (
+    ModelCallLimiter, ModelCapacityError, ModelSlot, TierLimits,
+)
+from app.core.stream_cancel import CancelListener
+from app.core.stream_codec import decode_entry, get_codec
+from app.services.ai_service import AIService
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def script():
+    return Mock(return_value=[1, 0])
+
+
+@pytest.fixture
+def mock_redis(script):
+    mock_redis = Mock()
+    mock_redis.register_script = Mock(return_value=script)
+    return mock_redis
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def limiter(mock_redis, clock):
+    return ModelCallLimiter(
+        mock_redis,
+        {'user': TierLimits(max_concurrency=4, rate_per_sec=2, burst=5), 'guest': TierLimits(max_concurrency=1)},
+        TierLimits(max_concurrency=8),
+        max_wait_seconds=1.0, poll_interval_seconds=0.1, clock=clock, sleep=clock.sleep,
+    )
+
+
+class TestTierLimits:
+    def test_default_burst_and_enabled(self):
+        assert TierLimits().enabled is False
+        assert TierLimits(rate_per_sec=3).burst == 3.0
+        assert TierLimits(rate_per_sec=0.2).burst == 1.0
+        assert TierLimits(max_concurrency=2).enabled is True
+
+    def test_from_env(self, monkeypatch, mock_redis):
+        assert ModelCallLimiter.from_env(mock_redis) is None
+
+        monkeypatch.setenv('MODEL_GUEST_MAX_CONCURRENCY', '3')
+        monkeypatch.setenv('MODEL_GUEST_RATE_PER_SEC', '1.5')
+        monkeypatch.setenv('MODEL_QUEUE_MAX_WAIT_SECONDS', '12')
+        limiter = ModelCallLimiter.from_env(mock_redis)
+
+        assert limiter.tiers['guest'].max_concurrency == 3
+        assert limiter.tiers['guest'].rate_per_sec == 1.5
+        assert limiter.tiers['user'].enabled is False
+        assert limiter.max_wait_seconds == 12.0
+        assert limiter.fail_open is True
+
+        monkeypatch.setenv('MODEL_LIMITER_FAIL_OPEN', 'false')
+        assert ModelCallLimiter.from_env(mock_redis).fail_open is False
+
+
+class TestModelCallLimiter:
+    def test_granted_immediately(self, limiter, script):
+        positions = []
+        slot = limiter.acquire('user', on_queued=positions.append)
+
+        assert isinstance(slot, ModelSlot)
+        assert positions == []
+        keys = script.call_args.kwargs['keys']
+        args = script.call_args.kwargs['args']
+        assert keys[:4] == ['model_limit:user:holders', 'model_limit:user:queue',
+                            'model_limit:user:seen', 'model_limit:user:bucket']
+        assert keys[4:] == ['model_limit:global:holders', 'model_limit:global:bucket']
+        assert args[1:3] == [1000.0, 1000.0 + limiter.lease_seconds]
+        assert args[4:] == [4, 2.0, 5.0, 8, 0.0, 1.0]
+
+    def test_queue_positions_reported_until_granted(self, limiter, script, mock_redis):
+        script.side_effect = [[0, 2], [0, 2], [0, 1], [0, 0], [1, 0]]
+        positions = []
+
+        slot = limiter.acquire('guest', on_queued=positions.append)
+
+        assert positions == [3, 2, 1, 0]
+        assert slot.waited_ms == pytest.approx(400.0)
+        # The same ticket is used on every poll
+        assert len({c.kwargs['args'][0] for c in script.call_args_list}) == 1
+
+        slot.release()
+        slot.release()
+        pipe = mock_redis.pipeline.return_value
+        assert [c.args for c in pipe.zrem.call_args_list] == [
+            ('model_limit:guest:holders', slot.token), ('model_limit:global:holders', slot.token)]
+
+    def test_gives_up_after_max_wait(self, limiter, script, mock_redis):
+        script.return_value = [0, 5]
+
+        with pytest.raises(ModelCapacityError):
+            limiter.acquire('user')
+
+        assert script.call_count == 11
+        pipe = mock_redis.pipeline.return_value
+        assert [c.args[0] for c in pipe.zrem.call_args_list] == ['model_limit:user:queue', 'model_limit:user:seen']
+
+    def test_on_wait_called_between_polls(self, limiter, script):
+        script.side_effect = [[0, 1], [0, 0], [1, 0]]
+        waits = []
+
+        limiter.acquire('user', on_wait=lambda: waits.append(1))
+
+        assert len(waits) == 2
+
+    def test_stop_while_queued(self, limiter, script):
+        script.return_value = [0, 0]
+        stop = iter([None, None, 'cancelled'])
+
+        assert limiter.acquire('user', should_stop=lambda: next(stop)) is None
+        assert script.call_count == 3
+
+    def test_redis_failure_fails_open(self, limiter, script):
+        script.side_effect = redis.ConnectionError('down')
+
+        slot = limiter.acquire('user')
+
+        assert slot.limiter is None
+        slot.release()
+
+    def test_redis_failure_fails_closed(self, limiter, script):
+        script.side_effect = redis.ConnectionError('down')
+        limiter.fail_open = False
+
+        with pytest.raises(ModelCapacityError):
+            limiter.acquire('user')
+
+    def test_stats(self, limiter, mock_redis):
+        mock_redis.pipeline.return_value.execute.return_value = [2, 1, 1, 0, 3]
+
+        stats = limiter.stats()
+
+        assert stats['user'] == {'in_flight': 2, 'queued': 1, 'max_concurrency': 4, 'rate_per_sec': 2.0}
+        assert stats['guest']['in_flight'] == 1
+        assert stats['global']['in_flight'] == 3
+
+
+class TestAIServiceLimits:
+    """Model calls go through the limiter."""
+
+    @pytest.fixture
+    def service_redis(self):
+        service_redis = Mock()
+        service_redis.exists = Mock(return_value=0)
+        return service_redis
+
+    @pytest.fixture
+    def service(self, service_redis):
+        stream_manager = Mock()
+        stream_manager.codec = get_codec()
+        service = AIService(service_redis, stream_manager)
+        service.cancel_listener = CancelListener(service_redis, autostart=False)
+        service.response_cache = None
+        service.provider = FakeProvider(ttft_ms=0, tokens_per_sec=0, answer_tokens=6)
+        service.model_limiter = Mock()
+        return service
+
+    def written_events(self, service_redis):
+        pipe = service_redis.pipeline.return_value
+        return [decode_entry(c.args[1]) for c in pipe.xadd.call_args_list]
+
+    def test_guest_stream_reports_queue_position(self, service, service_redis):
+        slot = Mock(spec=ModelSlot)
+        slot.__enter__ = Mock(return_value=slot)
+        slot.__exit__ = Mock(return_value=None)
+
+        def acquire(tier, on_queued=None, should_stop=None, on_wait=None):
+            on_queued(2)
+            on_wait()
+            on_queued(0)
+            return slot
+        service.model_limiter.acquire.side_effect = acquire
+
+        service.process_guest_messages_stream([{'role': 'user', 'content': 'Visa?'}], 's1')
+
+        assert service.model_limiter.acquire.call_args.args == ('guest',)
+        assert [c.args for c in service.stream_manager.add_event.call_args_list] == [
+            ('s1', {'type': 'queue', 'position': 2}), ('s1', {'type': 'queue', 'position': 0})]
+        slot.__exit__.assert_called_once()
+        assert self.written_events(service_redis)[-1]['type'] == 'complete'
+        # On start and while queued (and on idle model polls), so cleanup does not take it for abandoned
+        heartbeats = [c.args for c in service.stream_manager.heartbeat.call_args_list]
+        assert len(heartbeats) >= 2 and set(heartbeats) == {('s1',)}
+
+    def test_capacity_timeout_becomes_error_event(self, service):
+        service.model_limiter.acquire.side_effect = ModelCapacityError("AI service is busy.")
+
+        service.process_guest_messages_stream([{'role': 'user', 'content': 'Visa?'}], 's1')
+
+        service.stream_manager.add_event.assert_called_once_with(
+            's1', {'type': 'error', 'message': 'AI service is busy.', 'message_id': None})
+        service.stream_manager.mark_stream_error.assert_called_once_with('s1', 'AI service is busy.')
+
+    def test_cancelled_while_queued_skips_model(self, service, service_redis):
+        service.provider = Mock()
+
+        def acquire(tier, on_queued=None, should_stop=None, on_wait=None):
+            service.cancel_listener.dispatch('stream_cancel:s1', 'cancel')
+            assert should_stop() == 'cancelled'
+            return None
+        service.model_limiter.acquire.side_effect = acquire
+
+        service.process_guest_messages_stream([{'role': 'user', 'content': 'Visa?'}], 's1')
+
+        service.provider.stream.assert_not_called()
+        assert self.written_events(service_redis)[-1] == {'type': 'cancelled', 'message_id': None, 'reason': 'cancelled'}
+        service.stream_manager.mark_stream_cancelled.assert_called_once_with('s1')
+
+    def test_title_tool_call_uses_user_tier(self, service):
+        service.model_limiter.acquire.return_value = ModelSlot()
+
+        service.generate_title_via_tool('Need help with my student visa documents')
+
+        service.model_limiter.acquire.assert_called_once_with('user', on_queued=None, should_stop=None, on_wait=None)
@@ -0,0 +1,91 @@
+"""Tests for the shared Redis client provider."""
+import redis
+from flask import Flask
+
+from app.core.extensions import RedisProvider, redis_provider
+
+
+def make_app(**config):
+    app = Flask(__name__)
+    app.config.update(config)
+    return app
+
+
+class TestRedisProvider:
+    """Test pooled client configuration and stats."""
+
+    def test_defaults_without_app(self):
+        provider = RedisProvider()
+
+        pool = provider.client.connection_pool
+        assert pool.max_connections == provider.settings['REDIS_MAX_CONNECTIONS']
+        assert pool.connection_kwargs['decode_responses'] is True
+        assert provider.client is provider.client
+
+    def test_pools_use_app_config(self):
+        provider = RedisProvider(make_app(
+            REDIS_URL='redis://cache:6380/2',
+            REDIS_MAX_CONNECTIONS=7,
+            REDIS_SOCKET_TIMEOUT=1.5,
+            REDIS_HEALTH_CHECK_INTERVAL=11,
+            REDIS_BLOCKING_MAX_CONNECTIONS=3,
+            REDIS_BLOCKING_POOL_TIMEOUT=0.5,
+        ))
+
+        pool = provider.client.connection_pool
+        assert pool.max_connections == 7
+        assert pool.connection_kwargs['host'] == 'cache'
+        assert pool.connection_kwargs['port'] == 6380
+        assert pool.connection_kwargs['db'] == 2
+        assert pool.connection_kwargs['socket_timeout'] == 1.5
+        assert pool.connection_kwargs['health_check_interval'] == 11
+
+        blocking = provider.blocking_client.connection_pool
+        assert isinstance(blocking, redis.BlockingConnectionPool)
+        assert blocking.max_connections == 3
+        assert blocking.timeout == 0.5
+        assert blocking is not pool
+
+    def test_reconfigure_keeps_client_objects(self):
+        provider = RedisProvider()
+        client = provider.client
+        blocking_client = provider.blocking_client
+
+        provider.init_app(make_app(REDIS_MAX_CONNECTIONS=9))
+
+        assert provider.client is client
+        assert provider.blocking_client is blocking_client
+        assert client.connection_pool.max_connections == 9
+
+    def test_stats_only_report_created_pools(self):
+        provider = RedisProvider()
+        assert provider.stats() == {}
+
+        pool = provider.client.connection_pool
+        # Checked out but never connected, as while a command is in flight
+        pool._in_use_connections.add(pool.make_connection())
+
+        assert provider.stats() == {'default': {'max_connections': pool.max_connections, 'created': 1, 'in_use': 1, 'idle': 0}}
+
+    def test_blocking_pool_stats(self):
+        provider = RedisProvider(make_app(REDIS_BLOCKING_MAX_CONNECTIONS=4))
+        pool = provider.blocking_client.connection_pool
+        pool.make_connection()
+
+        assert provider.stats()['blocking'] == {'max_connections': 4, 'created': 1, 'in_use': 1, 'idle': 0}
+
+    def test_pool_stats_without_private_attributes(self):
+        provider = RedisProvider()
+        pool = provider.client.connection_pool
+        del pool._created_connections, pool._in_use_connections
+
+        assert provider.stats()['default'] == {
+            'max_connections': pool.max_connections, 'created': None, 'in_use': None, 'idle': 0}
+
+    def test_app_registers_shared_provider(self, app):
+        assert app.extensions['redis'] is redis_provider
+
+    def test_health_reports_pool_usage(self, client):
+        response = client.get('/chat/health')
+
+        assert 'redis_pools' in response.get_json()['services']
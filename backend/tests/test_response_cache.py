@@ -0,0 +1,162 @@
+"""Tests for the guest response cache."""
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+import pytest
+
+from app.core.response_cache import (
+    ResponseCache, _GET_LUA, _PUT_LUA, cache_key, normalize_messages, replay_chunks,
+)
+from app.core.stream_cancel import CancelListener
+from app.core.stream_codec import decode_entry, get_codec
+from app.services.ai_service import AIService
+
+
+QUESTION = [{'role': 'user', 'content': '¿Qué documentos necesito para una visa de estudiante?'}]
+
+
+def test_normalization_ignores_case_spacing_and_punctuation():
+    variant = [{'role': 'user', 'content': '  qué documentos   NECESITO para una visa de estudiante '}]
+    assert normalize_messages(variant) == normalize_messages(QUESTION)
+    assert cache_key(variant, 'gemini') == cache_key(QUESTION, 'gemini')
+
+
+def test_key_depends_on_model_and_history():
+    follow_up = QUESTION + [{'role': 'assistant', 'content': 'Pasaporte.'},
+                            {'role': 'user', 'content': '¿Y el seguro?'}]
+    assert cache_key(QUESTION, 'gemini-a') != cache_key(QUESTION, 'gemini-b')
+    assert cache_key(follow_up, 'gemini-a') != cache_key(QUESTION, 'gemini-a')
+
+
+def test_replay_chunks():
+    assert list(replay_chunks('abcdefg', 3)) == ['abc', 'def', 'g']
+    assert list(replay_chunks('', 3)) == []
+
+
+class TestResponseCache:
+    """Script calls and reply handling."""
+
+    @pytest.fixture
+    def scripts(self):
+        return {_GET_LUA: Mock(return_value=None), _PUT_LUA: Mock(return_value=[])}
+
+    @pytest.fixture
+    def mock_redis(self, scripts):
+        mock_redis = Mock()
+        mock_redis.register_script = Mock(side_effect=lambda source: scripts[source])
+        return mock_redis
+
+    @pytest.fixture
+    def cache(self, mock_redis):
+        return ResponseCache(mock_redis, ttl_seconds=60, max_entries=2)
+
+    def test_get_hit_and_miss(self, cache, scripts):
+        assert cache.get('abc') is None
+
+        scripts[_GET_LUA].return_value = ['answer', '1250.5']
+        assert cache.get('abc') == ('answer', 1250.5)
+        assert scripts[_GET_LUA].call_args.kwargs['keys'] == [
+            'guest_cache:entry:abc', 'guest_cache:lru', 'guest_cache:stats']
+
+    def test_put_passes_bounds(self, cache, scripts, mock_redis):
+        assert cache.put('abc', 'answer', 900.04) == 0
+
+        args = scripts[_PUT_LUA].call_args.kwargs['args']
+        assert args[:3] == ['answer', 900.0, 60]
+        assert args[4:] == ['abc', 2]
+        mock_redis.delete.assert_not_called()
+
+    def test_put_deletes_evicted_entries_outside_the_script(self, cache, scripts, mock_redis):
+        scripts[_PUT_LUA].return_value = ['old', 'older']
+
+        assert cache.put('abc', 'answer', 900.0) == 2
+
+        assert scripts[_PUT_LUA].call_args.kwargs['keys'] == [
+            'guest_cache:entry:abc', 'guest_cache:lru', 'guest_cache:stats']
+        mock_redis.delete.assert_called_once_with('guest_cache:entry:old', 'guest_cache:entry:older')
+
+    def test_stats(self, cache, mock_redis):
+        pipe = mock_redis.pipeline.return_value
+        pipe.execute.return_value = [
+            {'hits': '3', 'misses': '1', 'evictions': '2', 'latency_saved_ms': '4500'}, 2]
+
+        stats = cache.stats()
+
+        assert stats['hit_ratio'] == 0.75
+        assert stats['avg_latency_saved_ms'] == 1500.0
+        assert stats['entries'] == 2
+
+    def test_disabled_by_zero_ttl(self, mock_redis):
+        assert ResponseCache(mock_redis, ttl_seconds=0).enabled is False
+
+
+class FakeClient:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.models = self
+        self.calls = 0
+
+    def generate_content_stream(self, model, contents, **kwargs):
+        self.calls += 1
+        for text in self.chunks:
+            yield SimpleNamespace(text=text)
+
+
+class TestGuestCaching:
+    """Guest generation reads and fills the cache."""
+
+    @pytest.fixture
+    def mock_redis(self):
+        mock_redis = Mock()
+        mock_redis.exists = Mock(return_value=0)
+        return mock_redis
+
+    @pytest.fixture
+    def service(self, mock_redis):
+        stream_manager = Mock()
+        stream_manager.codec = get_codec()
+        service = AIService(mock_redis, stream_manager)
+        service.cancel_listener = CancelListener(mock_redis, autostart=False)
+        service.response_cache = Mock(enabled=True)
+        service.cache_replay_interval_ms = 0
+        service.cache_replay_chunk_chars = 4
+        service.client = FakeClient(['Pasa', 'porte ', 'vigente'])
+        return service
+
+    def written_events(self, mock_redis):
+        pipe = mock_redis.pipeline.return_value
+        return [decode_entry(c.args[1]) for c in pipe.xadd.call_args_list]
+
+    def test_hit_replays_without_model_call(self, service, mock_redis):
+        service.response_cache.get.return_value = ('Pasaporte vigente', 2000.0)
+
+        service.process_guest_messages_stream(QUESTION, 's1')
+
+        assert service.client.calls == 0
+        events = self.written_events(mock_redis)
+        assert ''.join(e['content'] for e in events if e['type'] == 'chunk') == 'Pasaporte vigente'
+        assert events[-1] == {'type': 'complete', 'message_id': None}
+        service.stream_manager.mark_stream_complete.assert_called_once_with('s1')
+        saved = service.response_cache.record_saved.call_args.args[0]
+        assert 0 < saved <= 2000.0
+        service.response_cache.put.assert_not_called()
+
+    def test_miss_generates_and_stores(self, service):
+        service.response_cache.get.return_value = None
+
+        service.process_guest_messages_stream(QUESTION, 's1')
+
+        assert service.client.calls == 1
+        digest, text, generation_ms = service.response_cache.put.call_args.args
+        assert digest == cache_key(QUESTION, service.model_name)
+        assert text == 'Pasaporte vigente'
+        assert generation_ms >= 0
+
+    def test_cancelled_answer_not_stored(self, service):
+        service.response_cache.get.return_value = None
+        service.cancel_listener.watch = Mock(return_value=Mock(reason='cancelled', should_stop=Mock(return_value=True)))
+
+        service.process_guest_messages_stream(QUESTION, 's1')
+
+        service.response_cache.put.assert_not_called()
+        service.stream_manager.mark_stream_cancelled.assert_called_once_with('s1')
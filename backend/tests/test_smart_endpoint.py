@@ -1,20 +1,40 @@
-from unittest.mock import patch
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
 
+import pytest
 
-def test_smart_send_creates_conversation(client, auth_headers):
-    # Mock title generation to deterministic value
-    with patch('app.api.chat.routes.ai_service.generate_title_via_tool', return_value='Test Title'):
-        resp = client.post('/chat/send', json={'content': 'Hello world'}, headers=auth_headers)
-        assert resp.status_code == 200
-        data = resp.get_json()
-        assert data['status'] == 'processing_started'
-        assert 'message_id' in data
-        assert 'stream_id' in data
-        assert 'conversation_id' in data
-        assert data['title'] == 'Test Title'
+from app.core.extensions import db
+from app.core.llm_provider import GeminiProvider
+from app.db.models import Conversation
+
+
+@pytest.fixture
+def no_workers():
+    """Stream creation and task queueing without Redis or a broker."""
+    with patch('app.api.chat.routes.stream_manager') as mock_sm, \
+            patch('app.api.chat.routes.process_message_stream_task') as ai_task, \
+            patch('app.api.chat.routes.generate_conversation_title_task') as title_task:
+        yield SimpleNamespace(stream_manager=mock_sm, ai_task=ai_task, title_task=title_task)
 
 
-def test_smart_send_existing_conversation(client, auth_headers):
+def test_smart_send_creates_conversation(client, auth_headers, no_workers):
+    resp = client.post('/chat/send', json={'content': 'Hello world'}, headers=auth_headers)
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert data['status'] == 'processing_started'
+    assert 'message_id' in data
+    assert 'stream_id' in data
+    assert 'conversation_id' in data
+    # Provisional local title; the AI title is generated in the background
+    assert data['title'] == 'Hello world'
+    no_workers.title_task.delay.assert_called_once_with(
+        data['conversation_id'], data['stream_id'], 'Hello world', 'Hello world')
+    no_workers.stream_manager.expect_title.assert_called_once_with(data['stream_id'])
+
+
+def test_smart_send_existing_conversation(client, auth_headers, no_workers):
     # First create a conversation explicitly
     resp_conv = client.post('/chat/conversations', json={'title': 'Manually Created'}, headers=auth_headers)
     assert resp_conv.status_code == 201
@@ -30,13 +50,90 @@ def test_smart_send_existing_conversation(client, auth_headers):
     # Should not include new conversation fields
     assert 'conversation_id' not in data or data.get('conversation_id') == conv_id
     assert 'title' not in data
+    no_workers.title_task.delay.assert_not_called()
+
+
+def test_smart_send_sanitizes_title(client, auth_headers, no_workers):
+    resp = client.post('/chat/send', json={'content': '<b>Unsafe</b>   title\n'}, headers=auth_headers)
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert data['title'] == 'Unsafe title'
 
 
-def test_smart_send_sanitizes_title(client, auth_headers):
-    with patch('app.api.chat.routes.ai_service.generate_title_via_tool', return_value='<b>Unsafe</b>   title\n'):
-        resp = client.post('/chat/send', json={'content': 'Hello'}, headers=auth_headers)
+class SlowTitleModel:
+    """Fake GenAI client whose title tool call takes ``delay_s``."""
+
+    def __init__(self, delay_s):
+        self.delay_s = delay_s
+        self.models = self
+        self.done = threading.Event()
+
+    def generate_content(self, model, contents, config=None):
+        time.sleep(self.delay_s)
+        self.done.set()
+        call = SimpleNamespace(args={'title': 'Student visa documents'})
+        return SimpleNamespace(function_calls=[call])
+
+
+def test_send_latency_independent_of_title_model(app, client, auth_headers, no_workers):
+    from app.api.chat import routes
+
+    model = SlowTitleModel(delay_s=1.0)
+    # No broker: the title runs on the background-thread fallback
+    no_workers.title_task.delay.side_effect = ConnectionError('no broker')
+    with patch.object(routes.ai_service, 'provider', GeminiProvider(model)), \
+            patch.object(routes.ai_service, 'stream_manager', Mock()) as service_sm:
+        start = time.perf_counter()
+        resp = client.post('/chat/send', json={'content': 'What documents do I need?'},
+                           headers=auth_headers)
+        elapsed = time.perf_counter() - start
+
         assert resp.status_code == 200
+        assert elapsed < model.delay_s / 2
         data = resp.get_json()
-        assert data['title'] == 'Unsafe title'
+        assert data['title'] == 'What documents do I need?'
+
+        assert model.done.wait(timeout=5)
+        for _ in range(50):
+            if service_sm.add_event.called:
+                break
+            time.sleep(0.02)
+
+    service_sm.add_event.assert_called_once_with(data['stream_id'], {
+        'type': 'title', 'conversation_id': data['conversation_id'], 'title': 'Student visa documents'})
+    db.session.expire_all()
+    assert db.session.get(Conversation, data['conversation_id']).title == 'Student visa documents'
+
+
+def test_renamed_conversation_keeps_user_title(app, test_user):
+    from app.api.chat import routes
+
+    conversation = Conversation(user_id=test_user.id, title='My own name')
+    db.session.add(conversation)
+    db.session.commit()
+
+    with patch.object(routes.ai_service, 'generate_title_via_tool', return_value='AI title'), \
+            patch.object(routes.ai_service, 'stream_manager', Mock()) as service_sm:
+        title = routes.ai_service.generate_conversation_title(conversation.id, 's1', 'hi', 'hi')
+
+    assert title == 'hi'
+    assert db.session.get(Conversation, conversation.id).title == 'My own name'
+    service_sm.add_event.assert_not_called()
+    service_sm.title_done.assert_called_once_with('s1')
+
+
+def test_completion_waits_for_pending_title(app):
+    from app.api.chat import routes
 
+    with patch.object(routes.ai_service, 'stream_manager', Mock()) as service_sm, \
+            patch.object(routes.ai_service, 'title_wait_seconds', 0.3):
+        service_sm.title_pending.side_effect = [True, True, False]
+        routes.ai_service._await_title('s1')
+        assert service_sm.title_pending.call_count == 3
 
+        # A title that never arrives only delays completion by the wait limit
+        service_sm.title_pending.side_effect = None
+        service_sm.title_pending.return_value = True
+        start = time.perf_counter()
+        routes.ai_service._await_title('s1')
+        assert 0.3 <= time.perf_counter() - start < 1
@@ -0,0 +1,130 @@
+"""Tests for the WSGI SSE endpoint and its wire format."""
+import json
+import pytest
+from unittest.mock import patch
+from app.api.chat import sse
+from app.api.chat.sse_protocol import format_event, parse_last_event_id
+
+
+def test_format_event_with_id():
+    frame = format_event({'type': 'chunk', 'content': 'Hi'}, '5-1')
+    assert frame == 'id: 5-1\ndata: {"type": "chunk", "content": "Hi"}\n\n'
+
+
+def test_format_event_without_id():
+    assert format_event({'type': 'connected'}) == 'data: {"type": "connected"}\n\n'
+
+
+@pytest.mark.parametrize('value,expected', [
+    ('1700000000000-0', '1700000000000-0'),
+    (' 12-3 ', '12-3'),
+    ('', None),
+    (None, None),
+    ('$', None),
+    ('12-x', None),
+])
+def test_parse_last_event_id(value, expected):
+    assert parse_last_event_id(value) == expected
+
+
+class TestSSEResumption:
+    """create_sse_response honors Last-Event-ID."""
+
+    def stream_body(self, app, headers, stored_cursor='0-0'):
+        entries = [('7-0', {'payload': json.dumps({'type': 'chunk', 'content': 'x'})}),
+                   ('8-0', {'payload': json.dumps({'type': 'complete', 'message_id': None})})]
+        app.config['SSE_MULTIPLEXED_READER'] = False
+        with app.test_request_context('/chat/stream/s1', headers=headers), \
+                patch.object(sse, 'stream_manager') as mock_sm, \
+                patch.object(sse, 'redis_client') as mock_redis:
+            mock_sm.get_stream.return_value = {'user_id': None, 'status': 'active'}
+            mock_sm.get_events_key.return_value = 'stream_events:s1'
+            mock_sm.get_last_id.return_value = stored_cursor
+            mock_redis.xread.return_value = [('stream_events:s1', entries)]
+            response = sse.create_sse_response('s1')
+            body = ''.join(response.response)
+            return body, mock_redis, mock_sm
+
+    def test_emits_entry_ids(self, app):
+        body, _redis, _sm = self.stream_body(app, {})
+        assert 'id: 7-0\ndata: ' in body
+        assert 'id: 8-0\ndata: ' in body
+        # The connection confirmation carries no id so it does not move the client cursor
+        assert body.startswith('data: {"type": "connected"')
+
+    def test_last_event_id_used_as_cursor(self, app):
+        _body, mock_redis, mock_sm = self.stream_body(app, {'Last-Event-ID': '6-0'}, stored_cursor='2-0')
+        assert mock_redis.xread.call_args[0][0] == {'stream_events:s1': '6-0'}
+        mock_sm.get_last_id.assert_not_called()
+
+    def test_falls_back_to_server_cursor(self, app):
+        _body, mock_redis, _sm = self.stream_body(app, {}, stored_cursor='2-0')
+        assert mock_redis.xread.call_args[0][0] == {'stream_events:s1': '2-0'}
+
+
+class TestSSEKeepAlive:
+    """Idle connections get comment frames so proxies keep them open."""
+
+    def test_idle_read_yields_keep_alive(self, app):
+        app.config['SSE_MULTIPLEXED_READER'] = False
+        app.config['SSE_KEEPALIVE_SECONDS'] = 0
+        with app.test_request_context('/chat/stream/s1'), \
+                patch.object(sse, 'stream_manager') as mock_sm, \
+                patch.object(sse, 'redis_client') as mock_redis:
+            mock_sm.get_stream.return_value = {'user_id': None, 'status': 'active'}
+            mock_sm.get_events_key.return_value = 'stream_events:s1'
+            mock_sm.get_last_id.return_value = '0-0'
+            mock_redis.xread.side_effect = [
+                [],
+                [('stream_events:s1', [('1-0', {'payload': json.dumps({'type': 'complete'})})])],
+            ]
+            body = ''.join(sse.create_sse_response('s1').response)
+
+        assert ': keep-alive\n\n' in body
+        assert body.index(': keep-alive') < body.index('id: 1-0')
+        mock_sm.heartbeat.assert_called_once_with('s1', last_id='1-0')
+
+
+class TestSSECursor:
+    """The shared cursor is written with throttled heartbeats, not per event."""
+
+    def test_cursor_rides_on_heartbeat_and_catches_up_at_the_end(self, app):
+        entries = [(f'{i}-0', {'payload': json.dumps({'type': 'chunk', 'content': 'x'})}) for i in range(1, 5)]
+        entries.append(('5-0', {'payload': json.dumps({'type': 'complete'})}))
+        app.config['SSE_MULTIPLEXED_READER'] = False
+        with app.test_request_context('/chat/stream/s1'), \
+                patch.object(sse, 'stream_manager') as mock_sm, \
+                patch.object(sse, 'redis_client') as mock_redis:
+            mock_sm.get_stream.return_value = {'user_id': None, 'status': 'active'}
+            mock_sm.get_last_id.return_value = '0-0'
+            mock_sm.heartbeat.side_effect = lambda sid, last_id=None: last_id == '1-0'
+            mock_redis.xread.return_value = [('stream_events:s1', entries)]
+            ''.join(sse.create_sse_response('s1').response)
+
+        assert mock_sm.heartbeat.call_count == 5
+        mock_sm.set_last_id.assert_called_once_with('s1', '5-0')
+
+
+class TestSSEEntryLayouts:
+    """Both stored layouts reach the browser as the same JSON text."""
+
+    def forwarded(self, app, fields):
+        app.config['SSE_MULTIPLEXED_READER'] = False
+        with app.test_request_context('/chat/stream/s1'), \
+                patch.object(sse, 'stream_manager') as mock_sm, \
+                patch.object(sse, 'redis_client') as mock_redis:
+            mock_sm.get_stream.return_value = {'user_id': None, 'status': 'active'}
+            mock_sm.get_last_id.return_value = '0-0'
+            mock_redis.xread.return_value = [('stream_events:s1', [('1-0', fields)])]
+            body = list(sse.create_sse_response('s1').response)
+        return body[-1]
+
+    def test_raw_entry_forwarded_verbatim(self, app):
+        data = '{"type":"complete","message_id":3}'
+        frame = self.forwarded(app, {'type': 'complete', 'data': data})
+        assert frame == f'id: 1-0\ndata: {data}\n\n'
+
+    def test_legacy_payload_entry(self, app):
+        payload = json.dumps({'type': 'complete', 'message_id': 3})
+        frame = self.forwarded(app, {'payload': payload})
+        assert frame == f'id: 1-0\ndata: {payload}\n\n'
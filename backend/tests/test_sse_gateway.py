@@ -0,0 +1,188 @@
+"""Tests for the asyncio SSE gateway."""
+import asyncio
+import json
+import pytest
+from unittest.mock import AsyncMock, Mock
+from app.api.chat.sse_gateway import SSEGateway
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class Recorder:
+    """Collects ASGI send messages."""
+
+    def __init__(self):
+        self.messages = []
+
+    async def __call__(self, message):
+        self.messages.append(message)
+
+    @property
+    def status(self):
+        return self.messages[0]['status']
+
+    @property
+    def frames(self):
+        """Parsed frames as ``(id, data)`` tuples."""
+        body = b''.join(m.get('body', b'') for m in self.messages if m['type'] == 'http.response.body')
+        parsed = []
+        for frame in body.decode().split('\n\n'):
+            fields = dict(line.split(': ', 1) for line in frame.splitlines() if ': ' in line)
+            if 'data' in fields:
+                parsed.append((fields.get('id'), json.loads(fields['data'])))
+        return parsed
+
+    @property
+    def events(self):
+        return [data for _id, data in self.frames]
+
+
+async def never_disconnect():
+    await asyncio.sleep(3600)
+
+
+def script_reads(fake_redis, *results):
+    """XREAD answers in order; ``None`` and reads past the end block until they time out."""
+    results = list(results)
+
+    async def xread(streams, count=None, block=None):
+        result = results.pop(0) if results else None
+        if result is None:
+            # Longer than a viewer's wait, so idle viewers see a timeout first
+            await asyncio.sleep(max(block / 1000, 0.05))
+            return []
+        return result
+
+    fake_redis.xread.side_effect = xread
+
+
+class TestSSEGateway:
+    """Test SSEGateway request handling."""
+
+    @pytest.fixture
+    def fake_redis(self):
+        fake = Mock()
+        fake.register_script = Mock(side_effect=lambda source: AsyncMock(return_value=1))
+        fake.hgetall = AsyncMock(return_value={'stream_id': 's1', 'user_id': '', 'status': 'active'})
+        fake.hget = AsyncMock(return_value='0-0')
+        fake.xread = AsyncMock(return_value=[])
+        fake.publish = AsyncMock(return_value=0)
+        return fake
+
+    @pytest.fixture
+    def gateway(self, app, fake_redis):
+        return SSEGateway(app, fake_redis, block_ms=10)
+
+    def scope(self, path='/chat/stream/s1', method='GET'):
+        return {'type': 'http', 'path': path, 'method': method, 'headers': []}
+
+    def test_unknown_path_returns_404(self, gateway):
+        send = Recorder()
+        run(gateway(self.scope(path='/chat/send'), never_disconnect, send))
+        assert send.status == 404
+
+    def test_missing_stream_returns_404(self, gateway, fake_redis):
+        fake_redis.hgetall.return_value = {}
+        send = Recorder()
+        run(gateway(self.scope(), never_disconnect, send))
+        assert send.status == 404
+
+    def test_owned_stream_requires_matching_user(self, gateway, fake_redis):
+        fake_redis.hgetall.return_value = {'stream_id': 's1', 'user_id': '42', 'status': 'active'}
+        send = Recorder()
+        run(gateway(self.scope(), never_disconnect, send))
+        assert send.status == 404
+
+    def test_forwards_events_until_complete(self, gateway, fake_redis):
+        script_reads(fake_redis, [], [('stream_events:s1', [
+            ('1-0', {'payload': json.dumps({'type': 'chunk', 'content': 'Hi'})}),
+            ('2-0', {'payload': json.dumps({'type': 'complete', 'message_id': None})}),
+            ('3-0', {'payload': json.dumps({'type': 'chunk', 'content': 'late'})}),
+        ])])
+        send = Recorder()
+
+        run(gateway(self.scope(), never_disconnect, send))
+
+        assert send.status == 200
+        assert [e['type'] for e in send.events] == ['connected', 'chunk', 'complete']
+        assert [i for i, _data in send.frames] == [None, '1-0', '2-0']
+        assert fake_redis.xread.call_args_list[1][0][0] == {'stream_events:s1': '0-0'}
+        assert send.messages[-1]['more_body'] is False
+
+    def test_client_disconnect_stops_stream(self, gateway, fake_redis):
+        async def slow_xread(*args, **kwargs):
+            await asyncio.sleep(3600)
+
+        async def disconnect_soon():
+            await asyncio.sleep(0.01)
+            return {'type': 'http.disconnect'}
+
+        fake_redis.xread.side_effect = slow_xread
+        send = Recorder()
+
+        run(asyncio.wait_for(gateway(self.scope(), disconnect_soon, send), timeout=5))
+
+        assert [e['type'] for e in send.events] == ['connected']
+        assert gateway.open_connections == 0
+
+    def test_owner_with_valid_token_is_streamed(self, gateway, fake_redis, auth_headers, test_user):
+        fake_redis.hgetall.return_value = {'stream_id': 's1', 'user_id': str(test_user.id), 'status': 'active'}
+        script_reads(fake_redis, [('stream_events:s1', [('1-0', {'payload': json.dumps({'type': 'complete'})})])])
+        scope = self.scope()
+        scope['headers'] = [(b'authorization', auth_headers['Authorization'].encode())]
+        send = Recorder()
+
+        run(gateway(scope, never_disconnect, send))
+
+        assert send.status == 200
+        assert send.events[-1]['type'] == 'complete'
+
+    def test_last_event_id_header_sets_cursor(self, gateway, fake_redis):
+        fake_redis.hget.return_value = '1-0'
+        script_reads(fake_redis, [('stream_events:s1', [('9-0', {'payload': json.dumps({'type': 'complete'})})])])
+        scope = self.scope()
+        scope['headers'] = [(b'last-event-id', b'8-0')]
+
+        run(gateway(scope, never_disconnect, Recorder()))
+
+        assert fake_redis.xread.call_args_list[0][0][0] == {'stream_events:s1': '8-0'}
+        fake_redis.hget.assert_not_called()
+
+    def test_invalid_last_event_id_falls_back_to_server_cursor(self, gateway, fake_redis):
+        fake_redis.hget.return_value = '4-0'
+        script_reads(fake_redis, [('stream_events:s1', [('5-0', {'payload': json.dumps({'type': 'complete'})})])])
+        scope = self.scope()
+        scope['headers'] = [(b'last-event-id', b'garbage')]
+
+        run(gateway(scope, never_disconnect, Recorder()))
+
+        assert fake_redis.xread.call_args_list[0][0][0] == {'stream_events:s1': '4-0'}
+
+    def test_idle_stream_sends_keep_alive(self, gateway, fake_redis):
+        gateway.keepalive_seconds = 0
+        script_reads(fake_redis, None, [('stream_events:s1', [('1-0', {'payload': json.dumps({'type': 'complete'})})])])
+        send = Recorder()
+
+        run(gateway(self.scope(), never_disconnect, send))
+
+        body = b''.join(m.get('body', b'') for m in send.messages if m['type'] == 'http.response.body')
+        assert b'\n\n: keep-alive\n\nid: 1-0' in body
+        assert [e['type'] for e in send.events] == ['connected', 'complete']
+
+    def test_viewers_share_one_read(self, gateway, fake_redis):
+        complete = {'payload': json.dumps({'type': 'complete'})}
+        script_reads(fake_redis, None, [('stream_events:s1', [('1-0', complete)]),
+                                        ('stream_events:s2', [('2-0', complete)])])
+        first, second = Recorder(), Recorder()
+
+        async def both():
+            await asyncio.gather(gateway(self.scope(), never_disconnect, first),
+                                 gateway(self.scope(path='/chat/stream/s2'), never_disconnect, second))
+
+        run(asyncio.wait_for(both(), timeout=5))
+
+        assert fake_redis.xread.call_args_list[1][0][0] == {'stream_events:s1': '0-0', 'stream_events:s2': '0-0'}
+        assert first.events[-1]['type'] == second.events[-1]['type'] == 'complete'
+        assert gateway.fanout.stats()['subscribers'] == 0
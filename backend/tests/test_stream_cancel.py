@@ -0,0 +1,326 @@
+"""Tests for push-based generation cancellation."""
+import json
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+import pytest
+
+from app.core.extensions import db
+from app.core.stream_cancel import CancelListener, CancelWatch, WatchedResponse
+from app.core.stream_codec import decode_entry, get_codec
+from app.db.models import Conversation, Message
+from app.services.ai_service import AIService
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCancelWatch:
+    """Signal handling for a single stream."""
+
+    def test_cancel_stops_immediately(self):
+        watch = CancelWatch('s1')
+        assert watch.should_stop() is False
+        watch.signal('cancel')
+        assert watch.reason == 'cancelled'
+
+    def test_disconnect_waits_for_grace_period(self):
+        clock = FakeClock()
+        watch = CancelWatch('s1', disconnect_grace_seconds=10, clock=clock)
+
+        watch.signal('disconnect')
+        clock.now += 9
+        assert watch.should_stop() is False
+        clock.now += 1
+        assert watch.reason == 'disconnected'
+
+    def test_resume_clears_disconnect(self):
+        clock = FakeClock()
+        watch = CancelWatch('s1', disconnect_grace_seconds=10, clock=clock)
+
+        watch.signal('disconnect')
+        clock.now += 5
+        watch.signal('resume')
+        clock.now += 60
+        assert watch.should_stop() is False
+
+
+class TestCancelListener:
+    """Dispatch of published signals to local watches."""
+
+    @pytest.fixture
+    def mock_redis(self):
+        mock_redis = Mock()
+        mock_redis.exists = Mock(return_value=0)
+        return mock_redis
+
+    @pytest.fixture
+    def listener(self, mock_redis):
+        return CancelListener(mock_redis, autostart=False)
+
+    def test_dispatch_routes_by_channel(self, listener):
+        first = listener.watch('s1')
+        second = listener.watch('s2')
+
+        assert listener.dispatch('stream_cancel:s1', 'cancel') is True
+        assert listener.dispatch(b'stream_cancel:unknown', b'cancel') is False
+
+        assert first.should_stop() is True
+        assert second.should_stop() is False
+
+    def test_watch_sees_cancel_requested_before_subscribe(self, listener, mock_redis):
+        mock_redis.exists.return_value = 1
+
+        watch = listener.watch('s1')
+
+        mock_redis.exists.assert_called_once_with('stream_cancelled:s1')
+        assert watch.reason == 'cancelled'
+
+    def test_unwatch_stops_dispatch(self, listener):
+        watch = listener.watch('s1')
+        listener.unwatch(watch)
+
+        assert listener.dispatch('stream_cancel:s1', 'cancel') is False
+        assert watch.should_stop() is False
+
+
+class StalledResponse:
+    """Yields ``chunks`` then hangs until ``resume`` is set, like a stalled model."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.resume = threading.Event()
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        yield from self.chunks
+        self.resume.wait(5)
+        yield 'late'
+
+    def close(self):
+        self.closed.set()
+
+
+class TestWatchedResponse:
+    """Stops are noticed while the model sends nothing."""
+
+    def consume(self, response, watch, signal_after=0.1, kind='cancel'):
+        threading.Timer(signal_after, watch.signal, args=[kind]).start()
+        chunks = WatchedResponse(response, watch, poll_seconds=0.02)
+        start = time.monotonic()
+        received = list(chunks)
+        return received, chunks.stop_reason, time.monotonic() - start
+
+    def test_cancel_during_stall(self):
+        response = StalledResponse(['a', 'b'])
+
+        received, reason, elapsed = self.consume(response, CancelWatch('s1'))
+
+        assert (received, reason) == (['a', 'b'], 'cancelled')
+        assert elapsed < 2
+        assert not response.closed.is_set()
+        response.resume.set()
+        assert response.closed.wait(2)
+
+    def test_disconnect_grace_expires_during_stall(self):
+        response = StalledResponse([])
+
+        received, reason, _elapsed = self.consume(
+            response, CancelWatch('s1', disconnect_grace_seconds=0.05), kind='disconnect')
+
+        assert (received, reason) == ([], 'disconnected')
+        response.resume.set()
+
+    def test_idle_polls_call_on_idle(self):
+        response = StalledResponse(['a'])
+        watch = CancelWatch('s1')
+        idle = []
+        threading.Timer(0.2, watch.signal, args=['cancel']).start()
+
+        received = list(WatchedResponse(response, watch, poll_seconds=0.02, on_idle=lambda: idle.append(1)))
+
+        assert received == ['a']
+        assert len(idle) >= 3
+        response.resume.set()
+
+    def test_finished_response_and_errors(self):
+        chunks = WatchedResponse(iter(['a', 'b']), CancelWatch('s1'), poll_seconds=0.02)
+        assert list(chunks) == ['a', 'b'] and chunks.stop_reason is None
+
+        def failing():
+            yield 'a'
+            raise ValueError('quota')
+
+        with pytest.raises(ValueError):
+            list(WatchedResponse(failing(), CancelWatch('s1'), poll_seconds=0.02))
+
+
+class CancellingClient:
+    """Streams chunks and requests cancellation after ``cancel_after`` of them."""
+
+    def __init__(self, chunks, watch_source, cancel_after):
+        self.chunks = chunks
+        self.watch_source = watch_source
+        self.cancel_after = cancel_after
+        self.models = self
+        self.closed = False
+        self.yielded = 0
+
+    def generate_content_stream(self, model, contents, **kwargs):
+        try:
+            for text in self.chunks:
+                if self.yielded == self.cancel_after:
+                    self.watch_source.dispatch('stream_cancel:s1', 'cancel')
+                self.yielded += 1
+                yield SimpleNamespace(text=text)
+        finally:
+            self.closed = True
+
+
+class TestAIServiceCancellation:
+    """Generation loops stop on a pushed signal without polling stream state."""
+
+    @pytest.fixture
+    def mock_redis(self):
+        mock_redis = Mock()
+        mock_redis.exists = Mock(return_value=0)
+        return mock_redis
+
+    @pytest.fixture
+    def service(self, mock_redis):
+        stream_manager = Mock()
+        stream_manager.codec = get_codec()
+        service = AIService(mock_redis, stream_manager)
+        service.cancel_listener = CancelListener(mock_redis, autostart=False)
+        return service
+
+    def written_events(self, mock_redis):
+        pipe = mock_redis.pipeline.return_value
+        return [decode_entry(c.args[1]) for c in pipe.xadd.call_args_list]
+
+    def test_guest_stream_stops_on_cancel(self, service, mock_redis):
+        client = CancellingClient(['a', 'b', 'c', 'd'], service.cancel_listener, cancel_after=2)
+        service.client = client
+
+        service.process_guest_messages_stream([{'role': 'user', 'content': 'hi'}], 's1')
+
+        assert client.closed is True
+        assert client.yielded == 3
+        events = self.written_events(mock_redis)
+        assert ''.join(e.get('content', '') for e in events if e['type'] == 'chunk') == 'ab'
+        assert events[-1] == {'type': 'cancelled', 'message_id': None, 'reason': 'cancelled'}
+        service.stream_manager.mark_stream_cancelled.assert_called_once_with('s1')
+        service.stream_manager.mark_stream_complete.assert_not_called()
+        service.stream_manager.get_stream.assert_not_called()
+
+    def test_partial_message_persisted_as_cancelled(self, app, test_user, service, mock_redis):
+        conversation = Conversation(user_id=test_user.id, title='Visa')
+        db.session.add(conversation)
+        db.session.commit()
+        user_message = Message(conversation_id=conversation.id, content='hi', role='user')
+        db.session.add(user_message)
+        db.session.commit()
+        service.stream_manager.get_stream.return_value = {'status': 'active'}
+        service.client = CancellingClient(['Hel', 'lo', ' there'], service.cancel_listener, cancel_after=2)
+
+        service.process_ai_task(user_message.id, 's1')
+
+        ai_message = Message.query.filter_by(role='assistant').one()
+        assert ai_message.status == 'cancelled'
+        assert ai_message.content == 'Hello'
+        assert self.written_events(mock_redis)[-1]['type'] == 'cancelled'
+        service.stream_manager.mark_stream_cancelled.assert_called_once_with('s1')
+        # Only the up-front existence check; no per-chunk polling
+        service.stream_manager.get_stream.assert_called_once_with('s1')
+        assert service.cancel_listener.dispatch('stream_cancel:s1', 'cancel') is False
+
+
+class TestCancelEndpoint:
+    """POST /chat/stream/<id>/cancel."""
+
+    @patch('app.api.chat.routes.stream_manager')
+    def test_cancel_owned_stream(self, mock_sm, client, auth_headers, test_user):
+        mock_sm.get_stream.return_value = {'user_id': test_user.id, 'status': 'active'}
+
+        response = client.post('/chat/stream/s1/cancel', headers=auth_headers)
+
+        assert response.status_code == 202
+        assert response.get_json() == {'stream_id': 's1', 'status': 'cancelling'}
+        mock_sm.request_cancel.assert_called_once_with('s1')
+
+    @patch('app.api.chat.routes.stream_manager')
+    def test_cancel_other_users_stream(self, mock_sm, client, auth_headers):
+        mock_sm.get_stream.return_value = {'user_id': 999, 'status': 'active'}
+
+        response = client.post('/chat/stream/s1/cancel', headers=auth_headers)
+
+        assert response.status_code == 404
+        mock_sm.request_cancel.assert_not_called()
+
+    @patch('app.api.chat.routes.stream_manager')
+    def test_cancel_finished_stream(self, mock_sm, client):
+        mock_sm.get_stream.return_value = {'user_id': None, 'status': 'complete'}
+
+        response = client.post('/chat/stream/s1/cancel')
+
+        assert response.status_code == 409
+        mock_sm.request_cancel.assert_not_called()
+
+
+class TestSSEDisconnectSignal:
+    """Viewers publish resume/disconnect signals for the producer."""
+
+    def run_stream(self, app, entries, consume, other_viewers=0):
+        from app.api.chat import sse
+
+        app.config['SSE_MULTIPLEXED_READER'] = False
+        with app.test_request_context('/chat/stream/s1'), \
+                patch.object(sse, 'stream_manager') as mock_sm, \
+                patch.object(sse, 'redis_client') as mock_redis:
+            mock_sm.get_stream.return_value = {'user_id': None, 'status': 'active'}
+            mock_sm.get_last_id.return_value = '0-0'
+            mock_sm.remove_viewer.return_value = other_viewers
+            mock_redis.xread.return_value = [('stream_events:s1', entries)]
+            frames = consume(sse.create_sse_response('s1').response)
+        return frames, [c.args[1] for c in mock_sm.publish_signal.call_args_list], mock_sm
+
+    def test_disconnect_before_completion_signals_producer(self, app):
+        def read_two_frames_then_leave(body):
+            frames = [next(body), next(body)]
+            body.close()
+            return frames
+
+        chunk = {'payload': json.dumps({'type': 'chunk', 'content': 'x'})}
+        _frames, signals, _sm = self.run_stream(app, [('1-0', chunk)], read_two_frames_then_leave)
+
+        assert signals == ['resume', 'disconnect']
+
+    def test_other_viewer_keeps_stream_going(self, app):
+        def read_two_frames_then_leave(body):
+            frames = [next(body), next(body)]
+            body.close()
+            return frames
+
+        chunk = {'payload': json.dumps({'type': 'chunk', 'content': 'x'})}
+        _frames, signals, mock_sm = self.run_stream(app, [('1-0', chunk)], read_two_frames_then_leave,
+                                                    other_viewers=1)
+
+        assert signals == ['resume']
+        mock_sm.add_viewer.assert_called_once_with('s1')
+        mock_sm.remove_viewer.assert_called_once_with('s1')
+        mock_sm.mark_stream_disconnected.assert_not_called()
+
+    def test_cancelled_event_ends_stream_without_disconnect(self, app):
+        cancelled = {'payload': json.dumps({'type': 'cancelled'})}
+        frames, signals, mock_sm = self.run_stream(app, [('1-0', cancelled)], list)
+
+        assert '"type": "cancelled"' in frames[-1]
+        assert signals == ['resume']
+        mock_sm.mark_stream_complete.assert_not_called()
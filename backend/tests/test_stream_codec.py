@@ -0,0 +1,53 @@
+"""Tests for stream event codecs."""
+import json
+
+import pytest
+
+from app.core.stream_codec import decode_entry, frame_entry, get_codec
+
+
+EVENT = {'type': 'chunk', 'content': 'Hi', 'message_id': 7}
+
+
+@pytest.mark.parametrize('name', ['raw', 'json'])
+def test_round_trip(name):
+    fields = get_codec(name).encode(EVENT)
+    assert decode_entry(fields) == EVENT
+    assert frame_entry(fields)[0] == 'chunk'
+
+
+def test_raw_layout_is_type_plus_json():
+    fields = get_codec('raw').encode(EVENT)
+    assert fields == {'type': 'chunk', 'data': json.dumps(EVENT)}
+
+
+def test_json_layout_is_single_payload():
+    assert get_codec('json').encode(EVENT) == {'payload': json.dumps(EVENT)}
+
+
+def test_default_codec_is_raw():
+    assert get_codec().name == 'raw'
+    assert get_codec(None) is get_codec('raw')
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        get_codec('msgpack')
+
+
+@pytest.mark.parametrize('fields', [
+    None,
+    {},
+    {'payload': ''},
+    {'payload': 'not json'},
+    {'payload': '[1, 2]'},
+])
+def test_unreadable_entries_are_skipped(fields):
+    assert frame_entry(fields) is None
+    assert decode_entry(fields) is None
+
+
+def test_frame_entry_does_not_reparse_raw_data():
+    # ``data`` is forwarded as-is; only ``type`` is inspected
+    assert frame_entry({'type': 'complete', 'data': '{"type":"complete"}'}) == (
+        'complete', '{"type":"complete"}')
@@ -0,0 +1,143 @@
+"""Tests for the multiplexed stream reader."""
+import json
+import time
+import pytest
+import redis
+from unittest.mock import Mock, patch
+from app.core.stream_fanout import StreamFanout, parse_entry_id
+
+
+def now_id(offset_ms=0, seq=0):
+    return f"{int(time.time() * 1000) - offset_ms}-{seq}"
+
+
+class TestStreamFanout:
+    """Test StreamFanout dispatch."""
+
+    @pytest.fixture
+    def mock_redis(self):
+        mock_redis = Mock()
+        mock_redis.xread = Mock(return_value=[])
+        return mock_redis
+
+    @pytest.fixture
+    def fanout(self, mock_redis):
+        return StreamFanout(mock_redis, block_ms=10, autostart=False)
+
+    def test_parse_entry_id(self):
+        assert parse_entry_id('12-3') < parse_entry_id('12-10')
+        assert parse_entry_id('9-0') < parse_entry_id('10-0')
+        assert parse_entry_id('5') == (5, 0)
+
+    def test_single_xread_for_all_streams(self, fanout, mock_redis):
+        fanout.subscribe('stream_events:a', '0-0')
+        fanout.subscribe('stream_events:b', '3-0')
+        fanout.subscribe('stream_events:b', '1-0')
+
+        fanout.poll_once()
+
+        mock_redis.xread.assert_called_once()
+        streams = mock_redis.xread.call_args[0][0]
+        assert streams == {'stream_events:a': '0-0', 'stream_events:b': '1-0'}
+
+    def test_dispatches_to_every_subscriber(self, fanout, mock_redis):
+        first = fanout.subscribe('stream_events:a', '0-0')
+        second = fanout.subscribe('stream_events:a', '0-0')
+        other = fanout.subscribe('stream_events:b', '0-0')
+        entry_id = now_id()
+        mock_redis.xread.return_value = [
+            ('stream_events:a', [(entry_id, {'payload': json.dumps({'type': 'chunk'})})]),
+        ]
+
+        assert fanout.poll_once() == 1
+
+        assert first.get(timeout=0.01)[0][0] == entry_id
+        assert second.get(timeout=0.01)[0][0] == entry_id
+        assert other.get(timeout=0.01) == []
+        assert first.cursor == entry_id
+
+    def test_skips_entries_before_subscriber_cursor(self, fanout, mock_redis):
+        behind = fanout.subscribe('stream_events:a', '0-0')
+        ahead = fanout.subscribe('stream_events:a', '2-0')
+        mock_redis.xread.return_value = [
+            ('stream_events:a', [('1-0', {'payload': '{}'}), ('3-0', {'payload': '{}'})]),
+        ]
+
+        fanout.poll_once()
+
+        assert [e[0] for e in behind.get(timeout=0.01)] == ['1-0', '3-0']
+        assert [e[0] for e in ahead.get(timeout=0.01)] == ['3-0']
+
+    def test_unsubscribe_removes_stream(self, fanout, mock_redis):
+        sub = fanout.subscribe('stream_events:a')
+        fanout.unsubscribe(sub)
+
+        assert fanout.poll_once() == 0
+        mock_redis.xread.assert_not_called()
+        assert fanout.stats()['subscribers'] == 0
+
+    def test_stats_report_subscribers_and_lag(self, fanout, mock_redis):
+        fanout.subscribe('stream_events:a')
+        fanout.subscribe('stream_events:a')
+        mock_redis.xread.return_value = [('stream_events:a', [(now_id(offset_ms=250), {'payload': '{}'})])]
+
+        fanout.poll_once()
+        stats = fanout.stats()
+
+        assert stats['subscribers'] == 2
+        assert stats['streams'] == 1
+        assert stats['dispatched'] == 1
+        assert stats['max_dispatch_lag_ms'] >= 250
+
+    def test_read_errors_are_logged_once_per_interval_and_reported(self, fanout, mock_redis, caplog):
+        fanout.subscribe('stream_events:a')
+        mock_redis.xread.side_effect = redis.ConnectionError('down')
+
+        for _ in range(3):
+            try:
+                fanout.poll_once()
+            except redis.ConnectionError as e:
+                fanout._record_error(e)
+
+        assert [r.levelname for r in caplog.records if r.name == 'app.core.stream_fanout'] == ['ERROR']
+        stats = fanout.stats()
+        assert stats['errors'] == 3
+        assert stats['last_error'] == 'ConnectionError: down'
+        assert stats['last_error_at'] is not None
+
+    def test_background_thread_delivers(self, mock_redis):
+        entry_id = now_id()
+        mock_redis.xread.side_effect = lambda *a, **k: [('stream_events:a', [(entry_id, {'payload': '{}'})])]
+        fanout = StreamFanout(mock_redis, block_ms=10)
+        try:
+            sub = fanout.subscribe('stream_events:a')
+            assert sub.get(timeout=2)[0][0] == entry_id
+        finally:
+            fanout.stop()
+
+
+class TestMultiplexedSSE:
+    """create_sse_response reads through the fanout when the flag is on."""
+
+    def test_sse_uses_fanout_subscription(self, app):
+        from app.api.chat import sse
+
+        fanout = Mock()
+        subscription = Mock()
+        subscription.get.return_value = [('1-0', {'payload': json.dumps({'type': 'complete', 'message_id': None})})]
+        fanout.subscribe.return_value = subscription
+        app.config['SSE_MULTIPLEXED_READER'] = True
+
+        with app.test_request_context('/chat/stream/s1'), \
+                patch.object(sse, 'stream_manager') as mock_sm, \
+                patch.object(sse, 'redis_client') as mock_redis, \
+                patch.object(sse, 'get_stream_fanout', return_value=fanout):
+            mock_sm.get_stream.return_value = {'user_id': None, 'status': 'active'}
+            mock_sm.get_last_id.return_value = '0-0'
+            response = sse.create_sse_response('s1')
+            body = ''.join(response.response)
+
+        assert '"type": "complete"' in body
+        fanout.subscribe.assert_called_once()
+        fanout.unsubscribe.assert_called_once_with(subscription)
+        mock_redis.xread.assert_not_called()
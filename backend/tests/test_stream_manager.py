@@ -1,202 +1,329 @@
 """Tests for StreamManager."""
 import pytest
-import json
 import time
 from unittest.mock import Mock, patch
-from app.core.stream_manager import StreamManager
+from app.core import stream_manager as stream_manager_module
+from app.core.stream_manager import (
+    StreamManager,
+    _CREATE_STREAM_LUA,
+    _SET_LAST_ID_LUA,
+    _TOUCH_STREAM_LUA,
+    _FINISH_STREAM_LUA,
+    _DISCONNECT_STREAM_LUA,
+    _POP_EXPIRED_LUA,
+    _ADD_VIEWER_LUA,
+    _REMOVE_VIEWER_LUA,
+)
+
+
+@pytest.fixture(autouse=True)
+def reset_heartbeats():
+    stream_manager_module._last_heartbeat.clear()
+    yield
+    stream_manager_module._last_heartbeat.clear()
 
 
 class TestStreamManager:
     """Test StreamManager functionality."""
-    
+
+    @pytest.fixture
+    def scripts(self):
+        """One mock per registered Lua script, keyed by its source."""
+        return {
+            _CREATE_STREAM_LUA: Mock(return_value=1),
+            _SET_LAST_ID_LUA: Mock(return_value=1),
+            _TOUCH_STREAM_LUA: Mock(return_value=1),
+            _FINISH_STREAM_LUA: Mock(return_value=1),
+            _DISCONNECT_STREAM_LUA: Mock(return_value=1),
+            _POP_EXPIRED_LUA: Mock(return_value=[]),
+            _ADD_VIEWER_LUA: Mock(return_value=1),
+            _REMOVE_VIEWER_LUA: Mock(return_value=0),
+        }
+
     @pytest.fixture
-    def mock_redis(self):
+    def mock_redis(self, scripts):
         """Create a mock Redis client."""
         mock_redis = Mock()
-        mock_redis.hset = Mock()
+        mock_redis.register_script = Mock(side_effect=lambda source: scripts[source])
         mock_redis.hget = Mock()
         mock_redis.hgetall = Mock()
-        mock_redis.hdel = Mock()
-        mock_redis.setex = Mock()
-        mock_redis.exists = Mock()
-        mock_redis.scan_iter = Mock()
-        mock_redis.delete = Mock()
+        mock_redis.zrange = Mock()
+        mock_redis.pipeline = Mock()
         return mock_redis
-    
+
     @pytest.fixture
     def stream_manager(self, mock_redis):
         """Create StreamManager with mock Redis."""
         return StreamManager(mock_redis)
-    
-    def test_create_stream(self, stream_manager, mock_redis):
+
+    def test_create_stream(self, stream_manager, scripts):
         """Test creating a new stream."""
         stream_id = "test-stream-123"
-        user_id = 1
-        conversation_id = 1
-        
-        result = stream_manager.create_stream(stream_id, user_id, conversation_id)
-        
+
+        result = stream_manager.create_stream(stream_id, 1, 2)
+
         assert result is True
-        mock_redis.hset.assert_called_once()
-        mock_redis.setex.assert_called_once()
-        
-        # Verify the stream data structure
-        call_args = mock_redis.hset.call_args
-        assert call_args[0][0] == "active_streams"
-        assert call_args[0][1] == stream_id
-        
-        stream_data = json.loads(call_args[0][2])
-        assert stream_data['stream_id'] == stream_id
-        assert stream_data['user_id'] == user_id
-        assert stream_data['conversation_id'] == conversation_id
-        assert stream_data['status'] == 'active'
-        assert 'created_at' in stream_data
-        assert 'last_activity' in stream_data
-    
+        script = scripts[_CREATE_STREAM_LUA]
+        script.assert_called_once()
+        keys = script.call_args.kwargs['keys']
+        args = script.call_args.kwargs['args']
+        assert keys == [f"stream_state:{stream_id}", f"stream_health:{stream_id}", "stream_expiry"]
+        assert args[:3] == [stream_id, 1, 2]
+        assert args[4] == 60
+
+    def test_create_guest_stream(self, stream_manager, scripts):
+        """Guest streams store empty owner fields."""
+        stream_manager.create_stream("guest-stream", None, None)
+
+        args = scripts[_CREATE_STREAM_LUA].call_args.kwargs['args']
+        assert args[1] == ''
+        assert args[2] == ''
+
     def test_get_stream(self, stream_manager, mock_redis):
         """Test getting stream data."""
         stream_id = "test-stream-123"
-        stream_data = {
+        mock_redis.hgetall.return_value = {
             'stream_id': stream_id,
-            'user_id': 1,
-            'conversation_id': 1,
-            'status': 'active'
+            'user_id': '1',
+            'conversation_id': '',
+            'status': 'active',
+            'created_at': '1700000000.5',
+            'last_id': '0-0',
         }
-        
-        mock_redis.hget.return_value = json.dumps(stream_data)
-        
+
         result = stream_manager.get_stream(stream_id)
-        
-        assert result == stream_data
-        mock_redis.hget.assert_called_once_with("active_streams", stream_id)
-    
+
+        assert result == {
+            'stream_id': stream_id,
+            'user_id': 1,
+            'conversation_id': None,
+            'status': 'active',
+            'created_at': 1700000000.5,
+            'last_id': '0-0',
+        }
+        mock_redis.hgetall.assert_called_once_with(f"stream_state:{stream_id}")
+
     def test_get_stream_not_found(self, stream_manager, mock_redis):
         """Test getting non-existent stream."""
-        stream_id = "non-existent-stream"
-        mock_redis.hget.return_value = None
-        
-        result = stream_manager.get_stream(stream_id)
-        
+        mock_redis.hgetall.return_value = {}
+
+        result = stream_manager.get_stream("non-existent-stream")
+
         assert result is None
-    
-    def test_update_stream_activity(self, stream_manager, mock_redis):
+
+    def test_get_last_id(self, stream_manager, mock_redis):
+        """Last id is read as a single field."""
+        mock_redis.hget.return_value = '5-1'
+
+        assert stream_manager.get_last_id("s1") == '5-1'
+        mock_redis.hget.assert_called_once_with("stream_state:s1", 'last_id')
+
+        mock_redis.hget.return_value = None
+        assert stream_manager.get_last_id("s1") == '0-0'
+
+    def test_set_last_id(self, stream_manager, scripts):
+        """Setting last id is one script call on the stream hash."""
+        stream_manager.set_last_id("s1", '7-0')
+
+        scripts[_SET_LAST_ID_LUA].assert_called_once_with(keys=["stream_state:s1"], args=['7-0'])
+
+    def test_update_stream_activity(self, stream_manager, scripts):
         """Test updating stream activity."""
         stream_id = "test-stream-123"
-        stream_data = {
-            'stream_id': stream_id,
-            'user_id': 1,
-            'conversation_id': 1,
-            'status': 'active',
-            'last_activity': time.time() - 10
-        }
-        
-        mock_redis.exists.return_value = True
-        mock_redis.hget.return_value = json.dumps(stream_data)
-        
+
         result = stream_manager.update_stream_activity(stream_id)
-        
+
         assert result is True
-        mock_redis.setex.assert_called_once()
-        mock_redis.hset.assert_called_once()
-    
-    def test_update_stream_activity_expired(self, stream_manager, mock_redis):
+        script = scripts[_TOUCH_STREAM_LUA]
+        script.assert_called_once()
+        assert script.call_args.kwargs['keys'] == [
+            f"stream_state:{stream_id}", f"stream_health:{stream_id}", "stream_expiry"]
+        now, ttl, member = script.call_args.kwargs['args']
+        assert now == pytest.approx(time.time(), abs=5)
+        assert ttl == 60
+        assert member == stream_id
+
+    def test_heartbeat_carries_the_cursor(self, stream_manager, scripts):
+        """A viewer's heartbeat also writes its cursor, in the same script call."""
+        assert stream_manager.heartbeat("s1", last_id='7-0') is True
+
+        assert scripts[_TOUCH_STREAM_LUA].call_args.kwargs['args'][3:] == ['7-0']
+        scripts[_SET_LAST_ID_LUA].assert_not_called()
+
+    def test_update_stream_activity_expired(self, stream_manager, scripts):
         """Test updating activity for expired stream."""
-        stream_id = "expired-stream"
-        mock_redis.exists.return_value = False
-        
-        result = stream_manager.update_stream_activity(stream_id)
-        
+        scripts[_TOUCH_STREAM_LUA].return_value = 0
+
+        result = stream_manager.update_stream_activity("expired-stream")
+
         assert result is False
-        mock_redis.setex.assert_not_called()
-        mock_redis.hset.assert_not_called()
-    
-    def test_mark_stream_complete(self, stream_manager, mock_redis):
+
+    def test_heartbeat_is_throttled_per_stream(self, stream_manager, scripts):
+        """Only the first heartbeat within the interval reaches Redis."""
+        assert stream_manager.heartbeat("s1") is True
+        assert stream_manager.heartbeat("s1") is False
+        assert stream_manager.heartbeat("s2") is True
+        assert scripts[_TOUCH_STREAM_LUA].call_count == 2
+
+    def test_heartbeat_after_interval(self, stream_manager, scripts):
+        """A heartbeat is sent again once the interval has passed."""
+        with patch.object(stream_manager_module.time, 'monotonic', side_effect=[100.0, 103.0, 106.0]):
+            assert stream_manager.heartbeat("s1") is True
+            assert stream_manager.heartbeat("s1") is False
+            assert stream_manager.heartbeat("s1") is True
+
+    def test_heartbeat_shared_across_instances(self, mock_redis, scripts):
+        """Throttling is per process, not per StreamManager instance."""
+        StreamManager(mock_redis).heartbeat("s1")
+        StreamManager(mock_redis).heartbeat("s1")
+        assert scripts[_TOUCH_STREAM_LUA].call_count == 1
+
+    def test_heartbeat_queues_on_pipeline(self, stream_manager, scripts):
+        """With a pipeline the refresh is queued instead of sent."""
+        pipe = Mock()
+        stream_manager.heartbeat("s1", pipe=pipe)
+        assert scripts[_TOUCH_STREAM_LUA].call_args.kwargs['client'] is pipe
+
+    def test_finish_forgets_heartbeat(self, stream_manager):
+        """Terminal streams stop being tracked for throttling."""
+        stream_manager.heartbeat("s1")
+        stream_manager.mark_stream_complete("s1")
+        assert "s1" not in stream_manager_module._last_heartbeat
+
+    def test_mark_stream_complete(self, stream_manager, scripts):
         """Test marking stream as complete."""
         stream_id = "test-stream-123"
-        stream_data = {
-            'stream_id': stream_id,
-            'user_id': 1,
-            'conversation_id': 1,
-            'status': 'active'
-        }
-        
-        mock_redis.hget.return_value = json.dumps(stream_data)
-        
+
         result = stream_manager.mark_stream_complete(stream_id)
-        
+
         assert result is True
-        mock_redis.hset.assert_called_once()
-        mock_redis.delete.assert_called_once()
-        
-        # Verify the updated stream data
-        call_args = mock_redis.hset.call_args
-        updated_data = json.loads(call_args[0][2])
-        assert updated_data['status'] == 'complete'
-        assert 'completed_at' in updated_data
-    
-    def test_mark_stream_error(self, stream_manager, mock_redis):
+        script = scripts[_FINISH_STREAM_LUA]
+        script.assert_called_once()
+        assert script.call_args.kwargs['keys'] == [
+            f"stream_state:{stream_id}",
+            f"stream_health:{stream_id}",
+            f"stream_events:{stream_id}",
+            "stream_expiry",
+        ]
+        args = script.call_args.kwargs['args']
+        assert args[:3] == [stream_id, 'complete', 'completed_at']
+        assert args[4] == 600
+        assert len(args) == 5
+
+    def test_mark_stream_complete_missing(self, stream_manager, scripts):
+        """Completing an unknown stream reports False."""
+        scripts[_FINISH_STREAM_LUA].return_value = 0
+
+        assert stream_manager.mark_stream_complete("missing") is False
+
+    def test_mark_stream_error(self, stream_manager, scripts):
         """Test marking stream as error."""
         stream_id = "test-stream-123"
         error_message = "Test error"
-        stream_data = {
-            'stream_id': stream_id,
-            'user_id': 1,
-            'conversation_id': 1,
-            'status': 'active'
-        }
-        
-        mock_redis.hget.return_value = json.dumps(stream_data)
-        
+
         result = stream_manager.mark_stream_error(stream_id, error_message)
-        
+
         assert result is True
-        mock_redis.hset.assert_called_once()
-        mock_redis.delete.assert_called_once()
-        
-        # Verify the updated stream data
-        call_args = mock_redis.hset.call_args
-        updated_data = json.loads(call_args[0][2])
-        assert updated_data['status'] == 'error'
-        assert updated_data['error_message'] == error_message
-        assert 'error_at' in updated_data
-    
-    def test_cleanup_expired_streams(self, stream_manager, mock_redis):
+        args = scripts[_FINISH_STREAM_LUA].call_args.kwargs['args']
+        assert args[:3] == [stream_id, 'error', 'error_at']
+        assert args[5] == error_message
+
+    def test_mark_stream_cancelled(self, stream_manager, scripts):
+        """Cancellation is a terminal transition like complete and error."""
+        stream_manager.mark_stream_cancelled("s1")
+
+        args = scripts[_FINISH_STREAM_LUA].call_args.kwargs['args']
+        assert args[:3] == ["s1", 'cancelled', 'cancelled_at']
+
+    def test_request_cancel(self, stream_manager, mock_redis):
+        """A cancel sets the flag key and publishes in one round trip."""
+        pipe = Mock()
+        mock_redis.pipeline.return_value = pipe
+
+        stream_manager.request_cancel("s1")
+
+        pipe.set.assert_called_once_with("stream_cancelled:s1", 1, ex=600)
+        pipe.publish.assert_called_once_with("stream_cancel:s1", 'cancel')
+        pipe.execute.assert_called_once()
+
+    def test_mark_stream_disconnected(self, stream_manager, scripts):
+        """Disconnect only runs the guarded transition script."""
+        scripts[_DISCONNECT_STREAM_LUA].return_value = 0
+
+        assert stream_manager.mark_stream_disconnected("s1") is False
+        assert scripts[_DISCONNECT_STREAM_LUA].call_args.kwargs['keys'] == ["stream_state:s1"]
+
+    def test_viewer_count(self, stream_manager, scripts):
+        """Viewers are counted per stream; the key lives as long as a replay."""
+        scripts[_ADD_VIEWER_LUA].return_value = 2
+        scripts[_REMOVE_VIEWER_LUA].return_value = 1
+
+        assert stream_manager.add_viewer("s1") == 2
+        assert stream_manager.remove_viewer("s1") == 1
+        scripts[_ADD_VIEWER_LUA].assert_called_once_with(keys=["stream_viewers:s1"], args=[600])
+        scripts[_REMOVE_VIEWER_LUA].assert_called_once_with(keys=["stream_viewers:s1"])
+
+    def test_cleanup_expired_streams(self, stream_manager, mock_redis, scripts):
         """Test cleaning up expired streams."""
-        # Mock scan_iter to return some health keys
-        mock_redis.scan_iter.return_value = [
-            "stream_health:stream1",
-            "stream_health:stream2"
-        ]
-        
-        # Mock exists to return False for all keys (expired)
-        mock_redis.exists.return_value = False
-        
+        scripts[_POP_EXPIRED_LUA].return_value = ["stream1", "stream2", "stream3"]
+        pipe = Mock()
+        mock_redis.pipeline.return_value = pipe
+
         result = stream_manager.cleanup_expired_streams()
-        
-        assert result == 2
-        assert mock_redis.hdel.call_count == 2
-    
+
+        assert result == 3
+        pop = scripts[_POP_EXPIRED_LUA]
+        pop.assert_called_once()
+        assert pop.call_args.kwargs['keys'] == ["stream_expiry"]
+        cutoff, limit = pop.call_args.kwargs['args']
+        assert cutoff == pytest.approx(time.time() - stream_manager.cleanup_grace_seconds, abs=5)
+        assert limit == 1000
+        pipe.delete.assert_any_call("stream_state:stream2", "stream_events:stream2", "stream_health:stream2")
+        assert pipe.delete.call_count == 3
+        pipe.execute.assert_called_once()
+
+    def test_quiet_stream_survives_cleanup_and_resumes(self, stream_manager, scripts):
+        """A stream quiet for longer than the health TTL is not swept; its next heartbeat revives it."""
+        created = time.time()
+        stream_manager.create_stream("s1", 1, 2)
+        later = created + 3 * stream_manager.health_ttl_seconds
+
+        with patch.object(stream_manager_module.time, 'time', return_value=later):
+            stream_manager.cleanup_expired_streams()
+            assert stream_manager.heartbeat("s1") is True
+
+        cutoff = scripts[_POP_EXPIRED_LUA].call_args.kwargs['args'][0]
+        assert cutoff < created
+        assert scripts[_TOUCH_STREAM_LUA].call_args.kwargs['args'][:3] == [later, 60, "s1"]
+
+    def test_cleanup_expired_streams_nothing_expired(self, stream_manager, mock_redis, scripts):
+        """An empty range pop issues no deletes."""
+        assert stream_manager.cleanup_expired_streams() == 0
+        mock_redis.pipeline.assert_not_called()
+
+    def test_cleanup_expired_streams_in_batches(self, stream_manager, mock_redis, scripts):
+        """Full batches are followed by another pop until the range is drained."""
+        stream_manager.cleanup_batch_size = 2
+        scripts[_POP_EXPIRED_LUA].side_effect = [["s1", "s2"], ["s3", "s4"], ["s5"]]
+        mock_redis.pipeline.return_value = Mock()
+
+        assert stream_manager.cleanup_expired_streams() == 5
+        assert scripts[_POP_EXPIRED_LUA].call_count == 3
+        assert mock_redis.pipeline.return_value.execute.call_count == 3
+
     def test_get_active_streams(self, stream_manager, mock_redis):
         """Test getting all active streams."""
-        streams_data = {
-            "stream1": json.dumps({
-                'stream_id': 'stream1',
-                'user_id': 1,
-                'status': 'active'
-            }),
-            "stream2": json.dumps({
-                'stream_id': 'stream2',
-                'user_id': 2,
-                'status': 'complete'
-            })
-        }
-        
-        mock_redis.hgetall.return_value = streams_data
-        
+        mock_redis.zrange.return_value = ["stream1", "stream2"]
+        pipe = Mock()
+        pipe.execute.return_value = [
+            {'stream_id': 'stream1', 'user_id': '1', 'status': 'active'},
+            {'stream_id': 'stream2', 'user_id': '2', 'status': 'active'},
+        ]
+        mock_redis.pipeline.return_value = pipe
+
         result = stream_manager.get_active_streams()
-        
+
         assert len(result) == 2
-        assert 'stream1' in result
-        assert 'stream2' in result
-        assert result['stream1']['status'] == 'active'
-        assert result['stream2']['status'] == 'complete'
+        assert result['stream1']['user_id'] == 1
+        assert result['stream2']['status'] == 'active'
+        assert pipe.hgetall.call_count == 2
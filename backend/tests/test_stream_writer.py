@@ -0,0 +1,118 @@
+"""Tests for the coalescing stream chunk writer."""
+import time
+
+import pytest
+from unittest.mock import Mock
+from app.core.stream_codec import decode_entry, get_codec
+from app.core.stream_writer import StreamChunkWriter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestStreamChunkWriter:
+    """Test StreamChunkWriter buffering and flushing."""
+
+    @pytest.fixture
+    def pipe(self):
+        return Mock()
+
+    @pytest.fixture
+    def mock_redis(self, pipe):
+        mock_redis = Mock()
+        mock_redis.pipeline.return_value = pipe
+        return mock_redis
+
+    @pytest.fixture
+    def mock_stream_manager(self):
+        mock_sm = Mock()
+        mock_sm.get_events_key.return_value = 'stream_events:s1'
+        mock_sm.codec = get_codec()
+        return mock_sm
+
+    @pytest.fixture
+    def clock(self):
+        return FakeClock()
+
+    def make_writer(self, mock_redis, mock_stream_manager, clock, **kwargs):
+        return StreamChunkWriter(mock_redis, mock_stream_manager, 's1', message_id=7,
+                                 clock=clock, **kwargs)
+
+    def test_buffers_until_byte_threshold(self, mock_redis, mock_stream_manager, pipe, clock):
+        writer = self.make_writer(mock_redis, mock_stream_manager, clock, max_bytes=10, max_interval_ms=1000)
+
+        writer.write('hello')
+        pipe.xadd.assert_not_called()
+
+        writer.write(' world')
+        pipe.xadd.assert_called_once()
+        payload = decode_entry(pipe.xadd.call_args[0][1])
+        assert payload == {'type': 'chunk', 'content': 'hello world', 'message_id': 7}
+        mock_stream_manager.heartbeat.assert_called_once_with('s1', pipe=pipe)
+        pipe.execute.assert_called_once()
+
+    def test_flushes_after_interval(self, mock_redis, mock_stream_manager, pipe, clock):
+        writer = self.make_writer(mock_redis, mock_stream_manager, clock, max_bytes=1000, max_interval_ms=50)
+
+        writer.write('a')
+        pipe.xadd.assert_not_called()
+
+        clock.now = 0.06
+        writer.write('b')
+        payload = decode_entry(pipe.xadd.call_args[0][1])
+        assert payload['content'] == 'ab'
+
+    def test_counts_utf8_bytes(self, mock_redis, mock_stream_manager, pipe, clock):
+        writer = self.make_writer(mock_redis, mock_stream_manager, clock, max_bytes=4, max_interval_ms=1000)
+
+        writer.write('éé')
+        pipe.xadd.assert_called_once()
+
+    def test_close_flushes_tail_with_final_event(self, mock_redis, mock_stream_manager, pipe, clock):
+        writer = self.make_writer(mock_redis, mock_stream_manager, clock, max_bytes=1000, max_interval_ms=1000)
+        writer.write('partial')
+
+        writer.close({'type': 'complete', 'message_id': 7})
+
+        assert pipe.xadd.call_count == 2
+        first = decode_entry(pipe.xadd.call_args_list[0][0][1])
+        last = decode_entry(pipe.xadd.call_args_list[1][0][1])
+        assert first['content'] == 'partial'
+        assert last['type'] == 'complete'
+        pipe.execute.assert_called_once()
+        assert writer.text == 'partial'
+
+    def test_close_without_pending_text(self, mock_redis, mock_stream_manager, pipe, clock):
+        writer = self.make_writer(mock_redis, mock_stream_manager, clock)
+
+        writer.close({'type': 'complete', 'message_id': 7})
+
+        pipe.xadd.assert_called_once()
+        mock_stream_manager.heartbeat.assert_not_called()
+
+    def test_text_joins_all_parts(self, mock_redis, mock_stream_manager, clock):
+        writer = self.make_writer(mock_redis, mock_stream_manager, clock, max_bytes=3)
+        for part in ['Hel', 'lo', ' there', '!']:
+            writer.write(part)
+
+        assert writer.text == 'Hello there!'
+
+    def test_pending_text_is_flushed_during_a_pause(self, mock_redis, mock_stream_manager, pipe):
+        writer = StreamChunkWriter(mock_redis, mock_stream_manager, 's1', message_id=7,
+                                   max_bytes=1000, max_interval_ms=20)
+
+        writer.write('waiting for the model')
+        pipe.xadd.assert_not_called()
+
+        deadline = time.monotonic() + 2
+        while not pipe.xadd.called and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert decode_entry(pipe.xadd.call_args[0][1])['content'] == 'waiting for the model'
+
+        writer.close({'type': 'complete', 'message_id': 7})
+        assert pipe.xadd.call_count == 2
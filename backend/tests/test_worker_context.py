@@ -0,0 +1,67 @@
+"""Tests for per-process Celery worker state."""
+from unittest.mock import Mock, patch
+
+import pytest
+
+from app.tasks import worker as worker_module
+from app.tasks.ai import process_message_stream_task, summarize_conversation_task
+
+
+@pytest.fixture(autouse=True)
+def testing_context(monkeypatch):
+    monkeypatch.setenv('FLASK_CONFIG', 'testing')
+    monkeypatch.setattr(worker_module, '_context', None)
+    yield
+
+
+def test_context_built_once_per_process():
+    first = worker_module.get_worker_context()
+    second = worker_module.get_worker_context()
+
+    assert first is second
+    assert first.ai_service.stream_manager is first.stream_manager
+
+
+def test_context_rebuilt_after_fork():
+    first = worker_module.get_worker_context()
+
+    with patch.object(worker_module.os, 'getpid', return_value=first.pid + 1):
+        second = worker_module.get_worker_context()
+
+    assert second is not first
+
+
+def test_process_init_signal_warms_context():
+    worker_module.init_worker_process()
+    assert worker_module._context is not None
+
+
+def test_shutdown_signal_drops_context():
+    worker_module.get_worker_context()
+    worker_module.shutdown_worker_process()
+    assert worker_module._context is None
+
+
+def test_tasks_reuse_the_worker_service():
+    context = worker_module.get_worker_context()
+    context.ai_service = Mock()
+    context.ai_service.summarize_conversation.return_value = 3
+
+    process_message_stream_task(1, 's1')
+    process_message_stream_task(2, 's2')
+
+    assert context.ai_service.process_ai_task.call_count == 2
+    assert summarize_conversation_task(5, 9) == 3
+    assert worker_module.get_worker_context() is context
+
+
+def test_task_failure_writes_error_event():
+    context = worker_module.get_worker_context()
+    context.ai_service = Mock()
+    context.ai_service.process_ai_task.side_effect = RuntimeError('boom')
+    context.stream_manager = Mock()
+
+    process_message_stream_task(1, 's1')
+
+    context.stream_manager.add_event.assert_called_once_with(
+        's1', {'type': 'error', 'message': 'boom', 'message_id': None})
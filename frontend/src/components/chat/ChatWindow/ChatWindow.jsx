@@ -71,6 +71,7 @@ const ChatWindow = ({
                 sender={message.sender}
                 timestamp={message.timestamp}
                 isLoading={!!message.thinking}
+                queuePosition={message.queuePosition}
               />
             ))}
           </div>
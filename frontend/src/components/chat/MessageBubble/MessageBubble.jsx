@@ -6,7 +6,8 @@ const MessageBubble = ({
   message, 
   sender = 'user', // 'user' | 'ai'
   timestamp, 
-  isLoading = false 
+  isLoading = false,
+  queuePosition = 0
 }) => {
   const formatTimestamp = (timestamp) => {
     if (!timestamp) return '';
@@ -26,7 +27,9 @@ const MessageBubble = ({
             <span></span>
             <span></span>
           </div>
-          <div className="message-text">Đang suy nghĩ...</div>
+          <div className="message-text">
+            {queuePosition > 0 ? `Đang chờ đến lượt (vị trí ${queuePosition})...` : 'Đang suy nghĩ...'}
+          </div>
         </div>
       </div>
     );
@@ -1,5 +1,6 @@
 import React, { useEffect, useRef, forwardRef, useImperativeHandle, useState } from 'react';
 import { useChat } from '@ai-sdk/react';
+import { useQueryClient } from '@tanstack/react-query';
 import { chatService, streamingService as openStream } from '../../../services/chat/index.js';
 import { useLocation, useNavigate } from 'react-router-dom';
 import { ChatWindow } from '../../../components/chat';
@@ -22,6 +23,7 @@ const ChatPage = forwardRef(({
   const didInitRef = useRef(false);
   const navigate = useNavigate();
   const location = useLocation();
+  const queryClient = useQueryClient();
 
   // Load history if conversationId provided
   useEffect(() => {
@@ -115,6 +117,14 @@ const ChatPage = forwardRef(({
             return copy;
           });
         },
+        onQueue: (data) => {
+          const position = data?.position || 0;
+          setMessages((prev) => prev.map((m) => (m.id === assistantId ? { ...m, queuePosition: position } : m)));
+        },
+        onTitle: () => {
+          // Sidebar picks up the AI title that replaced the provisional one
+          queryClient.invalidateQueries({ queryKey: ['chat', 'conversations'] });
+        },
         onComplete: () => {
           setIsStreaming(false);
           // After streaming finishes, if this was a new conversation (no prop conversationId), update URL
@@ -171,7 +181,8 @@ const ChatPage = forwardRef(({
             content: m.content,
             sender: m.role === 'user' ? 'user' : 'ai',
             timestamp: m.createdAt ? new Date(m.createdAt) : new Date(),
-            thinking: !!m.thinking
+            thinking: !!m.thinking,
+            queuePosition: m.queuePosition
           }))}
           isLoading={false}
           externalScrollContainerRef={scrollRef}
@@ -10,6 +10,7 @@ import PromptButton from '../../../components/common/PromptButton/PromptButton';
 import './GuestChatPage.css';
 
 const SESSION_STORAGE_KEY = 'guest_chat_messages';
+const SESSION_ID_STORAGE_KEY = 'guest_chat_session_id';
 
 const GuestChatPage = forwardRef(({
   initialMessage = '',
@@ -46,6 +47,7 @@ const GuestChatPage = forwardRef(({
     if (!newChat) return;
     setMessages([]);
     sessionStorage.removeItem(SESSION_STORAGE_KEY);
+    sessionStorage.removeItem(SESSION_ID_STORAGE_KEY);
   }, [newChat, setMessages]);
 
   // If a conversation id is provided (e.g. switching threads), clear current messages
@@ -53,6 +55,7 @@ const GuestChatPage = forwardRef(({
     if (!conversationId) return;
     setMessages([]);
     sessionStorage.removeItem(SESSION_STORAGE_KEY);
+    sessionStorage.removeItem(SESSION_ID_STORAGE_KEY);
   }, [conversationId, setMessages]);
 
   // Persist guest chat to session storage to allow resume-in-tab behaviour
@@ -84,18 +87,6 @@ const GuestChatPage = forwardRef(({
   const handleSendMessage = async (message) => {
     if (!message.trim()) return;
 
-    const sanitizedHistory = messages
-      .filter((m) => m.role === 'user' || (m.role === 'assistant' && m.content && m.content.trim() !== ''))
-      .map((m) => ({
-        role: m.role,
-        content: m.content ?? '',
-      }));
-
-    const conversationPayload = [
-      ...sanitizedHistory,
-      { role: 'user', content: message },
-    ];
-
     try {
       await append({ role: 'user', content: message });
     } catch {
@@ -106,11 +97,18 @@ const GuestChatPage = forwardRef(({
     }
 
     try {
-      const resp = await guestChatService.sendMessage({ messages: conversationPayload });
-      const { stream_id: streamId } = resp || {};
+      // History lives in a server-side session; only the new message is sent
+      const resp = await guestChatService.sendSessionMessage({
+        content: message,
+        sessionId: sessionStorage.getItem(SESSION_ID_STORAGE_KEY),
+      });
+      const { stream_id: streamId, session_id: sessionId } = resp || {};
       if (!streamId) {
         throw new Error('Stream id missing in response');
       }
+      if (sessionId) {
+        sessionStorage.setItem(SESSION_ID_STORAGE_KEY, sessionId);
+      }
 
       let assistantId = `assistant-${streamId || Date.now()}`;
       let firstTokenReceived = false;
@@ -133,6 +131,10 @@ const GuestChatPage = forwardRef(({
             return copy;
           });
         },
+        onQueue: (data) => {
+          const position = data?.position || 0;
+          setMessages((prev) => prev.map((m) => (m.id === assistantId ? { ...m, queuePosition: position } : m)));
+        },
         onComplete: () => {
           setIsStreaming(false);
         },
@@ -192,7 +194,8 @@ const GuestChatPage = forwardRef(({
         content: m.content,
         sender: m.role === 'user' ? 'user' : 'ai',
         timestamp: m.createdAt ? new Date(m.createdAt) : new Date(),
-        thinking: !!m.thinking
+        thinking: !!m.thinking,
+        queuePosition: m.queuePosition
       }))}
       isLoading={isLoading || isStreaming}
       externalScrollContainerRef={isInChat ? scrollRef : null}
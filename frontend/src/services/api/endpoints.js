@@ -44,6 +44,7 @@ const API_ENDPOINTS = {
     RENAME_CONVERSATION: (id) => `/chat/conversations/${id}/rename`,
     PIN_CONVERSATION: (id) => `/chat/conversations/${id}/pin`,
     STREAM: (sid) => `/chat/stream/${sid}`,
+    CANCEL_STREAM: (sid) => `/chat/stream/${sid}/cancel`,
   },
   
   // User management endpoints
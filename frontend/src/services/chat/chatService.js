@@ -41,6 +41,11 @@ const chatService = {
     throw lastError;
   },
 
+  async cancelStream(streamId) {
+    const res = await apiClient.post(API_ENDPOINTS.CHAT.CANCEL_STREAM(streamId));
+    return res.data;
+  },
+
   async renameConversation(conversationId, title) {
     const res = await apiClient.patch(API_ENDPOINTS.CHAT.RENAME_CONVERSATION(conversationId), { title });
     return res.data;
@@ -8,6 +8,15 @@ const guestChatService = {
     });
     return res.data;
   },
+
+  // Session mode: only the new message is sent, history stays on the server
+  async sendSessionMessage({ content, sessionId }) {
+    const res = await guestApiClient.post(API_ENDPOINTS.CHAT.SEND_MESSAGE, {
+      content,
+      ...(sessionId ? { session_id: sessionId } : {}),
+    });
+    return res.data;
+  },
 };
 
 export default guestChatService;
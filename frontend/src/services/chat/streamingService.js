@@ -2,7 +2,7 @@ import API_ENDPOINTS from '../api/endpoints.js';
 import { TokenManager } from '../api/apiClient.js';
 
 // Minimal SSE helper with auth header support via polyfill
-export function openStream(streamId, { onChunk, onComplete, onError }) {
+export function openStream(streamId, { onChunk, onComplete, onError, onTitle, onQueue }) {
   const url = (import.meta.env.VITE_API_URL || 'http://localhost:5000') + API_ENDPOINTS.CHAT.STREAM(streamId);
   const token = TokenManager.getAccessToken();
 
@@ -30,6 +30,8 @@ export function openStream(streamId, { onChunk, onComplete, onError }) {
           const dataLine = lines.filter((l) => l.startsWith('data:')).map(l => l.replace('data:', '').trim()).join('\n');
           let event = typeLine.replace('event:', '').trim();
           const payload = dataLine;
+          // Comment frames such as ": keep-alive" carry no event or data
+          if (!payload && !event) continue;
           try {
             const parsed = payload ? JSON.parse(payload) : null;
             // Fallbacks: infer event from payload if header missing
@@ -39,8 +41,14 @@ export function openStream(streamId, { onChunk, onComplete, onError }) {
               // Accept various shapes: {content}, {delta}, {text}
               const normalized = parsed && (parsed.content || parsed.delta || parsed.text || parsed);
               onChunk && onChunk(typeof normalized === 'string' ? { content: normalized } : normalized);
-            } else if (event === 'complete') {
+            } else if (event === 'complete' || event === 'cancelled') {
               onComplete && onComplete(parsed);
+            } else if (event === 'title') {
+              // AI title for a new conversation, generated in the background
+              onTitle && onTitle(parsed);
+            } else if (event === 'queue') {
+              // Waiting for a model slot; position 0 means generation started
+              onQueue && onQueue(parsed);
             } else if (event === 'error') {
               onError && onError(parsed);
             } else {